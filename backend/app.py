@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 import os
 from extensions import db, migrate, jwt
 from auth import auth
+from notifications import notifications
 from blueprints.grains import grains
 from blueprints.purchase import purchase
 from blueprints.inventory import inventory
@@ -14,7 +15,19 @@ from blueprints.godown import godown
 from blueprints.payment import payment
 from blueprints.metrics import metrics
 from blueprints.voice_bill import voice_bill
+from blueprints.bootstrap import bootstrap
+from blueprints.party import party
+from blueprints.analytics import analytics
+from blueprints.search import search
+from blueprints.events import events
+from blueprints.alerts import alerts
+from blueprints.transfer import transfer
+from blueprints.invoice import invoice
 from commands import init_commands, create_admin
+from utils import http_cache, compression, capacity, ledger, costing, prices, search as bill_search, events as live_events, push
+from utils import alerts as stock_alerts, replica
+from utils import serving
+from utils.serving import engine_options, stream_limit, workers
 
 def create_app():
     load_dotenv()
@@ -37,9 +50,10 @@ def create_app():
                 "https://shashanknagariya.pythonanywhere.com"
             ],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin"],
+            "allow_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin",
+                              "If-None-Match", "If-Modified-Since"],
             "supports_credentials": True,
-            "expose_headers": ["Content-Type", "Authorization"]
+            "expose_headers": ["Content-Type", "Authorization", "ETag", "Last-Modified"]
         }
     })
 
@@ -49,22 +63,52 @@ def create_app():
         if request.method == "OPTIONS":
             response = make_response()
             response.headers.add("Access-Control-Allow-Origin", request.headers.get("Origin", "*"))
-            response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization")
+            response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization,If-None-Match,If-Modified-Since")
             response.headers.add("Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS")
             response.headers.add("Access-Control-Allow-Credentials", "true")
             return response
     
     # Configure SQLAlchemy
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///grain_trading.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///grain_trading.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    if os.getenv('REPLICA_DATABASE_URL'):
+        # Dashboards and reports read from here (see utils/replica.py)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': os.getenv('REPLICA_DATABASE_URL')}
+    app.config['REPLICA_MAX_LAG'] = float(os.getenv('REPLICA_MAX_LAG', 30))  # seconds
+    app.config['COSTING_METHOD'] = os.getenv('COSTING_METHOD', 'fifo')  # or weighted_average
+    # Several workers only see each other's changes through the database broker
+    app.config['EVENTS_BROKER'] = os.getenv('EVENTS_BROKER', 'database' if workers() > 1 else 'local')
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = int(os.getenv('EVENTS_MAX_SUBSCRIBERS', stream_limit()))  # per worker
+    app.config['VAPID_PRIVATE_KEY'] = os.getenv('VAPID_PRIVATE_KEY')
+    app.config['VAPID_CLAIM_EMAIL'] = os.getenv('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
+    # Seller block of tax invoices (see utils/invoice.py)
+    app.config['INVOICE_SELLER_NAME'] = os.getenv('INVOICE_SELLER_NAME', 'Grain Trading Co.')
+    app.config['INVOICE_SELLER_ADDRESS'] = os.getenv('INVOICE_SELLER_ADDRESS', '')
+    app.config['INVOICE_SELLER_GSTIN'] = os.getenv('INVOICE_SELLER_GSTIN', '')
+    app.config['INVOICE_GST_RATE'] = float(os.getenv('INVOICE_GST_RATE', 0))  # percent; loose grain is nil-rated
+    app.config['INVOICE_CACHE_DIR'] = os.getenv('INVOICE_CACHE_DIR') or os.path.join(app.instance_path, 'invoices')
+    app.config['INVOICE_WORKERS'] = int(os.getenv('INVOICE_WORKERS', os.cpu_count() or 1))  # batch render processes
     
     # Initialize extensions
     db.init_app(app)
+    serving.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    http_cache.init_app(app)
+    compression.init_app(app)
+    capacity.init_app(app)
+    ledger.init_app(app)
+    costing.init_app(app)
+    prices.init_app(app)
+    bill_search.init_app(app)
+    live_events.init_app(app)  # after costing
+    stock_alerts.init_app(app)  # after costing
+    push.init_app(app)
+    replica.init_app(app)
     
     # Import models
-    from models import User, Grain, Purchase, Inventory, Sale
+    from models import User, Grain, Purchase, Inventory, Sale, ResourceVersion
     
     # Register blueprints with the correct URL prefixes
     blueprints = [
@@ -79,6 +123,15 @@ def create_app():
         (payment, '/api'),  # This will handle /api/payments/*
         (metrics, '/api'),  # This will handle /api/metrics/*
         (voice_bill, '/api'),  # This will handle /api/voice-bills/*
+        (bootstrap, '/api'),  # This will handle /api/bootstrap/*
+        (party, '/api'),  # This will handle /api/parties/*
+        (analytics, '/api'),  # This will handle /api/analytics/*
+        (search, '/api'),  # This will handle /api/search/*
+        (events, '/api'),  # This will handle /api/events
+        (notifications, '/api'),  # This will handle /api/notifications/*
+        (alerts, '/api'),  # This will handle /api/alerts/*
+        (transfer, '/api'),  # This will handle /api/transfers/*
+        (invoice, '/api'),  # This will handle /api/sales/*/invoice.pdf and /api/sales/invoices
     ]
     
     for blueprint, prefix in blueprints:
@@ -94,7 +147,16 @@ def create_app():
     
     return app
 
-app = create_app()
+
+def __getattr__(name):
+    """`from app import app` (flask CLI, init_db.py) builds the app on first
+    access instead of at import, so wsgi.py and cli.py no longer build two"""
+    global app
+    if name == 'app':
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
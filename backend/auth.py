@@ -2,7 +2,6 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
 from models import User
 from extensions import db
-from flask_mail import Mail, Message
 import secrets
 from datetime import datetime, timedelta
 
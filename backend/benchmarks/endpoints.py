@@ -0,0 +1,213 @@
+"""End-to-end benchmark for every API endpoint.
+
+Drives each route through the Flask test client against a database filled
+by `flask gen-data` (or generates one with --generate), and records p50/p95
+latency, SQL statements per request and peak Python memory. Results are
+saved as JSON; --compare prints the change against an earlier run.
+
+    cd backend && python -m benchmarks.endpoints --generate 200000 --out before.json
+    cd backend && python -m benchmarks.endpoints --out after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, func
+
+from app import create_app
+from extensions import db
+from models import BagInventory, Godown, Grain, Purchase, Role, Sale, StockThreshold, User
+from utils.datagen import generate
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+# Streams never finish, so they cannot be timed per request
+SKIP = {'events.stream_events', 'static'}
+QUERY_STRINGS = {
+    'search.search_all': 'q=ramesh',
+    'search.search_suggest': 'q=ram',
+    'analytics.get_price_series': 'grain_id={grain_id}',
+}
+
+
+def build_app(url):
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['VAPID_PRIVATE_KEY'] = None
+    return app
+
+
+def prepare(bills, seed):
+    """Generate data into an empty database and return the ids requests use"""
+    db.create_all()
+    if bills and not Grain.query.count():
+        started = time.perf_counter()
+        counts = generate(purchases=bills, sales=bills, seed=seed)
+        print(f"Generated {counts} in {time.perf_counter() - started:.0f}s")
+
+    user = User.query.filter_by(username=BENCH_USER).first()
+    if user is None:
+        user = User(username=BENCH_USER, email='bench@example.com', role=Role.ADMIN.value)
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+
+    stock = BagInventory.query.order_by(BagInventory.number_of_bags.desc()).first()
+    target = Godown.query.filter(Godown.id != stock.godown_id).order_by(Godown.id).first() if stock else None
+    return {
+        'token': create_access_token(identity=str(user.id)),
+        'user_id': user.id,
+        'grain_id': stock.grain_id if stock else 1,
+        'godown_id': stock.godown_id if stock else 1,
+        'to_godown_id': target.id if target else 1,
+        'purchase_id': db.session.query(func.max(Purchase.id)).scalar() or 1,
+        'sale_id': db.session.query(func.max(Sale.id)).scalar() or 1,
+        'threshold_id': db.session.query(func.max(StockThreshold.id)).scalar() or 1,
+        'rows': {'purchases': Purchase.query.count(), 'sales': Sale.query.count()},
+    }
+
+
+def reads(app, ids):
+    """One GET per route, path parameters filled from the sample ids"""
+    requests, seen = [], set()
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if 'GET' not in rule.methods or rule.endpoint in SKIP or rule.rule in seen:
+            continue
+        seen.add(rule.rule)
+        path = re.sub(r'<(?:\w+:)?(\w+)>', lambda match: str(ids[match.group(1)]), rule.rule)
+        if rule.endpoint in QUERY_STRINGS:
+            path += '?' + QUERY_STRINGS[rule.endpoint].format(**ids)
+        requests.append((rule.endpoint, 'GET', path, None))
+    return requests
+
+
+def writes(ids):
+    """Write paths, each repeatable without running out of stock"""
+    today = datetime.utcnow().isoformat()
+    return [
+        ('auth.login', 'POST', '/api/auth/login', {'username': BENCH_USER, 'password': BENCH_PASSWORD}),
+        ('purchase.create_purchase', 'POST', '/api/purchases', {
+            'grain_id': ids['grain_id'], 'godown_id': ids['godown_id'], 'number_of_bags': 20,
+            'weight_per_bag': 50, 'rate_per_kg': 25, 'supplier_name': 'Bench Traders', 'purchase_date': today}),
+        ('sale.create_sale', 'POST', '/api/sales', {
+            'grain_id': ids['grain_id'], 'buyer_name': 'Bench Buyer', 'number_of_bags': 10,
+            'total_weight': 500, 'rate_per_kg': 30, 'transportation_mode': 'truck',
+            'vehicle_number': 'MP09 AB 1234', 'driver_name': 'Bench', 'sale_date': today,
+            'godown_details': [{'godown_id': ids['godown_id'], 'number_of_bags': 10}]}),
+        ('purchase.update_purchase', 'PUT', f"/api/purchases/{ids['purchase_id']}", {'rate_per_kg': 26}),
+        ('sale.update_sale', 'PUT', f"/api/sales/{ids['sale_id']}", {'driver_name': 'Bench'}),
+        ('transfer.create_transfer', 'POST', '/api/transfers', {
+            'grain_id': ids['grain_id'], 'from_godown_id': ids['godown_id'],
+            'to_godown_id': ids['to_godown_id'], 'number_of_bags': 1}),
+        ('inventory.check_availability', 'POST', '/api/inventory/check-availability', {
+            'grain_id': ids['grain_id'], 'godown_details': [{'godown_id': ids['godown_id'], 'number_of_bags': 1}]}),
+        ('sale.plan_sale_allocation', 'POST', '/api/sales/plan-allocation', {
+            'grain_id': ids['grain_id'], 'number_of_bags': 50}),
+        ('alerts.set_threshold', 'PUT', '/api/alerts/thresholds', {'grain_id': ids['grain_id'], 'min_bags': 10}),
+    ]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def measure(client, counter, headers, method, path, body, repeat, warmup):
+    for _ in range(warmup):
+        client.open(path, method=method, json=body, headers=headers)
+    samples, queries, status = [], [], None
+    for _ in range(repeat):
+        before = counter.count
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+        status = response.status_code
+    samples.sort()
+    return {
+        'method': method,
+        'path': path,
+        'status': status,
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[max(0, int(len(samples) * 0.95) - 1)], 2),
+        'queries': round(statistics.mean(queries), 1),
+    }
+
+
+def peak_memory(client, headers, method, path, body):
+    """Peak Python allocation of one request, in KiB (tracemalloc is slow, so timed separately)"""
+    tracemalloc.start()
+    try:
+        client.open(path, method=method, json=body, headers=headers)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def compare(results, baseline):
+    print(f"{'endpoint':<44} {'p50 before':>10} {'p50 after':>10} {'change':>8} {'queries':>12}")
+    for name, after in results['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            print(f"{name:<44} {'-':>10} {after['p50_ms']:>10.2f}")
+            continue
+        change = (after['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+        print(f"{name:<44} {before['p50_ms']:>10.2f} {after['p50_ms']:>10.2f} {change:>+7.0f}% "
+              f"{before['queries']:>5} -> {after['queries']:<5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/endpoints_bench.db'))
+    parser.add_argument('--generate', type=int, default=0, metavar='BILLS',
+                        help='purchases and sales to generate when the database is empty')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', help='run endpoints whose name contains this text')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run')
+    args = parser.parse_args()
+
+    app = build_app(args.url)
+    with app.app_context():
+        ids = prepare(args.generate, args.seed)
+        counter = QueryCounter(db.engine)
+        dialect = db.engine.dialect.name
+    headers = {'Authorization': f"Bearer {ids['token']}"}
+    client = app.test_client()
+
+    results = {'meta': {'url': args.url, 'dialect': dialect, 'rows': ids['rows'], 'repeat': args.repeat,
+                        'python': platform.python_version(), 'run_at': datetime.utcnow().isoformat()},
+               'endpoints': {}}
+    for name, method, path, body in reads(app, ids) + writes(ids):
+        if args.only and args.only not in name:
+            continue
+        result = measure(client, counter, headers, method, path, body, args.repeat, args.warmup)
+        result['peak_kib'] = peak_memory(client, headers, method, path, body)
+        results['endpoints'][name] = result
+        flag = '' if result['status'] < 400 else f"  (HTTP {result['status']})"
+        print(f"{name:<44} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+              f"{result['queries']:>5} queries  {result['peak_kib']:>9.1f} KiB{flag}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
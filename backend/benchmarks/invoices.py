@@ -0,0 +1,91 @@
+"""Render-time benchmark for GST invoices.
+
+Times one invoice as its own PDF, a batch laid out as one PDF in process and
+on the worker pool, the batch as one PDF per invoice with a cold and a warm
+cache, and assembling those into a ZIP.
+
+    cd backend && python -m benchmarks.invoices --invoices 1000 --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.serialization import best_of
+from utils import invoice as invoices
+
+SELLER = ('Grain Trading Co.', '12, Krishi Upaj Mandi, Indore, Madhya Pradesh 452001', '23ABCDE1234F1Z5', 5.0)
+
+
+def make_invoices(count):
+    fields = []
+    for i in range(count):
+        bags = 20 + i % 180
+        weight = bags * 50 + (i % 7) * 0.125
+        rate = 21.5 + (i % 40) * 0.25
+        taxable = round(weight * rate, 2)
+        half = round(taxable * 0.025, 2)
+        fields.append({
+            'number': f'SB-20261019-{i:04d}', 'date': '19-10-2026', 'place': 'Madhya Pradesh (23)',
+            'po': f'PO{i}' if i % 3 else '', 'lr': f'LR{i}', 'transport': 'truck', 'vehicle': 'MP09HG1234',
+            'driver': 'Suresh', 'buyer': f'Buyer {i % 700} Traders', 'buyer_gstin': '23AAAPL1234C1Z5',
+            'buyer_state': 'Madhya Pradesh (23)', 'item': 'Wheat', 'hsn': '1001', 'bags': bags,
+            'weight': weight, 'rate': rate, 'taxable': taxable,
+            'taxes': [['CGST @ 2.5%', half], ['SGST @ 2.5%', half]], 'total': round(taxable + 2 * half, 2),
+        })
+    return fields
+
+
+def run(count, workers, repeat):
+    fields = make_invoices(count)
+    results = {}
+
+    seconds, _ = best_of(lambda: invoices.render_invoice(SELLER, fields[0]), repeat)
+    results['invoice_ms'] = round(seconds * 1000, 1)
+    seconds, body = best_of(lambda: invoices.combined(SELLER, fields), repeat)
+    results['batch_pdf_in_process_ms'] = round(seconds * 1000, 1)
+    results['batch_pdf_bytes'] = len(body[1])
+    if workers > 1:
+        invoices.combined(SELLER, fields[:invoices.CHUNK_MIN * 2], workers=workers)  # start the pool
+        seconds, _ = best_of(lambda: invoices.combined(SELLER, fields, workers=workers), repeat)
+        results[f'batch_pdf_pool_{workers}_ms'] = round(seconds * 1000, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        _, documents, _ = invoices.render(SELLER, fields, directory, workers)
+        results['documents_cold_cache_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        seconds, (_, _, rendered) = best_of(lambda: invoices.render(SELLER, fields, directory, workers), repeat)
+        results['documents_warm_cache_ms'] = round(seconds * 1000, 1)
+        results['rendered_on_warm_cache'] = rendered
+
+        invoices.combined(SELLER, fields, directory, workers)
+        seconds, _ = best_of(lambda: invoices.combined(SELLER, fields, directory, workers), repeat)
+        results['batch_pdf_warm_cache_ms'] = round(seconds * 1000, 1)
+
+    named = [(f"{item['number']}.pdf", document) for item, document in zip(fields, documents)]
+    seconds, body = best_of(lambda: invoices.zip_documents(named), repeat)
+    results['assemble_zip_ms'], results['zip_bytes'] = round(seconds * 1000, 1), len(body)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args()
+
+    results = run(args.invoices, args.workers, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'GST invoices, {args.invoices} sales (best of {args.repeat})')
+    for name, value in results.items():
+        print(f'  {name:<26} {value:>12,}')
+
+
+if __name__ == '__main__':
+    main()
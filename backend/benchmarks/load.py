@@ -0,0 +1,280 @@
+"""Multi-process load test of the WSGI app under gunicorn.
+
+Starts `wsgi:application` with N gunicorn workers against a local database
+and replays a weighted mix of reads and writes from several client
+processes at a fixed total rate. The bills all hit the same few hot
+(grain, godown) rows. The report covers throughput, latency percentiles
+per operation and error classes, counting lock timeouts, deadlocks and bill
+number collisions both from responses and from the server log. It ends
+with an inventory consistency check. Everything runs locally.
+
+Latency is measured from when a request was scheduled, not when it was
+sent, so a client that falls behind reports the queueing it suffered.
+
+    cd backend && python -m benchmarks.load --workers 4 --rate 100 --duration 30
+    cd backend && python -m benchmarks.load --mix create_sale=1 --hot 1 --out sqlite.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = 'load-benchmark-secret-not-for-production'
+DEFAULT_MIX = 'create_sale=4,create_purchase=2,get_inventory=2,sale_form=1,get_transfers=1'
+
+
+def sale_body(rng, grain_id, godown_id):
+    bags = rng.randrange(1, 6)
+    return {'grain_id': grain_id, 'buyer_name': f'Load Buyer {rng.randrange(50)}', 'number_of_bags': bags,
+            'total_weight': bags * 50, 'rate_per_kg': 30, 'transportation_mode': 'truck',
+            'vehicle_number': 'MP09 LT 0001', 'driver_name': 'Load',
+            'godown_details': [{'godown_id': godown_id, 'number_of_bags': bags}]}
+
+
+def purchase_body(rng, grain_id, godown_id):
+    return {'grain_id': grain_id, 'godown_id': godown_id, 'number_of_bags': rng.randrange(5, 21),
+            'weight_per_bag': 50, 'rate_per_kg': 25, 'supplier_name': f'Load Supplier {rng.randrange(50)}',
+            'purchase_date': datetime.utcnow().isoformat()}
+
+
+# name -> (method, path, body(rng, grain_id, godown_id) or None)
+OPERATIONS = {
+    'create_sale': ('POST', '/api/sales', sale_body),
+    'create_purchase': ('POST', '/api/purchases', purchase_body),
+    'get_inventory': ('GET', '/api/inventory', None),
+    'get_sales': ('GET', '/api/sales', None),
+    'sale_form': ('GET', '/api/bootstrap/sale-form', None),
+    'get_transfers': ('GET', '/api/transfers', None),
+    'dashboard': ('GET', '/api/dashboard/metrics', None),
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def classify(status, message):
+    """Error class of a failed request or a server log line"""
+    message = (message or '').lower()
+    if 'deadlock' in message:
+        return 'deadlock'
+    if 'locked' in message or 'lock timeout' in message or 'could not serialize' in message:
+        return 'lock'
+    if ('unique' in message or 'duplicate key' in message) and 'bill_number' in message:
+        return 'bill_number_collision'
+    if 'insufficient stock' in message:
+        return 'insufficient_stock'
+    if 'not enough space' in message:
+        return 'capacity'
+    return f'http_{status}' if status else 'other'
+
+
+def prepare(url, bills, hot, expires=False, seed=42):
+    """Create and fill the database if empty; returns (token, hot pairs)"""
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from extensions import db
+    from models import BagInventory, Grain, Role, User
+    from utils.datagen import generate
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if not Grain.query.count():
+            generate(purchases=bills, sales=bills, seed=seed)
+        user = User.query.filter_by(username='load').first()
+        if user is None:
+            user = User(username='load', email='load@example.com', role=Role.ADMIN.value)
+            user.set_password('load')
+            db.session.add(user)
+            db.session.commit()
+        pairs = [(row.grain_id, row.godown_id) for row in
+                 BagInventory.query.order_by(BagInventory.number_of_bags.desc()).limit(hot)]
+        return create_access_token(identity=str(user.id), expires_delta=expires), pairs
+
+
+def check_inventory():
+    from app import create_app
+    from utils.stock import inventory_drift
+    with create_app().app_context():
+        return len(inventory_drift())
+
+
+def start_server(workers, bind, env, log):
+    """gunicorn reads the workers, worker class and threads from env via gunicorn.conf.py"""
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', bind,
+         '--timeout', '120', 'wsgi:application'],
+        cwd=BACKEND, env=dict(env, WEB_CONCURRENCY=str(workers)), stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'gunicorn exited with {server.returncode}; see {log.name}')
+        try:
+            if requests.get(f'http://{bind}/api/health', timeout=1).ok:
+                return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('gunicorn did not become healthy within 60s')
+
+
+def client(index, clients, base, token, mix, rate, duration, start_at, pairs, seed):
+    """Open-loop sender: slot k of this client is due at start_at + (k + index / clients) / per_client_rate"""
+    rng = random.Random(seed + index)
+    names, weights = list(mix), list(mix.values())
+    interval = clients / rate
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    records = []
+    slot = 0
+    while True:
+        due = start_at + (slot + index / clients) * interval
+        if due - start_at >= duration:
+            return records
+        slot += 1
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        name = rng.choices(names, weights)[0]
+        method, path, body = OPERATIONS[name]
+        payload = body(rng, *rng.choice(pairs)) if body else None
+        status, error = None, None
+        try:
+            response = session.request(method, base + path, json=payload, timeout=60)
+            status = response.status_code
+            if status >= 400:
+                try:
+                    error = classify(status, (response.json() or {}).get('error'))
+                except ValueError:
+                    error = classify(status, response.text)
+        except requests.Timeout:
+            error = 'timeout'
+        except requests.RequestException:
+            error = 'connection'
+        records.append((name, (time.time() - due) * 1000, status, error))
+
+
+def percentile(samples, fraction):
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 2)
+
+
+def summarize(records, wall):
+    ops = {}
+    errors = {}
+    for name, latency, status, error in records:
+        op = ops.setdefault(name, {'latencies': [], 'ok': 0, 'errors': 0})
+        op['latencies'].append(latency)
+        if error:
+            op['errors'] += 1
+            errors[error] = errors.get(error, 0) + 1
+        else:
+            op['ok'] += 1
+    report = {}
+    for name, op in sorted(ops.items()):
+        samples = sorted(op['latencies'])
+        report[name] = {'count': len(samples), 'ok': op['ok'], 'errors': op['errors'],
+                        'p50_ms': round(statistics.median(samples), 2), 'p95_ms': percentile(samples, 0.95),
+                        'p99_ms': percentile(samples, 0.99), 'max_ms': round(samples[-1], 2)}
+    ok = sum(op['ok'] for op in ops.values())
+    return {'requests': len(records), 'throughput_rps': round(len(records) / wall, 1),
+            'ok_rps': round(ok / wall, 1), 'operations': report, 'errors': errors}
+
+
+def server_errors(path):
+    """Classify the 'Error ...' messages the views print before answering 500.
+
+    SQLAlchemy continues a message on lines starting with '(' or '[', so
+    those are read as part of the error above them.
+    """
+    messages = []
+    with open(path, errors='replace') as f:
+        for line in f:
+            if line.startswith('Error'):
+                messages.append(line)
+            elif messages and line.startswith(('(', '[')):
+                messages[-1] += line
+    errors = {}
+    for message in messages:
+        error = classify(None, message)
+        errors[error] = errors.get(error, 0) + 1
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/load_bench.db'))
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--worker-class', default=os.getenv('GUNICORN_WORKER_CLASS', 'gthread'),
+                        help='sync, gthread or gevent (see gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, default=16, help='threads per gthread worker')
+    parser.add_argument('--clients', type=int, default=8, help='load generator processes')
+    parser.add_argument('--rate', type=float, default=50, help='requests per second, all clients together')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'weighted operations (default {DEFAULT_MIX})')
+    parser.add_argument('--hot', type=int, default=2, help='number of (grain, godown) rows the bills hit')
+    parser.add_argument('--generate', type=int, default=2000, help='purchases and sales to seed an empty database')
+    parser.add_argument('--bind', default='127.0.0.1:8765')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write the report to this JSON file')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    # The server and this process must see the same database and JWT secret
+    env = dict(os.environ, DATABASE_URL=args.url, JWT_SECRET_KEY=JWT_SECRET, PYTHONUNBUFFERED='1',
+               GUNICORN_WORKER_CLASS=args.worker_class, GUNICORN_THREADS=str(args.threads))
+    os.environ.update(DATABASE_URL=args.url, JWT_SECRET_KEY=JWT_SECRET)
+    token, pairs = prepare(args.url, args.generate, args.hot, seed=args.seed)
+    if not pairs:
+        raise SystemExit('No stock rows to put load on')
+
+    log = tempfile.NamedTemporaryFile('w+', prefix='load-server-', suffix='.log', delete=False)
+    server = start_server(args.workers, args.bind, env, log)
+    try:
+        start_at = time.time() + 1
+        jobs = [(index, args.clients, f'http://{args.bind}', token, mix, args.rate, args.duration,
+                 start_at, pairs, args.seed) for index in range(args.clients)]
+        with multiprocessing.Pool(args.clients) as pool:
+            records = [record for chunk in pool.starmap(client, jobs) for record in chunk]
+        wall = max(args.duration, time.time() - start_at)
+    finally:
+        server.terminate()
+        server.wait(30)
+        log.close()
+
+    report = summarize(records, wall)
+    report['server_errors'] = server_errors(log.name)
+    both = [report['errors'], report['server_errors']]
+    report['lock_errors'] = max(errors.get('lock', 0) for errors in both)
+    report['deadlocks'] = max(errors.get('deadlock', 0) for errors in both)
+    report['bill_number_collisions'] = max(errors.get('bill_number_collision', 0) for errors in both)
+    report['inventory_drift_pairs'] = check_inventory()
+    report['meta'] = {'url': args.url, 'workers': args.workers, 'worker_class': args.worker_class,
+                      'threads': args.threads, 'clients': args.clients, 'rate': args.rate,
+                      'duration': args.duration, 'mix': mix, 'hot_pairs': pairs, 'server_log': log.name,
+                      'run_at': datetime.utcnow().isoformat()}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Latency benchmark for /api/search style queries on a large bill table.
+
+Bulk-inserts synthetic sales and purchases (the triggers fill the FTS index
+and fill_keys() adds the name keys, as they would in production), then times
+ranked search and suggest queries.
+
+    cd backend && python -m benchmarks.search --bills 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Grain, Sale, Purchase
+from utils import search
+
+NAMES = ['Ramesh', 'Suresh', 'Mohan', 'Shyam', 'Gopal', 'Vijay', 'Anil', 'Lakshmi', 'Rajesh', 'Sunil',
+         'रमेश', 'सुरेश', 'मोहन', 'श्याम', 'गोपाल', 'विजय']
+SUFFIXES = ['Traders', 'Agro', 'Kumar', 'Lal', 'Enterprises', 'ट्रेडर्स', 'एंड संस', '']
+QUERIES = ['ramesh', 'रमेश', 'shyam tra', 'SB-2024', 'MP09', 'gop', 'lakshmi agro', 'विजय', 'LR12', '27AB']
+
+
+def build_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    search.init_app(app)
+    return app
+
+
+def populate(bills, seed, batch=20000):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    db.session.execute(Grain.__table__.insert(), [{'id': 1, 'name': 'Wheat'}])
+    sales, purchases = [], []
+    for i in range(bills):
+        name = f"{rng.choice(NAMES)} {rng.choice(SUFFIXES)}".strip()
+        when = start + timedelta(minutes=rng.randrange(60 * 24 * 365 * 5))
+        if i % 2:
+            sales.append({
+                'id': i, 'bill_number': f"SB-{when:%Y%m%d}-{i:07d}", 'grain_id': 1,
+                'buyer_name': name, 'number_of_bags': 10, 'total_weight': 500, 'rate_per_kg': 25,
+                'total_amount': 12500, 'transportation_mode': 'truck',
+                'vehicle_number': f"MP{rng.randrange(1, 70):02d} {rng.choice('ABCDEFGH')}{rng.choice('ABCDEFGH')} {rng.randrange(10000):04d}",
+                'driver_name': 'Driver', 'lr_number': f"LR{rng.randrange(100000)}",
+                'po_number': f"PO{rng.randrange(100000)}", 'buyer_gst': f"{rng.randrange(10, 38)}AB{rng.randrange(10**6):06d}",
+                'sale_date': when,
+            })
+        else:
+            purchases.append({
+                'id': i, 'bill_number': f"PB-{when:%Y%m%d}-{i:07d}", 'grain_id': 1, 'godown_id': 1,
+                'number_of_bags': 10, 'weight_per_bag': 50, 'rate_per_kg': 20, 'total_weight': 500,
+                'total_amount': 10000, 'payment_status': 'pending', 'supplier_name': name,
+                'purchase_date': when,
+            })
+        if len(sales) + len(purchases) >= batch or i == bills - 1:
+            # Core inserts skip the ORM flush that fills in name keys
+            connection = db.session.connection()
+            if sales:
+                db.session.execute(Sale.__table__.insert(), sales)
+                search.fill_keys(connection, 'sale', [(row['id'], row['buyer_name']) for row in sales])
+            if purchases:
+                db.session.execute(Purchase.__table__.insert(), purchases)
+                search.fill_keys(connection, 'purchase', [(row['id'], row['supplier_name']) for row in purchases])
+            db.session.commit()
+            sales, purchases = [], []
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {'p50_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/search_bench.db'))
+    parser.add_argument('--bills', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help='query an existing database without reloading')
+    args = parser.parse_args()
+
+    app = build_app(args.url)
+    with app.app_context():
+        load_seconds = 0
+        if not args.reuse:
+            # bill_search is not in the metadata, so drop_all would leave it behind
+            if db.engine.dialect.name == 'sqlite':
+                for statement in search.sqlite_drop_ddl():
+                    db.session.execute(text(statement))
+                db.session.commit()
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            populate(args.bills, args.seed)
+            load_seconds = time.perf_counter() - started
+
+        results = {}
+        for query in QUERIES:
+            results[query] = {
+                'search': timed(lambda: search.search_bills(query, limit=20), args.repeat),
+                'suggest': timed(lambda: search.suggest(query), args.repeat),
+                'hits_first_page': len(search.search_bills(query, limit=20)[0]),
+            }
+        print(json.dumps({'bills': args.bills, 'load_seconds': round(load_seconds, 1),
+                          'queries': results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Encode-time and bytes-on-the-wire benchmark for the sales list.
+
+Compares the legacy per-endpoint dict comprehension + stdlib json against the
+precompiled row serializer with each registered JSON backend, then reports the
+payload size raw, gzipped and (when installed) brotli-compressed.
+
+    cd backend && python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from blueprints.sale import sale_list_row
+from utils.compression import brotli, compress
+from utils.serialization import JSON_BACKENDS
+
+
+def make_sales(count):
+    start = datetime(2024, 4, 1, 9, 30)
+    grains = [SimpleNamespace(name=name) for name in ('Wheat', 'Rice', 'Corn', 'Barley', 'Soybean')]
+    sales = []
+    for i in range(count):
+        when = start + timedelta(minutes=17 * i)
+        bags = 20 + i % 180
+        weight = bags * 50.0
+        rate = 21.5 + (i % 40) * 0.25
+        sales.append(SimpleNamespace(
+            id=i + 1,
+            bill_number=f'SB-{when:%Y%m%d}-{i % 10000:04d}',
+            grain=grains[i % len(grains)],
+            buyer_name=f'Buyer {i % 700}',
+            number_of_bags=bags,
+            total_weight=weight,
+            rate_per_kg=rate,
+            total_amount=weight * rate,
+            sale_date=when,
+            created_at=when,
+            payment_status='paid' if i % 3 else 'pending'
+        ))
+    return sales
+
+
+def legacy_encode(sales):
+    return json.dumps([{
+        'id': sale.id,
+        'bill_number': sale.bill_number,
+        'grain_name': sale.grain.name,
+        'buyer_name': sale.buyer_name,
+        'number_of_bags': sale.number_of_bags,
+        'total_weight': sale.total_weight,
+        'rate_per_kg': sale.rate_per_kg,
+        'total_amount': sale.total_amount,
+        'sale_date': sale.sale_date.isoformat(),
+        'created_at': sale.created_at.isoformat(),
+        'payment_status': sale.payment_status
+    } for sale in sales]).encode('utf-8')
+
+
+def best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def run(rows, repeat):
+    sales = make_sales(rows)
+    encoders = {'legacy dict + json': lambda: legacy_encode(sales)}
+    for name, dumps in JSON_BACKENDS.items():
+        encoders[f'row_serializer + {name}'] = lambda dumps=dumps: dumps(sale_list_row.many(sales))
+
+    results = []
+    for name, fn in encoders.items():
+        seconds, body = best_of(fn, repeat)
+        sizes = {'identity': len(body), 'gzip': len(compress(body, 'gzip', 6))}
+        if brotli is not None:
+            sizes['br'] = len(compress(body, 'br', 6))
+        results.append({'encoder': name, 'encode_ms': round(seconds * 1000, 2), 'bytes': sizes})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'Sales list, {args.rows} rows (best of {args.repeat})')
+    for result in results:
+        sizes = ', '.join(f'{encoding}={size:,}B' for encoding, size in result['bytes'].items())
+        print(f"  {result['encoder']:<28} {result['encode_ms']:>8.2f} ms   {sizes}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Requests in flight and memory per connection for each gunicorn worker mode.
+
+Starts a single worker in each mode (sync, gthread, and gevent when it is
+installed) and opens --streams concurrent /api/events streams, the app's
+longest-held requests, standing in for any request parked on a slow
+outbound call. For each mode it reports how many streams the one worker
+holds open at once, whether a plain GET still gets through meanwhile, and
+the worker's resident memory growth per open connection. Linux only (reads
+/proc), entirely local.
+
+    cd backend && python -m benchmarks.serving --streams 50
+"""
+import argparse
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+import requests
+
+from benchmarks.load import JWT_SECRET, prepare, start_server
+
+MODES = ['sync', 'gthread', 'gevent']
+
+
+def rss_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def worker_pid(master):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == master:
+                        return int(entry)
+            except (OSError, ValueError, IndexError):
+                continue
+        time.sleep(0.1)
+    raise SystemExit('gunicorn worker did not start')
+
+
+def open_streams(base, token, count, wait):
+    """Open `count` event streams; returns (open responses, seconds to first byte of each)"""
+    opened, first_bytes, lock = [], [], threading.Lock()
+
+    def connect():
+        started = time.perf_counter()
+        try:
+            response = requests.get(f'{base}/api/events', params={'jwt': token}, stream=True, timeout=(wait, wait))
+            if response.status_code != 200:
+                response.close()
+                return
+            next(response.iter_content(chunk_size=None))
+        except (requests.RequestException, StopIteration):
+            return
+        with lock:
+            opened.append(response)
+            first_bytes.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=connect, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(wait * 2 + 1)
+    return opened, first_bytes
+
+
+def run_mode(mode, args, token, env):
+    # Lift the per-worker stream cap: the point is how many the worker model itself can hold
+    env = dict(env, GUNICORN_WORKER_CLASS=mode, GUNICORN_THREADS=str(args.threads),
+               EVENTS_MAX_SUBSCRIBERS=str(args.streams))
+    log = tempfile.NamedTemporaryFile('w+', prefix=f'serving-{mode}-', suffix='.log', delete=False)
+    server = start_server(1, args.bind, env, log)
+    base = f'http://{args.bind}'
+    streams, pid = [], None
+    try:
+        pid = worker_pid(server.pid)
+        requests.get(f'{base}/api/health', timeout=5)
+        baseline = rss_kib(pid)
+        streams, first_bytes = open_streams(base, token, args.streams, args.wait)
+        started = time.perf_counter()
+        try:
+            requests.get(f'{base}/api/health', timeout=args.wait)
+            health_ms = round((time.perf_counter() - started) * 1000, 2)
+        except requests.RequestException:
+            health_ms = None
+        grown = rss_kib(pid) - baseline
+        with open(f'/proc/{pid}/status') as f:
+            threads = next(int(line.split()[1]) for line in f if line.startswith('Threads:'))
+        return {
+            'mode': mode,
+            'streams_requested': args.streams,
+            'streams_open': len(streams),
+            'health_ms_while_open': health_ms,
+            'worker_threads': threads,
+            'rss_base_kib': baseline,
+            'rss_per_stream_kib': round(grown / len(streams), 1) if streams else None,
+            'first_byte_p50_ms': round(sorted(first_bytes)[len(first_bytes) // 2] * 1000, 2) if first_bytes else None,
+        }
+    finally:
+        for response in streams:
+            response.close()
+        # A sync worker stuck in a stream would sit out the whole graceful timeout
+        if pid:
+            os.kill(pid, signal.SIGKILL)
+        server.terminate()
+        server.wait(30)
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/serving_bench.db'))
+    parser.add_argument('--streams', type=int, default=50, help='concurrent long-lived requests to open')
+    parser.add_argument('--threads', type=int, default=64, help='threads for the gthread worker')
+    parser.add_argument('--wait', type=float, default=3, help='seconds a connection may take to be served')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--bind', default='127.0.0.1:8766')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=args.url, JWT_SECRET_KEY=JWT_SECRET, PYTHONUNBUFFERED='1')
+    os.environ.update(DATABASE_URL=args.url, JWT_SECRET_KEY=JWT_SECRET)
+    # The stream closes when its token expires, so this one needs an expiry
+    token, _ = prepare(args.url, 200, 1, expires=timedelta(hours=1))
+
+    results = []
+    for mode in args.modes.split(','):
+        if mode == 'gevent':
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print('gevent is not installed, skipping')
+                continue
+        results.append(run_mode(mode, args, token, env))
+        print(json.dumps(results[-1]))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Cold-start cost of the app: import time and what gets imported.
+
+Starts a fresh interpreter per run, imports `wsgi` (which builds the app the
+way a gunicorn worker does) under `-X importtime`, and reports the median
+wall time, the slowest imports by cumulative time, and whether any of the
+modules that should load on first use (openai, pywebpush, ...) were pulled
+in at startup. --check exits non-zero on a lazy module imported at startup
+or a median over --budget-ms, so CI can run it.
+
+    cd backend && python -m benchmarks.startup --runs 5
+    cd backend && python -m benchmarks.startup --check --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use only: voice bills, web push, OpenAI error mapping
+LAZY = ['openai', 'httpx', 'pywebpush', 'py_vapid', 'http_ece', 'flask_mail']
+PROBE = ("import json, sys, time\n"
+         "started = time.perf_counter()\n"
+         "import wsgi\n"
+         "elapsed = time.perf_counter() - started\n"
+         "print(json.dumps({'ms': elapsed * 1000, 'lazy': [m for m in %r if m in sys.modules]}))" % LAZY)
+
+
+def parse_importtime(text):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative))
+    return modules
+
+
+def run_once(env):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=BACKEND, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise SystemExit(f'Importing wsgi failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--check', action='store_true', help='fail on a lazy import or a blown budget')
+    parser.add_argument('--budget-ms', type=float, default=0, help='maximum median startup with --check')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    # Never touch a real database: the app only connects on first query anyway
+    env = dict(os.environ, DATABASE_URL='sqlite:////tmp/startup_bench.db', PYTHONDONTWRITEBYTECODE='1')
+    runs, modules, lazy = [], {}, set()
+    for _ in range(args.runs):
+        probe, modules = run_once(env)
+        runs.append(probe['ms'])
+        lazy.update(probe['lazy'])
+
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    results = {
+        'median_ms': round(statistics.median(runs), 1),
+        'min_ms': round(min(runs), 1),
+        'modules_imported': len(modules),
+        'lazy_imported_at_startup': sorted(lazy),
+        'slowest': [{'module': name, 'self_ms': round(self_us / 1000, 1), 'cumulative_ms': round(total / 1000, 1)}
+                    for name, (self_us, total) in slowest],
+    }
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        failures = [f'{name} imported at startup' for name in results['lazy_imported_at_startup']]
+        if args.budget_ms and results['median_ms'] > args.budget_ms:
+            failures.append(f"median startup {results['median_ms']} ms exceeds {args.budget_ms} ms")
+        if failures:
+            raise SystemExit('; '.join(failures))
+
+
+if __name__ == '__main__':
+    main()
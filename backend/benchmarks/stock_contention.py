@@ -0,0 +1,159 @@
+"""Contention benchmark for multi-godown stock deduction.
+
+Runs concurrent "sales" against the same hot (grain, godown) rows using the
+legacy per-godown SELECT ... FOR UPDATE loop and the set-based conditional
+UPDATE from utils.stock, then checks that no bags were oversold.
+
+    cd backend && python -m benchmarks.stock_contention --url sqlite:////tmp/contention.db
+    cd backend && python -m benchmarks.stock_contention --url postgresql://localhost/grain_bench
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError, DBAPIError
+
+from models import Grain, Godown, BagInventory
+from utils.stock import deduction_statement
+
+TABLES = [Grain.__table__, Godown.__table__, BagInventory.__table__]
+inventory = BagInventory.__table__
+
+
+def setup(engine, godowns, bags_per_godown):
+    for table in reversed(TABLES):
+        table.drop(engine, checkfirst=True)
+    for table in TABLES:
+        table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(Grain.__table__.insert(), [{'id': 1, 'name': 'Wheat'}])
+        conn.execute(Godown.__table__.insert(), [
+            {'id': i, 'name': f'Godown {i}', 'capacity': None} for i in range(1, godowns + 1)
+        ])
+        conn.execute(inventory.insert(), [
+            {'grain_id': 1, 'godown_id': i, 'number_of_bags': bags_per_godown}
+            for i in range(1, godowns + 1)
+        ])
+
+
+def legacy_sale(conn, allocations):
+    for godown_id, bags in allocations.items():
+        row = conn.execute(
+            select(inventory.c.id, inventory.c.number_of_bags)
+            .where(inventory.c.grain_id == 1, inventory.c.godown_id == godown_id)
+            .with_for_update()
+        ).first()
+        if row is None or row.number_of_bags < bags:
+            return False
+        conn.execute(
+            inventory.update().where(inventory.c.id == row.id)
+            .values(number_of_bags=row.number_of_bags - bags)
+        )
+    return True
+
+
+def set_based_sale(conn, allocations):
+    result = conn.execute(deduction_statement(1, allocations))
+    return result.rowcount == len(allocations)
+
+
+STRATEGIES = {'legacy': legacy_sale, 'set-based': set_based_sale}
+
+
+def classify(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    if 'deadlock' in message:
+        return 'deadlock'
+    if 'locked' in message or 'lock timeout' in message or 'could not serialize' in message:
+        return 'lock'
+    return type(getattr(error, 'orig', error)).__name__
+
+
+def run_strategy(engine, name, threads, sales_per_thread, godowns, bags_per_godown, seed):
+    setup(engine, godowns, bags_per_godown)
+    sale_fn = STRATEGIES[name]
+    latencies, errors, sold = [], {}, [0]
+    outcomes = {'ok': 0, 'insufficient': 0}
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        for _ in range(sales_per_thread):
+            picked = rng.sample(range(1, godowns + 1), k=min(godowns, rng.randint(1, 3)))
+            allocations = {godown_id: rng.randint(1, 5) for godown_id in picked}
+            started = time.perf_counter()
+            outcome, error = None, None
+            try:
+                with engine.begin() as conn:
+                    if sale_fn(conn, allocations):
+                        outcome = 'ok'
+                    else:
+                        outcome = 'insufficient'
+                        raise _Rollback()
+            except _Rollback:
+                pass
+            except (OperationalError, DBAPIError) as e:
+                error = classify(e)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+                else:
+                    outcomes[outcome] += 1
+                    if outcome == 'ok':
+                        sold[0] += sum(allocations.values())
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        remaining = conn.execute(select(inventory.c.number_of_bags)).scalars().all()
+
+    latencies.sort()
+    return {
+        'strategy': name,
+        'transactions': len(latencies),
+        'throughput_tps': round(len(latencies) / wall, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        'outcomes': outcomes,
+        'errors': errors,
+        'negative_rows': sum(1 for bags in remaining if bags < 0),
+        'consistent': sum(remaining) == godowns * bags_per_godown - sold[0],
+    }
+
+
+class _Rollback(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/stock_contention.db'))
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--sales', type=int, default=200, help='sales per thread')
+    parser.add_argument('--godowns', type=int, default=4, help='number of hot godown rows')
+    parser.add_argument('--bags', type=int, default=20000, help='starting bags per godown')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url, pool_size=args.threads, max_overflow=0) \
+        if not args.url.startswith('sqlite') else create_engine(args.url, connect_args={'timeout': 5})
+    results = [run_strategy(engine, name, args.threads, args.sales, args.godowns, args.bags, args.seed)
+               for name in STRATEGIES]
+    print(json.dumps({'url': engine.url.render_as_string(hide_password=True), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
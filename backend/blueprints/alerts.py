@@ -0,0 +1,157 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from datetime import datetime
+from models import db, AlertRule, AlertState, Godown, Grain, Permission, StockAlert, StockThreshold
+from utils.alerts import evaluate_all, LIMITS
+from utils.http_cache import bump, conditional
+from utils.permissions import require_permission
+from utils.serialization import json_response, row_serializer
+
+alerts = Blueprint('alerts', __name__)
+
+threshold_row = row_serializer('id', 'grain_id', 'godown_id', *LIMITS, 'updated_at')
+
+MAX_LIMIT = 500
+
+
+@alerts.route('/alerts', methods=['GET'])
+@jwt_required()
+@conditional('alerts')
+def get_alerts():
+    """Alert feed, newest change first. Params: state (open/resolved/all, default
+    open), rule, grain_id, godown_id, since (ISO time of last change), limit"""
+    try:
+        state = request.args.get('state', AlertState.OPEN.value)
+        rule = request.args.get('rule')
+        if state != 'all' and state not in [s.value for s in AlertState]:
+            return jsonify({'error': 'state must be open, resolved or all'}), 400
+        if rule and rule not in [r.value for r in AlertRule]:
+            return jsonify({'error': f"Invalid rule. Must be one of: {', '.join(r.value for r in AlertRule)}"}), 400
+        try:
+            grain_id = request.args.get('grain_id', type=int)
+            godown_id = request.args.get('godown_id', type=int)
+            since = request.args.get('since')
+            since = datetime.fromisoformat(since) if since else None
+            limit = min(MAX_LIMIT, max(1, int(request.args.get('limit', 100))))
+        except ValueError:
+            return jsonify({'error': 'Invalid since or limit'}), 400
+
+        query = db.session.query(
+            StockAlert, Grain.name.label('grain_name'), Godown.name.label('godown_name')
+        ).outerjoin(
+            Grain, StockAlert.grain_id == Grain.id
+        ).outerjoin(
+            Godown, StockAlert.godown_id == Godown.id
+        )
+        if state != 'all':
+            query = query.filter(StockAlert.state == state)
+        if rule:
+            query = query.filter(StockAlert.rule == rule)
+        if grain_id:
+            query = query.filter(StockAlert.grain_id == grain_id)
+        if godown_id:
+            query = query.filter(StockAlert.godown_id == godown_id)
+        if since:
+            query = query.filter(StockAlert.updated_at > since)
+        rows = query.order_by(StockAlert.updated_at.desc(), StockAlert.id.desc()).limit(limit).all()
+
+        return json_response([{
+            'id': alert.id,
+            'rule': alert.rule,
+            'state': alert.state,
+            'grain_id': alert.grain_id,
+            'grain_name': grain_name,
+            'godown_id': alert.godown_id,
+            'godown_name': godown_name,
+            'value': alert.value,
+            'threshold': alert.threshold,
+            'opened_at': alert.opened_at,
+            'resolved_at': alert.resolved_at,
+            'updated_at': alert.updated_at
+        } for alert, grain_name, godown_name in rows])
+
+    except Exception as e:
+        print(f"Error fetching alerts: {str(e)}")
+        return jsonify({'error': 'Failed to fetch alerts'}), 500
+
+
+@alerts.route('/alerts/thresholds', methods=['GET'])
+@jwt_required()
+@conditional('alerts')
+def get_thresholds():
+    try:
+        thresholds = StockThreshold.query.order_by(StockThreshold.grain_id, StockThreshold.godown_id).all()
+        return json_response(threshold_row.many(thresholds))
+    except Exception as e:
+        print(f"Error fetching thresholds: {str(e)}")
+        return jsonify({'error': 'Failed to fetch thresholds'}), 500
+
+
+@alerts.route('/alerts/thresholds', methods=['PUT'])
+@jwt_required()
+@require_permission(Permission.MANAGE_INVENTORY.value)
+def set_threshold():
+    """Create or replace the limits for a grain and/or godown (omit both for
+    the global row) and re-check the stock it covers"""
+    try:
+        data = request.get_json() or {}
+        grain_id = data.get('grain_id')
+        godown_id = data.get('godown_id')
+        if grain_id is not None and not Grain.query.get(grain_id):
+            return jsonify({'error': 'Grain not found'}), 404
+        if godown_id is not None and not Godown.query.get(godown_id):
+            return jsonify({'error': 'Godown not found'}), 404
+        if grain_id is not None and data.get('max_fill_pct') is not None:
+            return jsonify({'error': 'max_fill_pct applies to a whole godown; omit grain_id'}), 400
+
+        limits = {}
+        try:
+            for field in LIMITS:
+                value = data.get(field)
+                limits[field] = None if value is None else (int if field in ('min_bags', 'velocity_days') else float)(value)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Limits must be numbers'}), 400
+        if any(value is not None and value < 0 for value in limits.values()) or limits['velocity_days'] == 0:
+            return jsonify({'error': 'Limits must be positive'}), 400
+
+        threshold = StockThreshold.query.filter(
+            StockThreshold.grain_id.is_(None) if grain_id is None else StockThreshold.grain_id == grain_id,
+            StockThreshold.godown_id.is_(None) if godown_id is None else StockThreshold.godown_id == godown_id
+        ).first()
+        if threshold is None:
+            threshold = StockThreshold(grain_id=grain_id, godown_id=godown_id)
+            db.session.add(threshold)
+        for field, value in limits.items():
+            setattr(threshold, field, value)
+        db.session.flush()
+
+        opened = evaluate_all(grain_id=grain_id, godown_id=godown_id)
+        bump('alerts')
+        db.session.commit()
+
+        return json_response(dict(threshold_row(threshold), opened_alerts=opened))
+
+    except Exception as e:
+        print(f"Error saving threshold: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to save threshold'}), 500
+
+
+@alerts.route('/alerts/thresholds/<int:threshold_id>', methods=['DELETE'])
+@jwt_required()
+@require_permission(Permission.MANAGE_INVENTORY.value)
+def delete_threshold(threshold_id):
+    try:
+        threshold = StockThreshold.query.get_or_404(threshold_id)
+        grain_id, godown_id = threshold.grain_id, threshold.godown_id
+        db.session.delete(threshold)
+        db.session.flush()
+        evaluate_all(grain_id=grain_id, godown_id=godown_id)
+        bump('alerts')
+        db.session.commit()
+        return jsonify({'message': 'Threshold deleted'})
+
+    except Exception as e:
+        print(f"Error deleting threshold: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to delete threshold'}), 500
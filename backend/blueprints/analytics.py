@@ -0,0 +1,224 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from models import Grain, Godown, Party, LotConsumption, PriceBucket, db
+from sqlalchemy import func, case
+from datetime import datetime, timedelta
+from utils.costing import costing_method
+from utils.http_cache import conditional
+from utils.money import kilos, money
+from utils.replica import replica_read
+from utils.periods import period_bucket, PERIODS
+from utils.serialization import json_response
+
+analytics = Blueprint('analytics', __name__)
+
+MARGIN_GROUPS = ('grain', 'godown', 'buyer', 'period')
+PRICE_SIDES = ('buy', 'sell')
+# Rough bucket lengths in days, used to pick a bucket for bucket=auto
+BUCKET_DAYS = (('day', 1), ('week', 7), ('month', 30))
+
+
+def _parse_day(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+@analytics.route('/analytics/margins', methods=['GET'])
+@jwt_required()
+@replica_read()
+def get_margins():
+    """Realized margin grouped by grain, godown, buyer or period.
+
+    Aggregates the lot consumption rows written with each sale, so nothing is
+    recomputed from purchase history at read time. Optional filters: from, to,
+    grain_id, godown_id, party_id; period (day/week/month) for group_by=period.
+    """
+    try:
+        group_by = request.args.get('group_by', 'grain')
+        period = request.args.get('period', 'month')
+        if group_by not in MARGIN_GROUPS:
+            return jsonify({'error': f"Invalid group_by. Must be one of: {', '.join(MARGIN_GROUPS)}"}), 400
+        if period not in PERIODS:
+            return jsonify({'error': f"Invalid period. Must be one of: {', '.join(PERIODS)}"}), 400
+        try:
+            start = _parse_day(request.args.get('from'))
+            end = _parse_day(request.args.get('to'))
+            filters = {key: request.args.get(key, type=int)
+                       for key in ('grain_id', 'godown_id', 'party_id') if request.args.get(key)}
+        except ValueError:
+            return jsonify({'error': 'Invalid filter value'}), 400
+
+        if group_by == 'grain':
+            key, label, join = LotConsumption.grain_id, Grain.name, (Grain, Grain.id == LotConsumption.grain_id)
+        elif group_by == 'godown':
+            key, label, join = LotConsumption.godown_id, Godown.name, (Godown, Godown.id == LotConsumption.godown_id)
+        elif group_by == 'buyer':
+            key, label, join = LotConsumption.party_id, Party.name, (Party, Party.id == LotConsumption.party_id)
+        else:
+            key = label = period_bucket(LotConsumption.sale_date, period)
+            join = None
+
+        query = db.session.query(
+            key.label('key'),
+            label.label('label'),
+            func.sum(LotConsumption.bags).label('bags'),
+            func.sum(LotConsumption.revenue).label('revenue'),
+            func.sum(LotConsumption.cost).label('cost'),
+            func.sum(LotConsumption.margin).label('margin'),
+            func.sum(case((LotConsumption.lot_id.is_(None), LotConsumption.bags), else_=0)).label('unattributed_bags')
+        )
+        if join is not None:
+            query = query.outerjoin(*join)
+        if start:
+            query = query.filter(LotConsumption.sale_date >= start)
+        if end:
+            query = query.filter(LotConsumption.sale_date < end + timedelta(days=1))
+        for column, value in filters.items():
+            query = query.filter(getattr(LotConsumption, column) == value)
+        query = query.group_by(key, label)
+        query = query.order_by(key) if group_by == 'period' else query.order_by(func.sum(LotConsumption.margin).desc())
+
+        rows = []
+        totals = {'bags': 0, 'revenue': 0, 'cost': 0, 'margin': 0, 'unattributed_bags': 0}
+        for row in query.all():
+            entry = {
+                'key': row.key,
+                'label': row.label,
+                'bags': int(row.bags or 0),
+                'revenue': row.revenue or 0,
+                'cost': row.cost or 0,
+                'margin': row.margin or 0,
+                'unattributed_bags': int(row.unattributed_bags or 0),
+            }
+            # Margin % is over the revenue whose cost is known
+            attributed_revenue = entry['cost'] + entry['margin']
+            entry['margin_pct'] = round(entry['margin'] * 100 / attributed_revenue, 2) if attributed_revenue else None
+            rows.append(entry)
+            for total in totals:
+                totals[total] += entry[total]
+        for total in ('revenue', 'cost', 'margin'):
+            totals[total] = money(totals[total])
+
+        return json_response({
+            'group_by': group_by,
+            'period': period if group_by == 'period' else None,
+            'method': costing_method(),
+            'rows': rows,
+            'totals': totals
+        })
+
+    except Exception as e:
+        print(f"Error fetching margins: {str(e)}")
+        return jsonify({'error': 'Failed to fetch margins'}), 500
+
+
+def _merge(points):
+    """Combine consecutive bucket summaries of one side into one"""
+    points = [point for point in points if point]
+    if not points:
+        return None
+    return {
+        'min': min(point['min'] for point in points),
+        'max': max(point['max'] for point in points),
+        'weight': kilos(sum(point['weight'] for point in points)),
+        'amount': money(sum(point['amount'] for point in points)),
+        'bills': sum(point['bills'] for point in points),
+    }
+
+
+def _downsample(series, max_points):
+    """Merge runs of adjacent buckets until at most max_points remain"""
+    if len(series) <= max_points:
+        return series
+    step = -(-len(series) // max_points)
+    merged = []
+    for start in range(0, len(series), step):
+        chunk = series[start:start + step]
+        merged.append({'period': chunk[0]['period'],
+                       **{side: _merge([point[side] for point in chunk]) for side in PRICE_SIDES}})
+    return merged
+
+
+@analytics.route('/analytics/prices', methods=['GET'])
+@jwt_required()
+@replica_read()
+@conditional('purchases', 'sales')
+def get_price_series():
+    """Buy/sell rate series for one grain from the daily price buckets.
+
+    Params: grain_id (required), from, to, bucket (day/week/month/auto),
+    max_points (default 400) and ma (moving-average window in buckets,
+    default 7). Each point has min/max/VWAP per side, a volume-weighted
+    moving average and the sell-buy VWAP spread.
+    """
+    try:
+        grain_id = request.args.get('grain_id', type=int)
+        if not grain_id:
+            return jsonify({'error': 'grain_id is required'}), 400
+        bucket = request.args.get('bucket', 'auto')
+        if bucket != 'auto' and bucket not in PERIODS:
+            return jsonify({'error': f"Invalid bucket. Must be one of: auto, {', '.join(PERIODS)}"}), 400
+        try:
+            start = _parse_day(request.args.get('from'))
+            end = _parse_day(request.args.get('to'))
+            max_points = max(10, int(request.args.get('max_points', 400)))
+            window = max(1, int(request.args.get('ma', 7)))
+        except ValueError:
+            return jsonify({'error': 'Invalid filter value'}), 400
+
+        query = db.session.query(PriceBucket).filter(PriceBucket.grain_id == grain_id)
+        if start:
+            query = query.filter(PriceBucket.day >= start.date())
+        if end:
+            query = query.filter(PriceBucket.day <= end.date())
+
+        if bucket == 'auto':
+            first, last = query.with_entities(func.min(PriceBucket.day), func.max(PriceBucket.day)).one()
+            if isinstance(first, str):
+                first, last = datetime.fromisoformat(first), datetime.fromisoformat(last)
+            span = (last - first).days + 1 if first else 0
+            bucket = next((name for name, days in BUCKET_DAYS if span / days <= max_points), 'month')
+
+        period = period_bucket(PriceBucket.day, bucket)
+        rows = query.with_entities(
+            period.label('period'),
+            PriceBucket.side,
+            func.min(PriceBucket.min_rate).label('min'),
+            func.max(PriceBucket.max_rate).label('max'),
+            func.sum(PriceBucket.weight).label('weight'),
+            func.sum(PriceBucket.amount).label('amount'),
+            func.sum(PriceBucket.bills).label('bills')
+        ).group_by(period, PriceBucket.side).order_by(period).all()
+
+        by_period = {}
+        for row in rows:
+            point = by_period.setdefault(str(row.period), {'period': str(row.period), 'buy': None, 'sell': None})
+            point[row.side] = {'min': row.min, 'max': row.max, 'weight': row.weight or 0,
+                               'amount': row.amount or 0, 'bills': int(row.bills or 0)}
+        series = _downsample(list(by_period.values()), max_points)
+
+        # Volume-weighted moving average over the trailing `window` buckets
+        for side in PRICE_SIDES:
+            trailing = []
+            for point in series:
+                summary = point[side]
+                trailing = (trailing + [summary])[-window:]
+                if summary:
+                    weight = sum(item['weight'] for item in trailing if item)
+                    amount = sum(item['amount'] for item in trailing if item)
+                    summary['vwap'] = summary['amount'] / summary['weight'] if summary['weight'] else None
+                    summary['moving_average'] = amount / weight if weight else None
+        for point in series:
+            buy, sell = point['buy'], point['sell']
+            point['spread'] = sell['vwap'] - buy['vwap'] \
+                if buy and sell and buy['vwap'] is not None and sell['vwap'] is not None else None
+
+        return json_response({
+            'grain_id': grain_id,
+            'bucket': bucket,
+            'moving_average_window': window,
+            'series': series
+        })
+
+    except Exception as e:
+        print(f"Error fetching price series: {str(e)}")
+        return jsonify({'error': 'Failed to fetch price series'}), 500
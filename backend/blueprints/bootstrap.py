@@ -0,0 +1,56 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from models import Grain, Godown
+from utils.http_cache import conditional
+from utils.serialization import json_response, row_serializer
+from utils.stock import stock_matrix
+
+bootstrap = Blueprint('bootstrap', __name__)
+
+grain_row = row_serializer('id', 'name')
+godown_row = row_serializer('id', 'name', 'location', 'capacity', 'created_at')
+
+
+def build_form_payload():
+    """Everything a bill entry screen needs for first paint.
+
+    Stock is sent as sparse [grain_id, godown_id, bags] triples; godown usage
+    comes from the used_bags counters.
+    """
+    matrix = stock_matrix()
+
+    godowns = []
+    for godown in Godown.query.order_by(Godown.name).all():
+        row = godown_row(godown)
+        row['used_bags'] = godown.used_bags
+        row['available_capacity'] = godown.capacity - godown.used_bags if godown.capacity else None
+        godowns.append(row)
+
+    return {
+        'grains': grain_row.many(Grain.query.order_by(Grain.name).all()),
+        'godowns': godowns,
+        'stock': [[grain_id, godown_id, bags]
+                  for (grain_id, godown_id), bags in sorted(matrix.items()) if bags],
+    }
+
+
+@bootstrap.route('/bootstrap/sale-form', methods=['GET'])
+@jwt_required()
+@conditional('grains', 'godowns', 'inventory')
+def get_sale_form_bootstrap():
+    try:
+        return json_response(build_form_payload())
+    except Exception as e:
+        print(f"Error fetching sale form bootstrap: {str(e)}")
+        return jsonify({'error': 'Failed to fetch form data'}), 500
+
+
+@bootstrap.route('/bootstrap/purchase-form', methods=['GET'])
+@jwt_required()
+@conditional('grains', 'godowns', 'inventory')
+def get_purchase_form_bootstrap():
+    try:
+        return json_response(build_form_payload())
+    except Exception as e:
+        print(f"Error fetching purchase form bootstrap: {str(e)}")
+        return jsonify({'error': 'Failed to fetch form data'}), 500
@@ -1,24 +1,28 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from models import Sale, Purchase, Inventory, Grain, db
-from sqlalchemy import func
+from sqlalchemy import func, type_coerce
 from datetime import datetime, timedelta
+from utils.archive import carried_totals, routed
+from utils.money import Money
+from utils.replica import replica_read
 
 dashboard = Blueprint('dashboard', __name__)
 
 @dashboard.route('/dashboard/metrics', methods=['GET'])
 @jwt_required()
+@replica_read()
 def get_dashboard_metrics():
     try:
-        # Get total sales
-        total_sales = db.session.query(
+        # Get total sales and purchases, with the closed years carried forward
+        carried = carried_totals()
+        total_sales = (db.session.query(
             func.sum(Sale.total_amount).label('total_amount')
-        ).scalar() or 0
+        ).scalar() or 0) + carried['sales_amount']
 
-        # Get total purchases
-        total_purchases = db.session.query(
+        total_purchases = (db.session.query(
             func.sum(Purchase.total_amount).label('total_amount')
-        ).scalar() or 0
+        ).scalar() or 0) + carried['purchases_amount']
 
         # Get total inventory
         total_inventory = db.session.query(
@@ -28,26 +32,27 @@ def get_dashboard_metrics():
         # Get active grains count
         active_grains = db.session.query(func.count(Grain.id)).scalar() or 0
 
-        # Get monthly data for chart
+        # Monthly totals by bill date, the same date the archive routes on
         now = datetime.now()
         start_date = now - timedelta(days=180)  # Last 6 months
+        sales, purchases = routed(Sale, start_date), routed(Purchase, start_date)
 
         monthly_sales = db.session.query(
-            func.strftime('%Y-%m', Sale.created_at).label('month'),
-            func.sum(Sale.total_amount).label('amount')
+            func.strftime('%Y-%m', sales.sale_date).label('month'),
+            func.sum(sales.total_amount).label('amount')
         ).filter(
-            Sale.created_at >= start_date
+            sales.sale_date >= start_date
         ).group_by(
-            func.strftime('%Y-%m', Sale.created_at)
+            func.strftime('%Y-%m', sales.sale_date)
         ).all()
 
         monthly_purchases = db.session.query(
-            func.strftime('%Y-%m', Purchase.created_at).label('month'),
-            func.sum(Purchase.total_amount).label('amount')
+            func.strftime('%Y-%m', purchases.purchase_date).label('month'),
+            func.sum(purchases.total_amount).label('amount')
         ).filter(
-            Purchase.created_at >= start_date
+            purchases.purchase_date >= start_date
         ).group_by(
-            func.strftime('%Y-%m', Purchase.created_at)
+            func.strftime('%Y-%m', purchases.purchase_date)
         ).all()
 
         # Format data for response
@@ -98,6 +103,7 @@ def get_dashboard_metrics():
 
 @dashboard.route('/dashboard/summary', methods=['GET'])
 @jwt_required()
+@replica_read()
 def get_dashboard_summary():
     try:
         # Get current date and start of month
@@ -118,7 +124,7 @@ def get_dashboard_summary():
 
         # Current inventory value
         inventory_value = db.session.query(
-            func.sum(Inventory.quantity * Purchase.rate_per_kg).label('total_value')
+            func.sum(type_coerce(Purchase.rate_per_kg * Inventory.quantity, Money())).label('total_value')
         ).join(
             Purchase, Purchase.grain_id == Inventory.grain_id
         ).first()
@@ -0,0 +1,59 @@
+import json
+import time
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import get_jwt, jwt_required
+from utils.events import TooManySubscribers, get_broker
+
+events = Blueprint('events', __name__)
+
+# Reconnect delay suggested to EventSource, in milliseconds
+RETRY_MS = 3000
+
+
+def _format(kind, event_id, payload):
+    lines = [f'event: {kind}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"data: {json.dumps(payload, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+@events.route('/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """Server-Sent Events stream of dashboard deltas.
+
+    Each committed bill, payment or stock change arrives as one `delta`
+    event; `resync` means events were missed and the client should refetch
+    /api/metrics. EventSource cannot send headers, so the token may be given
+    as ?jwt=. The stream closes when the token expires.
+    """
+    try:
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        try:
+            subscription = get_broker().subscribe(last_event_id)
+        except TooManySubscribers:
+            return jsonify({'error': 'Too many open event streams, poll /api/metrics instead'}), 503
+        broker = get_broker()
+        keepalive = current_app.config['EVENTS_KEEPALIVE']
+        expires_at = get_jwt()['exp']
+    except Exception as e:
+        print(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': 'Failed to open event stream'}), 500
+
+    def generate():
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            while time.time() < expires_at:
+                item = subscription.get(timeout=keepalive)
+                if item is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield _format(*item)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
@@ -1,54 +1,44 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import Godown, BagInventory, db
-from sqlalchemy import func
+from models import Godown, db
+from utils.http_cache import conditional
+from utils.serialization import json_response, row_serializer
 
 godown = Blueprint('godown', __name__)
 
+godown_row = row_serializer('id', 'name', 'location', 'capacity', 'created_at')
+
 @godown.route('/godowns', methods=['GET'])
 @jwt_required()
+@conditional('godowns')
 def get_godowns():
     try:
         godowns = Godown.query.all()
-        return jsonify([{
-            'id': godown.id,
-            'name': godown.name,
-            'location': godown.location,
-            'capacity': godown.capacity,
-            'created_at': godown.created_at.isoformat()
-        } for godown in godowns])
+        return json_response(godown_row.many(godowns))
     except Exception as e:
         print(f"Error fetching godowns: {str(e)}")
         return jsonify({'error': 'Failed to fetch godowns'}), 500
 
 @godown.route('/godowns/available', methods=['GET'])
 @jwt_required()
+@conditional('godowns', 'inventory')
 def get_available_godowns():
     try:
-        print("Fetching available godowns...")  # Debug log
-        
-        # Get all godowns with their current bag inventory
-        godowns_with_inventory = db.session.query(
-            Godown,
-            func.coalesce(func.sum(BagInventory.number_of_bags), 0).label('used_bags')
-        ).outerjoin(
-            BagInventory, Godown.id == BagInventory.godown_id
-        ).group_by(
-            Godown.id
-        ).all()
+        # used_bags is a counter maintained with every stock movement
+        godowns = Godown.query.order_by(Godown.id).all()
 
         response = [{
             'id': godown.id,
             'name': godown.name,
             'location': godown.location,
             'capacity': godown.capacity,
-            'available_capacity': godown.capacity - used_bags if godown.capacity else None,
-            'used_bags': used_bags,
-            'created_at': godown.created_at.isoformat()
-        } for godown, used_bags in godowns_with_inventory]
+            'available_capacity': godown.capacity - godown.used_bags if godown.capacity else None,
+            'used_bags': godown.used_bags,
+            'created_at': godown.created_at
+        } for godown in godowns]
 
         print(f"Found {len(response)} available godowns")  # Debug log
-        return jsonify(response)
+        return json_response(response)
         
     except Exception as e:
         print(f"Error fetching available godowns: {str(e)}")
@@ -1,18 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from models import Grain, db
+from utils.http_cache import conditional
+from utils.serialization import json_response, row_serializer
 
 grains = Blueprint('grains', __name__)
 
+grain_row = row_serializer('id', 'name')
+
 @grains.route('/grains', methods=['GET'])
 @jwt_required()
+@conditional('grains')
 def get_grains():
     try:
         grains = Grain.query.all()
-        return jsonify([{
-            'id': grain.id,
-            'name': grain.name
-        } for grain in grains]), 200
+        return json_response(grain_row.many(grains))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
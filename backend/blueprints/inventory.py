@@ -1,13 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import BagInventory, Grain, Godown, db, Inventory, Sale, Purchase
-from sqlalchemy import func
+from models import BagInventory, Grain, Godown, db, Inventory, Sale, Purchase, Party, AlertRule, AlertState, StockAlert
+from sqlalchemy import func, type_coerce
 from datetime import datetime
+from utils.http_cache import conditional
+from utils.money import Money
+from utils.replica import replica_read
+from utils.serialization import json_response
+from utils.serving import lock_at_first_write
+from utils.stock import merge_allocations, find_shortfalls
 
 inventory = Blueprint('inventory', __name__)
 
 @inventory.route('/inventory', methods=['GET'])
 @jwt_required()
+@conditional('grains', 'godowns', 'inventory')
 def get_inventory():
     try:
         # Query total bags and weight for each grain in each godown, grouped to avoid duplicates
@@ -16,7 +23,8 @@ def get_inventory():
             BagInventory.godown_id,
             Grain.name.label('grain_name'),
             Godown.name.label('godown_name'),
-            func.sum(BagInventory.number_of_bags).label('total_bags')
+            func.sum(BagInventory.number_of_bags).label('total_bags'),
+            func.max(BagInventory.last_updated).label('last_updated')
         ).join(
             Grain, BagInventory.grain_id == Grain.id
         ).join(
@@ -28,13 +36,13 @@ def get_inventory():
             Godown.name
         ).all()
 
-        return jsonify([{
+        return json_response([{
             'id': f"{item.grain_id}-{item.godown_id}",  # Composite ID
             'grain_name': item.grain_name,
             'godown_name': item.godown_name,
             'total_bags': item.total_bags,
             'total_weight': item.total_bags * 100,  # Assuming standard bag weight
-            'last_updated': datetime.utcnow().isoformat()
+            'last_updated': item.last_updated
         } for item in inventory_items])
 
     except Exception as e:
@@ -69,19 +77,48 @@ def get_inventory_history(grain_id):
 
 @inventory.route('/inventory/low-stock', methods=['GET'])
 @jwt_required()
+@conditional('alerts', 'inventory')
 def get_low_stock():
-    # Assuming low stock is less than 1000 units
-    low_stock_items = Inventory.query.filter(Inventory.quantity < 1000).all()
-    return jsonify([{
-        'id': item.id,
-        'grain_id': item.grain_id,
-        'grain_name': item.grain.name,
-        'quantity': item.quantity,
-        'last_updated': item.last_updated.isoformat()
-    } for item in low_stock_items])
+    """Stock rows with an open min-bags or days-of-cover alert (see /api/alerts)"""
+    try:
+        rows = db.session.query(
+            StockAlert,
+            Grain.name.label('grain_name'),
+            Godown.name.label('godown_name'),
+            func.coalesce(BagInventory.number_of_bags, 0).label('bags'),
+            BagInventory.last_updated
+        ).join(
+            Grain, StockAlert.grain_id == Grain.id
+        ).join(
+            Godown, StockAlert.godown_id == Godown.id
+        ).outerjoin(
+            BagInventory, (BagInventory.grain_id == StockAlert.grain_id) & (BagInventory.godown_id == StockAlert.godown_id)
+        ).filter(
+            StockAlert.state == AlertState.OPEN.value,
+            StockAlert.rule.in_([AlertRule.MIN_BAGS.value, AlertRule.DAYS_COVER.value])
+        ).order_by(Grain.name, Godown.name).all()
+
+        return json_response([{
+            'id': f"{alert.grain_id}-{alert.godown_id}",
+            'grain_id': alert.grain_id,
+            'grain_name': grain_name,
+            'godown_id': alert.godown_id,
+            'godown_name': godown_name,
+            'quantity': bags,
+            'rule': alert.rule,
+            'value': alert.value,
+            'threshold': alert.threshold,
+            'since': alert.opened_at,
+            'last_updated': last_updated
+        } for alert, grain_name, godown_name, bags, last_updated in rows])
+
+    except Exception as e:
+        print(f"Error fetching low stock: {str(e)}")
+        return jsonify({'error': 'Failed to fetch low stock'}), 500
 
 @inventory.route('/inventory/check-availability', methods=['POST'])
 @jwt_required()
+@lock_at_first_write
 def check_availability():
     try:
         data = request.get_json()
@@ -91,26 +128,21 @@ def check_availability():
         if not grain_id or not godown_details:
             return jsonify({'error': 'Missing required fields'}), 400
 
-        # Check each godown's availability
-        for detail in godown_details:
-            godown_id = detail.get('godown_id')
-            requested_bags = detail.get('number_of_bags')
+        try:
+            allocations = merge_allocations(godown_details)
+        except ValueError:
+            return jsonify({'error': 'Invalid godown details'}), 400
 
-            if not godown_id or not requested_bags:
-                return jsonify({'error': 'Invalid godown details'}), 400
-
-            inventory = BagInventory.query.filter_by(
-                grain_id=grain_id,
-                godown_id=godown_id
-            ).first()
-
-            if not inventory or inventory.number_of_bags < requested_bags:
-                godown = db.session.get(Godown, godown_id)
-                godown_name = godown.name if godown else f"Godown {godown_id}"
-                available = inventory.number_of_bags if inventory else 0
-                return jsonify({
-                    'error': f'Insufficient stock in {godown_name}. Available: {available} bags'
-                }), 400
+        # Check all godowns at once and report every shortfall
+        shortfalls = find_shortfalls(grain_id, allocations)
+        if shortfalls:
+            return jsonify({
+                'error': '; '.join(
+                    f"Insufficient stock in {s['godown_name']}. Available: {s['available']} bags"
+                    for s in shortfalls
+                ),
+                'shortfalls': shortfalls
+            }), 400
 
         return jsonify({'message': 'Stock available'}), 200
 
@@ -120,6 +152,7 @@ def check_availability():
 
 @inventory.route('/inventory/godown-stock/<int:grain_id>', methods=['GET'])
 @jwt_required()
+@conditional('godowns', 'inventory')
 def get_godown_stock(grain_id):
     try:
         # Get all godowns first
@@ -138,7 +171,7 @@ def get_godown_stock(grain_id):
             'available_bags': inventory_map.get(godown.id, 0)  # Default to 0 if no inventory
         } for godown in godowns]
 
-        return jsonify(result)
+        return json_response(result)
 
     except Exception as e:
         print(f"Error fetching godown stock: {str(e)}")
@@ -170,6 +203,7 @@ def check_inventory(grain_id, godown_id):
 
 @inventory.route('/inventory/summary', methods=['GET'])
 @jwt_required()
+@replica_read()
 def get_inventory_summary():
     try:
         # Get current inventory with grain details and latest rates
@@ -219,33 +253,26 @@ def get_inventory_summary():
 
 @inventory.route('/dashboard/summary', methods=['GET'])
 @jwt_required()
+@replica_read()
 def get_dashboard_summary():
     try:
-        # Get total pending incoming payments (Sales)
-        pending_incoming = db.session.query(
-            db.func.sum(Sale.total_amount)
-        ).filter(
-            Sale.payment_status == 'pending'
-        ).scalar() or 0
-
-        # Get total pending outgoing payments (Purchases)
-        pending_outgoing = db.session.query(
-            db.func.sum(Purchase.total_amount - Purchase.paid_amount)
-        ).filter(
-            Purchase.payment_status != 'PAID'
-        ).scalar() or 0
+        # Pending payments come from the running party balances
+        pending_incoming, pending_outgoing = db.session.query(
+            db.func.coalesce(db.func.sum(Party.receivable), 0),
+            db.func.coalesce(db.func.sum(Party.payable), 0)
+        ).one()
 
         # Get current inventory value
         inventory_value = db.session.query(
             db.func.sum(
-                BagInventory.number_of_bags * 100 * db.func.coalesce(
+                type_coerce(db.func.coalesce(
                     db.session.query(Sale.rate_per_kg)
                     .filter(Sale.grain_id == BagInventory.grain_id)
                     .order_by(Sale.created_at.desc())
                     .limit(1)
                     .as_scalar(),
                     0
-                )
+                ) * BagInventory.number_of_bags * 100, Money())
             )
         ).scalar() or 0
 
@@ -0,0 +1,132 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload
+from models import Sale, db
+from utils import invoice as invoices
+from utils.archive import date_range, history, routed
+from utils.replica import replica_read
+from utils.serving import lock_at_first_write
+
+invoice = Blueprint('invoice', __name__)
+
+# Sales per batch request; a month of bills fits comfortably
+BATCH_LIMIT = 2000
+
+
+def _unprintable(seller, sales, fields):
+    """400 response naming the text the invoice fonts cannot print, else None"""
+    settings = invoices.unprintable_seller(seller)
+    if settings:
+        return jsonify({'error': f"Invoice seller details cannot be printed: {', '.join(settings)} "
+                                 "must use Latin or Devanagari script"}), 400
+    problems = []
+    for sale, row in zip(sales, fields):
+        bad = invoices.unprintable(row)
+        if bad:
+            problems.append({'bill_number': sale.bill_number, 'fields': bad})
+    if problems:
+        return jsonify({'error': 'Invoices can only print Latin and Devanagari script; edit these bills to print them',
+                        'unprintable': problems}), 400
+    return None
+
+
+def _file_response(body, mimetype, filename, etag=None):
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Authorization')
+    return response
+
+
+@invoice.route('/sales/<int:sale_id>/invoice.pdf', methods=['GET'])
+@jwt_required()
+def get_invoice(sale_id):
+    """Tax invoice of one sale; the ETag is the content hash of the invoice"""
+    try:
+        sales = history(Sale)
+        sale = db.session.query(sales).options(joinedload(sales.grain)).filter(sales.id == sale_id).first()
+        if sale is None:
+            return jsonify({'error': 'Sale not found'}), 404
+        seller = invoices.seller_from_config(current_app.config)
+        fields = invoices.invoice_fields(sale, seller)
+        refused = _unprintable(seller, [sale], [fields])
+        if refused:
+            return refused
+        key = invoices.cache_key(seller, fields)
+        if key in request.if_none_match:
+            return _file_response(b'', 'application/pdf', f'{sale.bill_number}.pdf', etag=key).make_conditional(request)
+
+        _, documents, _ = invoices.render(seller, [fields], current_app.config['INVOICE_CACHE_DIR'])
+        response = _file_response(documents[0], 'application/pdf', f'{sale.bill_number}.pdf', etag=key)
+        return response.make_conditional(request)
+
+    except Exception as e:
+        print(f"Error rendering invoice: {str(e)}")
+        return jsonify({'error': 'Failed to render invoice'}), 500
+
+
+@invoice.route('/sales/invoices', methods=['POST'])
+@jwt_required()
+@replica_read()
+@lock_at_first_write
+def batch_invoices():
+    """Invoices of many sales in one PDF, or a ZIP of one PDF each.
+
+    Body: sale_ids, or from/to (sale date), and format 'pdf' (default) or 'zip'.
+    """
+    try:
+        data = request.get_json() or {}
+        output = data.get('format', 'pdf')
+        if output not in ('pdf', 'zip'):
+            return jsonify({'error': "format must be 'pdf' or 'zip'"}), 400
+
+        if data.get('sale_ids'):
+            try:
+                sale_ids = sorted({int(sale_id) for sale_id in data['sale_ids']})
+            except (TypeError, ValueError):
+                return jsonify({'error': 'sale_ids must be integers'}), 400
+            sales = history(Sale)
+            query = db.session.query(sales).filter(sales.id.in_(sale_ids))
+        elif data.get('from') or data.get('to'):
+            try:
+                start, end = date_range(data)
+            except ValueError:
+                return jsonify({'error': 'from and to must be ISO dates'}), 400
+            sales = routed(Sale, start)
+            query = db.session.query(sales)
+            if start:
+                query = query.filter(sales.sale_date >= start)
+            if end:
+                query = query.filter(sales.sale_date < end)
+        else:
+            return jsonify({'error': 'sale_ids or from/to is required'}), 400
+
+        rows = query.options(joinedload(sales.grain)).order_by(sales.sale_date, sales.id).limit(BATCH_LIMIT + 1).all()
+        if not rows:
+            return jsonify({'error': 'No sales found'}), 404
+        if len(rows) > BATCH_LIMIT:
+            return jsonify({'error': f'At most {BATCH_LIMIT} invoices per request'}), 400
+
+        seller = invoices.seller_from_config(current_app.config)
+        fields = [invoices.invoice_fields(sale, seller) for sale in rows]
+        refused = _unprintable(seller, rows, fields)
+        if refused:
+            return refused
+        directory, workers = current_app.config['INVOICE_CACHE_DIR'], current_app.config['INVOICE_WORKERS']
+        if output == 'zip':
+            _, documents, rendered = invoices.render(seller, fields, directory, workers=workers)
+            body = invoices.zip_documents(
+                [(f'{sale.bill_number}.pdf', document) for sale, document in zip(rows, documents)])
+            response = _file_response(body, 'application/zip', 'invoices.zip')
+        else:
+            _, body, rendered = invoices.combined(seller, fields, directory, workers=workers)
+            response = _file_response(body, 'application/pdf', 'invoices.pdf')
+        response.headers['X-Invoices-Rendered'] = str(rendered)
+        return response
+
+    except Exception as e:
+        print(f"Error rendering invoices: {str(e)}")
+        return jsonify({'error': 'Failed to render invoices'}), 500
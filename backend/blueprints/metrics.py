@@ -1,22 +1,39 @@
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required
-from models import Purchase, Sale, BagInventory, db
+from models import Purchase, Sale, BagInventory, CostLot, LotConsumption, db
 from sqlalchemy import func
 from datetime import datetime, timedelta
+from utils.events import get_broker
+from utils.archive import carried_totals
+from utils.replica import replica_read
 
 metrics = Blueprint('metrics', __name__)
 
 @metrics.route('/metrics', methods=['GET'])
 @jwt_required()
+# The event cursor must come from the same database as the totals
+@replica_read(when=lambda: get_broker().durable)
 def get_metrics():
     try:
         # Get current date for time-based calculations
         current_date = datetime.utcnow()
         thirty_days_ago = current_date - timedelta(days=30)
 
-        # Calculate total purchases and sales
-        total_purchases = db.session.query(func.sum(Purchase.total_amount)).scalar() or 0
-        total_sales = db.session.query(func.sum(Sale.total_amount)).scalar() or 0
+        # Live deltas after this id are not yet reflected in the totals below
+        event_id = get_broker().cursor()
+
+        # Calculate total purchases and sales, with the closed years carried forward
+        carried = carried_totals()
+        total_purchases = (db.session.query(func.sum(Purchase.total_amount)).scalar() or 0) + carried['purchases_amount']
+        total_sales = (db.session.query(func.sum(Sale.total_amount)).scalar() or 0) + carried['sales_amount']
+
+        # Realized margin comes from the cost lots consumed by each sale, so
+        # stock still on hand is not counted as an expense
+        cost_of_goods_sold, realized_margin = db.session.query(
+            func.sum(LotConsumption.cost),
+            func.sum(LotConsumption.margin)
+        ).one()
+        stock_value = db.session.query(func.sum(CostLot.remaining_cost)).scalar() or 0
 
         # Get total inventory (sum of all bags)
         total_inventory = db.session.query(func.sum(BagInventory.number_of_bags)).scalar() or 0
@@ -53,7 +70,10 @@ def get_metrics():
             'totalPurchases': float(total_purchases),
             'totalSales': float(total_sales),
             'totalInventory': int(total_inventory),
-            'totalRevenue': float(total_sales - total_purchases),
+            'totalRevenue': float(realized_margin or 0),
+            'costOfGoodsSold': float(cost_of_goods_sold or 0),
+            'stockValue': float(stock_value),
+            'eventId': event_id,
             'recentPurchases': [{
                 'id': p.id,
                 'billNumber': p.bill_number,
@@ -0,0 +1,91 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from models import Party, PartyBalance, LedgerSide, db
+from sqlalchemy import func, case
+from datetime import datetime, timedelta
+from utils.serialization import json_response, row_serializer
+
+party = Blueprint('party', __name__)
+
+party_row = row_serializer('id', 'name', 'receivable', 'payable')
+
+AGING_BUCKETS = (('0_30', 0, 30), ('31_60', 31, 60), ('61_90', 61, 90), ('90_plus', 91, None))
+
+# Float balances that net to less than half a paisa are treated as settled
+SETTLED = 0.005
+
+
+@party.route('/parties', methods=['GET'])
+@jwt_required()
+def get_parties():
+    try:
+        query = Party.query
+        side = request.args.get('side')
+        if side in (LedgerSide.RECEIVABLE.value, LedgerSide.PAYABLE.value):
+            column = getattr(Party, side)
+            query = query.filter(func.abs(column) > SETTLED).order_by(column.desc())
+        else:
+            query = query.order_by(Party.name)
+        return json_response(party_row.many(query.all()))
+    except Exception as e:
+        print(f"Error fetching parties: {str(e)}")
+        return jsonify({'error': 'Failed to fetch parties'}), 500
+
+
+@party.route('/parties/aging', methods=['GET'])
+@jwt_required()
+def get_aging():
+    """Outstanding per party in 0-30/31-60/61-90/90+ day buckets.
+
+    Reads only the precomputed per-day balance rows, so the cost scales with
+    open bill-days rather than with the number of bills or payments.
+    """
+    try:
+        side = request.args.get('side', LedgerSide.RECEIVABLE.value)
+        if side not in (LedgerSide.RECEIVABLE.value, LedgerSide.PAYABLE.value):
+            return jsonify({'error': 'side must be receivable or payable'}), 400
+
+        today = datetime.utcnow().date()
+        columns = []
+        for label, start, end in AGING_BUCKETS:
+            condition = PartyBalance.bill_date <= today - timedelta(days=start)
+            if end is not None:
+                condition = condition & (PartyBalance.bill_date >= today - timedelta(days=end))
+            columns.append(func.sum(case((condition, PartyBalance.outstanding), else_=0)).label(label))
+
+        rows = db.session.query(
+            Party.id,
+            Party.name,
+            func.sum(PartyBalance.outstanding).label('total'),
+            *columns
+        ).join(
+            Party, PartyBalance.party_id == Party.id
+        ).filter(
+            PartyBalance.side == side
+        ).group_by(
+            Party.id, Party.name
+        ).having(
+            func.abs(func.sum(PartyBalance.outstanding)) > SETTLED
+        ).order_by(
+            func.sum(PartyBalance.outstanding).desc()
+        ).all()
+
+        parties = [{
+            'party_id': row.id,
+            'name': row.name,
+            'total': row.total,
+            'buckets': {label: getattr(row, label) or 0 for label, _, _ in AGING_BUCKETS}
+        } for row in rows]
+
+        return json_response({
+            'side': side,
+            'as_of': today,
+            'totals': {
+                'total': sum(p['total'] for p in parties),
+                **{label: sum(p['buckets'][label] for p in parties) for label, _, _ in AGING_BUCKETS}
+            },
+            'parties': parties
+        })
+    except Exception as e:
+        print(f"Error fetching aging report: {str(e)}")
+        return jsonify({'error': 'Failed to fetch aging report'}), 500
@@ -1,12 +1,18 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import db, Purchase, PaymentHistory, PaymentStatus
+from models import db, Purchase, Sale, PaymentHistory
 from utils.permissions import require_permission
 from models import Permission
-from datetime import datetime
+from utils.payments import apply_payment_status, parse_statement, reconcile_statement
+from utils.serialization import json_response, row_serializer
+from utils.archive import history
 
 payment = Blueprint('payment', __name__)
 
+payment_row = row_serializer('id', 'amount', 'description', 'reference', 'payment_date', 'created_at')
+
+MAX_STATEMENT_BYTES = 5 * 1024 * 1024
+
 @payment.route('/purchases/<int:purchase_id>/payment-status', methods=['PUT'])
 @jwt_required()
 @require_permission(Permission.MANAGE_INVENTORY.value)
@@ -15,35 +21,11 @@ def update_payment_status(purchase_id):
         data = request.get_json()
         purchase = Purchase.query.get_or_404(purchase_id)
         new_status = data.get('status')
-        amount = data.get('amount', 0)
-        description = data.get('description', '')
-
-        if new_status not in [status.value for status in PaymentStatus]:
-            return jsonify({'error': 'Invalid payment status'}), 400
-
-        # Validate amount for partially paid status
-        if new_status == PaymentStatus.PARTIALLY_PAID.value:
-            if not amount or amount <= 0:
-                return jsonify({'error': 'Amount is required for partially paid status'}), 400
-            if amount >= purchase.total_amount:
-                return jsonify({'error': 'Amount should be less than total for partially paid status'}), 400
-
-        # Handle paid status
-        if new_status == PaymentStatus.PAID.value:
-            amount = purchase.total_amount - purchase.paid_amount
-
-        # Create payment history entry
-        if amount > 0:
-            payment_history = PaymentHistory(
-                purchase_id=purchase.id,
-                amount=amount,
-                description=description,
-                payment_date=datetime.utcnow()
-            )
-            db.session.add(payment_history)
-            purchase.paid_amount += amount
-
-        purchase.payment_status = new_status
+
+        try:
+            apply_payment_status(purchase, new_status, data.get('amount', 0), data.get('description', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         db.session.commit()
 
         return jsonify({
@@ -61,17 +43,70 @@ def update_payment_status(purchase_id):
 @jwt_required()
 def get_payment_history(purchase_id):
     try:
-        purchase = Purchase.query.get_or_404(purchase_id)
-        payments = purchase.payment_history.order_by(PaymentHistory.payment_date.desc()).all()
+        # Bills of closed years keep their payments in the archive
+        purchases, history_rows = history(Purchase), history(PaymentHistory)
+        db.session.query(purchases.id).filter(purchases.id == purchase_id).first_or_404()
+        payments = db.session.query(history_rows).filter(history_rows.purchase_id == purchase_id) \
+            .order_by(history_rows.payment_date.desc()).all()
         
-        return jsonify([{
-            'id': payment.id,
-            'amount': payment.amount,
-            'description': payment.description,
-            'payment_date': payment.payment_date.isoformat(),
-            'created_at': payment.created_at.isoformat()
-        } for payment in payments])
+        return json_response(payment_row.many(payments))
 
     except Exception as e:
         print(f"Error fetching payment history: {str(e)}")
-        return jsonify({'error': 'Failed to fetch payment history'}), 500 
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch payment history'}), 500
+
+@payment.route('/sales/<int:sale_id>/payments', methods=['GET'])
+@jwt_required()
+def get_sale_payment_history(sale_id):
+    try:
+        sales, history_rows = history(Sale), history(PaymentHistory)
+        db.session.query(sales.id).filter(sales.id == sale_id).first_or_404()
+        payments = db.session.query(history_rows).filter(history_rows.sale_id == sale_id) \
+            .order_by(history_rows.payment_date.desc()).all()
+
+        return json_response(payment_row.many(payments))
+
+    except Exception as e:
+        print(f"Error fetching sale payment history: {str(e)}")
+        return jsonify({'error': 'Failed to fetch payment history'}), 500
+
+@payment.route('/payments/reconcile', methods=['POST'])
+@jwt_required()
+@require_permission(Permission.MANAGE_INVENTORY.value)
+def reconcile_payments():
+    """Apply a bank statement CSV (multipart `file` or raw text/csv body).
+
+    Credits settle sales and debits settle purchases. Query params:
+    window_days (default 7) bounds exact-amount matches, dry_run=1 only
+    reports what would be applied.
+    """
+    try:
+        upload = request.files.get('file')
+        raw = upload.read(MAX_STATEMENT_BYTES + 1) if upload else request.get_data()
+        if not raw:
+            return jsonify({'error': 'Statement file is required'}), 400
+        if len(raw) > MAX_STATEMENT_BYTES:
+            return jsonify({'error': 'Statement file is too large'}), 413
+
+        try:
+            window_days = int(request.args.get('window_days', 7))
+        except ValueError:
+            return jsonify({'error': 'window_days must be an integer'}), 400
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+        try:
+            lines, errors = parse_statement(raw.decode('utf-8-sig'))
+        except (ValueError, UnicodeDecodeError) as e:
+            return jsonify({'error': f'Invalid statement: {str(e)}'}), 400
+
+        result = reconcile_statement(lines, window_days=window_days, dry_run=dry_run)
+        result['unmatched'] = errors + result['unmatched']
+        if not dry_run:
+            db.session.commit()
+
+        return json_response(result)
+
+    except Exception as e:
+        print(f"Error reconciling payments: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to reconcile payments'}), 500
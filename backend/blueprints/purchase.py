@@ -1,49 +1,63 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import Purchase, Grain, BagInventory, Godown, PaymentHistory, Permission, db
+from models import Purchase, Grain, Godown, PaymentHistory, Permission, db
 from datetime import datetime, timezone
 from utils.permissions import require_permission
+from utils.http_cache import conditional
+from utils.serialization import json_response, row_serializer, as_float, or_zero, parse_timestamp
+from utils.capacity import CapacityExceeded
+from utils.stock import move_stock, InsufficientStock
+from utils.archive import date_range, history, routed
+from utils.money import kilos, money
 import re
 
 purchase = Blueprint('purchase', __name__)
 
+purchase_list_row = row_serializer(
+    'id', 'bill_number', 'grain_name', 'supplier_name', 'number_of_bags',
+    ('weight_per_bag', 'weight_per_bag', as_float),
+    ('extra_weight', 'extra_weight', or_zero),
+    ('total_weight', 'total_weight', as_float),
+    ('rate_per_kg', 'rate_per_kg', as_float),
+    ('total_amount', 'total_amount', as_float),
+    'payment_status',
+    ('paid_amount', 'paid_amount', as_float),
+    'purchase_date'
+)
+
 @purchase.route('/purchases', methods=['GET'])
 @jwt_required()
+@conditional('purchases', 'grains')
 def get_purchases():
+    """Newest first. Optional from/to (purchase date); a range reaching into a
+    closed financial year also reads its archived bills"""
     try:
-        purchases = db.session.query(
-            Purchase.id,
-            Purchase.bill_number,
+        try:
+            start, end = date_range(request.args)
+        except ValueError:
+            return jsonify({'error': 'from and to must be ISO dates'}), 400
+        purchases = routed(Purchase, start)
+        query = db.session.query(
+            purchases.id,
+            purchases.bill_number,
             Grain.name.label('grain_name'),
-            Purchase.supplier_name,
-            Purchase.number_of_bags,
-            Purchase.weight_per_bag,
-            Purchase.extra_weight,
-            Purchase.total_weight,
-            Purchase.rate_per_kg,
-            Purchase.total_amount,
-            Purchase.payment_status,
-            Purchase.paid_amount,
-            Purchase.purchase_date
-        ).join(Grain, Purchase.grain_id == Grain.id)\
-        .order_by(Purchase.purchase_date.desc())\
-        .all()
+            purchases.supplier_name,
+            purchases.number_of_bags,
+            purchases.weight_per_bag,
+            purchases.extra_weight,
+            purchases.total_weight,
+            purchases.rate_per_kg,
+            purchases.total_amount,
+            purchases.payment_status,
+            purchases.paid_amount,
+            purchases.purchase_date
+        ).join(Grain, purchases.grain_id == Grain.id)
+        if start:
+            query = query.filter(purchases.purchase_date >= start)
+        if end:
+            query = query.filter(purchases.purchase_date < end)
 
-        return jsonify([{
-            'id': p.id,
-            'bill_number': p.bill_number,
-            'grain_name': p.grain_name,
-            'supplier_name': p.supplier_name,
-            'number_of_bags': p.number_of_bags,
-            'weight_per_bag': float(p.weight_per_bag),
-            'extra_weight': float(p.extra_weight) if p.extra_weight else 0,
-            'total_weight': float(p.total_weight),
-            'rate_per_kg': float(p.rate_per_kg),
-            'total_amount': float(p.total_amount),
-            'payment_status': p.payment_status,
-            'paid_amount': float(p.paid_amount),
-            'purchase_date': p.purchase_date.isoformat()
-        } for p in purchases])
+        return json_response(purchase_list_row.many(query.order_by(purchases.purchase_date.desc()).all()))
     except Exception as e:
         print(f"Error fetching purchases: {str(e)}")
         return jsonify({'error': 'Failed to fetch purchases'}), 500
@@ -86,12 +100,11 @@ def create_purchase():
         # Generate bill number if not provided
         bill_number = data.get('bill_number') or generate_bill_number()
         
-        # Calculate total weight and amount
-        total_weight = (data['number_of_bags'] * data['weight_per_bag']) + data.get('extra_weight', 0)
-        total_amount = total_weight * data['rate_per_kg']
-        
-        # Begin transaction
-        db.session.begin_nested()
+        # Calculate total weight and amount, to the gram and paisa they are stored at
+        weight_per_bag, extra_weight = kilos(data['weight_per_bag']), kilos(data.get('extra_weight', 0))
+        rate_per_kg = money(data['rate_per_kg'])
+        total_weight = kilos(data['number_of_bags'] * weight_per_bag + extra_weight)
+        total_amount = money(total_weight * rate_per_kg)
         
         try:
             # Validate grain and godown exist
@@ -109,36 +122,21 @@ def create_purchase():
                 grain_id=data['grain_id'],
                 godown_id=data['godown_id'],
                 number_of_bags=data['number_of_bags'],
-                weight_per_bag=data['weight_per_bag'],
-                extra_weight=data.get('extra_weight', 0),
-                rate_per_kg=data['rate_per_kg'],
+                weight_per_bag=weight_per_bag,
+                extra_weight=extra_weight,
+                rate_per_kg=rate_per_kg,
                 total_weight=total_weight,
                 total_amount=total_amount,
                 supplier_name=data['supplier_name'],
-                purchase_date=datetime.fromisoformat(data['purchase_date'].replace('Z', '+00:00')),
+                purchase_date=parse_timestamp(data['purchase_date']),
                 payment_status='pending',
                 paid_amount=0
             )
             
             db.session.add(purchase)
             
-            # Update inventory
-            inventory = BagInventory.query.filter_by(
-                grain_id=data['grain_id'],
-                godown_id=data['godown_id']
-            ).with_for_update().first()  # Lock the row for update
-            
-            if not inventory:
-                # Create new inventory record
-                inventory = BagInventory(
-                    grain_id=data['grain_id'],
-                    godown_id=data['godown_id'],
-                    number_of_bags=data['number_of_bags']
-                )
-                db.session.add(inventory)
-            else:
-                # Update existing inventory
-                inventory.number_of_bags += data['number_of_bags']
+            # Update inventory (locked, capacity checked)
+            move_stock({(data['grain_id'], data['godown_id']): data['number_of_bags']})
             
             db.session.commit()
             
@@ -159,6 +157,9 @@ def create_purchase():
                 'purchase_date': purchase.purchase_date.isoformat()
             }), 201
             
+        except CapacityExceeded as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'overflows': e.overflows}), 400
         except Exception as e:
             db.session.rollback()
             print(f"Error in transaction: {str(e)}")
@@ -171,7 +172,8 @@ def create_purchase():
 @purchase.route('/purchases/<int:purchase_id>', methods=['GET'])
 @jwt_required()
 def get_purchase(purchase_id):
-    purchase = Purchase.query.get_or_404(purchase_id)
+    purchases = history(Purchase)
+    purchase = db.session.query(purchases).filter(purchases.id == purchase_id).first_or_404()
     return jsonify({
         'id': purchase.id,
         'bill_number': purchase.bill_number,
@@ -199,16 +201,12 @@ def delete_purchase(purchase_id):
     try:
         purchase = Purchase.query.get_or_404(purchase_id)
         
-        # Update bag inventory
-        bag_inventory = BagInventory.query.filter_by(
-            grain_id=purchase.grain_id,
-            godown_id=purchase.godown_id
-        ).first()
-        
-        if bag_inventory:
-            bag_inventory.number_of_bags -= purchase.number_of_bags
-            if bag_inventory.number_of_bags < 0:
-                return jsonify({'error': 'Cannot delete: Inventory already used'}), 400
+        # Take the bags back out of stock; refuses if they were already sold
+        try:
+            move_stock({(purchase.grain_id, purchase.godown_id): -purchase.number_of_bags})
+        except InsufficientStock:
+            db.session.rollback()
+            return jsonify({'error': 'Cannot delete: Inventory already used'}), 400
         
         # Delete payment history
         PaymentHistory.query.filter_by(purchase_id=purchase_id).delete()
@@ -232,27 +230,26 @@ def update_purchase(purchase_id):
         data = request.get_json()
         purchase = Purchase.query.get_or_404(purchase_id)
         
-        # Begin transaction
-        db.session.begin_nested()
-        
         try:
             # Update basic fields
             if 'supplier_name' in data:
                 purchase.supplier_name = data['supplier_name']
             if 'purchase_date' in data:
-                purchase.purchase_date = datetime.fromisoformat(data['purchase_date'].replace('Z', '+00:00'))
+                purchase.purchase_date = parse_timestamp(data['purchase_date'])
+            
+            old_stock = (purchase.grain_id, purchase.godown_id, purchase.number_of_bags)
             
             # Update quantity and amount related fields
             if any(key in data for key in ['number_of_bags', 'weight_per_bag', 'rate_per_kg', 'extra_weight']):
                 # Get current values or new values from request
                 number_of_bags = data.get('number_of_bags', purchase.number_of_bags)
-                weight_per_bag = data.get('weight_per_bag', purchase.weight_per_bag)
-                rate_per_kg = data.get('rate_per_kg', purchase.rate_per_kg)
-                extra_weight = data.get('extra_weight', purchase.extra_weight)
+                weight_per_bag = kilos(data.get('weight_per_bag', purchase.weight_per_bag))
+                rate_per_kg = money(data.get('rate_per_kg', purchase.rate_per_kg))
+                extra_weight = kilos(data.get('extra_weight', purchase.extra_weight))
                 
                 # Calculate new totals
-                total_weight = (number_of_bags * weight_per_bag) + extra_weight
-                total_amount = total_weight * rate_per_kg
+                total_weight = kilos(number_of_bags * weight_per_bag + extra_weight)
+                total_amount = money(total_weight * rate_per_kg)
                 
                 # Update purchase record
                 purchase.number_of_bags = number_of_bags
@@ -262,34 +259,18 @@ def update_purchase(purchase_id):
                 purchase.total_weight = total_weight
                 purchase.total_amount = total_amount
             
-            # Update inventory if godown changed
-            if 'godown_id' in data and data['godown_id'] != purchase.godown_id:
-                # Remove bags from old godown
-                old_inventory = BagInventory.query.filter_by(
-                    grain_id=purchase.grain_id,
-                    godown_id=purchase.godown_id
-                ).with_for_update().first()
-                
-                if old_inventory:
-                    old_inventory.number_of_bags -= purchase.number_of_bags
-                    
-                # Add bags to new godown
-                new_inventory = BagInventory.query.filter_by(
-                    grain_id=purchase.grain_id,
-                    godown_id=data['godown_id']
-                ).with_for_update().first()
-                
-                if not new_inventory:
-                    new_inventory = BagInventory(
-                        grain_id=purchase.grain_id,
-                        godown_id=data['godown_id'],
-                        number_of_bags=0
-                    )
-                    db.session.add(new_inventory)
-                
-                new_inventory.number_of_bags += purchase.number_of_bags
+            if 'godown_id' in data:
+                if not Godown.query.get(data['godown_id']):
+                    db.session.rollback()
+                    return jsonify({'error': 'Invalid godown_id'}), 400
                 purchase.godown_id = data['godown_id']
             
+            # Move the difference in bags (and any change of godown) in one locked pass
+            changes = {(old_stock[0], old_stock[1]): -old_stock[2]}
+            new_key = (purchase.grain_id, purchase.godown_id)
+            changes[new_key] = changes.get(new_key, 0) + purchase.number_of_bags
+            move_stock(changes)
+            
             db.session.commit()
             return jsonify({
                 'message': 'Purchase updated successfully',
@@ -309,6 +290,10 @@ def update_purchase(purchase_id):
             db.session.rollback()
             raise e
             
+    except InsufficientStock as e:
+        return jsonify({'error': f'Cannot reduce: bags already sold. {e}', 'shortfalls': e.shortfalls}), 400
+    except CapacityExceeded as e:
+        return jsonify({'error': str(e), 'overflows': e.overflows}), 400
     except Exception as e:
         print(f"Error updating purchase: {str(e)}")
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,11 +1,34 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import Sale, BagInventory, SaleGodownDetail, db
+from models import Sale, SaleGodownDetail, Godown, db
+from sqlalchemy.orm import joinedload
 from datetime import datetime
+from utils.http_cache import conditional
+from utils.serialization import json_response, row_serializer, or_zero, parse_timestamp
+from utils.stock import merge_allocations, deduct_stock, move_stock, stock_matrix, InsufficientStock
+from utils.capacity import CapacityExceeded
+from utils.allocation import plan_allocation, oldest_stock_dates, POLICIES
+from utils.payments import apply_payment_status
+from utils.archive import date_range, history, routed
+from utils.money import kilos, money
+from utils.serving import lock_at_first_write
 import re
 
 sale = Blueprint('sale', __name__)
 
+sale_list_row = row_serializer(
+    'id', 'bill_number', ('grain_name', 'grain.name'), 'buyer_name', 'number_of_bags',
+    'total_weight', 'rate_per_kg', 'total_amount', 'sale_date', 'created_at', 'payment_status',
+    ('paid_amount', 'paid_amount', or_zero)
+)
+
+sale_detail_row = row_serializer(
+    'id', 'bill_number', 'grain_id', ('grain_name', 'grain.name'), 'buyer_name',
+    'number_of_bags', 'total_weight', 'rate_per_kg', 'total_amount', 'transportation_mode',
+    'vehicle_number', 'driver_name', 'lr_number', 'po_number', 'buyer_gst',
+    'sale_date', 'created_at', 'payment_status', ('paid_amount', 'paid_amount', or_zero)
+)
+
 def generate_bill_number():
     # Format: SB-YYYYMMDD-XXXX
     date_part = datetime.now().strftime('%Y%m%d')
@@ -29,21 +52,21 @@ def generate_bill_number():
 
 @sale.route('/sales', methods=['GET'])
 @jwt_required()
+@conditional('sales', 'grains')
 def get_sales():
-    sales = Sale.query.order_by(Sale.created_at.desc()).all()
-    return jsonify([{
-        'id': sale.id,
-        'bill_number': sale.bill_number,
-        'grain_name': sale.grain.name,
-        'buyer_name': sale.buyer_name,
-        'number_of_bags': sale.number_of_bags,
-        'total_weight': sale.total_weight,
-        'rate_per_kg': sale.rate_per_kg,
-        'total_amount': sale.total_amount,
-        'sale_date': sale.sale_date.isoformat(),
-        'created_at': sale.created_at.isoformat(),
-        'payment_status': sale.payment_status
-    } for sale in sales])
+    """Newest first. Optional from/to (sale date); a range reaching into a
+    closed financial year also reads its archived bills"""
+    try:
+        start, end = date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO dates'}), 400
+    sales = routed(Sale, start)
+    query = db.session.query(sales).options(joinedload(sales.grain))
+    if start:
+        query = query.filter(sales.sale_date >= start)
+    if end:
+        query = query.filter(sales.sale_date < end)
+    return json_response(sale_list_row.many(query.order_by(sales.created_at.desc()).all()))
 
 @sale.route('/sales', methods=['POST'])
 @jwt_required()
@@ -59,37 +82,18 @@ def create_sale():
         if not all(k in data for k in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        # Begin transaction
-        db.session.begin_nested()
-        
         try:
             # Convert string numbers to integers
             data['number_of_bags'] = int(data['number_of_bags'])
-            data['total_weight'] = float(data['total_weight'])
-            data['rate_per_kg'] = float(data['rate_per_kg'])
+            data['total_weight'] = kilos(float(data['total_weight']))
+            data['rate_per_kg'] = money(float(data['rate_per_kg']))
             
-            # Check and update inventory in each godown
-            for godown_detail in data['godown_details']:
-                godown_detail['number_of_bags'] = int(godown_detail['number_of_bags'])
-                inventory = BagInventory.query.filter_by(
-                    grain_id=data['grain_id'],
-                    godown_id=godown_detail['godown_id']
-                ).with_for_update().first()  # Lock the row for update
-                
-                if not inventory:
-                    raise ValueError(f'No inventory found in godown {godown_detail["godown_id"]}')
-                    
-                if inventory.number_of_bags < godown_detail['number_of_bags']:
-                    raise ValueError(
-                        f'Insufficient stock in godown {godown_detail["godown_id"]}. '
-                        f'Available: {inventory.number_of_bags}, Requested: {godown_detail["number_of_bags"]}'
-                    )
-                
-                # Deduct bags from inventory
-                inventory.number_of_bags -= godown_detail['number_of_bags']
+            # Deduct from every godown in one conditional UPDATE
+            allocations = merge_allocations(data['godown_details'])
+            deduct_stock(data['grain_id'], allocations)
 
             # Calculate total amount
-            total_amount = data['total_weight'] * data['rate_per_kg']
+            total_amount = money(data['total_weight'] * data['rate_per_kg'])
             
             # Create sale record
             sale = Sale(
@@ -113,11 +117,11 @@ def create_sale():
             db.session.add(sale)
             
             # Create sale godown details
-            for godown_detail in data['godown_details']:
+            for godown_id, bags in allocations.items():
                 detail = SaleGodownDetail(
                     sale=sale,
-                    godown_id=godown_detail['godown_id'],
-                    number_of_bags=godown_detail['number_of_bags']
+                    godown_id=godown_id,
+                    number_of_bags=bags
                 )
                 db.session.add(detail)
             
@@ -133,34 +137,78 @@ def create_sale():
             db.session.rollback()
             raise e
             
+    except InsufficientStock as e:
+        return jsonify({'error': str(e), 'shortfalls': e.shortfalls}), 400
     except Exception as e:
         print(f"Error creating sale: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@sale.route('/sales/plan-allocation', methods=['POST'])
+@jwt_required()
+@lock_at_first_write
+def plan_sale_allocation():
+    """Suggest a godown split for a sale, ready to submit as godown_details"""
+    try:
+        data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Send a JSON object'}), 400
+        policy = data.get('policy', 'fifo')
+        try:
+            grain_id = int(data['grain_id'])
+            number_of_bags = int(data['number_of_bags'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'grain_id and number_of_bags are required'}), 400
+        try:
+            distances = {int(k): float(v) for k, v in (data.get('distances') or {}).items()}
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'distances must map godown ids to numbers'}), 400
+        location = data.get('location')
+        if location is not None and not isinstance(location, str):
+            return jsonify({'error': 'location must be text'}), 400
+        if number_of_bags <= 0:
+            return jsonify({'error': 'number_of_bags must be positive'}), 400
+        if policy not in POLICIES:
+            return jsonify({'error': f"Invalid policy. Must be one of: {', '.join(POLICIES)}"}), 400
+
+        stock = {godown_id: bags for (_, godown_id), bags in stock_matrix(grain_id).items()}
+        godowns = {g.id: g for g in Godown.query.filter(Godown.id.in_(list(stock))).all()}
+
+        plan, shortfall = plan_allocation(
+            stock,
+            number_of_bags,
+            policy,
+            oldest=oldest_stock_dates(grain_id, stock) if policy == 'fifo' else None,
+            distances=distances,
+            location=location,
+            locations={godown_id: g.location for godown_id, g in godowns.items()}
+        )
+        if shortfall > 0:
+            return jsonify({
+                'error': f'Insufficient stock. Available: {number_of_bags - shortfall}, Requested: {number_of_bags}',
+                'available': number_of_bags - shortfall
+            }), 400
+
+        return jsonify({
+            'grain_id': grain_id,
+            'number_of_bags': number_of_bags,
+            'policy': policy,
+            'godown_details': [{
+                'godown_id': godown_id,
+                'godown_name': godowns[godown_id].name if godown_id in godowns else None,
+                'number_of_bags': bags
+            } for godown_id, bags in plan]
+        })
+
+    except Exception as e:
+        print(f"Error planning allocation: {str(e)}")
+        return jsonify({'error': 'Failed to plan allocation'}), 500
+
 @sale.route('/sales/<int:sale_id>', methods=['GET'])
 @jwt_required()
 def get_sale(sale_id):
-    sale = Sale.query.get_or_404(sale_id)
-    return jsonify({
-        'id': sale.id,
-        'bill_number': sale.bill_number,
-        'grain_id': sale.grain_id,
-        'grain_name': sale.grain.name,
-        'buyer_name': sale.buyer_name,
-        'number_of_bags': sale.number_of_bags,
-        'total_weight': sale.total_weight,
-        'rate_per_kg': sale.rate_per_kg,
-        'total_amount': sale.total_amount,
-        'transportation_mode': sale.transportation_mode,
-        'vehicle_number': sale.vehicle_number,
-        'driver_name': sale.driver_name,
-        'lr_number': sale.lr_number,
-        'po_number': sale.po_number,
-        'buyer_gst': sale.buyer_gst,
-        'sale_date': sale.sale_date.isoformat(),
-        'created_at': sale.created_at.isoformat(),
-        'payment_status': sale.payment_status
-    }) 
+    sales = history(Sale)
+    sale = db.session.query(sales).filter(sales.id == sale_id).first_or_404()
+    return json_response(sale_detail_row(sale))
 
 @sale.route('/sales/<int:sale_id>', methods=['PUT'])
 @jwt_required()
@@ -169,15 +217,12 @@ def update_sale(sale_id):
         data = request.get_json()
         sale = Sale.query.get_or_404(sale_id)
         
-        # Begin transaction
-        db.session.begin_nested()
-        
         try:
             # Update basic fields
             if 'buyer_name' in data:
                 sale.buyer_name = data['buyer_name']
             if 'sale_date' in data:
-                sale.sale_date = datetime.fromisoformat(data['sale_date'].replace('Z', '+00:00'))
+                sale.sale_date = parse_timestamp(data['sale_date'])
             if 'transportation_mode' in data:
                 sale.transportation_mode = data['transportation_mode']
             if 'vehicle_number' in data:
@@ -188,63 +233,51 @@ def update_sale(sale_id):
             # Update quantity and amount related fields
             if any(key in data for key in ['number_of_bags', 'total_weight', 'rate_per_kg']):
                 # Get current values or new values from request
-                number_of_bags = data.get('number_of_bags', sale.number_of_bags)
-                total_weight = data.get('total_weight', sale.total_weight)
-                rate_per_kg = data.get('rate_per_kg', sale.rate_per_kg)
+                number_of_bags = int(data.get('number_of_bags', sale.number_of_bags))
+                total_weight = kilos(float(data.get('total_weight', sale.total_weight)))
+                rate_per_kg = money(float(data.get('rate_per_kg', sale.rate_per_kg)))
                 
-                # Calculate new total amount
-                total_amount = total_weight * rate_per_kg
-                
-                # Get the difference in bags
-                bags_difference = number_of_bags - sale.number_of_bags
-                
-                # Update inventory in godowns if number of bags changed
-                if bags_difference != 0:
-                    # Update existing godown details
-                    for godown_detail in data.get('godown_details', []):
-                        inventory = BagInventory.query.filter_by(
-                            grain_id=sale.grain_id,
-                            godown_id=godown_detail['godown_id']
-                        ).with_for_update().first()
-                        
-                        if not inventory:
-                            raise ValueError(f'No inventory found in godown {godown_detail["godown_id"]}')
-                        
-                        new_bags = int(godown_detail['number_of_bags'])
-                        old_detail = SaleGodownDetail.query.filter_by(
-                            sale_id=sale.id,
-                            godown_id=godown_detail['godown_id']
-                        ).first()
-                        
-                        # Calculate the difference for this godown
-                        godown_difference = new_bags - (old_detail.number_of_bags if old_detail else 0)
-                        
-                        # Check if we have enough inventory
-                        if inventory.number_of_bags < godown_difference:
-                            raise ValueError(
-                                f'Insufficient stock in godown {godown_detail["godown_id"]}. '
-                                f'Available: {inventory.number_of_bags}, Required: {godown_difference}'
-                            )
-                        
-                        # Update inventory
-                        inventory.number_of_bags -= godown_difference
-                        
-                        # Update or create sale godown detail
-                        if old_detail:
-                            old_detail.number_of_bags = new_bags
-                        else:
-                            new_detail = SaleGodownDetail(
-                                sale_id=sale.id,
-                                godown_id=godown_detail['godown_id'],
-                                number_of_bags=new_bags
-                            )
-                            db.session.add(new_detail)
+                if number_of_bags != sale.number_of_bags and 'godown_details' not in data:
+                    # A sale from one godown keeps taking from it; a split needs the new one
+                    if len(sale.godown_details) != 1:
+                        db.session.rollback()
+                        return jsonify({'error': 'godown_details are required when number_of_bags changes '
+                                                 'on a sale from several godowns'}), 400
+                    data['godown_details'] = [{'godown_id': sale.godown_details[0].godown_id,
+                                               'number_of_bags': number_of_bags}]
                 
                 # Update sale record
                 sale.number_of_bags = number_of_bags
                 sale.total_weight = total_weight
                 sale.rate_per_kg = rate_per_kg
-                sale.total_amount = total_amount
+                sale.total_amount = money(total_weight * rate_per_kg)
+            
+            # godown_details replace the whole allocation; godowns left out get their bags back
+            if 'godown_details' in data:
+                try:
+                    allocations = merge_allocations(data['godown_details'])
+                except ValueError as e:
+                    db.session.rollback()
+                    return jsonify({'error': str(e)}), 400
+                if sum(allocations.values()) != sale.number_of_bags:
+                    db.session.rollback()
+                    return jsonify({'error': 'godown_details must add up to number_of_bags'}), 400
+                
+                current = {detail.godown_id: detail for detail in sale.godown_details}
+                changes = {}
+                for godown_id in set(current) | set(allocations):
+                    old_bags = current[godown_id].number_of_bags if godown_id in current else 0
+                    changes[(sale.grain_id, godown_id)] = old_bags - allocations.get(godown_id, 0)
+                move_stock(changes)
+                
+                for godown_id, detail in current.items():
+                    if godown_id not in allocations:
+                        sale.godown_details.remove(detail)
+                    elif detail.number_of_bags != allocations[godown_id]:
+                        detail.number_of_bags = allocations[godown_id]
+                for godown_id, bags in allocations.items():
+                    if godown_id not in current:
+                        sale.godown_details.append(SaleGodownDetail(godown_id=godown_id, number_of_bags=bags))
             
             db.session.commit()
             return jsonify({
@@ -267,6 +300,10 @@ def update_sale(sale_id):
             db.session.rollback()
             raise e
             
+    except InsufficientStock as e:
+        return jsonify({'error': str(e), 'shortfalls': e.shortfalls}), 400
+    except CapacityExceeded as e:
+        return jsonify({'error': str(e), 'overflows': e.overflows}), 400
     except Exception as e:
         print(f"Error updating sale: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -277,21 +314,10 @@ def delete_sale(sale_id):
     try:
         sale = Sale.query.get_or_404(sale_id)
         
-        # Begin transaction
-        db.session.begin_nested()
-        
         try:
             # Return bags to inventory
-            for detail in sale.godown_details:
-                inventory = BagInventory.query.filter_by(
-                    grain_id=sale.grain_id,
-                    godown_id=detail.godown_id
-                ).with_for_update().first()
-                
-                if inventory:
-                    # Add bags back to inventory
-                    inventory.number_of_bags += detail.number_of_bags
-                    db.session.add(inventory)
+            move_stock({(sale.grain_id, detail.godown_id): detail.number_of_bags
+                        for detail in sale.godown_details})
             
             # Delete sale and its details
             db.session.delete(sale)
@@ -303,6 +329,8 @@ def delete_sale(sale_id):
             db.session.rollback()
             raise e
             
+    except CapacityExceeded as e:
+        return jsonify({'error': str(e), 'overflows': e.overflows}), 400
     except Exception as e:
         print(f"Error deleting sale: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -316,18 +344,20 @@ def update_payment_status(sale_id):
         
         if 'status' not in data:
             return jsonify({'error': 'Status is required'}), 400
-            
-        if data['status'] not in ['pending', 'paid']:
-            return jsonify({'error': 'Invalid status'}), 400
-            
-        sale.payment_status = data['status']
+
+        try:
+            apply_payment_status(sale, data['status'], data.get('amount', 0), data.get('description', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         db.session.commit()
         
         return jsonify({
             'message': 'Payment status updated successfully',
-            'status': sale.payment_status
+            'status': sale.payment_status,
+            'paid_amount': sale.paid_amount
         })
         
     except Exception as e:
         print(f"Error updating payment status: {str(e)}")
-        return jsonify({'error': 'Failed to update payment status'}), 500 
\ No newline at end of file
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update payment status'}), 500 
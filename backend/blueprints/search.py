@@ -0,0 +1,57 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from utils.search import search_bills, suggest, SEARCH_KINDS
+from utils.serialization import json_response
+
+search = Blueprint('search', __name__)
+
+MAX_PER_PAGE = 100
+
+
+@search.route('/search', methods=['GET'])
+@jwt_required()
+def search_all():
+    """Ranked search over bill numbers, party names, vehicles and LR/PO/GST numbers.
+
+    Every word of q must prefix-match; names also match across Hindi and
+    romanized spellings. Params: type (sale/purchase), page, per_page.
+    """
+    try:
+        q = (request.args.get('q') or '').strip()
+        kind = request.args.get('type')
+        if kind and kind not in SEARCH_KINDS:
+            return jsonify({'error': f"Invalid type. Must be one of: {', '.join(SEARCH_KINDS)}"}), 400
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = min(MAX_PER_PAGE, max(1, int(request.args.get('per_page', 20))))
+        except ValueError:
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+
+        results, has_more = search_bills(q, kind, limit=per_page, offset=(page - 1) * per_page) if q else ([], False)
+        return json_response({
+            'query': q,
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more,
+            'results': results
+        })
+
+    except Exception as e:
+        print(f"Error searching: {str(e)}")
+        return jsonify({'error': 'Search failed'}), 500
+
+
+@search.route('/search/suggest', methods=['GET'])
+@jwt_required()
+def search_suggest():
+    """Prefix completions for the bill forms: field=party (default) or vehicle"""
+    try:
+        q = (request.args.get('q') or '').strip()
+        field = request.args.get('field', 'party')
+        if field not in ('party', 'vehicle'):
+            return jsonify({'error': 'field must be party or vehicle'}), 400
+        return json_response(suggest(q, field) if q else [])
+
+    except Exception as e:
+        print(f"Error fetching suggestions: {str(e)}")
+        return jsonify({'error': 'Failed to fetch suggestions'}), 500
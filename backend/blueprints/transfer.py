@@ -0,0 +1,135 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+from models import db, Grain, Godown, Permission, StockTransfer
+from sqlalchemy import or_
+from utils.capacity import CapacityExceeded
+from utils.http_cache import conditional
+from utils.permissions import require_permission
+from utils.serialization import json_response, row_serializer
+from utils.stock import transfer_stock, InsufficientStock
+import re
+
+transfer = Blueprint('transfer', __name__)
+
+transfer_row = row_serializer(
+    'id', 'reference', 'grain_id', ('grain_name', 'grain.name'),
+    'from_godown_id', ('from_godown_name', 'from_godown.name'),
+    'to_godown_id', ('to_godown_name', 'to_godown.name'),
+    'number_of_bags', 'cost', 'note', 'transfer_date'
+)
+
+MAX_BATCH = 500
+MAX_NOTE = 200  # StockTransfer.note
+MAX_PER_PAGE = 200
+
+
+def generate_reference():
+    # Format: TR-YYYYMMDD-XXXX, shared by every move of a batch
+    date_part = datetime.now().strftime('%Y%m%d')
+    latest = StockTransfer.query.filter(
+        StockTransfer.reference.like(f'TR-{date_part}-%')
+    ).order_by(StockTransfer.reference.desc()).first()
+    match = re.search(r'TR-\d{8}-(\d{4})', latest.reference) if latest else None
+    sequence = int(match.group(1)) + 1 if match else 1
+    return f'TR-{date_part}-{sequence:04d}'
+
+
+def parse_moves(items):
+    """Validate [{grain_id, from_godown_id, to_godown_id, number_of_bags}]"""
+    moves = []
+    for item in items:
+        try:
+            move = (int(item['grain_id']), int(item['from_godown_id']),
+                    int(item['to_godown_id']), int(item['number_of_bags']))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each transfer needs grain_id, from_godown_id, to_godown_id and number_of_bags')
+        if move[3] <= 0:
+            raise ValueError('number_of_bags must be positive')
+        if move[1] == move[2]:
+            raise ValueError('Source and destination godown must differ')
+        moves.append(move)
+    return moves
+
+
+@transfer.route('/transfers', methods=['POST'])
+@jwt_required()
+@require_permission(Permission.MANAGE_INVENTORY.value)
+def create_transfer():
+    """Move bags between godowns: one move in the body, or a batch under
+    'transfers' that succeeds or fails as a whole"""
+    try:
+        data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Send a JSON object'}), 400
+        note = data.get('note')
+        if note is not None and (not isinstance(note, str) or len(note) > MAX_NOTE):
+            return jsonify({'error': f'note must be text of at most {MAX_NOTE} characters'}), 400
+        items = data['transfers'] if isinstance(data.get('transfers'), list) else [data]
+        if not items or len(items) > MAX_BATCH:
+            return jsonify({'error': f'Send between 1 and {MAX_BATCH} transfers'}), 400
+        try:
+            moves = parse_moves(items)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        grain_ids = {move[0] for move in moves}
+        godown_ids = {godown_id for move in moves for godown_id in move[1:3]}
+        if Grain.query.filter(Grain.id.in_(grain_ids)).count() != len(grain_ids):
+            return jsonify({'error': 'Invalid grain_id'}), 400
+        if Godown.query.filter(Godown.id.in_(godown_ids)).count() != len(godown_ids):
+            return jsonify({'error': 'Invalid godown_id'}), 400
+
+        try:
+            reference = generate_reference()
+            ids = [row.id for row in transfer_stock(moves, reference, note=note,
+                                                    user_id=int(get_jwt_identity()))]
+            db.session.commit()
+        except InsufficientStock as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'shortfalls': e.shortfalls}), 400
+        except CapacityExceeded as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'overflows': e.overflows}), 400
+
+        # One query reloads the rows with the cost basis costing recorded
+        transfers = StockTransfer.query.filter(StockTransfer.id.in_(ids)).order_by(StockTransfer.id).all()
+        return json_response({
+            'reference': reference,
+            'transfers': transfer_row.many(transfers)
+        }, 201)
+
+    except Exception as e:
+        print(f"Error creating transfer: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create transfer'}), 500
+
+
+@transfer.route('/transfers', methods=['GET'])
+@jwt_required()
+@conditional('transfers')
+def get_transfers():
+    """Newest first. Params: grain_id, godown_id (either side), reference, page, per_page"""
+    try:
+        try:
+            grain_id = request.args.get('grain_id', type=int)
+            godown_id = request.args.get('godown_id', type=int)
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = min(MAX_PER_PAGE, max(1, int(request.args.get('per_page', 50))))
+        except ValueError:
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+
+        query = StockTransfer.query
+        if grain_id:
+            query = query.filter(StockTransfer.grain_id == grain_id)
+        if godown_id:
+            query = query.filter(or_(StockTransfer.from_godown_id == godown_id,
+                                     StockTransfer.to_godown_id == godown_id))
+        if request.args.get('reference'):
+            query = query.filter(StockTransfer.reference == request.args['reference'])
+        transfers = query.order_by(StockTransfer.id.desc()).offset((page - 1) * per_page).limit(per_page).all()
+        return json_response(transfer_row.many(transfers))
+
+    except Exception as e:
+        print(f"Error fetching transfers: {str(e)}")
+        return jsonify({'error': 'Failed to fetch transfers'}), 500
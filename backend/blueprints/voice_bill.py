@@ -2,20 +2,18 @@ import os
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import openai
 from werkzeug.utils import secure_filename
-from models.intermediate_bill import IntermediateBill
-from models.godown import Godown
-from models.grain import Grain
-from database import db
+from extensions import db
 from utils.error_handlers import handle_error
 from utils.validators import validate_audio_file
-from models import Purchase, Sale, SaleGodownDetail
+from utils.outbound import openai_client
+from utils.serving import lock_at_first_write
+from utils.money import kilos, money
+from models import Godown, Grain, IntermediateBill, Purchase, Sale, SaleGodownDetail
 
 voice_bill = Blueprint('voice_bill', __name__)
 
-# Configure OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Configure OpenAI (the client is shared per worker, see utils.outbound)
 WHISPER_MODEL = os.getenv('OPENAI_WHISPER_MODEL', 'whisper-1')
 GPT_MODEL = os.getenv('OPENAI_GPT_MODEL', 'gpt-4-turbo-preview')
 
@@ -66,8 +64,9 @@ def get_field_list(bill_type):
             'driver_name', 'lr_number', 'po_number'
         ]
 
-@voice_bill.route('/api/voice-bills', methods=['POST'])
+@voice_bill.route('/voice-bills', methods=['POST'])
 @jwt_required()
+@lock_at_first_write
 def create_voice_bill():
     """Create a new intermediate bill from voice input"""
     try:
@@ -82,9 +81,9 @@ def create_voice_bill():
             return jsonify({'error': 'Invalid audio file'}), 400
 
         # Get audio transcript using Whisper API
-        transcript = openai.Audio.transcribe(
+        transcript = openai_client().audio.transcriptions.create(
             model=WHISPER_MODEL,
-            file=audio_file,
+            file=(secure_filename(audio_file.filename) or 'audio.webm', audio_file.read(), audio_file.mimetype),
             response_format="text"
         )
 
@@ -96,7 +95,7 @@ def create_voice_bill():
         )
 
         # Parse transcript using GPT
-        completion = openai.ChatCompletion.create(
+        completion = openai_client().chat.completions.create(
             model=GPT_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -111,7 +110,7 @@ def create_voice_bill():
             bill_type=bill_type,
             raw_transcript=transcript,
             parsed_data=parsed_data,
-            created_by_id=get_jwt_identity()
+            created_by_id=int(get_jwt_identity())
         )
         db.session.add(intermediate_bill)
         db.session.commit()
@@ -121,13 +120,13 @@ def create_voice_bill():
     except Exception as e:
         return handle_error(e)
 
-@voice_bill.route('/api/voice-bills/<int:bill_id>', methods=['DELETE'])
+@voice_bill.route('/voice-bills/<int:bill_id>', methods=['DELETE'])
 @jwt_required()
 def delete_voice_bill(bill_id):
     """Delete an intermediate bill"""
     try:
         bill = IntermediateBill.query.get_or_404(bill_id)
-        if bill.created_by_id != get_jwt_identity():
+        if bill.created_by_id != int(get_jwt_identity()):
             return jsonify({'error': 'Unauthorized'}), 403
             
         db.session.delete(bill)
@@ -136,13 +135,13 @@ def delete_voice_bill(bill_id):
     except Exception as e:
         return handle_error(e)
 
-@voice_bill.route('/api/voice-bills/<int:bill_id>/approve', methods=['POST'])
+@voice_bill.route('/voice-bills/<int:bill_id>/approve', methods=['POST'])
 @jwt_required()
 def approve_voice_bill(bill_id):
     """Approve and create final bill from intermediate bill"""
     try:
         bill = IntermediateBill.query.get_or_404(bill_id)
-        if bill.created_by_id != get_jwt_identity():
+        if bill.created_by_id != int(get_jwt_identity()):
             return jsonify({'error': 'Unauthorized'}), 403
             
         data = bill.parsed_data
@@ -173,8 +172,8 @@ def create_purchase_bill(data):
         raise ValueError(f"Invalid godown name: {data['godown_name']}")
     
     # Calculate total weight and amount
-    total_weight = data['number_of_bags'] * data['weight_per_bag']
-    total_amount = total_weight * data['rate_per_kg']
+    total_weight = kilos(data['number_of_bags'] * data['weight_per_bag'])
+    total_amount = money(total_weight * money(data['rate_per_kg']))
     
     # Create purchase bill
     purchase = Purchase(
@@ -203,8 +202,8 @@ def create_sale_bill(data):
         raise ValueError(f"Invalid grain name: {data['grain_name']}")
     
     # Calculate total weight and amount
-    total_weight = data['number_of_bags'] * data['weight_per_bag']
-    total_amount = total_weight * data['rate_per_kg']
+    total_weight = kilos(data['number_of_bags'] * data['weight_per_bag'])
+    total_amount = money(total_weight * money(data['rate_per_kg']))
     
     # Create sale bill
     sale = Sale(
@@ -121,36 +121,334 @@ def init_test_data():
 @with_appcontext
 def cleanup_inventory():
     """Clean up duplicate inventory entries"""
+    from utils.stock import merge_duplicates
     try:
-        # Get all inventory entries
-        inventory_items = BagInventory.query.all()
-        
-        # Create a dictionary to track unique grain-godown combinations
-        unique_entries = {}
-        duplicates = []
-        
-        for item in inventory_items:
-            key = (item.grain_id, item.godown_id)
-            if key in unique_entries:
-                # If entry exists, merge the bags and mark for deletion
-                unique_entries[key].number_of_bags += item.number_of_bags
-                duplicates.append(item)
-            else:
-                unique_entries[key] = item
-        
-        # Delete duplicate entries
-        for duplicate in duplicates:
-            db.session.delete(duplicate)
-        
+        removed = merge_duplicates()
         db.session.commit()
-        print(f"Cleaned up {len(duplicates)} duplicate entries")
+        print(f"Cleaned up {removed} duplicate entries")
         
     except Exception as e:
         db.session.rollback()
         print(f"Error cleaning up inventory: {str(e)}")
 
+@click.command('rebuild-ledger')
+@with_appcontext
+def rebuild_ledger():
+    """Link bills to parties and recompute all outstanding balances"""
+    from utils.ledger import rebuild_balances
+    try:
+        stats = rebuild_balances()
+        db.session.commit()
+        print(f"Ledger rebuilt: {stats['names_linked']} party names linked, "
+              f"{stats['balance_rows']} balance rows")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error rebuilding ledger: {str(e)}")
+
+@click.command('rebuild-costs')
+@click.option('--method', type=click.Choice(['fifo', 'weighted_average']), default=None,
+              help='Costing method (defaults to COSTING_METHOD)')
+@with_appcontext
+def rebuild_costs(method):
+    """Replay all purchases and sales into cost lots and realized margins"""
+    from utils.costing import rebuild_costs as replay_history
+    try:
+        stats = replay_history(method)
+        db.session.commit()
+        print(f"Costs rebuilt: {stats['lots']} lots, {stats['consumption_rows']} consumption rows")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error rebuilding costs: {str(e)}")
+
+@click.command('rebuild-prices')
+@with_appcontext
+def rebuild_prices():
+    """Regroup all purchase and sale rates into the daily price buckets"""
+    from utils.prices import rebuild_buckets
+    try:
+        count = rebuild_buckets()
+        db.session.commit()
+        print(f"Price buckets rebuilt: {count} daily buckets")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error rebuilding price buckets: {str(e)}")
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search():
+    """Create the bill search index if needed and repopulate it"""
+    from utils.search import rebuild_index
+    try:
+        count = rebuild_index()
+        db.session.commit()
+        print(f"Search index rebuilt: {count} bills indexed")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error rebuilding search index: {str(e)}")
+
+@click.command('notify-overdue')
+@click.option('--days', default=30, show_default=True, help='Age after which a receivable is overdue')
+@click.option('--timeout', default=300, show_default=True, help='Seconds to wait for delivery')
+@with_appcontext
+def notify_overdue(days, timeout):
+    """Push a summary of overdue receivables to every subscribed device (run daily)"""
+    from flask import current_app
+    from utils.push import get_queue, notify_overdue as queue_overdue
+    if not current_app.config.get('VAPID_PRIVATE_KEY'):
+        print('VAPID_PRIVATE_KEY is not set, nothing sent')
+        return
+    queue_overdue(days)
+    if get_queue().join(timeout):
+        print('Overdue payment notifications delivered')
+    else:
+        print(f'Gave up waiting for delivery after {timeout}s')
+
+@click.command('evaluate-alerts')
+@with_appcontext
+def evaluate_alerts():
+    """Re-check every stock row against the alert thresholds (run daily)"""
+    from utils.alerts import evaluate_all
+    try:
+        opened = evaluate_all()
+        db.session.commit()
+        print(f"Alerts evaluated: {opened} opened")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error evaluating alerts: {str(e)}")
+
+@click.command('check-godown-usage')
+@click.option('--fix', is_flag=True, help='Reset drifted counters to the actual stock')
+@with_appcontext
+def check_godown_usage(fix):
+    """Compare each godown's used_bags counter with the sum of its stock rows"""
+    from utils.capacity import usage_drift
+    try:
+        drift = usage_drift(fix=fix)
+        for row in drift:
+            print(f"{row['name']}: counter {row['used_bags']}, actual {row['actual']}")
+        if fix:
+            db.session.commit()
+        print(f"{len(drift)} godown(s) out of step" + (', fixed' if fix and drift else ''))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error checking godown usage: {str(e)}")
+
+@click.command('verify-inventory')
+@click.option('--dry-run', is_flag=True, help='Only report the differences')
+@with_appcontext
+def verify_inventory(dry_run):
+    """Recompute stock from opening stock, purchases, sales and transfers and repair bag_inventory"""
+    from utils.stock import inventory_drift, repair_inventory
+    try:
+        drift = inventory_drift()
+        for row in drift:
+            print(f"Grain {row['grain_id']} in godown {row['godown_id']}: "
+                  f"expected {row['expected']}, stored {row['actual']} in {row['rows']} row(s)")
+        if dry_run or not drift:
+            print(f"{len(drift)} stock pair(s) out of step")
+            return
+        unfixable = repair_inventory(drift)
+        db.session.commit()
+        print(f"Repaired {len(drift) - len(unfixable)} stock pair(s)")
+        for row in unfixable:
+            print(f"Left grain {row['grain_id']} in godown {row['godown_id']} alone: "
+                  f"its bills sell {-row['expected']} more bags than were bought")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error verifying inventory: {str(e)}")
+
+@click.command('close-year')
+@click.argument('start_year', type=int)
+@click.option('--dry-run', is_flag=True, help='Only report what would be archived')
+@with_appcontext
+def close_year(start_year, dry_run):
+    """Archive the settled bills of the financial year starting in April of START_YEAR"""
+    from utils.archive import close_year as archive_year, year_label
+    try:
+        counts = archive_year(start_year)
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        print(f"{'Would archive' if dry_run else 'Archived'} {year_label(start_year)}: "
+              + ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error closing financial year: {str(e)}")
+
+@click.command('reopen-year')
+@click.argument('start_year', type=int)
+@with_appcontext
+def reopen_year(start_year):
+    """Move a closed financial year's archived bills back into the live tables"""
+    from utils.archive import reopen_year as restore_year, year_label
+    try:
+        counts = restore_year(start_year)
+        db.session.commit()
+        print(f"Reopened {year_label(start_year)}: "
+              + ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reopening financial year: {str(e)}")
+
+@click.command('gen-data')
+@click.option('--purchases', default=1000000, show_default=True)
+@click.option('--sales', default=1000000, show_default=True)
+@click.option('--grains', default=30, show_default=True)
+@click.option('--godowns', default=50, show_default=True)
+@click.option('--days', default=3 * 365, show_default=True, help='Length of the generated history')
+@click.option('--voice-bills', type=int, help='Pending, approved and rejected voice bills (default: one per 200 bills)')
+@click.option('--seed', default=42, show_default=True)
+@with_appcontext
+def gen_data(purchases, sales, grains, godowns, days, voice_bills, seed):
+    """Fill an empty database with a large, reproducible trading history for benchmarks"""
+    import time
+    from utils.datagen import generate
+    try:
+        started = time.perf_counter()
+        counts = generate(purchases=purchases, sales=sales, grains=grains, godowns=godowns,
+                          days=days, seed=seed, voice_bills=voice_bills)
+        print(', '.join(f"{count} {table}" for table, count in counts.items()))
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error generating data: {str(e)}")
+
+@click.command('backup')
+@click.option('--dir', 'directory', help='Backup root (defaults to BACKUP_DIR, else backups/ next to the database)')
+@click.option('--keep', default=7, show_default=True, help='Backups to keep')
+@click.option('--every', type=int, default=0, help='Keep running: snapshot every N seconds and archive the WAL in between')
+@click.option('--wal-interval', default=5, show_default=True, help='Seconds between WAL archive passes')
+@click.option('--pages', default=1024, show_default=True, help='Pages copied per backup step')
+@with_appcontext
+def backup(directory, keep, every, wal_interval, pages):
+    """Take an online backup of the SQLite database; with --every, run as the backup scheduler"""
+    from utils.backup import backup_root, database_path, prune, run_scheduler, snapshot
+    try:
+        database = database_path(db.engine.url)
+        root = directory or backup_root(database)
+        if every:
+            run_scheduler(database, root, every, wal_interval, keep, pages=pages)
+            return
+        manifest = snapshot(database, root, pages=pages)
+        removed = prune(root, keep)
+        print(f"Backup {manifest['backup']} written to {root}: {manifest['bytes']} bytes in "
+              f"{manifest['steps']} steps, {manifest['compressed_bytes']} compressed, sha256 {manifest['sha256']}"
+              + (f'; pruned {removed} old backup(s)' if removed else ''))
+    except KeyboardInterrupt:
+        print('Backup scheduler stopped')
+    except Exception as e:
+        print(f'Error backing up database: {str(e)}')
+        raise SystemExit(1)
+
+def _restore_backup(directory, name, until, target):
+    from datetime import datetime
+    from utils.backup import backup_root, database_path, find_backup, restore
+    root = directory or backup_root(database_path(db.engine.url))
+    until = datetime.fromisoformat(until) if until else None
+    return restore(root, find_backup(root, name, until), target, until)
+
+@click.command('restore')
+@click.argument('target')
+@click.option('--dir', 'directory', help='Backup root (defaults to BACKUP_DIR, else backups/ next to the database)')
+@click.option('--backup', 'name', help='Backup to restore (defaults to the newest)')
+@click.option('--until', help='UTC time (ISO) to restore to; defaults to the last archived commit')
+@with_appcontext
+def restore_backup(target, directory, name, until):
+    """Rebuild the database as of a point in time into TARGET (stop the app before swapping it in)"""
+    try:
+        result = _restore_backup(directory, name, until, target)
+        print(f"Restored {result['backup']} plus {result['segments']} WAL segment(s), {result['commits']} "
+              f"commit(s), to {target} as of {result['restored_to']}")
+    except Exception as e:
+        print(f'Error restoring backup: {str(e)}')
+        raise SystemExit(1)
+
+@click.command('verify-backup')
+@click.option('--dir', 'directory', help='Backup root (defaults to BACKUP_DIR, else backups/ next to the database)')
+@click.option('--backup', 'name', help='Backup to verify (defaults to the newest)')
+@click.option('--until', help='UTC time (ISO) to restore to; defaults to the last archived commit')
+@with_appcontext
+def verify_backup(directory, name, until):
+    """Restore a backup to a scratch file and run the integrity check and inventory reconciliation on it"""
+    import os
+    import tempfile
+    from utils.backup import check_restored
+    healthy = False
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            target = os.path.join(scratch, 'restored.db')
+            result = _restore_backup(directory, name, until, target)
+            print(f"Restored {result['backup']} plus {result['segments']} WAL segment(s) "
+                  f"as of {result['restored_to']}")
+            report = check_restored(target)
+        print(f"Integrity check: {', '.join(report['integrity'][:10])}")
+        for row in report['inventory_drift']:
+            print(f"Grain {row['grain_id']} in godown {row['godown_id']}: "
+                  f"expected {row['expected']}, stored {row['actual']} in {row['rows']} row(s)")
+        for row in report['usage_drift']:
+            print(f"{row['name']}: counter {row['used_bags']}, actual {row['actual']}")
+        healthy = report['integrity'] == ['ok'] and not report['inventory_drift'] and not report['usage_drift']
+        print('Backup verified' if healthy else 'Backup FAILED verification')
+    except Exception as e:
+        print(f'Error verifying backup: {str(e)}')
+    if not healthy:
+        raise SystemExit(1)
+
+@click.command('refresh-replica')
+@click.option('--every', type=int, default=0, help='Keep running: refresh every N seconds (keep it under REPLICA_MAX_LAG)')
+@click.option('--pages', default=1024, show_default=True, help='Pages copied per step')
+@with_appcontext
+def refresh_replica(every, pages):
+    """Copy the SQLite database over the SQLite read replica set by REPLICA_DATABASE_URL"""
+    import os
+    import sqlite3
+    import time
+    from flask import current_app
+    from extensions import REPLICA_BIND
+    from utils.backup import database_path
+    from utils.replica import refresh_snapshot
+    try:
+        if REPLICA_BIND not in (current_app.config.get('SQLALCHEMY_BINDS') or {}):
+            raise ValueError('REPLICA_DATABASE_URL is not set')
+        database = database_path(db.engine.url)
+        replica = database_path(db.get_engine(bind=REPLICA_BIND).url)
+        if os.path.realpath(database) == os.path.realpath(replica):
+            raise ValueError('The replica must be a different file from the database')
+        while True:
+            started = time.monotonic()
+            try:
+                created_at, seconds = refresh_snapshot(database, replica, pages=pages)
+                print(f'Replica {replica} refreshed as of {created_at.isoformat()} in {seconds:.2f}s')
+            except (sqlite3.Error, OSError) as e:
+                if not every:
+                    raise
+                print(f'Error refreshing replica: {str(e)}')
+            if not every:
+                return
+            time.sleep(max(0, every - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print('Replica refresh stopped')
+    except Exception as e:
+        print(f'Error refreshing replica: {str(e)}')
+
 def init_commands(app):
     app.cli.add_command(create_admin)
     app.cli.add_command(init_inventory)
     app.cli.add_command(init_test_data)
-    app.cli.add_command(cleanup_inventory) 
\ No newline at end of file
+    app.cli.add_command(cleanup_inventory)
+    app.cli.add_command(rebuild_ledger)
+    app.cli.add_command(rebuild_costs)
+    app.cli.add_command(rebuild_prices)
+    app.cli.add_command(rebuild_search)
+    app.cli.add_command(notify_overdue) 
+    app.cli.add_command(evaluate_alerts)
+    app.cli.add_command(check_godown_usage)
+    app.cli.add_command(verify_inventory)
+    app.cli.add_command(gen_data)
+    app.cli.add_command(close_year)
+    app.cli.add_command(reopen_year)
+    app.cli.add_command(backup)
+    app.cli.add_command(restore_backup)
+    app.cli.add_command(verify_backup)
+    app.cli.add_command(refresh_replica)
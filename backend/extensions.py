@@ -1,7 +1,36 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from sqlalchemy import orm
 
-db = SQLAlchemy()
+# SQLALCHEMY_BINDS key of the read replica, and the flag on `g` that routes reads to it
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica while the request is routed there (see utils/replica.py).
+
+    Flushes always go to the primary.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_app_context() and g.get(REPLICA_BIND):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _execute_for_all_tables(self, app, bind, operation, skip_tables=False):
+        # create_all() and drop_all() leave the replica alone; it only holds copies
+        if bind == '__all__':
+            binds = self.get_app(app).config.get('SQLALCHEMY_BINDS') or ()
+            bind = [None] + [key for key in binds if key != REPLICA_BIND]
+        super()._execute_for_all_tables(app, bind, operation, skip_tables)
+
+
+db = RoutingSQLAlchemy()
 migrate = Migrate()
-jwt = JWTManager() 
\ No newline at end of file
+jwt = JWTManager()
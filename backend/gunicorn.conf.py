@@ -0,0 +1,58 @@
+"""Gunicorn settings: `gunicorn -c gunicorn.conf.py wsgi:application`
+
+Workers are threaded (gthread) by default, so a request waiting on the
+network (an OpenAI call, a long-lived /api/events stream) holds one thread
+rather than a whole worker process. GUNICORN_WORKER_CLASS=gevent switches to
+greenlets when gevent is installed; sync keeps the old one-request-per-
+worker behaviour. The database pool is sized from the same variables (see
+utils/serving.py).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2 + 1)))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound slow leaks; jitter avoids restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print('gevent is not installed, using gthread workers')
+        worker_class = 'gthread'
+if worker_class == 'sync':
+    # gunicorn quietly runs sync workers as gthread when threads > 1
+    threads = 1
+os.environ['GUNICORN_WORKER_CLASS'] = worker_class
+os.environ['GUNICORN_THREADS'] = str(threads)
+# The app picks its event broker and stream cap from these, so set the worker
+# count with WEB_CONCURRENCY rather than --workers
+os.environ['GUNICORN_WORKERS'] = str(workers)
+
+# Import the app once in the master and fork workers from it: they share the
+# imported code copy-on-write and a restarted worker starts without importing
+# anything. GUNICORN_PRELOAD=0 restores per-worker imports (code reload on HUP).
+# gevent must patch the standard library before the app is imported, so it
+# does not preload by default.
+preload_app = os.getenv('GUNICORN_PRELOAD', '0' if worker_class == 'gevent' else '1') == '1'
+
+
+def post_fork(server, worker):
+    """create_app() opens no connections, but drop any a preloaded master
+    might hold so no two workers ever share a pooled socket"""
+    if server.cfg.workers != workers:
+        server.log.warning('Started with %s workers but the app was configured for %s; set WEB_CONCURRENCY '
+                           'instead of --workers', server.cfg.workers, workers)
+    if server.cfg.preload_app:
+        from extensions import db
+        from wsgi import application
+        with application.app_context():
+            db.engine.dispose()
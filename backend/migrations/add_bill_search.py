@@ -0,0 +1,23 @@
+"""Add bill search index
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+SQLite gets an FTS5 table kept in sync by triggers; PostgreSQL gets trigram
+indexes.
+"""
+from alembic import op
+from sqlalchemy import text
+from utils.search import create_index, populate_index, sqlite_drop_ddl
+
+def upgrade():
+    bind = op.get_bind()
+    create_index(bind)
+    populate_index(bind)
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in sqlite_drop_ddl():
+            bind.execute(text(statement))
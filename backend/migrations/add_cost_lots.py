@@ -0,0 +1,53 @@
+"""Add cost lots and per-sale lot consumption
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Run `flask rebuild-costs` after upgrading to replay existing history.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'cost_lots',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('purchase_id', sa.Integer, sa.ForeignKey('purchase.id', name='fk_costlot_purchase')),
+        sa.Column('grain_id', sa.Integer, sa.ForeignKey('grains.id', name='fk_costlot_grain'), nullable=False),
+        sa.Column('godown_id', sa.Integer, sa.ForeignKey('godowns.id', name='fk_costlot_godown'), nullable=False),
+        sa.Column('lot_date', sa.DateTime, nullable=False),
+        sa.Column('bags', sa.Integer, nullable=False),
+        sa.Column('weight', sa.Float, nullable=False),
+        sa.Column('cost', sa.Float, nullable=False),
+        sa.Column('remaining_bags', sa.Integer, nullable=False),
+        sa.Column('remaining_cost', sa.Float, nullable=False)
+    )
+    op.create_index('ix_cost_lots_purchase_id', 'cost_lots', ['purchase_id'])
+    op.create_index('ix_cost_lot_partition', 'cost_lots', ['grain_id', 'godown_id', 'lot_date'])
+
+    op.create_table(
+        'lot_consumption',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('sale_id', sa.Integer, sa.ForeignKey('sale.id', name='fk_lotconsumption_sale'), nullable=False),
+        sa.Column('lot_id', sa.Integer, sa.ForeignKey('cost_lots.id', name='fk_lotconsumption_lot')),
+        sa.Column('grain_id', sa.Integer, nullable=False),
+        sa.Column('godown_id', sa.Integer, nullable=False),
+        sa.Column('party_id', sa.Integer),
+        sa.Column('sale_date', sa.DateTime, nullable=False),
+        sa.Column('bags', sa.Integer, nullable=False),
+        sa.Column('weight', sa.Float),
+        sa.Column('cost', sa.Float),
+        sa.Column('revenue', sa.Float, nullable=False),
+        sa.Column('margin', sa.Float)
+    )
+    op.create_index('ix_lot_consumption_sale_id', 'lot_consumption', ['sale_id'])
+    op.create_index('ix_lot_consumption_lot_id', 'lot_consumption', ['lot_id'])
+    op.create_index('ix_lot_consumption_partition', 'lot_consumption', ['grain_id', 'godown_id', 'sale_date'])
+    op.create_index('ix_lot_consumption_godown_date', 'lot_consumption', ['godown_id', 'sale_date'])
+    op.create_index('ix_lot_consumption_party_date', 'lot_consumption', ['party_id', 'sale_date'])
+    op.create_index('ix_lot_consumption_date', 'lot_consumption', ['sale_date'])
+
+def downgrade():
+    op.drop_table('lot_consumption')
+    op.drop_table('cost_lots')
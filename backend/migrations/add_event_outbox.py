@@ -0,0 +1,23 @@
+"""Add event outbox for live dashboard updates
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Only written when EVENTS_BROKER=database (several workers behind one database).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'event_outbox',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('payload', sa.Text, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False)
+    )
+    op.create_index('ix_event_outbox_created_at', 'event_outbox', ['created_at'])
+
+def downgrade():
+    op.drop_index('ix_event_outbox_created_at', table_name='event_outbox')
+    op.drop_table('event_outbox')
@@ -0,0 +1,124 @@
+"""Add financial-year archive tables and carried-forward opening stock
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+The archive tables mirror sale, sale_godown_detail, purchase and
+payment_history without keys; rows keep their ids. Cost lots and lot
+consumption keep pointing at archived bills, so their foreign keys to
+purchase and sale are dropped. `flask close-year 2024` fills the archive.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'financial_years',
+        sa.Column('start_year', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('starts_on', sa.DateTime, nullable=False),
+        sa.Column('ends_on', sa.DateTime, nullable=False),
+        sa.Column('sales', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('sales_amount', sa.Float, nullable=False, server_default='0'),
+        sa.Column('purchases', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('purchases_amount', sa.Float, nullable=False, server_default='0'),
+        sa.Column('payments', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('closed_at', sa.DateTime)
+    )
+    op.create_table(
+        'opening_stock',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('start_year', sa.Integer, sa.ForeignKey('financial_years.start_year', name='fk_openingstock_year'),
+                  nullable=False),
+        sa.Column('grain_id', sa.Integer, nullable=False),
+        sa.Column('godown_id', sa.Integer, nullable=False),
+        sa.Column('bags', sa.Integer, nullable=False, server_default='0'),
+        sa.UniqueConstraint('start_year', 'grain_id', 'godown_id', name='uq_opening_stock')
+    )
+
+    op.create_table(
+        'sale_archive',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('bill_number', sa.String(20), nullable=False),
+        sa.Column('grain_id', sa.Integer, nullable=False),
+        sa.Column('buyer_name', sa.String(100), nullable=False),
+        sa.Column('number_of_bags', sa.Integer, nullable=False),
+        sa.Column('total_weight', sa.Float, nullable=False),
+        sa.Column('rate_per_kg', sa.Float, nullable=False),
+        sa.Column('total_amount', sa.Float, nullable=False),
+        sa.Column('transportation_mode', sa.String(50), nullable=False),
+        sa.Column('vehicle_number', sa.String(20), nullable=False),
+        sa.Column('driver_name', sa.String(100), nullable=False),
+        sa.Column('lr_number', sa.String(50)),
+        sa.Column('po_number', sa.String(50)),
+        sa.Column('buyer_gst', sa.String(20)),
+        sa.Column('party_id', sa.Integer),
+        sa.Column('sale_date', sa.DateTime, nullable=False),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('payment_status', sa.String(20)),
+        sa.Column('paid_amount', sa.Float)
+    )
+    op.create_index('ix_sale_archive_sale_date', 'sale_archive', ['sale_date'])
+
+    op.create_table(
+        'sale_godown_detail_archive',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('sale_id', sa.Integer, nullable=False),
+        sa.Column('godown_id', sa.Integer, nullable=False),
+        sa.Column('number_of_bags', sa.Integer, nullable=False),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_index('ix_sale_godown_detail_archive_sale_id', 'sale_godown_detail_archive', ['sale_id'])
+
+    op.create_table(
+        'purchase_archive',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('grain_id', sa.Integer, nullable=False),
+        sa.Column('godown_id', sa.Integer, nullable=False),
+        sa.Column('bill_number', sa.String(50), nullable=False),
+        sa.Column('number_of_bags', sa.Integer, nullable=False),
+        sa.Column('weight_per_bag', sa.Float, nullable=False),
+        sa.Column('extra_weight', sa.Float),
+        sa.Column('rate_per_kg', sa.Float, nullable=False),
+        sa.Column('total_weight', sa.Float, nullable=False),
+        sa.Column('total_amount', sa.Float, nullable=False),
+        sa.Column('payment_status', sa.String(20), nullable=False),
+        sa.Column('paid_amount', sa.Float),
+        sa.Column('supplier_name', sa.String(200), nullable=False),
+        sa.Column('party_id', sa.Integer),
+        sa.Column('purchase_date', sa.DateTime, nullable=False),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_index('ix_purchase_archive_purchase_date', 'purchase_archive', ['purchase_date'])
+
+    op.create_table(
+        'payment_history_archive',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('purchase_id', sa.Integer),
+        sa.Column('sale_id', sa.Integer),
+        sa.Column('amount', sa.Float, nullable=False),
+        sa.Column('description', sa.Text),
+        sa.Column('payment_date', sa.DateTime, nullable=False),
+        sa.Column('reference', sa.String(100)),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_index('ix_payment_history_archive_sale_id', 'payment_history_archive', ['sale_id'])
+    op.create_index('ix_payment_history_archive_purchase_id', 'payment_history_archive', ['purchase_id'])
+
+    with op.batch_alter_table('cost_lots') as batch_op:
+        batch_op.drop_constraint('fk_costlot_purchase', type_='foreignkey')
+    with op.batch_alter_table('lot_consumption') as batch_op:
+        batch_op.drop_constraint('fk_lotconsumption_sale', type_='foreignkey')
+
+def downgrade():
+    # Move archived bills back first (`flask reopen-year`) or they are lost
+    with op.batch_alter_table('lot_consumption') as batch_op:
+        batch_op.create_foreign_key('fk_lotconsumption_sale', 'sale', ['sale_id'], ['id'])
+    with op.batch_alter_table('cost_lots') as batch_op:
+        batch_op.create_foreign_key('fk_costlot_purchase', 'purchase', ['purchase_id'], ['id'])
+    op.drop_table('payment_history_archive')
+    op.drop_table('purchase_archive')
+    op.drop_table('sale_godown_detail_archive')
+    op.drop_table('sale_archive')
+    op.drop_table('opening_stock')
+    op.drop_table('financial_years')
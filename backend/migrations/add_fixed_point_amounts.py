@@ -0,0 +1,66 @@
+"""Store money as integer paise and weights as integer grams
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Every amount, rate and weight column moves from FLOAT to BIGINT (see
+utils/money.py), rounding existing values to the paisa or gram. On SQLite
+the values are scaled in place before each table is rebuilt with the new
+types; rebuilding sale and purchase drops their search triggers, so those
+are created again at the end.
+"""
+from alembic import op
+import sqlalchemy as sa
+from utils.search import create_index
+
+MONEY, WEIGHT = 100, 1000
+
+BILL_COLUMNS = {'weight_per_bag': WEIGHT, 'extra_weight': WEIGHT, 'rate_per_kg': MONEY,
+                'total_weight': WEIGHT, 'total_amount': MONEY, 'paid_amount': MONEY}
+SALE_COLUMNS = {'total_weight': WEIGHT, 'rate_per_kg': MONEY, 'total_amount': MONEY, 'paid_amount': MONEY}
+
+# table -> {column: units per rupee or kilogram}
+COLUMNS = {
+    'purchase': BILL_COLUMNS,
+    'purchase_archive': BILL_COLUMNS,
+    'sale': SALE_COLUMNS,
+    'sale_archive': SALE_COLUMNS,
+    'payment_history': {'amount': MONEY},
+    'payment_history_archive': {'amount': MONEY},
+    'stock_transfers': {'cost': MONEY, 'weight': WEIGHT},
+    'parties': {'receivable': MONEY, 'payable': MONEY},
+    'party_balance': {'outstanding': MONEY},
+    'cost_lots': {'weight': WEIGHT, 'cost': MONEY, 'remaining_cost': MONEY},
+    'lot_consumption': {'weight': WEIGHT, 'cost': MONEY, 'revenue': MONEY, 'margin': MONEY},
+    'price_daily': {'min_rate': MONEY, 'max_rate': MONEY, 'weight': WEIGHT, 'amount': MONEY},
+    'financial_years': {'sales_amount': MONEY, 'purchases_amount': MONEY},
+}
+
+
+def _convert(to_fixed):
+    bind = op.get_bind()
+    sqlite = bind.dialect.name == 'sqlite'
+    for table, columns in COLUMNS.items():
+        if sqlite and to_fixed:
+            bind.execute(sa.text(f'UPDATE {table} SET ' + ', '.join(
+                f'{column} = ROUND({column} * {factor})' for column, factor in columns.items())))
+        with op.batch_alter_table(table) as batch_op:
+            for column, factor in columns.items():
+                if to_fixed:
+                    batch_op.alter_column(column, type_=sa.BigInteger(), existing_type=sa.Float(),
+                                          postgresql_using=f'round({column} * {factor})::bigint')
+                else:
+                    batch_op.alter_column(column, type_=sa.Float(), existing_type=sa.BigInteger(),
+                                          postgresql_using=f'{column} / {factor}.0')
+        if sqlite and not to_fixed:
+            bind.execute(sa.text(f'UPDATE {table} SET ' + ', '.join(
+                f'{column} = {column} / {factor}.0' for column, factor in columns.items())))
+    if sqlite:
+        create_index(bind)
+
+def upgrade():
+    _convert(True)
+
+def downgrade():
+    _convert(False)
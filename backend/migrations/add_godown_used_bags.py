@@ -0,0 +1,23 @@
+"""Add used bags counter to godowns
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Backfilled from bag_inventory; `flask check-godown-usage` compares the two
+afterwards.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('godowns', sa.Column('used_bags', sa.Integer, nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE godowns SET used_bags = (
+            SELECT COALESCE(SUM(number_of_bags), 0) FROM bag_inventory
+            WHERE bag_inventory.godown_id = godowns.id
+        )
+    """)
+
+def downgrade():
+    op.drop_column('godowns', 'used_bags')
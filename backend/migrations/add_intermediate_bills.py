@@ -0,0 +1,29 @@
+"""Add intermediate bills parsed from voice input
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+The model used to live in a models/ package that models.py shadowed, so the
+table was never created and the voice bill blueprint could not be imported.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'intermediate_bill',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('bill_type', sa.String(10), nullable=False),
+        sa.Column('raw_transcript', sa.Text, nullable=False),
+        sa.Column('parsed_data', sa.JSON, nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('error_message', sa.Text),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('updated_at', sa.DateTime, nullable=False),
+        sa.Column('created_by_id', sa.Integer, sa.ForeignKey('user.id', name='fk_intermediatebill_user'),
+                  nullable=False)
+    )
+
+def downgrade():
+    op.drop_table('intermediate_bill')
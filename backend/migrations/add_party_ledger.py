@@ -0,0 +1,53 @@
+"""Add parties and per-day outstanding balances
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Run `flask rebuild-ledger` after upgrading to link existing bills.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'parties',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(200), nullable=False),
+        sa.Column('normalized_name', sa.String(200), nullable=False, unique=True),
+        sa.Column('receivable', sa.Float, nullable=False, server_default='0'),
+        sa.Column('payable', sa.Float, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_table(
+        'party_balance',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('party_id', sa.Integer, sa.ForeignKey('parties.id', name='fk_partybalance_party'), nullable=False),
+        sa.Column('side', sa.String(20), nullable=False),
+        sa.Column('bill_date', sa.Date, nullable=False),
+        sa.Column('outstanding', sa.Float, nullable=False, server_default='0'),
+        sa.UniqueConstraint('party_id', 'side', 'bill_date', name='uq_party_side_date')
+    )
+    op.create_index('ix_party_balance_side_date', 'party_balance', ['side', 'bill_date'])
+
+    with op.batch_alter_table('purchase') as batch_op:
+        batch_op.add_column(sa.Column('party_id', sa.Integer))
+        batch_op.create_foreign_key('fk_purchase_party', 'parties', ['party_id'], ['id'])
+        batch_op.create_index('ix_purchase_party_id', ['party_id'])
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.add_column(sa.Column('party_id', sa.Integer))
+        batch_op.create_foreign_key('fk_sale_party', 'parties', ['party_id'], ['id'])
+        batch_op.create_index('ix_sale_party_id', ['party_id'])
+
+def downgrade():
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.drop_index('ix_sale_party_id')
+        batch_op.drop_constraint('fk_sale_party', type_='foreignkey')
+        batch_op.drop_column('party_id')
+    with op.batch_alter_table('purchase') as batch_op:
+        batch_op.drop_index('ix_purchase_party_id')
+        batch_op.drop_constraint('fk_purchase_party', type_='foreignkey')
+        batch_op.drop_column('party_id')
+    op.drop_index('ix_party_balance_side_date', 'party_balance')
+    op.drop_table('party_balance')
+    op.drop_table('parties')
@@ -0,0 +1,28 @@
+"""Add daily price buckets
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Run `flask rebuild-prices` after upgrading to bucket existing bills.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'price_daily',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('grain_id', sa.Integer, sa.ForeignKey('grains.id', name='fk_pricedaily_grain'), nullable=False),
+        sa.Column('side', sa.String(10), nullable=False),
+        sa.Column('day', sa.Date, nullable=False),
+        sa.Column('min_rate', sa.Float, nullable=False),
+        sa.Column('max_rate', sa.Float, nullable=False),
+        sa.Column('weight', sa.Float, nullable=False),
+        sa.Column('amount', sa.Float, nullable=False),
+        sa.Column('bills', sa.Integer, nullable=False),
+        sa.UniqueConstraint('grain_id', 'day', 'side', name='uq_price_grain_day_side')
+    )
+
+def downgrade():
+    op.drop_table('price_daily')
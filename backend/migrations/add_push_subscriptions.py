@@ -0,0 +1,27 @@
+"""Add push subscriptions
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Subscriptions used to live in process memory, so browsers have to
+subscribe again once after upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'push_subscriptions',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id', name='fk_pushsubscription_user')),
+        sa.Column('endpoint', sa.String(1024), nullable=False, unique=True),
+        sa.Column('p256dh', sa.String(200), nullable=False),
+        sa.Column('auth', sa.String(100), nullable=False),
+        sa.Column('created_at', sa.DateTime)
+    )
+    op.create_index('ix_push_subscriptions_user_id', 'push_subscriptions', ['user_id'])
+
+def downgrade():
+    op.drop_index('ix_push_subscriptions_user_id', table_name='push_subscriptions')
+    op.drop_table('push_subscriptions')
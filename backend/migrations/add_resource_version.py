@@ -0,0 +1,23 @@
+"""Add resource version counters for HTTP caching
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+RESOURCES = ['grains', 'godowns', 'inventory', 'purchases', 'sales']
+
+def upgrade():
+    resource_version = op.create_table(
+        'resource_version',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('version', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime, nullable=False, server_default=sa.func.now())
+    )
+    op.bulk_insert(resource_version, [{'name': name, 'version': 0} for name in RESOURCES])
+
+def downgrade():
+    op.drop_table('resource_version')
@@ -0,0 +1,15 @@
+"""Index sale godown details by sale
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Without it every join from a sale to its godown split scans the table.
+"""
+from alembic import op
+
+def upgrade():
+    op.create_index('ix_sale_godown_detail_sale_id', 'sale_godown_detail', ['sale_id'])
+
+def downgrade():
+    op.drop_index('ix_sale_godown_detail_sale_id', table_name='sale_godown_detail')
@@ -0,0 +1,52 @@
+"""Add sale payments and payment lookup indexes
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Run `flask rebuild-ledger` after upgrading so receivables use paid_amount.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.add_column(sa.Column('paid_amount', sa.Float, server_default='0'))
+        batch_op.create_index('ix_sale_party_status', ['party_id', 'payment_status'])
+    op.execute("UPDATE sale SET paid_amount = total_amount WHERE payment_status = 'paid'")
+
+    with op.batch_alter_table('purchase') as batch_op:
+        batch_op.create_index('ix_purchase_party_status', ['party_id', 'payment_status'])
+
+    with op.batch_alter_table('payment_history') as batch_op:
+        batch_op.alter_column('purchase_id', existing_type=sa.Integer, nullable=True)
+        batch_op.add_column(sa.Column('sale_id', sa.Integer))
+        batch_op.add_column(sa.Column('reference', sa.String(100)))
+        batch_op.create_foreign_key('fk_paymenthistory_sale', 'sale', ['sale_id'], ['id'])
+        batch_op.create_index('ix_payment_history_purchase_id', ['purchase_id'])
+        batch_op.create_index('ix_payment_history_sale_id', ['sale_id'])
+        batch_op.create_check_constraint('ck_payment_one_bill', '(purchase_id IS NULL) != (sale_id IS NULL)')
+
+    # Sales marked paid before payments were tracked get one history row each
+    op.execute(
+        "INSERT INTO payment_history (sale_id, amount, description, payment_date, created_at) "
+        "SELECT id, total_amount, 'Marked paid before payment tracking', sale_date, CURRENT_TIMESTAMP "
+        "FROM sale WHERE payment_status = 'paid'"
+    )
+
+def downgrade():
+    op.execute("DELETE FROM payment_history WHERE sale_id IS NOT NULL")
+    with op.batch_alter_table('payment_history') as batch_op:
+        batch_op.drop_constraint('ck_payment_one_bill', type_='check')
+        batch_op.drop_index('ix_payment_history_sale_id')
+        batch_op.drop_index('ix_payment_history_purchase_id')
+        batch_op.drop_constraint('fk_paymenthistory_sale', type_='foreignkey')
+        batch_op.drop_column('reference')
+        batch_op.drop_column('sale_id')
+        batch_op.alter_column('purchase_id', existing_type=sa.Integer, nullable=False)
+
+    with op.batch_alter_table('purchase') as batch_op:
+        batch_op.drop_index('ix_purchase_party_status')
+    with op.batch_alter_table('sale') as batch_op:
+        batch_op.drop_index('ix_sale_party_status')
+        batch_op.drop_column('paid_amount')
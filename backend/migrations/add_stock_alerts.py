@@ -0,0 +1,48 @@
+"""Add stock thresholds and alerts
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Existing stock is not evaluated until something touches it; run
+`flask evaluate-alerts` once after upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'stock_thresholds',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('grain_id', sa.Integer, sa.ForeignKey('grains.id', name='fk_stockthreshold_grain')),
+        sa.Column('godown_id', sa.Integer, sa.ForeignKey('godowns.id', name='fk_stockthreshold_godown')),
+        sa.Column('min_bags', sa.Integer),
+        sa.Column('max_fill_pct', sa.Float),
+        sa.Column('min_days_cover', sa.Float),
+        sa.Column('velocity_days', sa.Integer),
+        sa.Column('updated_at', sa.DateTime),
+        sa.UniqueConstraint('grain_id', 'godown_id', name='uq_threshold_grain_godown')
+    )
+    op.create_table(
+        'stock_alerts',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('grain_id', sa.Integer),
+        sa.Column('godown_id', sa.Integer, nullable=False),
+        sa.Column('rule', sa.String(20), nullable=False),
+        sa.Column('state', sa.String(10), nullable=False),
+        sa.Column('value', sa.Float),
+        sa.Column('threshold', sa.Float),
+        sa.Column('opened_at', sa.DateTime, nullable=False),
+        sa.Column('resolved_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime, nullable=False)
+    )
+    op.create_index('ix_stock_alert_feed', 'stock_alerts', ['state', 'updated_at'])
+    op.create_index('uq_stock_alert_open', 'stock_alerts',
+                    ['godown_id', sa.text('coalesce(grain_id, 0)'), 'rule'], unique=True,
+                    sqlite_where=sa.text("state = 'open'"), postgresql_where=sa.text("state = 'open'"))
+
+def downgrade():
+    op.drop_index('uq_stock_alert_open', table_name='stock_alerts')
+    op.drop_index('ix_stock_alert_feed', table_name='stock_alerts')
+    op.drop_table('stock_alerts')
+    op.drop_table('stock_thresholds')
@@ -0,0 +1,53 @@
+"""Add stock transfers between godowns
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Transferred bags carry their cost basis into a lot at the destination,
+hence cost_lots.transfer_id.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'stock_transfers',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('reference', sa.String(50), nullable=False),
+        sa.Column('grain_id', sa.Integer, sa.ForeignKey('grains.id', name='fk_stocktransfer_grain'), nullable=False),
+        sa.Column('from_godown_id', sa.Integer, sa.ForeignKey('godowns.id', name='fk_stocktransfer_from_godown'),
+                  nullable=False),
+        sa.Column('to_godown_id', sa.Integer, sa.ForeignKey('godowns.id', name='fk_stocktransfer_to_godown'),
+                  nullable=False),
+        sa.Column('number_of_bags', sa.Integer, nullable=False),
+        sa.Column('cost', sa.Float),
+        sa.Column('costed_bags', sa.Integer),
+        sa.Column('weight', sa.Float),
+        sa.Column('note', sa.String(200)),
+        sa.Column('transfer_date', sa.DateTime, nullable=False),
+        sa.Column('created_by', sa.Integer, sa.ForeignKey('user.id', name='fk_stocktransfer_user')),
+        sa.Column('created_at', sa.DateTime),
+        sa.CheckConstraint('from_godown_id != to_godown_id', name='ck_transfer_distinct_godowns'),
+        sa.CheckConstraint('number_of_bags > 0', name='ck_transfer_positive_bags')
+    )
+    op.create_index('ix_stock_transfers_reference', 'stock_transfers', ['reference'])
+    op.create_index('ix_stock_transfer_from', 'stock_transfers', ['grain_id', 'from_godown_id', 'transfer_date'])
+    op.create_index('ix_stock_transfer_to', 'stock_transfers', ['grain_id', 'to_godown_id', 'transfer_date'])
+    op.create_index('ix_stock_transfer_date', 'stock_transfers', ['transfer_date'])
+
+    with op.batch_alter_table('cost_lots') as batch_op:
+        batch_op.add_column(sa.Column('transfer_id', sa.Integer))
+        batch_op.create_foreign_key('fk_costlot_transfer', 'stock_transfers', ['transfer_id'], ['id'])
+        batch_op.create_index('ix_cost_lots_transfer_id', ['transfer_id'])
+
+def downgrade():
+    with op.batch_alter_table('cost_lots') as batch_op:
+        batch_op.drop_index('ix_cost_lots_transfer_id')
+        batch_op.drop_constraint('fk_costlot_transfer', type_='foreignkey')
+        batch_op.drop_column('transfer_id')
+    op.drop_index('ix_stock_transfer_date', table_name='stock_transfers')
+    op.drop_index('ix_stock_transfer_to', table_name='stock_transfers')
+    op.drop_index('ix_stock_transfer_from', table_name='stock_transfers')
+    op.drop_index('ix_stock_transfers_reference', table_name='stock_transfers')
+    op.drop_table('stock_transfers')
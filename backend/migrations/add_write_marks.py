@@ -0,0 +1,21 @@
+"""Add per-user write marks for read-replica routing
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+Each write request stamps the user's row in the same transaction; reads
+routed to a replica go to the primary until the replica has caught up past it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'write_marks',
+        sa.Column('user_id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('written_at', sa.DateTime, nullable=False)
+    )
+
+def downgrade():
+    op.drop_table('write_marks')
@@ -0,0 +1,25 @@
+"""Keep search_key() out of the bill search triggers
+
+Revision ID: xxx
+Revises: xxx
+Create Date: 2026-10-19 xx:xx:xx.xxx
+
+The triggers called search_key(), a Python function only the app registers,
+so any other client inserting or updating a bill failed. They now index the
+bill with party_key NULL and the app fills the key in after each flush.
+"""
+from alembic import op
+from sqlalchemy import text
+from utils.search import create_index, sqlite_drop_trigger_ddl
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in sqlite_drop_trigger_ddl():
+            bind.execute(text(statement))
+        create_index(bind)
+
+def downgrade():
+    # The old triggers cannot be recreated without search_key() on every
+    # connection; the new ones keep the index in sync either way
+    pass
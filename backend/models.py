@@ -1,8 +1,9 @@
 from extensions import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from enum import Enum
 from sqlalchemy import func
+from utils.money import Money, Weight
 
 class Role(str, Enum):
     ADMIN = 'admin'
@@ -85,19 +86,25 @@ class Purchase(db.Model):
     godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_purchase_godown'), nullable=False)
     bill_number = db.Column(db.String(50), unique=True, nullable=False)
     number_of_bags = db.Column(db.Integer, nullable=False)
-    weight_per_bag = db.Column(db.Float, nullable=False)  # in kg
-    extra_weight = db.Column(db.Float, default=0)  # in kg
-    rate_per_kg = db.Column(db.Float, nullable=False)
-    total_weight = db.Column(db.Float, nullable=False)  # Calculated field
-    total_amount = db.Column(db.Float, nullable=False)  # Calculated field
+    weight_per_bag = db.Column(Weight, nullable=False)  # in kg
+    extra_weight = db.Column(Weight, default=0)  # in kg
+    rate_per_kg = db.Column(Money, nullable=False)
+    total_weight = db.Column(Weight, nullable=False)  # Calculated field
+    total_amount = db.Column(Money, nullable=False)  # Calculated field
     payment_status = db.Column(db.String(20), nullable=False, default=PaymentStatus.PENDING.value)
-    paid_amount = db.Column(db.Float, default=0)
+    paid_amount = db.Column(Money, default=0)
     supplier_name = db.Column(db.String(200), nullable=False)
+    party_id = db.Column(db.Integer, db.ForeignKey('parties.id', name='fk_purchase_party'), index=True)
     purchase_date = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_purchase_party_status', 'party_id', 'payment_status'),
+    )
     
     grain = db.relationship('Grain', backref='purchases')
     godown = db.relationship('Godown', backref='purchases')
+    party = db.relationship('Party', backref='purchases')
     payment_history = db.relationship('PaymentHistory', backref='purchase', lazy='dynamic')
 
 class Inventory(db.Model):
@@ -116,20 +123,29 @@ class Sale(db.Model):
     grain_id = db.Column(db.Integer, db.ForeignKey('grains.id'), nullable=False)
     buyer_name = db.Column(db.String(100), nullable=False)
     number_of_bags = db.Column(db.Integer, nullable=False)
-    total_weight = db.Column(db.Float, nullable=False)  # Total weight in kg
-    rate_per_kg = db.Column(db.Float, nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
+    total_weight = db.Column(Weight, nullable=False)  # Total weight in kg
+    rate_per_kg = db.Column(Money, nullable=False)
+    total_amount = db.Column(Money, nullable=False)
     transportation_mode = db.Column(db.String(50), nullable=False)
     vehicle_number = db.Column(db.String(20), nullable=False)
     driver_name = db.Column(db.String(100), nullable=False)
     lr_number = db.Column(db.String(50))
     po_number = db.Column(db.String(50))
     buyer_gst = db.Column(db.String(20))
+    party_id = db.Column(db.Integer, db.ForeignKey('parties.id', name='fk_sale_party'), index=True)
     sale_date = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     payment_status = db.Column(db.String(20), default='pending')
+    paid_amount = db.Column(Money, default=0)
+
+    __table_args__ = (
+        db.Index('ix_sale_party_status', 'party_id', 'payment_status'),
+    )
     
     grain = db.relationship('Grain', backref='sales')
+    party = db.relationship('Party', backref='sales')
+    payment_history = db.relationship('PaymentHistory', backref='sale', lazy='dynamic',
+                                      cascade='all, delete-orphan')
     godown_details = db.relationship('SaleGodownDetail', 
                                    backref='sale',
                                    cascade='all, delete-orphan',
@@ -139,7 +155,7 @@ class SaleGodownDetail(db.Model):
     __tablename__ = 'sale_godown_detail'
     
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id', name='fk_salegodowndetail_sale'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id', name='fk_salegodowndetail_sale'), nullable=False, index=True)
     godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_salegodowndetail_godown'), nullable=False)
     number_of_bags = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -153,6 +169,7 @@ class Godown(db.Model):
     name = db.Column(db.String(100), nullable=False)
     location = db.Column(db.String(200))
     capacity = db.Column(db.Integer)  # Total bag capacity
+    used_bags = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # kept in step by utils.capacity
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class BagInventory(db.Model):
@@ -182,10 +199,336 @@ class BagInventory(db.Model):
         self.number_of_bags -= number_of_bags
         self.last_updated = datetime.utcnow()
 
+class StockTransfer(db.Model):
+    """Bags of one grain moved between godowns; a batch shares its reference.
+
+    cost, costed_bags and weight are the cost basis that moved with the bags
+    (bags no purchase accounts for move without one).
+    """
+    __tablename__ = 'stock_transfers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(50), nullable=False, index=True)
+    grain_id = db.Column(db.Integer, db.ForeignKey('grains.id', name='fk_stocktransfer_grain'), nullable=False)
+    from_godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_stocktransfer_from_godown'), nullable=False)
+    to_godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_stocktransfer_to_godown'), nullable=False)
+    number_of_bags = db.Column(db.Integer, nullable=False)
+    cost = db.Column(Money)
+    costed_bags = db.Column(db.Integer)
+    weight = db.Column(Weight)  # in kg
+    note = db.Column(db.String(200))
+    transfer_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_stocktransfer_user'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    grain = db.relationship('Grain')
+    from_godown = db.relationship('Godown', foreign_keys=[from_godown_id])
+    to_godown = db.relationship('Godown', foreign_keys=[to_godown_id])
+
+    __table_args__ = (
+        db.CheckConstraint('from_godown_id != to_godown_id', name='ck_transfer_distinct_godowns'),
+        db.CheckConstraint('number_of_bags > 0', name='ck_transfer_positive_bags'),
+        db.Index('ix_stock_transfer_from', 'grain_id', 'from_godown_id', 'transfer_date'),
+        db.Index('ix_stock_transfer_to', 'grain_id', 'to_godown_id', 'transfer_date'),
+        db.Index('ix_stock_transfer_date', 'transfer_date'),
+    )
+
 class PaymentHistory(db.Model):
+    """A payment against either a purchase (outgoing) or a sale (incoming)"""
     id = db.Column(db.Integer, primary_key=True)
-    purchase_id = db.Column(db.Integer, db.ForeignKey('purchase.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchase.id'), index=True)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id', name='fk_paymenthistory_sale'), index=True)
+    amount = db.Column(Money, nullable=False)
     description = db.Column(db.Text)
     payment_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    reference = db.Column(db.String(100))  # e.g. bank statement line reference
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.CheckConstraint('(purchase_id IS NULL) != (sale_id IS NULL)', name='ck_payment_one_bill'),
+    )
+
+class ResourceVersion(db.Model):
+    """Per-resource change counter used for HTTP conditional GETs"""
+    __tablename__ = 'resource_version'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class WriteMark(db.Model):
+    """When a user last committed a write, so their reads skip a replica that is behind it"""
+    __tablename__ = 'write_marks'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    written_at = db.Column(db.DateTime, nullable=False)
+
+class EventOutbox(db.Model):
+    """Committed change events, polled by every worker to fan out live updates"""
+    __tablename__ = 'event_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON delta
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class PushSubscription(db.Model):
+    """A browser push endpoint registered by a signed-in user"""
+    __tablename__ = 'push_subscriptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_pushsubscription_user'), index=True)
+    endpoint = db.Column(db.String(1024), unique=True, nullable=False)
+    p256dh = db.Column(db.String(200), nullable=False)
+    auth = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def subscription_info(self):
+        return {'endpoint': self.endpoint, 'keys': {'p256dh': self.p256dh, 'auth': self.auth}}
+
+class AlertRule(str, Enum):
+    MIN_BAGS = 'min_bags'  # stock below a bag count
+    MAX_FILL = 'max_fill'  # godown above a % of its capacity (godown-wide, grain_id is NULL)
+    DAYS_COVER = 'days_cover'  # stock lasts fewer days at the recent sales rate
+
+class AlertState(str, Enum):
+    OPEN = 'open'
+    RESOLVED = 'resolved'
+
+class StockThreshold(db.Model):
+    """Alert limits for a grain and/or godown; NULL grain or godown means any.
+
+    Each limit is taken from the most specific row that sets it:
+    grain+godown, then grain, then godown, then the global row.
+    """
+    __tablename__ = 'stock_thresholds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    grain_id = db.Column(db.Integer, db.ForeignKey('grains.id', name='fk_stockthreshold_grain'))
+    godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_stockthreshold_godown'))
+    min_bags = db.Column(db.Integer)
+    max_fill_pct = db.Column(db.Float)  # only read from rows without a grain
+    min_days_cover = db.Column(db.Float)
+    velocity_days = db.Column(db.Integer)  # sales window for days of cover, default 30
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('grain_id', 'godown_id', name='uq_threshold_grain_godown'),
+    )
+
+class StockAlert(db.Model):
+    """One breach of a rule, open until the condition clears"""
+    __tablename__ = 'stock_alerts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    grain_id = db.Column(db.Integer)
+    godown_id = db.Column(db.Integer, nullable=False)
+    rule = db.Column(db.String(20), nullable=False)
+    state = db.Column(db.String(10), nullable=False, default=AlertState.OPEN.value)
+    value = db.Column(db.Float)  # bags, fill % or days of cover when last evaluated
+    threshold = db.Column(db.Float)
+    opened_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stock_alert_feed', 'state', 'updated_at'),
+    )
+
+# At most one open alert per rule and stock row; godown-wide alerts have no
+# grain, and NULLs never collide in a unique index, hence the coalesce
+db.Index('uq_stock_alert_open', StockAlert.godown_id, func.coalesce(StockAlert.grain_id, 0), StockAlert.rule,
+         unique=True, sqlite_where=db.text("state = 'open'"), postgresql_where=db.text("state = 'open'"))
+
+class LedgerSide(str, Enum):
+    RECEIVABLE = 'receivable'  # buyers owe us
+    PAYABLE = 'payable'  # we owe suppliers
+
+class Party(db.Model):
+    """A supplier and/or buyer, matched on normalized name"""
+    __tablename__ = 'parties'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    normalized_name = db.Column(db.String(200), unique=True, nullable=False)
+    receivable = db.Column(Money, nullable=False, default=0)
+    payable = db.Column(Money, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PartyBalance(db.Model):
+    """Outstanding amount per party, side and bill date, kept current on every write"""
+    __tablename__ = 'party_balance'
+
+    id = db.Column(db.Integer, primary_key=True)
+    party_id = db.Column(db.Integer, db.ForeignKey('parties.id', name='fk_partybalance_party'), nullable=False)
+    side = db.Column(db.String(20), nullable=False)
+    bill_date = db.Column(db.Date, nullable=False)
+    outstanding = db.Column(Money, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('party_id', 'side', 'bill_date', name='uq_party_side_date'),
+        db.Index('ix_party_balance_side_date', 'side', 'bill_date'),
+    )
+
+    party = db.relationship('Party', backref='balances')
+
+class CostingMethod(str, Enum):
+    FIFO = 'fifo'
+    WEIGHTED_AVERAGE = 'weighted_average'
+
+class CostLot(db.Model):
+    """Cost basis of the bags one purchase (or one transfer) put into a godown"""
+    __tablename__ = 'cost_lots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    purchase_id = db.Column(db.Integer, index=True)  # may be archived (utils.archive), so no foreign key
+    transfer_id = db.Column(db.Integer, db.ForeignKey('stock_transfers.id', name='fk_costlot_transfer'), index=True)
+    grain_id = db.Column(db.Integer, db.ForeignKey('grains.id', name='fk_costlot_grain'), nullable=False)
+    godown_id = db.Column(db.Integer, db.ForeignKey('godowns.id', name='fk_costlot_godown'), nullable=False)
+    lot_date = db.Column(db.DateTime, nullable=False)
+    bags = db.Column(db.Integer, nullable=False)
+    weight = db.Column(Weight, nullable=False)  # in kg
+    cost = db.Column(Money, nullable=False)
+    remaining_bags = db.Column(db.Integer, nullable=False)
+    remaining_cost = db.Column(Money, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_cost_lot_partition', 'grain_id', 'godown_id', 'lot_date'),
+    )
+
+class LotConsumption(db.Model):
+    """Bags of a sale drawn from one cost lot, with cost and revenue attributed.
+
+    lot_id is null (and cost/margin unknown) for bags sold from stock that no
+    purchase accounts for.
+    """
+    __tablename__ = 'lot_consumption'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sale_id = db.Column(db.Integer, nullable=False, index=True)  # may be archived, so no foreign key
+    lot_id = db.Column(db.Integer, db.ForeignKey('cost_lots.id', name='fk_lotconsumption_lot'), index=True)
+    grain_id = db.Column(db.Integer, nullable=False)
+    godown_id = db.Column(db.Integer, nullable=False)
+    party_id = db.Column(db.Integer)
+    sale_date = db.Column(db.DateTime, nullable=False)
+    bags = db.Column(db.Integer, nullable=False)
+    weight = db.Column(Weight)
+    cost = db.Column(Money)
+    revenue = db.Column(Money, nullable=False)
+    margin = db.Column(Money)
+
+    __table_args__ = (
+        db.Index('ix_lot_consumption_partition', 'grain_id', 'godown_id', 'sale_date'),
+        db.Index('ix_lot_consumption_godown_date', 'godown_id', 'sale_date'),
+        db.Index('ix_lot_consumption_party_date', 'party_id', 'sale_date'),
+        db.Index('ix_lot_consumption_date', 'sale_date'),
+    )
+
+class PriceBucket(db.Model):
+    """Daily buy/sell rate summary per grain, the base of the price analytics"""
+    __tablename__ = 'price_daily'
+
+    id = db.Column(db.Integer, primary_key=True)
+    grain_id = db.Column(db.Integer, db.ForeignKey('grains.id', name='fk_pricedaily_grain'), nullable=False)
+    side = db.Column(db.String(10), nullable=False)  # 'buy' (purchases) or 'sell' (sales)
+    day = db.Column(db.Date, nullable=False)
+    min_rate = db.Column(Money, nullable=False)
+    max_rate = db.Column(Money, nullable=False)
+    weight = db.Column(Weight, nullable=False)  # kg traded
+    amount = db.Column(Money, nullable=False)  # value traded; amount / weight is the VWAP
+    bills = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('grain_id', 'day', 'side', name='uq_price_grain_day_side'),
+    )
+
+class FinancialYear(db.Model):
+    """A closed financial year whose settled bills were moved to the archive tables.
+
+    The counts and amounts are what was archived, carried forward into the
+    all-time figures that the live tables alone no longer add up to.
+    """
+    __tablename__ = 'financial_years'
+
+    start_year = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 2024 is April 2024 - March 2025
+    starts_on = db.Column(db.DateTime, nullable=False)
+    ends_on = db.Column(db.DateTime, nullable=False)  # exclusive
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    sales_amount = db.Column(Money, nullable=False, default=0)
+    purchases = db.Column(db.Integer, nullable=False, default=0)
+    purchases_amount = db.Column(Money, nullable=False, default=0)
+    payments = db.Column(db.Integer, nullable=False, default=0)
+    closed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class OpeningStock(db.Model):
+    """Bags the archived bills of a closed year carry forward per (grain, godown):
+    archived purchases in, archived sales out"""
+    __tablename__ = 'opening_stock'
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_year = db.Column(db.Integer, db.ForeignKey('financial_years.start_year', name='fk_openingstock_year'),
+                           nullable=False)
+    grain_id = db.Column(db.Integer, nullable=False)
+    godown_id = db.Column(db.Integer, nullable=False)
+    bags = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('start_year', 'grain_id', 'godown_id', name='uq_opening_stock'),
+    )
+
+class IntermediateBill(db.Model):
+    """Model for storing intermediate bills generated from voice input"""
+    __tablename__ = 'intermediate_bill'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bill_type = db.Column(db.String(10), nullable=False)  # 'purchase' or 'sale'
+    raw_transcript = db.Column(db.Text, nullable=False)
+    parsed_data = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, approved, error
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    created_by = db.relationship('User', backref=db.backref('intermediate_bills', lazy=True))
+
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'bill_type': self.bill_type,
+            'raw_transcript': self.raw_transcript,
+            'parsed_data': self.parsed_data,
+            'status': self.status,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'created_by_id': self.created_by_id
+        }
+
+    @classmethod
+    def cleanup_old_records(cls, retention_hours=24):
+        """Delete old intermediate bills that are no longer needed"""
+        cutoff_time = datetime.utcnow() - timedelta(hours=retention_hours)
+        cls.query.filter(
+            cls.created_at < cutoff_time,
+            cls.status.in_(['approved', 'error'])
+        ).delete()
+        db.session.commit()
+
+def archive_table(model, *indexed):
+    """Copy of a bill table's columns without keys or constraints, for closed years.
+
+    Rows keep their ids, so live and archived rows union without clashes.
+    """
+    table = model.__table__
+    return db.Table(
+        f'{table.name}_archive', db.metadata,
+        *[db.Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False,
+                    nullable=column.nullable) for column in table.columns],
+        *[db.Index(f'ix_{table.name}_archive_{column}', column) for column in indexed]
+    )
+
+sale_archive = archive_table(Sale, 'sale_date')
+sale_godown_detail_archive = archive_table(SaleGodownDetail, 'sale_id')
+purchase_archive = archive_table(Purchase, 'purchase_date')
+payment_history_archive = archive_table(PaymentHistory, 'sale_id', 'purchase_id')
@@ -1,35 +1,47 @@
 from flask import Blueprint, jsonify, request
-from pywebpush import webpush, WebPushException
-import json
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import PushSubscription, db
 
 notifications = Blueprint('notifications', __name__)
 
-# Store subscriptions in memory (use database in production)
-push_subscriptions = set()
 
-@notifications.route('/api/notifications/subscribe', methods=['POST'])
+@notifications.route('/notifications/subscribe', methods=['POST'])
+@jwt_required()
 def subscribe():
-    subscription_info = request.get_json()
-    push_subscriptions.add(json.dumps(subscription_info))
-    return jsonify({'status': 'success'})
+    try:
+        data = request.get_json() or {}
+        endpoint = data.get('endpoint')
+        keys = data.get('keys') or {}
+        if not endpoint or not keys.get('p256dh') or not keys.get('auth'):
+            return jsonify({'error': 'endpoint and keys (p256dh, auth) are required'}), 400
 
-@notifications.route('/api/notifications/unsubscribe', methods=['POST'])
-def unsubscribe():
-    subscription_info = request.get_json()
-    push_subscriptions.remove(json.dumps(subscription_info))
-    return jsonify({'status': 'success'})
+        # Browsers re-send the same endpoint after key rotation or a new login
+        subscription = PushSubscription.query.filter_by(endpoint=endpoint).first()
+        if subscription is None:
+            subscription = PushSubscription(endpoint=endpoint)
+            db.session.add(subscription)
+        subscription.p256dh = keys['p256dh']
+        subscription.auth = keys['auth']
+        subscription.user_id = int(get_jwt_identity())
+        db.session.commit()
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        print(f"Error saving push subscription: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to save subscription'}), 500
 
-def send_push_notification(subscription_info, message):
+
+@notifications.route('/notifications/unsubscribe', methods=['POST'])
+@jwt_required()
+def unsubscribe():
     try:
-        webpush(
-            subscription_info=json.loads(subscription_info),
-            data=json.dumps(message),
-            vapid_private_key="your_private_key",
-            vapid_claims={
-                "sub": "mailto:your@email.com"
-            }
-        )
-    except WebPushException as e:
-        print(f"Push notification failed: {e}")
-        if e.response and e.response.status_code == 410:
-            push_subscriptions.remove(subscription_info) 
\ No newline at end of file
+        endpoint = (request.get_json() or {}).get('endpoint')
+        if not endpoint:
+            return jsonify({'error': 'endpoint is required'}), 400
+        PushSubscription.query.filter_by(endpoint=endpoint).delete(synchronize_session=False)
+        db.session.commit()
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        print(f"Error removing push subscription: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to remove subscription'}), 500
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Godown, Grain, Role, User  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app on a fresh SQLite file; no app context is left pushed, since
+    each request tears the shared session down"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret-key-of-at-least-32-bytes')
+    app = create_app()
+    app.config.update(TESTING=True, INVOICE_CACHE_DIR=str(tmp_path / 'invoices'))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(app):
+    with app.app_context():
+        user = User(username='admin', email='admin@example.com', role=Role.ADMIN.value)
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+        return {'Authorization': 'Bearer ' + create_access_token(identity=str(user.id))}
+
+
+@pytest.fixture
+def stock(app):
+    """(grain_id, [godown_id, godown_id]) to trade in"""
+    with app.app_context():
+        grain = Grain(name='Wheat')
+        godowns = [Godown(name='North', capacity=10 ** 6), Godown(name='South', capacity=10 ** 6)]
+        db.session.add_all([grain] + godowns)
+        db.session.commit()
+        return grain.id, [godown.id for godown in godowns]
+
+
+@pytest.fixture
+def buy(client, headers):
+    """POST a purchase; fields override a 10-bag default"""
+    def post(grain_id, godown_id, **fields):
+        body = dict({'grain_id': grain_id, 'godown_id': godown_id, 'number_of_bags': 10, 'weight_per_bag': 50,
+                     'rate_per_kg': 25, 'supplier_name': 'Supplier', 'purchase_date': '2026-10-01T00:00:00'},
+                    **fields)
+        return client.post('/api/purchases', json=body, headers=headers)
+    return post
+
+
+@pytest.fixture
+def sell(client, headers):
+    """POST a sale of `bags` from one godown; fields override the defaults"""
+    def post(grain_id, godown_id, bags=2, **fields):
+        body = dict({'grain_id': grain_id, 'buyer_name': 'Buyer', 'number_of_bags': bags,
+                     'total_weight': bags * 50, 'rate_per_kg': 30, 'transportation_mode': 'truck',
+                     'vehicle_number': 'MP09HG1234', 'driver_name': 'Driver',
+                     'godown_details': [{'godown_id': godown_id, 'number_of_bags': bags}]}, **fields)
+        return client.post('/api/sales', json=body, headers=headers)
+    return post
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from utils.backup import _connect, enable_wal
+
+
+def test_backup_and_restore_exit_nonzero_on_failure(app, tmp_path):
+    runner = app.test_cli_runner()
+    not_a_directory = tmp_path / 'file'
+    not_a_directory.write_text('')
+    assert runner.invoke(args=['backup', '--dir', str(not_a_directory)]).exit_code == 1
+    result = runner.invoke(args=['restore', str(tmp_path / 'restored.db'), '--dir', str(tmp_path / 'none')])
+    assert result.exit_code == 1
+
+
+def test_bill_waits_for_the_archiver_checkpoint(app, tmp_path, stock, buy):
+    """The archiver holds the write lock and commits a no-op while a bill is posted"""
+    grain_id, godown_ids = stock
+    database = str(tmp_path / 'test.db')
+    enable_wal(database)
+    held = threading.Event()
+
+    def checkpoint():
+        connection = _connect(database)
+        connection.execute('BEGIN IMMEDIATE')
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        connection.execute(f'PRAGMA user_version = {version}')
+        held.set()
+        time.sleep(0.5)
+        connection.execute('COMMIT')
+        connection.close()
+
+    archiver = threading.Thread(target=checkpoint)
+    archiver.start()
+    held.wait()
+    response = buy(grain_id, godown_ids[0])
+    archiver.join()
+    assert response.status_code == 201, response.get_json()
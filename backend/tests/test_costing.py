@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from extensions import db
+from models import Purchase
+
+
+def test_backdated_purchase_with_utc_offset_after_a_sale(app, client, headers, stock, buy, sell):
+    """A 'Z' timestamp is stored as naive UTC and compared with costed sale dates"""
+    grain_id, godown_ids = stock
+    assert buy(grain_id, godown_ids[0]).status_code == 201
+    assert sell(grain_id, godown_ids[0]).status_code == 201
+
+    response = buy(grain_id, godown_ids[0], purchase_date='2026-09-15T04:30:00Z')
+    assert response.status_code == 201, response.get_json()
+    later = buy(grain_id, godown_ids[0], purchase_date='2099-01-01T05:30:00+05:30')
+    assert later.status_code == 201, later.get_json()
+    edited = client.put(f"/api/purchases/{later.get_json()['id']}", headers=headers,
+                        json={'purchase_date': '2026-09-20T00:00:00Z'})
+    assert edited.status_code == 200, edited.get_json()
+
+    with app.app_context():
+        purchase = db.session.get(Purchase, response.get_json()['id'])
+        assert purchase.purchase_date == datetime(2026, 9, 15, 4, 30)
+        assert db.session.get(Purchase, later.get_json()['id']).purchase_date == datetime(2026, 9, 20)
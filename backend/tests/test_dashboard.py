@@ -0,0 +1,13 @@
+from datetime import datetime, timedelta
+
+
+def test_chart_groups_bills_by_bill_date(client, headers, stock, buy):
+    """A bill entered today for an earlier date counts in that month"""
+    grain_id, godown_ids = stock
+    earlier = datetime.now() - timedelta(days=70)
+    buy(grain_id, godown_ids[0], purchase_date=earlier.isoformat(), rate_per_kg=10)
+    buy(grain_id, godown_ids[0], purchase_date=(datetime.now() - timedelta(days=400)).isoformat())
+
+    chart = client.get('/api/dashboard/metrics', headers=headers).get_json()['chartData']
+    assert chart['labels'] == [earlier.strftime('%Y-%m')]
+    assert chart['datasets'][1]['data'] == [5000]
@@ -0,0 +1,17 @@
+from extensions import db
+from models import IntermediateBill, Purchase, Sale
+from utils.datagen import generate
+
+
+def test_generated_history_includes_voice_bills(app):
+    with app.app_context():
+        counts = generate(purchases=300, sales=300, grains=3, godowns=4, days=60)
+        assert counts['intermediate_bill'] == 3
+        assert Purchase.query.count() + Sale.query.count() == 600
+        bills = IntermediateBill.query.all()
+        assert {bill.status for bill in bills} <= {'pending', 'approved', 'error'}
+        for bill in bills:
+            assert bill.to_dict()['created_by_id'] == bill.created_by.id
+            assert 'grain_name' in bill.parsed_data
+            assert (bill.error_message is not None) == (bill.status == 'error')
+        db.session.rollback()
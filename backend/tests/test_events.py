@@ -0,0 +1,41 @@
+import pytest
+
+from app import create_app
+from utils.events import DatabaseBroker, LocalBroker, TooManySubscribers
+
+
+@pytest.fixture
+def streams_app(tmp_path, monkeypatch):
+    """An app whose worker has 8 threads"""
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    return create_app()
+
+
+def test_streams_are_capped_well_below_the_thread_count(streams_app):
+    assert streams_app.config['EVENTS_MAX_SUBSCRIBERS'] == 2
+    broker = streams_app.extensions['events']
+    broker.subscribe()
+    broker.subscribe()
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe()
+
+
+def test_stream_over_the_cap_gets_503(app, client, headers):
+    app.extensions['events'].max_subscribers = 1
+    first = client.get('/api/events', headers=headers, buffered=False)
+    assert first.status_code == 200
+    second = client.get('/api/events', headers=headers, buffered=False)
+    assert second.status_code == 503
+    first.close()
+
+
+def test_broker_follows_the_worker_count(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.delenv('EVENTS_BROKER', raising=False)
+    assert isinstance(create_app().extensions['events'], LocalBroker)
+    monkeypatch.setenv('GUNICORN_WORKERS', '4')
+    assert isinstance(create_app().extensions['events'], DatabaseBroker)
+    monkeypatch.setenv('EVENTS_BROKER', 'local')
+    with pytest.raises(ValueError):
+        create_app()
@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+from pypdf import PdfReader
+
+from utils import invoice as invoices
+
+
+def _text(document):
+    return '\n'.join(page.extract_text() for page in PdfReader(io.BytesIO(document)).pages)
+
+
+def test_page_prints_latin_text(client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    sale_id = sell(grain_id, godown_ids[0], buyer_name='Café Agro Traders').get_json()['id']
+    response = client.get(f'/api/sales/{sale_id}/invoice.pdf', headers=headers)
+    assert response.status_code == 200
+    assert response.data.startswith(b'%PDF-')
+    assert 'Café Agro Traders' in _text(response.data)
+
+
+def test_devanagari_is_printed_with_the_font_embedded(app, client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    app.config['INVOICE_SELLER_NAME'] = 'अन्नपूर्णा ट्रेडिंग'
+    latin = sell(grain_id, godown_ids[0]).get_json()
+    hindi = sell(grain_id, godown_ids[0], buyer_name='रमेश ट्रेडर्स', driver_name='सुरेश').get_json()
+
+    response = client.get(f"/api/sales/{hindi['id']}/invoice.pdf", headers=headers)
+    assert response.status_code == 200
+    assert b'+ShobhikaRegular' in response.data  # a subset of the font travels with the PDF
+    text = _text(response.data)
+    assert 'रमेश ट्रेडर्स' in text and 'सुरेश' in text and 'For अन्नपूर्णा' in text
+
+    response = client.post('/api/sales/invoices', headers=headers,
+                           json={'sale_ids': [latin['id'], hindi['id']], 'format': 'zip'})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert 'रमेश ट्रेडर्स' in _text(archive.read(f"{hindi['bill_number']}.pdf"))
+
+
+def test_batch_pdf_is_cached(client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    sale_ids = [sell(grain_id, godown_ids[0], buyer_name=name).get_json()['id'] for name in ('Ramesh', 'रमेश')]
+
+    first = client.post('/api/sales/invoices', headers=headers, json={'sale_ids': sale_ids})
+    assert first.status_code == 200
+    assert first.headers['X-Invoices-Rendered'] == '2'
+    assert len(PdfReader(io.BytesIO(first.data)).pages) == 2
+    again = client.post('/api/sales/invoices', headers=headers, json={'sale_ids': sale_ids})
+    assert again.headers['X-Invoices-Rendered'] == '0'
+    assert again.data == first.data
+
+
+def test_scripts_outside_the_font_are_refused(app, client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    hindi = sell(grain_id, godown_ids[0], buyer_name='रमेश').get_json()
+    tamil = sell(grain_id, godown_ids[0], buyer_name='முருகன் ஸ்டோர்ஸ்').get_json()
+
+    response = client.get(f"/api/sales/{tamil['id']}/invoice.pdf", headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['unprintable'] == [{'bill_number': tamil['bill_number'], 'fields': ['buyer']}]
+    response = client.post('/api/sales/invoices', headers=headers, json={'sale_ids': [hindi['id'], tamil['id']]})
+    assert [row['bill_number'] for row in response.get_json()['unprintable']] == [tamil['bill_number']]
+
+    app.config['INVOICE_SELLER_NAME'] = 'முருகன்'
+    response = client.get(f"/api/sales/{hindi['id']}/invoice.pdf", headers=headers)
+    assert response.status_code == 400
+    assert 'INVOICE_SELLER_NAME' in response.get_json()['error']
+
+
+def test_unprintable_checks_both_faces():
+    assert invoices.unprintable({'buyer': 'रमेश ट्रेडर्स', 'item': 'Wheat', 'driver': '李', 'bags': 3}) == ['driver']
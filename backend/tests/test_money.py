@@ -0,0 +1,99 @@
+import random
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from models import Purchase, Sale
+from utils.money import kilos, money, paise
+
+
+def test_units_round_half_even_and_drop_float_noise():
+    assert paise(0.1 + 0.2) == 30
+    assert paise(Decimal('0.125')) == 12
+    assert paise(Decimal('0.135')) == 14
+    assert paise(7) == 700
+    assert kilos(50.0004) == 50.0
+    assert money(19.999) == 20.0
+
+
+def _scalar(sql):
+    return db.session.execute(text(sql)).scalar()
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3, 4, 5])
+def test_totals_reconcile_exactly(app, client, headers, stock, buy, sell, seed):
+    """Random bills and payments in awkward fractions; every total agrees to the paisa"""
+    rng = random.Random(seed)
+    grain_id, godown_ids = stock
+    for day in range(40):
+        response = buy(grain_id, rng.choice(godown_ids), number_of_bags=rng.randrange(5, 40),
+                       weight_per_bag=rng.choice([49.7, 50, 50.3333]), extra_weight=rng.choice([0, 0.1234, 1.1]),
+                       rate_per_kg=round(rng.uniform(20, 40), rng.choice([1, 2, 3])),
+                       supplier_name=rng.choice(['Ravi', 'Mohan', ' ravi ']),
+                       purchase_date=f'2026-09-{day % 28 + 1:02d}T00:00:00')
+        assert response.status_code == 201, response.get_json()
+    for _ in range(30):
+        response = sell(grain_id, rng.choice(godown_ids), bags=rng.randrange(1, 4),
+                        total_weight=round(rng.uniform(50, 200), 4), rate_per_kg=round(rng.uniform(25, 45), 3),
+                        buyer_name=rng.choice(['Asha', 'Vijay']))
+        assert response.status_code in (201, 400), response.get_json()  # 400: godown ran short
+
+    with app.app_context():
+        bills = [('purchases', bill.id, bill.total_amount) for bill in Purchase.query] + \
+                [('sales', bill.id, bill.total_amount) for bill in Sale.query]
+    for kind, bill_id, total in bills:
+        # Two odd slices, then sometimes exactly what is left
+        for amount in (round(total / 3, 2), round(total / 7, 3)):
+            response = client.put(f'/api/{kind}/{bill_id}/payment-status', headers=headers,
+                                  json={'status': 'partially_paid', 'amount': amount})
+            assert response.status_code == 200, response.get_json()
+        if rng.random() < 0.6:
+            with app.app_context():
+                model = Purchase if kind == 'purchases' else Sale
+                bill = db.session.get(model, bill_id)
+                left = bill.total_amount - bill.paid_amount
+            response = client.put(f'/api/{kind}/{bill_id}/payment-status', headers=headers,
+                                  json={'status': 'paid', 'amount': left})
+            assert response.status_code == 200, response.get_json()
+
+    with app.app_context():
+        # Stored values are integer paise and grams
+        assert _scalar("SELECT count(*) FROM purchase WHERE typeof(total_amount) != 'integer' "
+                       "OR typeof(total_weight) != 'integer' OR typeof(paid_amount) != 'integer'") == 0
+        # The party ledger matches the bills, in paise
+        for table, side in (('purchase', 'payable'), ('sale', 'receivable')):
+            owed = _scalar(f'SELECT sum(total_amount - coalesce(paid_amount, 0)) FROM {table}')
+            assert owed == _scalar(f'SELECT sum({side}) FROM parties')
+            assert owed == _scalar(f"SELECT sum(outstanding) FROM party_balance WHERE side = '{side}'")
+            # Payments add up to what each bill records as paid
+            assert _scalar(f'SELECT count(*) FROM {table} b WHERE coalesce(paid_amount, 0) != '
+                           f'(SELECT coalesce(sum(amount), 0) FROM payment_history WHERE {table}_id = b.id)') == 0
+        # FIFO lots: what was drawn plus what is left is what was bought
+        assert _scalar('SELECT sum(cost) FROM cost_lots') == \
+            _scalar('SELECT sum(remaining_cost) FROM cost_lots') + _scalar('SELECT coalesce(sum(cost), 0) FROM lot_consumption')
+
+        for bill in list(Purchase.query) + list(Sale.query):
+            # A bill is paid exactly when nothing is owed
+            assert (bill.payment_status == 'paid') == (paise(bill.total_amount) == paise(bill.paid_amount))
+            # The stored total is the stored weight times the stored rate
+            assert paise(bill.total_amount) == paise(bill.total_weight * bill.rate_per_kg)
+        # SQL sums equal the sums of the values the ORM hands out
+        total = db.session.query(db.func.sum(Purchase.total_amount)).scalar()
+        assert paise(total) == sum(paise(bill.total_amount) for bill in Purchase.query)
+
+
+def test_edited_bills_total_from_stored_weight_and_rate(app, client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    purchase_id = buy(grain_id, godown_ids[0]).get_json()['id']
+    sale_id = sell(grain_id, godown_ids[0]).get_json()['id']
+    assert client.put(f'/api/purchases/{purchase_id}', headers=headers,
+                      json={'weight_per_bag': 49.99951, 'rate_per_kg': 23.4567}).status_code == 200
+    assert client.put(f'/api/sales/{sale_id}', headers=headers,
+                      json={'total_weight': 99.12345, 'rate_per_kg': 31.005}).status_code == 200
+    with app.app_context():
+        for bill in (db.session.get(Purchase, purchase_id), db.session.get(Sale, sale_id)):
+            assert bill.total_weight == kilos(bill.total_weight)
+            assert bill.rate_per_kg == money(bill.rate_per_kg)
+            assert paise(bill.total_amount) == paise(bill.total_weight * bill.rate_per_kg)
@@ -0,0 +1,70 @@
+import pytest
+
+from extensions import db
+from models import BagInventory, Sale
+
+
+def _bags(app, grain_id, godown_id):
+    with app.app_context():
+        row = BagInventory.query.filter_by(grain_id=grain_id, godown_id=godown_id).first()
+        return row.number_of_bags if row else 0
+
+
+def test_changing_bags_of_a_single_godown_sale_moves_its_stock(app, client, headers, stock, buy, sell):
+    """The edit form sends number_of_bags alone; the sale's only godown absorbs the change"""
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    sale_id = sell(grain_id, godown_ids[0], bags=4).get_json()['id']
+    assert _bags(app, grain_id, godown_ids[0]) == 6
+
+    response = client.put(f'/api/sales/{sale_id}', headers=headers, json={'number_of_bags': '7', 'total_weight': 350})
+    assert response.status_code == 200, response.get_json()
+    assert _bags(app, grain_id, godown_ids[0]) == 3
+    response = client.put(f'/api/sales/{sale_id}', headers=headers, json={'number_of_bags': 20})
+    assert response.status_code == 400
+    assert _bags(app, grain_id, godown_ids[0]) == 3
+    with app.app_context():
+        sale = db.session.get(Sale, sale_id)
+        assert sale.number_of_bags == 7
+        assert [detail.number_of_bags for detail in sale.godown_details] == [7]
+
+
+def test_changing_bags_of_a_split_sale_needs_the_allocation(app, client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    for godown_id in godown_ids:
+        buy(grain_id, godown_id)
+    response = sell(grain_id, godown_ids[0], bags=4, godown_details=[
+        {'godown_id': godown_ids[0], 'number_of_bags': 2}, {'godown_id': godown_ids[1], 'number_of_bags': 2}])
+    sale_id = response.get_json()['id']
+    assert client.put(f'/api/sales/{sale_id}', headers=headers, json={'number_of_bags': 5}).status_code == 400
+    response = client.put(f'/api/sales/{sale_id}', headers=headers, json={
+        'number_of_bags': 5, 'godown_details': [{'godown_id': godown_ids[0], 'number_of_bags': 2},
+                                                {'godown_id': godown_ids[1], 'number_of_bags': 3}]})
+    assert response.status_code == 200, response.get_json()
+    assert _bags(app, grain_id, godown_ids[1]) == 7
+
+
+@pytest.mark.parametrize('extra', [
+    {'distances': {'x': 'y'}},
+    {'distances': {'1': 'far'}},
+    {'distances': [1, 2]},
+    {'distances': 'near'},
+    {'location': ['Indore']},
+])
+def test_malformed_allocation_request_is_rejected(client, headers, stock, buy, extra):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    response = client.post('/api/sales/plan-allocation', headers=headers,
+                           json={'grain_id': grain_id, 'number_of_bags': 2, 'policy': 'nearest', **extra})
+    assert response.status_code == 400, response.get_json()
+
+
+def test_nearest_plan_follows_distances(client, headers, stock, buy):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    buy(grain_id, godown_ids[1])
+    response = client.post('/api/sales/plan-allocation', headers=headers, json={
+        'grain_id': grain_id, 'number_of_bags': 2, 'policy': 'nearest',
+        'distances': {str(godown_ids[0]): 40, str(godown_ids[1]): '5.5'}})
+    assert response.status_code == 200, response.get_json()
+    assert [row['godown_id'] for row in response.get_json()['godown_details']] == [godown_ids[1]]
@@ -0,0 +1,51 @@
+import sqlite3
+
+from extensions import db
+from utils import search
+
+
+def _found(client, headers, q):
+    response = client.get('/api/search', headers=headers, query_string={'q': q})
+    assert response.status_code == 200, response.get_json()
+    return {(row['kind'], row['bill_number']) for row in response.get_json()['results']}
+
+
+def test_hindi_and_romanized_names_find_each_other(client, headers, stock, buy, sell):
+    grain_id, godown_ids = stock
+    purchase = buy(grain_id, godown_ids[0], supplier_name='रमेश ट्रेडर्स').get_json()
+    sale = sell(grain_id, godown_ids[0], buyer_name='Ramesh Traders').get_json()
+    found = _found(client, headers, 'रमेश')
+    assert ('sale', sale['bill_number']) in found
+    assert ('purchase', purchase['bill_number']) in found
+    assert ('purchase', purchase['bill_number']) in _found(client, headers, 'ramesh')
+
+
+def test_other_clients_can_write_bills(app, client, headers, stock, buy, sell):
+    """The triggers must not need search_key(), which only app connections have"""
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    sale = sell(grain_id, godown_ids[0]).get_json()
+
+    connection = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '', 1))
+    try:
+        connection.execute("UPDATE sale SET buyer_name = 'Mohan Agro', vehicle_number = 'RJ14AB0001' WHERE id = ?",
+                           (sale['id'],))
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(purchase)") if row[1] != 'id']
+        values = [{'bill_number': "'PB-RAW-1'", 'supplier_name': "'Gopal Lal'"}.get(column, column)
+                  for column in columns]
+        connection.execute(f"INSERT INTO purchase ({', '.join(columns)}) "
+                           f"SELECT {', '.join(values)} FROM purchase LIMIT 1")
+        connection.commit()
+    finally:
+        connection.close()
+
+    assert ('sale', sale['bill_number']) in _found(client, headers, 'Mohan')
+    assert ('sale', sale['bill_number']) in _found(client, headers, 'RJ14')
+    assert ('purchase', 'PB-RAW-1') in _found(client, headers, 'Gopal')
+    # Their name keys arrive with the next rebuild
+    assert ('purchase', 'PB-RAW-1') not in _found(client, headers, 'गोपाल')
+    with app.app_context():
+        search.rebuild_index()
+        db.session.commit()
+    assert ('purchase', 'PB-RAW-1') in _found(client, headers, 'गोपाल')
+    assert ('sale', sale['bill_number']) in _found(client, headers, 'मोहन')
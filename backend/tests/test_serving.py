@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from extensions import db
+from models import Grain
+
+
+def _other_writer_can_commit(app):
+    """Whether another connection, not willing to wait, can write right now"""
+    connection = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '', 1), timeout=0)
+    try:
+        connection.execute("UPDATE grains SET name = name")
+        connection.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        assert 'locked' in str(e)
+        return False
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('method, path', [
+    ('GET', '/api/grains'),
+    ('POST', '/api/sales/invoices'),
+    ('POST', '/api/sales/plan-allocation'),
+])
+def test_reads_leave_the_database_to_writers(app, stock, method, path):
+    with app.test_request_context(path, method=method):
+        try:
+            assert Grain.query.all()
+            assert _other_writer_can_commit(app)
+        finally:
+            db.session.remove()
+
+
+def test_writing_requests_lock_before_they_read(app, stock):
+    """So two requests cannot read the same next bill number and both use it"""
+    with app.test_request_context('/api/grains', method='POST'):
+        try:
+            Grain.query.all()
+            assert not _other_writer_can_commit(app)
+            db.session.commit()
+            assert _other_writer_can_commit(app)
+        finally:
+            db.session.remove()
+
+
+def test_other_sessions_lock_at_their_first_write(app, stock):
+    with app.app_context():
+        try:
+            Grain.query.all()
+            assert _other_writer_can_commit(app)
+            db.session.add(Grain(name='Rice'))
+            db.session.flush()
+            assert not _other_writer_can_commit(app)
+            db.session.commit()
+            assert _other_writer_can_commit(app)
+        finally:
+            db.session.remove()
@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    [{'grain_id': 1, 'from_godown_id': 1, 'to_godown_id': 2, 'number_of_bags': 1}],
+    'transfer',
+    {'grain_id': 1, 'from_godown_id': 1, 'to_godown_id': 2, 'number_of_bags': 1, 'note': {'text': 'x'}},
+    {'grain_id': 1, 'from_godown_id': 1, 'to_godown_id': 2, 'number_of_bags': 1, 'note': 'x' * 201},
+    {'transfers': [1, 'a']},
+])
+def test_malformed_transfer_is_rejected(client, headers, stock, buy, body):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    response = client.post('/api/transfers', headers=headers, json=body)
+    assert response.status_code == 400, response.get_json()
+
+
+def test_transfer_keeps_its_note(client, headers, stock, buy):
+    grain_id, godown_ids = stock
+    buy(grain_id, godown_ids[0])
+    response = client.post('/api/transfers', headers=headers, json={
+        'grain_id': grain_id, 'from_godown_id': godown_ids[0], 'to_godown_id': godown_ids[1],
+        'number_of_bags': 3, 'note': 'नया गोदाम'})
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json()['transfers'][0]['note'] == 'नया गोदाम'
@@ -0,0 +1,254 @@
+from datetime import datetime, timedelta
+from functools import partial
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, func, inspect, or_, select
+from extensions import db
+from models import (AlertRule, AlertState, BagInventory, Godown, Grain, LotConsumption, Purchase,
+                    SaleGodownDetail, StockAlert, StockThreshold, StockTransfer)
+from utils.http_cache import bump
+from utils.changes import previous
+
+_OPENED_KEY = 'alerts_opened'
+_TOUCHED_KEY = 'alerts_touched'
+_listeners_installed = False
+
+alerts_table = StockAlert.__table__
+thresholds_table = StockThreshold.__table__
+
+LIMITS = ('min_bags', 'max_fill_pct', 'min_days_cover', 'velocity_days')
+DEFAULT_VELOCITY_DAYS = 30
+# Partitions per evaluation query when re-checking everything
+CHUNK = 200
+
+
+def _defaults():
+    config = current_app.config
+    return {'min_bags': config.get('ALERT_MIN_BAGS'), 'max_fill_pct': config.get('ALERT_MAX_FILL_PCT'),
+            'min_days_cover': config.get('ALERT_MIN_DAYS_COVER'), 'velocity_days': DEFAULT_VELOCITY_DAYS}
+
+
+def resolve_limits(thresholds, grain_id, godown_id, defaults):
+    """Take each limit from the most specific threshold row that sets it"""
+    order = [(grain_id, godown_id), (grain_id, None), (None, godown_id), (None, None)]
+    limits = {}
+    for field in LIMITS:
+        limits[field] = next((getattr(thresholds[key], field) for key in order
+                              if key in thresholds and getattr(thresholds[key], field) is not None),
+                             defaults.get(field))
+    return limits
+
+
+def _pairs(columns, partitions):
+    return or_(*[and_(columns.grain_id == grain_id, columns.godown_id == godown_id)
+                 for grain_id, godown_id in sorted(partitions)])
+
+
+def evaluate(connection, partitions, now=None):
+    """Re-check every rule for {(grain_id, godown_id)} and record transitions.
+
+    Reads only those stock rows, their godowns' counters and their recent sales
+    (through the lot consumption partition index). An alert opens once per
+    breach and is updated in place while it lasts, so repeated writes never
+    duplicate it. Returns (newly opened alerts, number of transitions).
+    """
+    partitions = {key for key in partitions if None not in key}
+    if not partitions:
+        return [], 0
+    now = now or datetime.utcnow()
+    grain_ids = sorted({grain_id for grain_id, _ in partitions})
+    godown_ids = sorted({godown_id for _, godown_id in partitions})
+    defaults = _defaults()
+
+    thresholds = {(row.grain_id, row.godown_id): row for row in connection.execute(
+        select(thresholds_table).where(
+            or_(thresholds_table.c.grain_id.in_(grain_ids), thresholds_table.c.grain_id.is_(None)),
+            or_(thresholds_table.c.godown_id.in_(godown_ids), thresholds_table.c.godown_id.is_(None)))
+    )}
+    limits = {key: resolve_limits(thresholds, *key, defaults) for key in partitions}
+
+    inventory = BagInventory.__table__
+    stock = {(row.grain_id, row.godown_id): row.number_of_bags or 0 for row in connection.execute(
+        select(inventory.c.grain_id, inventory.c.godown_id, inventory.c.number_of_bags)
+        .where(_pairs(inventory.c, partitions)))}
+    godowns = {row.id: (row.capacity, row.used_bags) for row in connection.execute(
+        select(Godown.id, Godown.capacity, Godown.used_bags).where(Godown.id.in_(godown_ids)))}
+
+    sold = {}
+    cover_keys = [key for key in sorted(partitions) if limits[key]['min_days_cover'] is not None]
+    if cover_keys:
+        consumption = LotConsumption.__table__.c
+        sold = {(row.grain_id, row.godown_id): row.bags for row in connection.execute(
+            select(consumption.grain_id, consumption.godown_id, func.sum(consumption.bags).label('bags'))
+            .where(or_(*[and_(consumption.grain_id == grain_id, consumption.godown_id == godown_id,
+                              consumption.sale_date >= now - timedelta(days=limits[(grain_id, godown_id)]['velocity_days']))
+                         for grain_id, godown_id in cover_keys]))
+            .group_by(consumption.grain_id, consumption.godown_id))}
+
+    breaches = {}
+    for key in partitions:
+        bags, limit = stock.get(key, 0), limits[key]
+        if limit['min_bags'] is not None and bags < limit['min_bags']:
+            breaches[key + (AlertRule.MIN_BAGS.value,)] = (bags, limit['min_bags'])
+        if limit['min_days_cover'] is not None and sold.get(key):
+            cover = bags / (sold[key] / limit['velocity_days'])
+            if cover < limit['min_days_cover']:
+                breaches[key + (AlertRule.DAYS_COVER.value,)] = (round(cover, 1), limit['min_days_cover'])
+    for godown_id in godown_ids:
+        capacity, bags = godowns.get(godown_id, (None, 0))
+        limit = resolve_limits(thresholds, None, godown_id, defaults)['max_fill_pct']
+        if limit is not None and capacity:
+            fill = bags * 100 / capacity
+            if fill > limit:
+                breaches[(None, godown_id, AlertRule.MAX_FILL.value)] = (round(fill, 1), limit)
+
+    current = {(row.grain_id, row.godown_id, row.rule): row for row in connection.execute(
+        select(alerts_table.c.id, alerts_table.c.grain_id, alerts_table.c.godown_id, alerts_table.c.rule,
+               alerts_table.c.value, alerts_table.c.threshold)
+        .where(alerts_table.c.state == AlertState.OPEN.value,
+               or_(_pairs(alerts_table.c, partitions),
+                   and_(alerts_table.c.grain_id.is_(None), alerts_table.c.godown_id.in_(godown_ids)))))}
+
+    opened = [{'grain_id': grain_id, 'godown_id': godown_id, 'rule': rule, 'state': AlertState.OPEN.value,
+               'value': value, 'threshold': threshold, 'opened_at': now, 'updated_at': now}
+              for (grain_id, godown_id, rule), (value, threshold) in sorted(breaches.items(), key=str)
+              if (grain_id, godown_id, rule) not in current]
+    changes = len(opened)
+    if opened:
+        connection.execute(alerts_table.insert(), opened)
+    for key, row in current.items():
+        if key not in breaches:
+            connection.execute(alerts_table.update().where(alerts_table.c.id == row.id).values(
+                state=AlertState.RESOLVED.value, resolved_at=now, updated_at=now))
+        elif breaches[key] != (row.value, row.threshold):
+            value, threshold = breaches[key]
+            connection.execute(alerts_table.update().where(alerts_table.c.id == row.id).values(
+                value=value, threshold=threshold, updated_at=now))
+        else:
+            continue
+        changes += 1
+    return opened, changes
+
+
+def evaluate_all(session=None, grain_id=None, godown_id=None):
+    """Re-check every stock row (optionally one grain or godown); returns opened count.
+
+    Days of cover drifts as old sales leave the window, so run this daily.
+    """
+    session = session or db.session
+    connection = session.connection()
+    query = select(BagInventory.grain_id, BagInventory.godown_id)
+    if grain_id is not None:
+        query = query.where(BagInventory.grain_id == grain_id)
+    if godown_id is not None:
+        query = query.where(BagInventory.godown_id == godown_id)
+    partitions = sorted(tuple(row) for row in connection.execute(query))
+    opened, changes = [], 0
+    for start in range(0, len(partitions), CHUNK):
+        chunk_opened, chunk_changes = evaluate(connection, set(partitions[start:start + CHUNK]))
+        opened += chunk_opened
+        changes += chunk_changes
+    if changes:
+        bump('alerts', session=session)
+    _queue_notifications(session, opened)
+    return len(opened)
+
+
+def touched_partitions(session):
+    """(grain_id, godown_id) stock rows this flush can have changed.
+
+    New sales and transfers move stock with Core statements, so their godown
+    details and transfer rows are used rather than BagInventory instances.
+    """
+    touched = set()
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        if isinstance(obj, (BagInventory, Purchase)):
+            if obj not in session.new:
+                state = inspect(obj)
+                touched.add((previous(state, 'grain_id'), previous(state, 'godown_id')))
+            touched.add((obj.grain_id, obj.godown_id))
+        elif isinstance(obj, SaleGodownDetail) and obj.sale is not None:
+            if obj not in session.new:
+                touched.add((obj.sale.grain_id, previous(inspect(obj), 'godown_id')))
+            touched.add((obj.sale.grain_id, obj.godown_id))
+        elif isinstance(obj, StockTransfer):
+            touched.add((obj.grain_id, obj.from_godown_id))
+            touched.add((obj.grain_id, obj.to_godown_id))
+    return {key for key in touched if None not in key}
+
+
+def touch(session, partitions):
+    """Re-check these stock rows at commit; for stock changed with Core statements"""
+    session.info.setdefault(_TOUCHED_KEY, set()).update(partitions)
+
+
+def _queue_notifications(session, opened):
+    if opened:
+        session.info.setdefault(_OPENED_KEY, []).extend(opened)
+
+
+def alert_message(alerts):
+    """Push message for newly opened alerts; runs on the push dispatcher"""
+    grains = dict(db.session.query(Grain.id, Grain.name).filter(
+        Grain.id.in_({alert['grain_id'] for alert in alerts if alert['grain_id']})).all())
+    godowns = dict(db.session.query(Godown.id, Godown.name).filter(
+        Godown.id.in_({alert['godown_id'] for alert in alerts})).all())
+    lines = []
+    for alert in alerts:
+        place = godowns.get(alert['godown_id'], f"Godown {alert['godown_id']}")
+        if alert['rule'] == AlertRule.MAX_FILL.value:
+            lines.append(f"{place} is {alert['value']:g}% full")
+        elif alert['rule'] == AlertRule.DAYS_COVER.value:
+            lines.append(f"{grains.get(alert['grain_id'], 'Grain')} in {place}: {alert['value']:g} days of cover")
+        else:
+            lines.append(f"{grains.get(alert['grain_id'], 'Grain')} in {place}: {alert['value']:g} bags")
+    return {'title': 'Stock alert', 'body': '; '.join(lines), 'url': '/alerts', 'tag': 'stock-alert'}, None
+
+
+def _after_flush(session, flush_context):
+    if has_app_context():
+        session.info.setdefault(_TOUCHED_KEY, set()).update(touched_partitions(session))
+
+
+def _before_commit(session):
+    # Evaluated once per transaction: a purchase flushes the bill before its
+    # stock row, and checking in between would open and resolve a false alert
+    if not has_app_context():
+        return
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        opened, changes = evaluate(session.connection(), touched)
+        if changes:
+            bump('alerts', session=session)
+        _queue_notifications(session, opened)
+
+
+def _after_commit(session):
+    opened = session.info.pop(_OPENED_KEY, None)
+    if opened and has_app_context() and 'push' in current_app.extensions:
+        current_app.extensions['push'].submit(partial(alert_message, opened))
+
+
+def _reset(session, *args):
+    session.info.pop(_TOUCHED_KEY, None)
+    session.info.pop(_OPENED_KEY, None)
+
+
+def init_app(app):
+    """Evaluate stock alert rules for the rows each transaction touches.
+
+    Must be initialised after costing, whose sales history feeds days of cover.
+    """
+    global _listeners_installed
+    app.config.setdefault('ALERT_MIN_BAGS', 50)
+    app.config.setdefault('ALERT_MAX_FILL_PCT', None)
+    app.config.setdefault('ALERT_MIN_DAYS_COVER', None)
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'before_commit', _before_commit)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
@@ -0,0 +1,76 @@
+from extensions import db
+from models import Purchase
+from sqlalchemy import func
+
+POLICIES = ('fifo', 'min_godowns', 'nearest')
+
+
+def oldest_stock_dates(grain_id, stock):
+    """Date of the oldest bag still on hand per godown, from the purchase ledger.
+
+    Assuming stock leaves each godown first-in-first-out, what remains is the
+    newest purchases; walking back from the newest purchase until the running
+    total covers current stock gives the age of the oldest remaining bag.
+    """
+    running = func.sum(Purchase.number_of_bags).over(
+        partition_by=Purchase.godown_id,
+        order_by=(Purchase.purchase_date.desc(), Purchase.id.desc())
+    )
+    rows = db.session.query(
+        Purchase.godown_id,
+        Purchase.purchase_date,
+        Purchase.number_of_bags,
+        running.label('running_bags')
+    ).filter(
+        Purchase.grain_id == grain_id,
+        Purchase.godown_id.in_([godown_id for godown_id, bags in stock.items() if bags > 0])
+    ).all()
+
+    oldest = {}
+    for godown_id, purchase_date, bags, running_bags in rows:
+        # Purchase still (partly) on hand if stock reaches back past its start
+        if running_bags - bags < stock[godown_id]:
+            if godown_id not in oldest or purchase_date < oldest[godown_id]:
+                oldest[godown_id] = purchase_date
+    return oldest
+
+
+def plan_allocation(stock, bags, policy, oldest=None, distances=None, location=None, locations=None):
+    """Split `bags` across godowns; returns ([(godown_id, bags)], shortfall).
+
+    stock maps godown_id -> available bags. Policies:
+      fifo         oldest remaining stock first (needs `oldest`)
+      min_godowns  largest stock first, which minimizes the number of godowns
+      nearest      smallest distance first (`distances`), else godowns whose
+                   `locations` entry matches `location`, then largest stock
+    Ties always break on larger stock and then godown_id so plans are stable.
+    """
+    candidates = [(godown_id, available) for godown_id, available in stock.items() if available > 0]
+
+    if policy == 'fifo':
+        oldest = oldest or {}
+        key = lambda item: (oldest.get(item[0]) is None, oldest.get(item[0]), -item[1], item[0])
+    elif policy == 'nearest':
+        distances = distances or {}
+        locations = locations or {}
+        wanted = (location or '').strip().lower()
+        key = lambda item: (
+            distances.get(item[0], float('inf')),
+            not wanted or (locations.get(item[0]) or '').strip().lower() != wanted,
+            -item[1],
+            item[0]
+        )
+    elif policy == 'min_godowns':
+        key = lambda item: (-item[1], item[0])
+    else:
+        raise ValueError(f"Invalid policy. Must be one of: {', '.join(POLICIES)}")
+
+    plan = []
+    remaining = bags
+    for godown_id, available in sorted(candidates, key=key):
+        if remaining <= 0:
+            break
+        take = min(available, remaining)
+        plan.append((godown_id, take))
+        remaining -= take
+    return plan, remaining
@@ -0,0 +1,242 @@
+"""Financial-year archival of settled bills.
+
+Closing a financial year moves its settled sales and purchases, with their
+godown splits and payments, from the live tables into *_archive tables that
+keep the same columns and ids. The live tables then hold the working set:
+the open years and anything still owed. The stock the archived bills moved
+is carried forward in opening_stock and their totals in financial_years, so
+inventory checks and all-time figures stay right without reading the
+archive.
+
+Reads that need old rows go through history() (everything) or routed() (from
+a date on). Both return the plain model until a year is closed, and an alias
+over live and archived rows only when the read reaches back past the
+archive boundary.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import Column, Integer, MetaData, Table, and_, exists, func, or_, select, union_all
+from sqlalchemy.orm import aliased
+from extensions import db
+from models import (CostLot, FinancialYear, OpeningStock, PaymentHistory, Purchase, Sale, SaleGodownDetail,
+                    payment_history_archive, purchase_archive, sale_archive, sale_godown_detail_archive)
+from utils import search
+from utils.http_cache import bump
+from utils.payments import SETTLED
+
+# Financial years run April to March
+FY_START_MONTH = 4
+
+ARCHIVES = {
+    'sale': sale_archive,
+    'sale_godown_detail': sale_godown_detail_archive,
+    'purchase': purchase_archive,
+    'payment_history': payment_history_archive,
+}
+
+
+def year_bounds(start_year):
+    """(first day, first day of the next year) of the year starting in `start_year`"""
+    return datetime(start_year, FY_START_MONTH, 1), datetime(start_year + 1, FY_START_MONTH, 1)
+
+
+def year_label(start_year):
+    return f'{start_year}-{(start_year + 1) % 100:02d}'
+
+
+def archive_boundary(connection=None):
+    """End of the latest closed year (no archived bill is dated on or after it), or None"""
+    connection = connection or db.session.connection()
+    return connection.execute(select(func.max(FinancialYear.ends_on))).scalar()
+
+
+def _union(model):
+    table = model.__table__
+    rows = union_all(select(table), select(ARCHIVES[table.name])).subquery(f'{table.name}_history')
+    return aliased(model, rows, adapt_on_names=True)
+
+
+def history(model, connection=None):
+    """`model` over live and archived rows; the plain model while nothing is archived"""
+    if archive_boundary(connection) is None:
+        return model
+    return _union(model)
+
+
+def routed(model, start=None, connection=None):
+    """`model` for a read of bills dated from `start` on.
+
+    The archive is unioned in only when `start` is before the archive
+    boundary; no start means the live working set.
+    """
+    if start is None:
+        return model
+    if not isinstance(start, datetime):
+        start = datetime.combine(start, datetime.min.time()) if isinstance(start, date) else start
+    boundary = archive_boundary(connection)
+    if boundary is None or start >= boundary:
+        return model
+    return _union(model)
+
+
+def date_range(args):
+    """(start, end exclusive) from ISO `from` and `to` request args; ValueError when malformed"""
+    start = datetime.fromisoformat(args['from']) if args.get('from') else None
+    end = datetime.fromisoformat(args['to']) + timedelta(days=1) if args.get('to') else None
+    return start, end
+
+
+def carried_totals(connection=None):
+    """All-time totals of the archived bills: {sales, sales_amount, purchases, purchases_amount}"""
+    connection = connection or db.session.connection()
+    row = connection.execute(select(
+        func.coalesce(func.sum(FinancialYear.sales), 0), func.coalesce(func.sum(FinancialYear.sales_amount), 0),
+        func.coalesce(func.sum(FinancialYear.purchases), 0),
+        func.coalesce(func.sum(FinancialYear.purchases_amount), 0)
+    )).one()
+    return dict(zip(('sales', 'sales_amount', 'purchases', 'purchases_amount'), row))
+
+
+def _settled(model):
+    return func.abs(model.total_amount - func.coalesce(model.paid_amount, 0)) <= SETTLED
+
+
+def _id_table(name):
+    return Table(name, MetaData(), Column('id', Integer, primary_key=True), prefixes=['TEMPORARY'])
+
+
+def _copy(connection, source, target, condition):
+    """Copy the rows matching `condition` from source to target; returns rows copied"""
+    return connection.execute(target.insert().from_select(
+        [column.name for column in source.columns], select(source).where(condition))).rowcount
+
+
+def _move(connection, source, target, condition):
+    moved = _copy(connection, source, target, condition)
+    connection.execute(source.delete().where(condition))
+    return moved
+
+
+def close_year(start_year, session=None):
+    """Move the settled bills of a financial year to the archive; returns counts.
+
+    A sale is settled when its outstanding amount is within SETTLED. A
+    purchase must also have every bag of its cost lot sold, so live costing
+    never draws on an archived purchase. Unsettled bills stay live; closing
+    the year again later sweeps the ones paid since. The newest sale and
+    purchase always stay live so SQLite never hands their ids out again.
+    """
+    session = session or db.session
+    starts_on, ends_on = year_bounds(start_year)
+    if ends_on > datetime.utcnow():
+        raise ValueError(f'Financial year {year_label(start_year)} has not ended yet')
+    connection = session.connection()
+
+    # Snapshot the ids once so every statement below moves the same bills
+    sale_ids, purchase_ids = _id_table('archive_sale_ids'), _id_table('archive_purchase_ids')
+    sale_ids.create(connection)
+    purchase_ids.create(connection)
+    connection.execute(sale_ids.insert().from_select(['id'], select(Sale.id).where(
+        Sale.sale_date >= starts_on, Sale.sale_date < ends_on, _settled(Sale),
+        Sale.id < select(func.max(Sale.id)).scalar_subquery())))
+    connection.execute(purchase_ids.insert().from_select(['id'], select(Purchase.id).where(
+        Purchase.purchase_date >= starts_on, Purchase.purchase_date < ends_on, _settled(Purchase),
+        Purchase.id < select(func.max(Purchase.id)).scalar_subquery(),
+        ~exists().where(and_(CostLot.purchase_id == Purchase.id, CostLot.remaining_bags > 0)))))
+    archived_sales, archived_purchases = select(sale_ids.c.id), select(purchase_ids.c.id)
+
+    # Stock the archived bills moved, carried forward per (grain, godown)
+    carried = {}
+    bags_in = select(Purchase.grain_id, Purchase.godown_id, func.sum(Purchase.number_of_bags)).where(
+        Purchase.id.in_(archived_purchases)).group_by(Purchase.grain_id, Purchase.godown_id)
+    bags_out = select(Sale.grain_id, SaleGodownDetail.godown_id, -func.sum(SaleGodownDetail.number_of_bags)).join(
+        Sale, Sale.id == SaleGodownDetail.sale_id).where(Sale.id.in_(archived_sales)).group_by(
+        Sale.grain_id, SaleGodownDetail.godown_id)
+    for query in (bags_in, bags_out):
+        for grain_id, godown_id, bags in connection.execute(query):
+            carried[(grain_id, godown_id)] = carried.get((grain_id, godown_id), 0) + bags
+
+    sales, sales_amount = connection.execute(select(
+        func.count(), func.coalesce(func.sum(Sale.total_amount), 0)).where(Sale.id.in_(archived_sales))).one()
+    purchases, purchases_amount = connection.execute(select(
+        func.count(), func.coalesce(func.sum(Purchase.total_amount), 0)).where(
+        Purchase.id.in_(archived_purchases))).one()
+
+    # Children first, so no live row ever points at a missing bill
+    payments = _move(connection, PaymentHistory.__table__, payment_history_archive, or_(
+        PaymentHistory.sale_id.in_(archived_sales), PaymentHistory.purchase_id.in_(archived_purchases)))
+    details = _move(connection, SaleGodownDetail.__table__, sale_godown_detail_archive,
+                    SaleGodownDetail.sale_id.in_(archived_sales))
+    _move(connection, Sale.__table__, sale_archive, Sale.id.in_(archived_sales))
+    _move(connection, Purchase.__table__, purchase_archive, Purchase.id.in_(archived_purchases))
+    sale_ids.drop(connection)
+    purchase_ids.drop(connection)
+
+    year = session.get(FinancialYear, start_year)
+    if year is None:
+        year = FinancialYear(start_year=start_year, starts_on=starts_on, ends_on=ends_on, sales=0,
+                             sales_amount=0, purchases=0, purchases_amount=0, payments=0)
+        session.add(year)
+    year.sales += sales
+    year.sales_amount += sales_amount
+    year.purchases += purchases
+    year.purchases_amount += purchases_amount
+    year.payments += payments
+    year.closed_at = datetime.utcnow()
+    session.flush()
+
+    stored = {(row.grain_id, row.godown_id): row
+              for row in OpeningStock.query.filter_by(start_year=start_year)}
+    for (grain_id, godown_id), bags in carried.items():
+        if (grain_id, godown_id) in stored:
+            stored[(grain_id, godown_id)].bags += bags
+        elif bags:
+            session.add(OpeningStock(start_year=start_year, grain_id=grain_id, godown_id=godown_id, bags=bags))
+    bump('sales', 'purchases', session=session)
+    session.flush()
+    return {'sales': sales, 'purchases': purchases, 'godown_details': details, 'payments': payments,
+            'opening_stock_pairs': len(carried)}
+
+
+def reopen_year(start_year, session=None):
+    """Move a closed year's archived bills back into the live tables; returns counts"""
+    session = session or db.session
+    year = session.get(FinancialYear, start_year)
+    if year is None:
+        raise ValueError(f'Financial year {year_label(start_year)} is not closed')
+    starts_on, ends_on = year.starts_on, year.ends_on
+    connection = session.connection()
+
+    sales = select(sale_archive.c.id).where(sale_archive.c.sale_date >= starts_on,
+                                           sale_archive.c.sale_date < ends_on)
+    purchases = select(purchase_archive.c.id).where(purchase_archive.c.purchase_date >= starts_on,
+                                                    purchase_archive.c.purchase_date < ends_on)
+    # Parents first on the way back; the archive has no keys, so the
+    # conditions still find the children after their bills are copied
+    counts = {
+        'sales': _copy(connection, sale_archive, Sale.__table__, sale_archive.c.id.in_(sales)),
+        'purchases': _copy(connection, purchase_archive, Purchase.__table__,
+                                purchase_archive.c.id.in_(purchases)),
+        'godown_details': _copy(connection, sale_godown_detail_archive, SaleGodownDetail.__table__,
+                                     sale_godown_detail_archive.c.sale_id.in_(sales)),
+        'payments': _copy(connection, payment_history_archive, PaymentHistory.__table__, or_(
+            payment_history_archive.c.sale_id.in_(sales), payment_history_archive.c.purchase_id.in_(purchases))),
+    }
+    # The search triggers index the copied bills without their name keys
+    search.fill_keys(connection, 'sale', connection.execute(
+        select(Sale.id, Sale.buyer_name).where(Sale.id.in_(sales))).all())
+    search.fill_keys(connection, 'purchase', connection.execute(
+        select(Purchase.id, Purchase.supplier_name).where(Purchase.id.in_(purchases))).all())
+    for archive, condition in (
+            (payment_history_archive, or_(payment_history_archive.c.sale_id.in_(sales),
+                                          payment_history_archive.c.purchase_id.in_(purchases))),
+            (sale_godown_detail_archive, sale_godown_detail_archive.c.sale_id.in_(sales)),
+            (sale_archive, sale_archive.c.id.in_(sales)),
+            (purchase_archive, purchase_archive.c.id.in_(purchases))):
+        connection.execute(archive.delete().where(condition))
+
+    OpeningStock.query.filter_by(start_year=start_year).delete()
+    session.delete(year)
+    bump('sales', 'purchases', session=session)
+    session.flush()
+    return counts
+
@@ -0,0 +1,519 @@
+"""Online backups of the SQLite database, with WAL archiving for point-in-time restore.
+
+Every backup is a directory under the backup root, named by the UTC time it
+was taken:
+
+    <stamp>/manifest.json        checksums and size of the snapshot
+    <stamp>/snapshot.db.gz       consistent copy made with the online backup API
+    <stamp>/wal/index.jsonl      one line per archived WAL segment, with its checksum
+    <stamp>/wal/00000000.wal.gz  committed WAL frames, in order
+
+The snapshot is copied a few pages per step from inside a read transaction.
+In WAL mode a reader never blocks writers, so the copy neither stalls the
+app nor restarts when it commits. Restoring replays the archived frames over
+the snapshot: frames are whole page images, so replaying from any point at
+or before the snapshot gives the database as of the last replayed commit.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from utils.capacity import usage_drift
+from utils.serving import SQLITE_BUSY_TIMEOUT
+from utils.stock import inventory_drift
+
+# Pages copied per backup step, and the pause between steps
+BACKUP_PAGES = 1024
+BACKUP_SLEEP = 0.01
+# WAL size at which the archiver folds the WAL back into the database
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+WAL_HEADER = struct.Struct('>8I')  # magic, version, page size, checkpoint, salt1, salt2, checksum1, checksum2
+FRAME_HEADER = struct.Struct('>6I')  # page, database pages after commit (0 if not a commit), salt1, salt2, checksum1, checksum2
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+CHUNK = 1024 * 1024
+
+
+def database_path(url):
+    """File path of a SQLite database URL; ValueError for anything else"""
+    url = make_url(str(url))
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        raise ValueError('Online backups need a file-based SQLite database')
+    return os.path.abspath(url.database)
+
+
+def backup_root(database):
+    return os.getenv('BACKUP_DIR') or os.path.join(os.path.dirname(database), 'backups')
+
+
+def _stamp():
+    return datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+
+
+def _connect(path):
+    return sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+
+
+def enable_wal(database):
+    """Switch the database to WAL mode (kept in the file); returns the journal mode"""
+    with closing(_connect(database)) as connection:
+        return connection.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compress(source, target):
+    """gzip `source` into `target`; returns the sha256 of the uncompressed bytes"""
+    digest = hashlib.sha256()
+    with open(source, 'rb') as raw, open(target, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as packed:
+            for chunk in iter(lambda: raw.read(CHUNK), b''):
+                digest.update(chunk)
+                packed.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return digest.hexdigest()
+
+
+def copy_database(database, target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Online copy of `database` into the new file `target`, in rollback-journal mode.
+
+    Returns (created_at, steps, seconds, page_size, page_count); created_at
+    is taken just before the copy's snapshot, so every commit before it is
+    in the copy.
+    """
+    steps = []
+
+    def progress(status, remaining, total):
+        # Only busy steps pause inside backup(); this spaces out the rest
+        steps.append(remaining)
+        if remaining:
+            time.sleep(sleep)
+
+    started = time.perf_counter()
+    with closing(_connect(database)) as source, closing(sqlite3.connect(target)) as copy:
+        # Pin one snapshot for the whole copy; commits made meanwhile land
+        # in the WAL and do not restart the backup
+        source.execute('BEGIN')
+        created_at = datetime.utcnow()
+        source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        source.backup(copy, pages=pages, progress=progress, sleep=sleep)
+        source.execute('COMMIT')
+        copy.execute('PRAGMA journal_mode=DELETE')
+        page_size = copy.execute('PRAGMA page_size').fetchone()[0]
+        page_count = copy.execute('PRAGMA page_count').fetchone()[0]
+    return created_at, len(steps), time.perf_counter() - started, page_size, page_count
+
+
+def snapshot(database, root, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, wal=False):
+    """Copy the database into a new backup directory under `root`; returns its manifest.
+
+    `wal` marks a backup whose WAL segments the archiver will add.
+    """
+    if enable_wal(database) != 'wal':
+        raise ValueError('Could not switch the database to WAL mode')
+    os.makedirs(root, exist_ok=True)
+    name = _stamp()
+    while os.path.exists(os.path.join(root, name)):
+        time.sleep(1)
+        name = _stamp()
+    partial = os.path.join(root, f'.{name}.partial')
+    os.makedirs(os.path.join(partial, 'wal') if wal else partial)
+    copy = os.path.join(partial, 'snapshot.db')
+    created_at, steps, seconds, page_size, page_count = copy_database(database, copy, pages, sleep)
+
+    db_sha256 = _compress(copy, os.path.join(partial, 'snapshot.db.gz'))
+    size = os.path.getsize(copy)
+    os.remove(copy)
+    manifest = {
+        'backup': name,
+        'created_at': created_at.isoformat(),
+        'database': database,
+        'file': 'snapshot.db.gz',
+        'sha256': _sha256(os.path.join(partial, 'snapshot.db.gz')),
+        'db_sha256': db_sha256,
+        'bytes': size,
+        'compressed_bytes': os.path.getsize(os.path.join(partial, 'snapshot.db.gz')),
+        'page_size': page_size,
+        'pages': page_count,
+        'steps': steps,
+        'seconds': round(seconds, 3),
+        'wal': wal,
+    }
+    _write_json(os.path.join(partial, 'manifest.json'), manifest)
+    os.rename(partial, os.path.join(root, name))
+    return manifest
+
+
+def backups(root):
+    """Manifests of the finished backups under `root`, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    found = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, 'manifest.json')
+        if not name.startswith('.') and os.path.exists(path):
+            with open(path) as f:
+                found.append(json.load(f))
+    return found
+
+
+def prune(root, keep):
+    """Delete all but the newest `keep` backups, with their WAL; returns how many went"""
+    old = backups(root)[:-keep] if keep > 0 else []
+    for manifest in old:
+        shutil.rmtree(os.path.join(root, manifest['backup']))
+    return len(old)
+
+
+# --- WAL archiving -------------------------------------------------------------
+
+def _checksum(data, s0, s1, big_endian):
+    """SQLite's WAL checksum over `data` (a multiple of 8 bytes), continuing from (s0, s1)"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xffffffff
+        s1 = (s1 + words[i + 1] + s0) & 0xffffffff
+    return s0, s1
+
+
+def wal_header(path):
+    """(page size, salts, big endian, checksum) of a WAL file, or None while it has no valid header"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(WAL_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(head) < WAL_HEADER.size:
+        return None
+    magic, _, page_size, _, salt1, salt2, c0, c1 = WAL_HEADER.unpack(head)
+    if magic not in WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if _checksum(head[:24], 0, 0, big_endian) != (c0, c1):
+        return None
+    return page_size, (salt1, salt2), big_endian, (c0, c1)
+
+
+def committed_frames(path, page_size, salts, big_endian, offset, checksum):
+    """Frames from `offset` up to the last commit that checks out.
+
+    Returns (frames, end offset, checksum at end, commits, database pages at
+    the last commit, end of the last valid frame, committed or not). A frame
+    with other salts or a bad checksum is left over from before the WAL
+    restarted, or still being written.
+    """
+    size = FRAME_HEADER.size + page_size
+    frames, pending, commits, pages = [], [], 0, None
+    end, committed = offset, checksum
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            frame = f.read(size)
+            if len(frame) < size:
+                break
+            _, after, salt1, salt2, c0, c1 = FRAME_HEADER.unpack_from(frame)
+            if (salt1, salt2) != salts:
+                break
+            running = _checksum(frame[FRAME_HEADER.size:], *_checksum(frame[:8], *checksum, big_endian), big_endian)
+            if running != (c0, c1):
+                break
+            checksum = running
+            pending.append(frame)
+            offset += size
+            if after:
+                frames.extend(pending)
+                pending = []
+                commits += 1
+                pages = after
+                end, committed = offset, checksum
+    return b''.join(frames), end, committed, commits, pages, offset
+
+
+def _extent(path, page_size, salts, offset):
+    """End of the run of frames carrying `salts` from `offset`, going by their headers alone"""
+    size = FRAME_HEADER.size + page_size
+    with open(path, 'rb') as f:
+        while True:
+            f.seek(offset)
+            head = f.read(FRAME_HEADER.size)
+            if len(head) < FRAME_HEADER.size or FRAME_HEADER.unpack(head)[2:4] != salts:
+                return offset
+            offset += size
+
+
+class WalArchiver:
+    """Copies every commit in the WAL into the current backup's wal/ directory.
+
+    It keeps a read transaction open on its own connection, so checkpoints
+    cannot get past frames it has not copied and no writer can start the
+    WAL over them. When the WAL grows past CHECKPOINT_BYTES it holds off
+    writers for a moment, copies the last frames, checkpoints and restarts
+    the WAL itself.
+
+    If the WAL starts over anyway, frames the old WAL gained since the last
+    sync still sit further down the file. They are copied as long as the
+    new WAL has not grown over them; otherwise frames were lost, and sync()
+    returns False so the caller takes a new snapshot.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.wal = database + '-wal'
+        self.directory = None
+        self.segment = 0
+        # (page size, salts, big endian, offset, checksum) just past the last copied commit
+        self.cursor = None
+        enable_wal(database)
+        self._pin = _connect(database)
+        self._repin()
+
+    def close(self):
+        self._pin.close()
+
+    def _repin(self):
+        if self._pin.in_transaction:
+            self._pin.execute('COMMIT')
+        self._pin.execute('BEGIN')
+        self._pin.execute('SELECT count(*) FROM sqlite_master').fetchone()
+
+    def wal_bytes(self):
+        """Length of the live WAL; the file itself never shrinks"""
+        return self.cursor[3] if self.cursor else 0
+
+    def _read(self, page_size, salts, big_endian, offset, checksum):
+        """Committed frames past a WAL position, moving the cursor over them"""
+        frames, end, checksum, commits, pages, _ = committed_frames(
+            self.wal, page_size, salts, big_endian, offset, checksum)
+        if commits:
+            self.cursor = (page_size, salts, big_endian, end, checksum)
+        return frames, commits, pages
+
+    def sync(self, repin=True):
+        """Archive the commits made since the last sync as one segment; False when some were lost"""
+        # Every commit made before this moment is in the frames read below
+        read_at = datetime.utcnow()
+        header = wal_header(self.wal)
+        if header is None:
+            return True
+        page_size, salts, big_endian, checksum = header
+        intact, parts = True, []
+        if self.cursor is None:
+            self.cursor = (page_size, salts, big_endian, WAL_HEADER.size, checksum)
+        elif salts != self.cursor[1]:
+            old = self.cursor
+            # The new WAL only grows, so if it still ends short of where the
+            # old one was read from, nothing read there had been overwritten
+            if salts[0] == (old[1][0] + 1) & 0xffffffff:
+                parts.append(self._read(*old))
+                intact = _extent(self.wal, page_size, salts, WAL_HEADER.size) <= old[3]
+            else:
+                intact = False
+            if not intact:
+                self.directory = None
+            self.cursor = (page_size, salts, big_endian, WAL_HEADER.size, checksum)
+            parts.append(self._read(*self.cursor))
+        else:
+            parts.append(self._read(*self.cursor))
+        commits = sum(part[1] for part in parts)
+        if commits and self.directory:
+            pages = [part[2] for part in parts if part[1]][-1]
+            self._write_segment(b''.join(part[0] for part in parts), page_size, commits, pages, read_at)
+        if repin:
+            self._repin()
+        return intact
+
+    def _write_segment(self, frames, page_size, commits, pages, read_at):
+        name = f'wal/{self.segment:08d}.wal.gz'
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(gzip.compress(frames, compresslevel=6, mtime=0))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        _, salts, _, end, _ = self.cursor
+        line = {'segment': self.segment, 'file': name, 'sha256': _sha256(path), 'page_size': page_size,
+                'frames': len(frames) // (FRAME_HEADER.size + page_size), 'commits': commits, 'pages': pages,
+                'wal': [*salts, end], 'archived_at': read_at.isoformat()}
+        with open(os.path.join(self.directory, 'wal', 'index.jsonl'), 'a') as f:
+            f.write(json.dumps(line) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.segment += 1
+
+    def checkpoint(self):
+        """Copy the last frames with writers held off, fold the WAL into the database and start it over"""
+        intact = self.sync()
+        self._pin.execute('COMMIT')
+        self._pin.execute('BEGIN IMMEDIATE')
+        try:
+            intact = self.sync(repin=False) and intact
+            with closing(_connect(self.database)) as connection:
+                connection.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        finally:
+            self._pin.execute('ROLLBACK')
+        # Commit a no-op (page 1 rewritten as is) so the WAL starts over
+        # now, under our control, and the pin below covers a frame at once
+        # instead of reading past a WAL other writers could restart
+        self._pin.execute('BEGIN IMMEDIATE')
+        version = self._pin.execute('PRAGMA user_version').fetchone()[0]
+        self._pin.execute(f'PRAGMA user_version = {version}')
+        self._pin.execute('COMMIT')
+        self._repin()
+        restarted = self.sync()
+        return intact and restarted
+
+    def rotate(self, root, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+        """Finish the current backup and start a new one; returns its manifest"""
+        self.sync()
+        manifest = snapshot(self.database, root, pages=pages, sleep=sleep, wal=True)
+        self.directory = os.path.join(root, manifest['backup'])
+        self.segment = 0
+        return manifest
+
+
+@contextmanager
+def _locked(root):
+    """Only one archiver may write to a backup root"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ValueError(f'Another backup scheduler is running on {root}')
+        yield
+
+
+def run_scheduler(database, root, every, wal_interval, keep, pages=BACKUP_PAGES):
+    """Snapshot every `every` seconds and archive the WAL every `wal_interval`; runs until interrupted"""
+    with _locked(root), closing(WalArchiver(database)) as archiver:
+        archiver.checkpoint()
+        due = 0
+        while True:
+            try:
+                if archiver.directory is None or time.monotonic() >= due:
+                    manifest = archiver.rotate(root, pages=pages)
+                    removed = prune(root, keep)
+                    due = time.monotonic() + every
+                    print(f"Backup {manifest['backup']}: {manifest['bytes']} bytes in {manifest['steps']} steps, "
+                          f"{manifest['compressed_bytes']} compressed" + (f', pruned {removed}' if removed else ''))
+                elif not archiver.sync():
+                    print('WAL restarted before its frames were archived, taking a new snapshot')
+                    continue
+                if archiver.wal_bytes() > CHECKPOINT_BYTES and not archiver.checkpoint():
+                    print('WAL restarted before its frames were archived, taking a new snapshot')
+                    continue
+            except (sqlite3.Error, OSError) as e:
+                # The chain may have a gap now; the next pass starts a new backup
+                archiver.directory = None
+                print(f"Error archiving WAL: {str(e)}")
+            time.sleep(wal_interval)
+
+
+# --- Restore -------------------------------------------------------------------
+
+def find_backup(root, name=None, until=None):
+    """Manifest of backup `name`, else the newest taken at or before `until` (or at all)"""
+    found = backups(root)
+    if name:
+        found = [manifest for manifest in found if manifest['backup'] == name]
+    if until:
+        found = [manifest for manifest in found if datetime.fromisoformat(manifest['created_at']) <= until]
+    if not found:
+        raise ValueError(f"No backup {name + ' ' if name else ''}in {root}"
+                         + (f' taken by {until.isoformat()}' if until else ''))
+    return found[-1]
+
+
+def segments(directory):
+    path = os.path.join(directory, 'wal', 'index.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def restore(root, manifest, target, until=None):
+    """Rebuild a backup into `target`: the snapshot, then its WAL segments archived by `until`.
+
+    Checks the sha256 of every file it reads. Returns what was applied.
+    """
+    if os.path.exists(target):
+        raise ValueError(f'{target} already exists')
+    directory = os.path.join(root, manifest['backup'])
+    packed = os.path.join(directory, manifest['file'])
+    if _sha256(packed) != manifest['sha256']:
+        raise ValueError(f"{manifest['backup']}: snapshot checksum does not match")
+    digest = hashlib.sha256()
+    with gzip.open(packed, 'rb') as source, open(target, 'wb') as f:
+        for chunk in iter(lambda: source.read(CHUNK), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    if digest.hexdigest() != manifest['db_sha256']:
+        os.remove(target)
+        raise ValueError(f"{manifest['backup']}: restored snapshot checksum does not match")
+
+    applied, commits, length, restored_to = 0, 0, None, manifest['created_at']
+    with open(target, 'r+b') as f:
+        for number, segment in enumerate(segments(directory)):
+            if until and datetime.fromisoformat(segment['archived_at']) > until:
+                break
+            if segment['segment'] != number:
+                raise ValueError(f"{manifest['backup']}: WAL segment {number} is missing")
+            path = os.path.join(directory, segment['file'])
+            if _sha256(path) != segment['sha256']:
+                raise ValueError(f"{manifest['backup']}: WAL segment {number} checksum does not match")
+            page_size = segment['page_size']
+            size = FRAME_HEADER.size + page_size
+            with gzip.open(path, 'rb') as packed_frames:
+                frames = packed_frames.read()
+            for start in range(0, len(frames), size):
+                page = FRAME_HEADER.unpack_from(frames, start)[0]
+                f.seek((page - 1) * page_size)
+                f.write(frames[start + FRAME_HEADER.size:start + size])
+            applied += 1
+            commits += segment['commits']
+            length = segment['pages'] * page_size
+            restored_to = segment['archived_at']
+        if length is not None:
+            f.truncate(length)
+    # Frames carry the WAL flag in page 1; the restored file stands alone
+    with closing(sqlite3.connect(target)) as connection:
+        connection.execute('PRAGMA journal_mode=DELETE')
+    return {'backup': manifest['backup'], 'segments': applied, 'commits': commits, 'restored_to': restored_to}
+
+
+def check_restored(path):
+    """PRAGMA integrity_check and the inventory reconciliation, run against a restored copy"""
+    with closing(sqlite3.connect(path)) as connection:
+        integrity = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        with engine.connect() as connection:
+            return {'integrity': integrity, 'inventory_drift': inventory_drift(connection),
+                    'usage_drift': usage_drift(connection)}
+    finally:
+        engine.dispose()
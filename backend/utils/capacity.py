@@ -0,0 +1,116 @@
+from sqlalchemy import event, func, inspect, or_, select
+from extensions import db
+from models import BagInventory, Godown
+from utils.changes import previous
+
+_listeners_installed = False
+
+godowns_table = Godown.__table__
+inventory_table = BagInventory.__table__
+
+
+class CapacityExceeded(ValueError):
+    """Raised with every godown a write would overfill"""
+
+    def __init__(self, overflows):
+        self.overflows = overflows
+        super().__init__('; '.join(
+            f"Not enough space in {o['godown_name']}. "
+            f"Free: {o['available']} bags, Requested: {o['requested']}"
+            for o in overflows
+        ))
+
+
+def adjust_usage(connection, deltas):
+    """Apply {godown_id: bags} to the used_bags counters or raise CapacityExceeded.
+
+    Increases are a conditional UPDATE that only matches while the godown
+    has room (a capacity of NULL or 0 means unlimited), so concurrent
+    writers cannot overfill it between a check and the write. Godowns are
+    updated in id order so writers lock them in the same sequence.
+    """
+    overflows = []
+    for godown_id in sorted(deltas):
+        bags = deltas[godown_id]
+        if not bags:
+            continue
+        statement = godowns_table.update().where(
+            godowns_table.c.id == godown_id
+        ).values(used_bags=godowns_table.c.used_bags + bags)
+        if bags > 0:
+            statement = statement.where(or_(
+                godowns_table.c.capacity.is_(None),
+                godowns_table.c.capacity == 0,
+                godowns_table.c.used_bags + bags <= godowns_table.c.capacity
+            ))
+        if connection.execute(statement).rowcount == 0 and bags > 0:
+            overflows.append(godown_id)
+
+    if overflows:
+        rows = connection.execute(
+            select(godowns_table.c.id, godowns_table.c.name, godowns_table.c.capacity, godowns_table.c.used_bags)
+            .where(godowns_table.c.id.in_(overflows))
+        ).all()
+        found = {row.id: row for row in rows}
+        raise CapacityExceeded([{
+            'godown_id': godown_id,
+            'godown_name': found[godown_id].name if godown_id in found else f'Godown {godown_id}',
+            'capacity': found[godown_id].capacity if godown_id in found else None,
+            'requested': deltas[godown_id],
+            'available': max(0, found[godown_id].capacity - found[godown_id].used_bags) if godown_id in found else 0
+        } for godown_id in overflows])
+
+
+def usage_drift(connection=None, fix=False):
+    """Compare each godown's counter with SUM(bag_inventory); optionally reset it.
+
+    Returns [{godown_id, name, used_bags, actual}] for every godown that differs.
+    """
+    connection = connection or db.session.connection()
+    actual = select(func.coalesce(func.sum(inventory_table.c.number_of_bags), 0)).where(
+        inventory_table.c.godown_id == godowns_table.c.id
+    ).scalar_subquery()
+    rows = connection.execute(
+        select(godowns_table.c.id, godowns_table.c.name, godowns_table.c.used_bags, actual.label('actual'))
+        .order_by(godowns_table.c.id)
+    ).all()
+    drift = [{'godown_id': row.id, 'name': row.name, 'used_bags': row.used_bags, 'actual': row.actual}
+             for row in rows if row.used_bags != row.actual]
+    if fix and drift:
+        connection.execute(godowns_table.update().where(
+            godowns_table.c.id.in_([row['godown_id'] for row in drift])
+        ).values(used_bags=actual))
+    return drift
+
+
+def _add(deltas, godown_id, bags):
+    if godown_id is not None and bags:
+        deltas[godown_id] = deltas.get(godown_id, 0) + bags
+
+
+def _after_flush(session, flush_context):
+    deltas = {}
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        if not isinstance(obj, BagInventory):
+            continue
+        if obj not in session.new:
+            state = inspect(obj)
+            _add(deltas, previous(state, 'godown_id'), -(previous(state, 'number_of_bags') or 0))
+        if obj not in session.deleted:
+            _add(deltas, obj.godown_id, obj.number_of_bags or 0)
+    if deltas:
+        adjust_usage(session.connection(), deltas)
+
+
+def init_app(app):
+    """Keep Godown.used_bags in step with every ORM write to BagInventory.
+
+    Core statements that move stock (see utils.stock) call adjust_usage
+    themselves.
+    """
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    _listeners_installed = True
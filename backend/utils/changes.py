@@ -0,0 +1,12 @@
+"""Helpers for session listeners that look at what a flush changes."""
+
+
+def previous(state, key):
+    """Value an attribute had before this flush (the loaded value if unchanged,
+    None for a new object)"""
+    history = state.attrs[key].load_history()
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
@@ -0,0 +1,487 @@
+from flask import current_app
+from sqlalchemy import and_, bindparam, event, func, inspect, or_, select
+from extensions import db
+from models import CostingMethod, CostLot, LotConsumption, Purchase, Sale, SaleGodownDetail, StockTransfer
+from utils.archive import history as bill_history
+from utils.money import kilos, money
+from utils.changes import previous
+
+_REPLAY_KEY = 'costing_replay'
+_NEW_KEY = 'costing_new'
+_DELTA_KEY = 'costing_delta'
+_listeners_installed = False
+
+lots_table = CostLot.__table__
+consumption_table = LotConsumption.__table__
+transfers_table = StockTransfer.__table__
+
+# Columns whose change alters how a partition's bags are costed
+PURCHASE_FIELDS = ('grain_id', 'godown_id', 'purchase_date', 'number_of_bags', 'total_weight', 'total_amount')
+SALE_FIELDS = ('grain_id', 'sale_date', 'total_amount', 'buyer_name')
+DETAIL_FIELDS = ('godown_id', 'number_of_bags', 'sale_id')
+
+
+def costing_method():
+    method = current_app.config.get('COSTING_METHOD', CostingMethod.FIFO.value)
+    if method not in [m.value for m in CostingMethod]:
+        raise ValueError(f'Unknown costing method: {method}')
+    return method
+
+
+def consume(lots, bags, method):
+    """Draw `bags` from open lots, oldest first; returns ([(lot, bags, cost)], shortfall).
+
+    Lots are dicts with remaining_bags/remaining_cost and are updated in place.
+    FIFO charges each lot its own unit cost; weighted average charges the pool
+    average and revalues what is left to it, i.e. a moving average. Costs are
+    rounded to the paisa; under FIFO a lot's charges and what it has left
+    always add up to its cost exactly.
+    """
+    average = None
+    if method == CostingMethod.WEIGHTED_AVERAGE.value:
+        pool_bags = sum(lot['remaining_bags'] for lot in lots)
+        pool_cost = sum(lot['remaining_cost'] for lot in lots)
+        average = pool_cost / pool_bags if pool_bags > 0 else 0
+
+    takes = []
+    remaining = bags
+    for lot in lots:
+        if remaining <= 0:
+            break
+        if lot['remaining_bags'] <= 0:
+            continue
+        take = min(lot['remaining_bags'], remaining)
+        before = lot['remaining_cost']
+        unit = before / lot['remaining_bags']
+        lot['remaining_bags'] -= take
+        lot['remaining_cost'] = money(before - take * unit) if lot['remaining_bags'] else 0
+        takes.append((lot, take, money(before - lot['remaining_cost'] if average is None else take * average)))
+        remaining -= take
+
+    if average is not None:
+        for lot in lots:
+            if lot['remaining_bags'] > 0:
+                lot['remaining_cost'] = money(lot['remaining_bags'] * average)
+    return takes, remaining
+
+
+def _lot(purchase_id, grain_id, godown_id, lot_date, bags, weight, cost, transfer_id=None):
+    return {
+        'purchase_id': purchase_id, 'transfer_id': transfer_id, 'grain_id': grain_id, 'godown_id': godown_id,
+        'lot_date': lot_date, 'bags': bags, 'weight': weight or 0, 'cost': cost or 0,
+        'remaining_bags': bags, 'remaining_cost': cost or 0,
+    }
+
+
+def _consumption_rows(sale, godown_id, takes, shortfall, revenue_per_bag):
+    """sale is a dict with id, grain_id, party_id, sale_date"""
+    rows = []
+    for lot, bags, cost in takes:
+        revenue = money(bags * revenue_per_bag)
+        rows.append({
+            'sale_id': sale['id'], 'lot': lot, 'grain_id': sale['grain_id'], 'godown_id': godown_id,
+            'party_id': sale['party_id'], 'sale_date': sale['sale_date'], 'bags': bags,
+            'weight': kilos(bags * lot['weight'] / lot['bags']) if lot['bags'] else None,
+            'cost': cost, 'revenue': revenue, 'margin': money(revenue - cost),
+        })
+    if shortfall > 0:
+        # Stock no purchase accounts for (e.g. seeded inventory): revenue only
+        rows.append({
+            'sale_id': sale['id'], 'lot': None, 'grain_id': sale['grain_id'], 'godown_id': godown_id,
+            'party_id': sale['party_id'], 'sale_date': sale['sale_date'], 'bags': shortfall,
+            'weight': None, 'cost': None, 'revenue': money(shortfall * revenue_per_bag), 'margin': None,
+        })
+    return rows
+
+
+def _write_consumption(connection, rows):
+    if rows:
+        connection.execute(consumption_table.insert(), [
+            dict({key: value for key, value in row.items() if key != 'lot'},
+                 lot_id=row['lot']['id'] if row['lot'] else None)
+            for row in rows
+        ])
+
+
+def _partition_filter(columns, partitions):
+    return or_(*[and_(columns.grain_id == grain_id, columns.godown_id == godown_id)
+                 for grain_id, godown_id in sorted(partitions)])
+
+
+def clear_partitions(connection, partitions=None):
+    """Drop lots and consumption rows, for every partition when none are given"""
+    if partitions is None:
+        connection.execute(consumption_table.delete())
+        connection.execute(lots_table.delete())
+    elif partitions:
+        connection.execute(consumption_table.delete().where(_partition_filter(consumption_table.c, partitions)))
+        connection.execute(lots_table.delete().where(_partition_filter(lots_table.c, partitions)))
+
+
+def valuation(connection, partitions=None):
+    """Cost of goods sold, realized margin and stock value of some partitions"""
+    if partitions is not None and not partitions:
+        return {'cost': 0, 'margin': 0, 'stock': 0}
+    sold = select(func.coalesce(func.sum(consumption_table.c.cost), 0),
+                  func.coalesce(func.sum(consumption_table.c.margin), 0))
+    stock = select(func.coalesce(func.sum(lots_table.c.remaining_cost), 0))
+    if partitions is not None:
+        sold = sold.where(_partition_filter(consumption_table.c, partitions))
+        stock = stock.where(_partition_filter(lots_table.c, partitions))
+    cost, margin = connection.execute(sold).one()
+    return {'cost': cost, 'margin': margin, 'stock': connection.execute(stock).scalar()}
+
+
+def _add_delta(session, values, sign=1):
+    delta = session.info.setdefault(_DELTA_KEY, {'cost': 0, 'margin': 0, 'stock': 0})
+    for key in delta:
+        delta[key] += sign * (values.get(key) or 0)
+
+
+def pop_valuation_delta(session):
+    """Net change to {'cost', 'margin', 'stock'} written by the flushes so far"""
+    return session.info.pop(_DELTA_KEY, None)
+
+
+def _moved(takes, bags, shortfall):
+    """(cost, costed_bags, weight) a transfer carries out of its source lots"""
+    return (money(sum(cost for _, _, cost in takes)), bags - shortfall,
+            kilos(sum(take * lot['weight'] / lot['bags'] for lot, take, _ in takes if lot['bags'])))
+
+
+def _same(moved, stored):
+    if moved is None or stored is None:
+        return moved == stored
+    return moved[1] == stored[1] and all(abs((a or 0) - (b or 0)) < 1e-6 for a, b in zip(moved, stored))
+
+
+def _replay(connection, partitions, method):
+    # Archived bills still hold the cost basis of the years after them
+    purchases, sales, details = (bill_history(model, connection) for model in (Purchase, Sale, SaleGodownDetail))
+    purchase_query = select(
+        purchases.id, purchases.grain_id, purchases.godown_id, purchases.purchase_date,
+        purchases.number_of_bags, purchases.total_weight, purchases.total_amount
+    )
+    sale_bags = select(
+        details.sale_id, func.sum(details.number_of_bags).label('bags')
+    ).group_by(details.sale_id).subquery()
+    detail_query = select(
+        details.id, details.godown_id, details.number_of_bags,
+        sales.id.label('sale_id'), sales.grain_id, sales.party_id, sales.sale_date, sales.total_amount,
+        sale_bags.c.bags.label('sale_bags')
+    ).join(sales, sales.id == details.sale_id
+    ).join(sale_bags, sale_bags.c.sale_id == sales.id)
+    transfer_query = select(
+        StockTransfer.id, StockTransfer.grain_id, StockTransfer.from_godown_id, StockTransfer.to_godown_id,
+        StockTransfer.transfer_date, StockTransfer.number_of_bags, StockTransfer.cost,
+        StockTransfer.costed_bags, StockTransfer.weight
+    )
+
+    if partitions is not None:
+        if not partitions:
+            return {'lots': 0, 'consumption_rows': 0}, set()
+        grain_ids = sorted({grain_id for grain_id, _ in partitions})
+        godown_ids = sorted({godown_id for _, godown_id in partitions})
+        purchase_query = purchase_query.where(purchases.grain_id.in_(grain_ids), purchases.godown_id.in_(godown_ids))
+        detail_query = detail_query.where(sales.grain_id.in_(grain_ids), details.godown_id.in_(godown_ids))
+        transfer_query = transfer_query.where(StockTransfer.grain_id.in_(grain_ids), or_(
+            StockTransfer.from_godown_id.in_(godown_ids), StockTransfer.to_godown_id.in_(godown_ids)))
+
+    events = {}
+
+    def add(key, when, order, row, kind):
+        if (partitions is None or key in partitions) and row.number_of_bags > 0:
+            events.setdefault(key, []).append((when, order, row.id, kind, row))
+
+    for row in connection.execute(purchase_query):
+        add((row.grain_id, row.godown_id), row.purchase_date, 0, row, 'purchase')
+    for row in connection.execute(detail_query):
+        add((row.grain_id, row.godown_id), row.sale_date, 1, row, 'sale')
+    stored, destinations = {}, {}
+    for row in connection.execute(transfer_query):
+        stored[row.id] = (row.cost, row.costed_bags, row.weight)
+        destinations[row.id] = (row.grain_id, row.to_godown_id)
+        # Arriving bags are a lot like a purchase; leaving bags are drawn like a sale
+        add((row.grain_id, row.to_godown_id), row.transfer_date, 0, row, 'in')
+        add((row.grain_id, row.from_godown_id), row.transfer_date, 1, row, 'out')
+
+    lots, consumption, moved, used = [], [], {}, {}
+    for key, history in sorted(events.items()):
+        open_lots = []
+        for _, _, _, kind, row in sorted(history, key=lambda event: event[:3] + (event[4].id,)):
+            if kind == 'purchase':
+                lot = _lot(row.id, row.grain_id, row.godown_id, row.purchase_date,
+                           row.number_of_bags, row.total_weight, row.total_amount)
+                open_lots.append(lot)
+                lots.append(lot)
+            elif kind == 'in':
+                # The source may not have been replayed yet; checked below
+                used[row.id] = moved.get(row.id, stored[row.id])
+                cost, costed_bags, weight = used[row.id]
+                if costed_bags:
+                    lot = _lot(None, row.grain_id, row.to_godown_id, row.transfer_date,
+                               costed_bags, weight, cost, transfer_id=row.id)
+                    open_lots.append(lot)
+                    lots.append(lot)
+            elif kind == 'out':
+                takes, shortfall = consume(open_lots, row.number_of_bags, method)
+                moved[row.id] = _moved(takes, row.number_of_bags, shortfall)
+                open_lots = [lot for lot in open_lots if lot['remaining_bags'] > 0]
+            else:
+                takes, shortfall = consume(open_lots, row.number_of_bags, method)
+                sale = {'id': row.sale_id, 'grain_id': row.grain_id,
+                        'party_id': row.party_id, 'sale_date': row.sale_date}
+                consumption.extend(_consumption_rows(
+                    sale, row.godown_id, takes, shortfall, (row.total_amount or 0) / row.sale_bags))
+                open_lots = [lot for lot in open_lots if lot['remaining_bags'] > 0]
+
+    if lots:
+        connection.execute(lots_table.insert(), lots)
+        ids = connection.execute(
+            select(lots_table.c.id, lots_table.c.purchase_id, lots_table.c.transfer_id)
+            .where(or_(lots_table.c.purchase_id.in_(sorted({lot['purchase_id'] for lot in lots if lot['purchase_id']})),
+                       lots_table.c.transfer_id.in_(sorted({lot['transfer_id'] for lot in lots if lot['transfer_id']}))))
+        ).all()
+        by_source = {(purchase_id, transfer_id): lot_id for lot_id, purchase_id, transfer_id in ids}
+        for lot in lots:
+            lot['id'] = by_source[(lot['purchase_id'], lot['transfer_id'])]
+    _write_consumption(connection, consumption)
+
+    # Transfers whose cost basis changed leave a stale lot at their destination
+    stale = set()
+    for transfer_id, values in moved.items():
+        if not _same(values, stored[transfer_id]):
+            cost, costed_bags, weight = values
+            connection.execute(transfers_table.update().where(transfers_table.c.id == transfer_id).values(
+                cost=cost, costed_bags=costed_bags, weight=weight))
+        if not _same(values, used.get(transfer_id, stored[transfer_id])):
+            stale.add(destinations[transfer_id])
+    return {'lots': len(lots), 'consumption_rows': len(consumption)}, stale
+
+
+def replay(connection, partitions=None, method=None):
+    """Rebuild lots and consumption for (grain_id, godown_id) partitions from history.
+
+    Purchases, transfers and sale godown details are merged by date (arrivals
+    first on a tie, then by id) so a replay always produces the same
+    attribution. The partitions must already be cleared. Destinations of
+    transfers whose cost basis changed are replayed too; stats['cascade'] is
+    the valuation change of those outside `partitions`.
+    """
+    method = method or costing_method()
+    stats, stale = _replay(connection, partitions, method)
+    cascade = {'cost': 0, 'margin': 0, 'stock': 0}
+    while stale:
+        outside = stale - partitions if partitions is not None else set()
+        before = valuation(connection, outside)
+        clear_partitions(connection, stale)
+        more, stale = _replay(connection, stale, method)
+        after = valuation(connection, outside)
+        for key in cascade:
+            cascade[key] += after[key] - before[key]
+        for key in more:
+            stats[key] += more[key]
+    stats['cascade'] = cascade
+    return stats
+
+
+def _open_lots(connection, grain_id, godown_id):
+    rows = connection.execute(
+        select(lots_table.c.id, lots_table.c.bags, lots_table.c.weight,
+               lots_table.c.remaining_bags, lots_table.c.remaining_cost)
+        .where(lots_table.c.grain_id == grain_id,
+               lots_table.c.godown_id == godown_id,
+               lots_table.c.remaining_bags > 0)
+        .order_by(lots_table.c.lot_date, lots_table.c.id)
+        .with_for_update()
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def _save_lots(connection, lots):
+    if lots:
+        connection.execute(
+            lots_table.update().where(lots_table.c.id == bindparam('lot_id')).values(
+                remaining_bags=bindparam('new_bags'), remaining_cost=bindparam('new_cost')),
+            [{'lot_id': lot['id'], 'new_bags': lot['remaining_bags'], 'new_cost': lot['remaining_cost']}
+             for lot in lots]
+        )
+
+
+def consume_sale(connection, sale, method=None, skip=()):
+    """Attribute a new sale's godown details to open lots at write time.
+
+    Revenue is split by bags across all details; partitions in `skip` are
+    being replayed from history instead. Returns the valuation change.
+    """
+    method = method or costing_method()
+    details = [detail for detail in sale.godown_details if detail.number_of_bags > 0]
+    total_bags = sum(detail.number_of_bags for detail in details)
+    if not total_bags:
+        return {}
+    info = {'id': sale.id, 'grain_id': sale.grain_id, 'party_id': sale.party_id, 'sale_date': sale.sale_date}
+    revenue_per_bag = (sale.total_amount or 0) / total_bags
+
+    rows, touched = [], []
+    stock_before = 0
+    for detail in sorted(details, key=lambda detail: detail.godown_id):
+        if (sale.grain_id, detail.godown_id) in skip:
+            continue
+        lots = _open_lots(connection, sale.grain_id, detail.godown_id)
+        stock_before += sum(lot['remaining_cost'] for lot in lots)
+        takes, shortfall = consume(lots, detail.number_of_bags, method)
+        rows.extend(_consumption_rows(info, detail.godown_id, takes, shortfall, revenue_per_bag))
+        touched.extend(lots)
+
+    _save_lots(connection, touched)
+    _write_consumption(connection, rows)
+    return {
+        'cost': sum(row['cost'] or 0 for row in rows),
+        'margin': sum(row['margin'] or 0 for row in rows),
+        'stock': sum(lot['remaining_cost'] for lot in touched) - stock_before,
+    }
+
+
+def add_purchase_lot(connection, purchase):
+    """Open a lot for a new purchase, or replay its partition if it is backdated
+    before sales that were already costed. Returns the valuation change."""
+    key = (purchase.grain_id, purchase.godown_id)
+    last_sale = connection.execute(
+        select(func.max(consumption_table.c.sale_date))
+        .where(consumption_table.c.grain_id == key[0], consumption_table.c.godown_id == key[1])
+    ).scalar()
+    if last_sale is not None and purchase.purchase_date < last_sale:
+        before = valuation(connection, {key})
+        clear_partitions(connection, {key})
+        cascade = replay(connection, {key})['cascade']
+        after = valuation(connection, {key})
+        return {name: after[name] - before[name] + cascade[name] for name in after}
+    connection.execute(lots_table.insert().values(**_lot(
+        purchase.id, purchase.grain_id, purchase.godown_id, purchase.purchase_date,
+        purchase.number_of_bags, purchase.total_weight, purchase.total_amount)))
+    return {'stock': purchase.total_amount or 0}
+
+
+def move_lots(connection, transfer, method=None, open_destination=True):
+    """Draw a new transfer's bags from its source lots and record the cost basis
+    they carry; opens the destination lot unless that partition is being
+    replayed. Returns the valuation change."""
+    method = method or costing_method()
+    lots = _open_lots(connection, transfer.grain_id, transfer.from_godown_id)
+    stock_before = sum(lot['remaining_cost'] for lot in lots)
+    takes, shortfall = consume(lots, transfer.number_of_bags, method)
+    _save_lots(connection, lots)
+    cost, costed_bags, weight = _moved(takes, transfer.number_of_bags, shortfall)
+    connection.execute(transfers_table.update().where(transfers_table.c.id == transfer.id).values(
+        cost=cost, costed_bags=costed_bags, weight=weight))
+    stock = sum(lot['remaining_cost'] for lot in lots) - stock_before
+    if open_destination and costed_bags:
+        connection.execute(lots_table.insert().values(**_lot(
+            None, transfer.grain_id, transfer.to_godown_id, transfer.transfer_date,
+            costed_bags, weight, cost, transfer_id=transfer.id)))
+        stock += cost
+    return {'stock': stock}
+
+
+def _changed(state, fields):
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _before_flush(session, flush_context, instances):
+    replay_set = set()
+    new = session.info.setdefault(_NEW_KEY, [])
+
+    with session.no_autoflush:
+        for obj in list(session.new):
+            if isinstance(obj, (Purchase, Sale, StockTransfer)):
+                new.append(obj)
+            elif isinstance(obj, SaleGodownDetail) and obj.sale is not None and obj.sale not in session.new:
+                replay_set.add((obj.sale.grain_id, obj.godown_id))
+
+        for obj in list(session.dirty):
+            if not session.is_modified(obj):
+                continue
+            state = inspect(obj)
+            if isinstance(obj, Purchase) and _changed(state, PURCHASE_FIELDS):
+                replay_set.add((previous(state, 'grain_id'), previous(state, 'godown_id')))
+                replay_set.add((obj.grain_id, obj.godown_id))
+            elif isinstance(obj, Sale) and _changed(state, SALE_FIELDS):
+                for detail in obj.godown_details:
+                    replay_set.add((previous(state, 'grain_id'), detail.godown_id))
+                    replay_set.add((obj.grain_id, detail.godown_id))
+            elif isinstance(obj, SaleGodownDetail) and _changed(state, DETAIL_FIELDS) and obj.sale is not None:
+                replay_set.add((obj.sale.grain_id, previous(state, 'godown_id')))
+                replay_set.add((obj.sale.grain_id, obj.godown_id))
+
+        for obj in list(session.deleted):
+            state = inspect(obj)
+            if isinstance(obj, Purchase):
+                replay_set.add((previous(state, 'grain_id'), previous(state, 'godown_id')))
+            elif isinstance(obj, Sale):
+                for detail in obj.godown_details:
+                    replay_set.add((previous(state, 'grain_id'), detail.godown_id))
+            elif isinstance(obj, SaleGodownDetail) and obj.sale is not None:
+                replay_set.add((obj.sale.grain_id, previous(state, 'godown_id')))
+            elif isinstance(obj, StockTransfer):
+                replay_set.add((obj.grain_id, obj.from_godown_id))
+                replay_set.add((obj.grain_id, obj.to_godown_id))
+
+    replay_set = {key for key in replay_set if None not in key}
+    if replay_set:
+        # Cleared before the flush so deleted bills are no longer referenced
+        _add_delta(session, valuation(session.connection(), replay_set), -1)
+        clear_partitions(session.connection(), replay_set)
+        session.info.setdefault(_REPLAY_KEY, set()).update(replay_set)
+
+
+def _after_flush(session, flush_context):
+    replay_set = session.info.pop(_REPLAY_KEY, set())
+    new = session.info.pop(_NEW_KEY, [])
+    if not replay_set and not new:
+        return
+    connection = session.connection()
+    method = costing_method()
+
+    # Transfers first: a replayed destination reads the cost basis they record
+    for obj in new:
+        if isinstance(obj, StockTransfer) and (obj.grain_id, obj.from_godown_id) not in replay_set:
+            _add_delta(session, move_lots(connection, obj, method,
+                                          open_destination=(obj.grain_id, obj.to_godown_id) not in replay_set))
+    if replay_set:
+        cascade = replay(connection, replay_set, method)['cascade']
+        _add_delta(session, valuation(connection, replay_set))
+        _add_delta(session, cascade)
+    for obj in new:
+        if isinstance(obj, Purchase) and (obj.grain_id, obj.godown_id) not in replay_set:
+            _add_delta(session, add_purchase_lot(connection, obj))
+    for obj in new:
+        if isinstance(obj, Sale):
+            _add_delta(session, consume_sale(connection, obj, method, skip=replay_set))
+
+
+def _reset(session, *args):
+    session.info.pop(_REPLAY_KEY, None)
+    session.info.pop(_NEW_KEY, None)
+    session.info.pop(_DELTA_KEY, None)
+
+
+def init_app(app):
+    """Open a cost lot per purchase, move lots with transfers and attribute
+    every sale as it is written"""
+    global _listeners_installed
+    app.config.setdefault('COSTING_METHOD', CostingMethod.FIFO.value)
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'before_flush', _before_flush)
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _reset)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
+
+
+def rebuild_costs(method=None, session=None):
+    """Replay every purchase and sale into fresh lots; returns counts"""
+    session = session or db.session
+    connection = session.connection()
+    clear_partitions(connection)
+    return replay(connection, None, method)
@@ -0,0 +1,273 @@
+import math
+import random
+from datetime import datetime, time, timedelta
+from sqlalchemy import bindparam, func, text
+from extensions import db
+from models import (BagInventory, Godown, Grain, IntermediateBill, PaymentHistory, PaymentStatus, Purchase, Role, Sale,
+                    SaleGodownDetail, User)
+from utils import search
+from utils.costing import rebuild_costs
+from utils.http_cache import bump
+from utils.ledger import rebuild_balances
+from utils.prices import rebuild_buckets
+
+GRAIN_NAMES = [
+    'Wheat', 'Rice', 'Corn', 'Barley', 'Soybean', 'Bajra', 'Jowar', 'Ragi', 'Chana', 'Tur',
+    'Moong', 'Urad', 'Masoor', 'Mustard', 'Groundnut', 'Sesame', 'Cotton Seed', 'Sunflower',
+    'Maize', 'Basmati Rice', 'Sona Masuri', 'Durum Wheat', 'Sharbati Wheat', 'Kabuli Chana',
+    'Rajma', 'Lobia', 'Matar', 'Methi', 'Dhaniya', 'Jeera'
+]
+CITIES = ['Indore', 'Bhopal', 'Ujjain', 'Dewas', 'Ratlam', 'Khandwa', 'Harda', 'Vidisha', 'Sehore', 'Mandsaur']
+FIRST_NAMES = ['Ramesh', 'Suresh', 'Mohan', 'Shyam', 'Gopal', 'Vijay', 'Anil', 'Lakshmi', 'Rajesh', 'Sunil',
+               'Mahesh', 'Dinesh', 'Kailash', 'Prakash', 'Rakesh', 'Santosh', 'Ashok', 'Manoj',
+               'रमेश', 'सुरेश', 'मोहन', 'श्याम', 'गोपाल', 'विजय']
+SUFFIXES = ['Traders', 'Agro', 'Kumar', 'Lal', 'Enterprises', 'Industries', 'Foods', 'ट्रेडर्स', 'एंड संस']
+BAG_WEIGHTS = [50, 50, 50, 60, 75, 100]
+TRANSPORT = ['truck', 'tractor', 'tempo', 'rail']
+
+BATCH = 20000
+# Bills younger than this are left unpaid; older ones are mostly settled
+SETTLE_AFTER_DAYS = 30
+# One voice bill per this many bills, all from the last day (older ones are cleaned up)
+VOICE_BILL_EVERY = 200
+VOICE_ERRORS = ['Invalid grain name: {grain}', 'Invalid godown name: {godown}', 'Insufficient stock in {godown}']
+
+
+def _names(rng, count):
+    names = []
+    for i in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(SUFFIXES)}"
+        names.append(name if i < len(FIRST_NAMES) * len(SUFFIXES) else f"{name} {i}")
+    return names
+
+
+def _vehicle(rng):
+    return f"MP{rng.randrange(1, 70):02d} {rng.choice('ABCDEFGH')}{rng.choice('ABCDEFGH')} {rng.randrange(10000):04d}"
+
+
+class _Writer:
+    """Buffers rows per table and writes each buffer with one executemany"""
+
+    def __init__(self, session, batch):
+        self.session = session
+        self.batch = batch
+        self.rows = {}
+        self.written = {}
+
+    def add(self, table, row):
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        # Parents first so foreign keys hold on databases that check them
+        for table in (Purchase.__table__, Sale.__table__, SaleGodownDetail.__table__, PaymentHistory.__table__,
+                      IntermediateBill.__table__):
+            rows = self.rows.pop(table, None)
+            if rows:
+                self.session.execute(table.insert(), rows)
+                self.written[table.name] = self.written.get(table.name, 0) + len(rows)
+        self.session.commit()
+
+
+def _payments(rng, key, bill_id, amount, bill_date, end):
+    """Settle an old bill in one or two payments, sometimes only partly.
+
+    Returns (paid, status, payment rows).
+    """
+    if (end - bill_date).days < SETTLE_AFTER_DAYS or rng.random() < 0.15:
+        return 0, PaymentStatus.PENDING.value, []
+    paid = amount if rng.random() < 0.8 else round(amount * rng.uniform(0.2, 0.9), 2)
+    parts = [paid] if rng.random() < 0.6 else [round(paid / 2, 2), round(paid - round(paid / 2, 2), 2)]
+    rows, when = [], bill_date
+    for part in parts:
+        when = min(end, when + timedelta(days=rng.randrange(1, SETTLE_AFTER_DAYS)))
+        rows.append({'purchase_id': None, 'sale_id': None, key: bill_id, 'amount': part, 'payment_date': when, 'created_at': when,
+                     'description': 'Generated payment', 'reference': f"UTR{rng.randrange(10 ** 10):010d}"})
+    return paid, PaymentStatus.PAID.value if paid >= amount else PaymentStatus.PARTIALLY_PAID.value, rows
+
+
+def _voice_bill(rng, user_id, when, grain, godowns, suppliers, buyers):
+    """A voice bill as the transcription and parsing steps leave it: pending,
+    approved or rejected with the error shown to the user"""
+    bags, weight, rate = rng.randrange(10, 200), rng.choice(BAG_WEIGHTS), round(rng.uniform(18, 90), 2)
+    godown = rng.choice(godowns)
+    parsed = {'grain_name': grain, 'number_of_bags': bags, 'weight_per_bag': weight, 'rate_per_kg': rate}
+    if rng.random() < 0.5:
+        bill_type, party = 'purchase', rng.choice(suppliers)
+        parsed.update(supplier_name=party, godown_name=godown)
+        transcript = f"{party} से {grain} {bags} बोरी, {weight} किलो की बोरी, {rate} रुपये किलो, {godown} में"
+    else:
+        bill_type, party = 'sale', rng.choice(buyers)
+        vehicle = _vehicle(rng)
+        parsed.update(buyer_name=party, godown_details=[{'name': godown, 'bags': bags}], buyer_gst=None,
+                      transportation_mode=rng.choice(TRANSPORT), vehicle_number=vehicle,
+                      driver_name=rng.choice(FIRST_NAMES), lr_number=None, po_number=None)
+        transcript = f"{party} को {grain} {bags} बोरी, {rate} रुपये किलो, गाड़ी {vehicle}, {godown} से"
+    status = rng.choices(['pending', 'approved', 'error'], [5, 3, 1])[0]
+    error = rng.choice(VOICE_ERRORS).format(grain=grain, godown=godown) if status == 'error' else None
+    return {'bill_type': bill_type, 'raw_transcript': transcript, 'parsed_data': parsed, 'status': status,
+            'error_message': error, 'created_at': when, 'updated_at': when, 'created_by_id': user_id}
+
+
+def generate(purchases=1000000, sales=1000000, grains=30, godowns=50, days=3 * 365, end=None,
+             seed=42, batch=BATCH, session=None, voice_bills=None):
+    """Fill an empty database with a deterministic trading history.
+
+    Bills are written in date order with bulk inserts; sales only take bags
+    the godowns hold at that moment, split over up to three godowns, so
+    stock, costing and the ledger agree with what the API would have
+    produced. Voice bills (one per VOICE_BILL_EVERY bills unless given) come
+    from the last day and belong to the first user, or to a 'datagen' user
+    without a password. The same seed and end date give the same rows. Derived tables
+    (party balances, cost lots, price buckets, search index) are rebuilt
+    once at the end. Returns row counts.
+    """
+    session = session or db.session
+    if session.query(func.count(Grain.id)).scalar() or session.query(func.count(Godown.id)).scalar():
+        raise ValueError('gen-data needs an empty database (grains or godowns already exist)')
+
+    rng = random.Random(seed)
+    end = datetime.combine(end or datetime.utcnow().date(), time(18, 0))
+    start = end - timedelta(days=days)
+    connection = session.connection()
+
+    grain_rows = [{'id': i + 1, 'name': GRAIN_NAMES[i] if i < len(GRAIN_NAMES) else f'Grain {i + 1}',
+                   'created_at': start} for i in range(grains)]
+    godown_rows = [{'id': i + 1, 'name': f'Godown {i + 1:02d}', 'location': CITIES[i % len(CITIES)],
+                    'used_bags': 0, 'created_at': start} for i in range(godowns)]
+    connection.execute(Grain.__table__.insert(), grain_rows)
+    connection.execute(Godown.__table__.insert(), godown_rows)
+    # Triggers would index row by row; the index is rebuilt in one pass below
+    if connection.dialect.name == 'sqlite':
+        for statement in search.sqlite_drop_ddl():
+            connection.execute(text(statement))
+    session.commit()
+
+    suppliers = _names(rng, 1500)
+    buyers = _names(rng, 2500)
+    base_rate = {grain['id']: rng.uniform(18, 90) for grain in grain_rows}
+    stock = {grain['id']: {} for grain in grain_rows}
+    on_hand = {grain['id']: 0 for grain in grain_rows}
+    peak = {godown['id']: 0 for godown in godown_rows}
+    used = {godown['id']: 0 for godown in godown_rows}
+    sequence = {}
+    writer = _Writer(session, batch)
+    purchase_id = sale_id = 0
+    remaining = {'purchase': purchases, 'sale': sales}
+    total = purchases + sales
+    step = (end - start) / max(total, 1)
+
+    for i in range(total):
+        when = start + step * i + timedelta(seconds=rng.randrange(max(1, int(step.total_seconds()))))
+        kind = 'purchase' if rng.random() * (remaining['purchase'] + remaining['sale']) < remaining['purchase'] else 'sale'
+        grain_id = rng.randrange(1, grains + 1)
+        # Seasonal swing of +/-15% around each grain's base rate
+        rate = round(base_rate[grain_id] * (1 + 0.15 * math.sin(2 * math.pi * (when - start).days / 365))
+                     * rng.uniform(0.95, 1.05), 2)
+        if kind == 'sale' and not on_hand[grain_id]:
+            kind = 'purchase' if remaining['purchase'] else 'sale'
+        if kind == 'sale' and not on_hand[grain_id]:
+            continue
+        remaining[kind] -= 1
+        day = when.strftime('%Y%m%d')
+        sequence[(kind, day)] = sequence.get((kind, day), 0) + 1
+
+        if kind == 'purchase':
+            purchase_id += 1
+            godown_id = rng.randrange(1, godowns + 1)
+            bags = rng.randrange(20, 400)
+            weight_per_bag = rng.choice(BAG_WEIGHTS)
+            extra_weight = rng.choice([0, 0, 0, rng.randrange(1, 50)])
+            total_weight = bags * weight_per_bag + extra_weight
+            amount = round(total_weight * rate, 2)
+            paid, status, payments = _payments(rng, 'purchase_id', purchase_id, amount, when, end)
+            writer.add(Purchase.__table__, {
+                'id': purchase_id, 'bill_number': f"PB-{day}-{sequence[(kind, day)]:04d}",
+                'grain_id': grain_id, 'godown_id': godown_id, 'number_of_bags': bags,
+                'weight_per_bag': weight_per_bag, 'extra_weight': extra_weight, 'rate_per_kg': rate,
+                'total_weight': total_weight, 'total_amount': amount, 'payment_status': status,
+                'paid_amount': paid, 'supplier_name': rng.choice(suppliers), 'purchase_date': when,
+                'created_at': when
+            })
+            stock[grain_id][godown_id] = stock[grain_id].get(godown_id, 0) + bags
+            on_hand[grain_id] += bags
+            used[godown_id] += bags
+            peak[godown_id] = max(peak[godown_id], used[godown_id])
+        else:
+            sale_id += 1
+            bags = min(on_hand[grain_id], rng.randrange(10, 300))
+            held = [godown_id for godown_id, count in stock[grain_id].items() if count]
+            split = rng.sample(held, min(len(held), rng.randrange(1, 4)))
+            # Fall back to every godown holding the grain when the sample runs short
+            split += [godown_id for godown_id in held if godown_id not in split]
+            details, needed = [], bags
+            for godown_id in split:
+                take = min(needed, stock[grain_id][godown_id])
+                if not take:
+                    continue
+                details.append({'sale_id': sale_id, 'godown_id': godown_id,
+                                'number_of_bags': take, 'created_at': when})
+                stock[grain_id][godown_id] -= take
+                used[godown_id] -= take
+                needed -= take
+                if not needed:
+                    break
+            on_hand[grain_id] -= bags
+            total_weight = bags * rng.choice(BAG_WEIGHTS)
+            sale_rate = round(rate * rng.uniform(1.02, 1.12), 2)
+            amount = round(total_weight * sale_rate, 2)
+            paid, status, payments = _payments(rng, 'sale_id', sale_id, amount, when, end)
+            writer.add(Sale.__table__, {
+                'id': sale_id, 'bill_number': f"SB-{day}-{sequence[(kind, day)]:04d}",
+                'grain_id': grain_id, 'buyer_name': rng.choice(buyers), 'number_of_bags': bags,
+                'total_weight': total_weight, 'rate_per_kg': sale_rate, 'total_amount': amount,
+                'transportation_mode': rng.choice(TRANSPORT), 'vehicle_number': _vehicle(rng),
+                'driver_name': rng.choice(FIRST_NAMES), 'lr_number': f"LR{rng.randrange(10 ** 6)}",
+                'po_number': f"PO{rng.randrange(10 ** 6)}" if rng.random() < 0.4 else None,
+                'buyer_gst': f"23AB{rng.randrange(10 ** 6):06d}Z{rng.randrange(10)}" if rng.random() < 0.5 else None,
+                'sale_date': when, 'created_at': when, 'payment_status': status, 'paid_amount': paid
+            })
+            for detail in details:
+                writer.add(SaleGodownDetail.__table__, detail)
+        for payment in payments:
+            writer.add(PaymentHistory.__table__, payment)
+
+    if voice_bills is None:
+        voice_bills = total // VOICE_BILL_EVERY
+    if voice_bills:
+        user = session.query(User).order_by(User.id).first()
+        if user is None:
+            user = User(username='datagen', email='datagen@example.com', role=Role.STAFF.value)
+            session.add(user)
+            session.flush()
+        godown_names = [godown['name'] for godown in godown_rows]
+        for _ in range(voice_bills):
+            when = end - timedelta(seconds=rng.randrange(24 * 3600))
+            writer.add(IntermediateBill.__table__, _voice_bill(
+                rng, user.id, when, rng.choice(grain_rows)['name'], godown_names, suppliers, buyers))
+    writer.flush()
+
+    connection = session.connection()
+    inventory = [{'grain_id': grain_id, 'godown_id': godown_id, 'number_of_bags': bags, 'last_updated': end}
+                 for grain_id, held in stock.items() for godown_id, bags in held.items()]
+    if inventory:
+        connection.execute(BagInventory.__table__.insert(), inventory)
+    # Room for the busiest moment plus a fifth, rounded up to a thousand bags
+    godowns_table = Godown.__table__
+    connection.execute(
+        godowns_table.update().where(godowns_table.c.id == bindparam('godown')).values(
+            used_bags=bindparam('used'), capacity=bindparam('cap')),
+        [{'godown': godown_id, 'used': used[godown_id],
+          'cap': max(1000, math.ceil(peak[godown_id] * 1.2 / 1000) * 1000)} for godown_id in used]
+    )
+
+    counts = dict(writer.written, grains=grains, godowns=godowns, bag_inventory=len(inventory))
+    counts['parties'] = rebuild_balances(session)['names_linked']
+    counts['cost_lots'] = rebuild_costs(session=session).get('lots', 0)
+    counts['price_buckets'] = rebuild_buckets(session)
+    counts['bill_search'] = search.rebuild_index(session)
+    bump('grains', 'godowns', 'inventory', 'purchases', 'sales', session=session)
+    session.commit()
+    return counts
@@ -1,25 +1,29 @@
+import sys
 from flask import jsonify
-import openai
 
 def handle_error(error):
     """Handle different types of errors and return appropriate responses"""
-    if isinstance(error, openai.error.InvalidRequestError):
-        return jsonify({
-            'error': 'Invalid request to OpenAI API',
-            'details': str(error)
-        }), 400
-        
-    if isinstance(error, openai.error.AuthenticationError):
-        return jsonify({
-            'error': 'OpenAI API authentication failed',
-            'details': 'Please check your API key'
-        }), 401
-        
-    if isinstance(error, openai.error.RateLimitError):
-        return jsonify({
-            'error': 'OpenAI API rate limit exceeded',
-            'details': 'Please try again later'
-        }), 429
+    # openai is imported on first use (utils/outbound.py); until then no
+    # error can have come from it
+    openai = sys.modules.get('openai')
+    if openai is not None:
+        if isinstance(error, openai.BadRequestError):
+            return jsonify({
+                'error': 'Invalid request to OpenAI API',
+                'details': str(error)
+            }), 400
+
+        if isinstance(error, openai.AuthenticationError):
+            return jsonify({
+                'error': 'OpenAI API authentication failed',
+                'details': 'Please check your API key'
+            }), 401
+
+        if isinstance(error, openai.RateLimitError):
+            return jsonify({
+                'error': 'OpenAI API rate limit exceeded',
+                'details': 'Please try again later'
+            }), 429
         
     # Generic error handler
     return jsonify({
@@ -0,0 +1,338 @@
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from extensions import db
+from models import BagInventory, EventOutbox, PaymentHistory, Purchase, Sale
+from utils.costing import pop_valuation_delta
+from utils.serving import stream_limit, workers
+from utils.changes import previous
+
+_PENDING_KEY = 'events_pending'
+_OUTBOX_KEY = 'events_outbox_id'
+_STOCK_KEY = 'events_stock'
+_listeners_installed = False
+
+outbox = EventOutbox.__table__
+
+BILL_FIELDS = ('bill_number', 'total_amount', 'purchase_date', 'sale_date', 'supplier_name', 'buyer_name',
+               'grain_id', 'godown_id', 'number_of_bags')
+PAYMENT_FIELDS = ('payment_status', 'paid_amount')
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """One open event stream; a full queue turns into a single resync"""
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.stale = False
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stale = True
+
+    def get(self, timeout):
+        if self.stale:
+            self.stale = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return ('resync', None, {})
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """In-process pub/sub: events published after commit reach this worker's streams.
+
+    Keeps the most recent events so a reconnecting EventSource can resume
+    from Last-Event-ID; anything older gets a resync instead.
+    """
+    durable = False
+
+    def __init__(self, history=256, queue_size=100, max_subscribers=100):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.recent = deque(maxlen=history)
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.last_id = 0
+        self._ids = itertools.count(1)
+
+    def subscribe(self, last_event_id=None):
+        subscription = Subscription(self.queue_size)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            if last_event_id is not None and last_event_id != self.last_id:
+                oldest = self.recent[0][1] if self.recent else None
+                if oldest is None or not oldest - 1 <= last_event_id < self.last_id:
+                    subscription.put(('resync', None, {}))
+                else:
+                    for item in self.recent:
+                        if item[1] > last_event_id:
+                            subscription.put(item)
+            self.subscribers.add(subscription)
+        self._started()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def deliver(self, event_id, payload):
+        item = ('delta', event_id, payload)
+        with self.lock:
+            self.last_id = max(self.last_id, event_id)
+            self.recent.append(item)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(item)
+
+    def publish(self, payload):
+        self.deliver(next(self._ids), payload)
+
+    def cursor(self, connection=None):
+        return self.last_id
+
+    def _started(self):
+        pass
+
+
+class DatabaseBroker(LocalBroker):
+    """Fan-out across worker processes through the event_outbox table.
+
+    The delta is written in the same transaction as the change, and each
+    worker with open streams polls for committed rows; this stands in for an
+    external broker such as Redis pub/sub. Polling stops with the last stream.
+    """
+    durable = True
+    # Rows committed out of id order (PostgreSQL) are caught by re-reading this
+    # many ids behind the cursor
+    LOOKBACK = 100
+
+    def __init__(self, app, interval=0.5, retention=timedelta(hours=1), **kwargs):
+        super().__init__(**kwargs)
+        self.app = app
+        self.interval = interval
+        self.retention = retention
+        self.seen = deque(maxlen=1000)
+        self.thread = None
+
+    def _started(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._poll, name='event-outbox', daemon=True)
+            self.thread.start()
+
+    def cursor(self, connection=None):
+        connection = connection or db.session.connection()
+        return connection.execute(select(func.coalesce(func.max(outbox.c.id), 0))).scalar()
+
+    def _poll(self):
+        with self.app.app_context():
+            engine = db.engine
+        with engine.connect() as connection:
+            cursor = floor = self.cursor(connection)
+        self.last_id = max(self.last_id, cursor)
+        pruned = 0
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+            try:
+                with engine.connect() as connection:
+                    rows = connection.execute(
+                        select(outbox.c.id, outbox.c.payload)
+                        .where(outbox.c.id > cursor - self.LOOKBACK)
+                        .order_by(outbox.c.id).limit(500)
+                    ).all()
+                    for row in rows:
+                        if row.id <= floor or row.id in self.seen:
+                            continue
+                        self.seen.append(row.id)
+                        cursor = max(cursor, row.id)
+                        self.deliver(row.id, json.loads(row.payload))
+                    if time.monotonic() - pruned > 60:
+                        with connection.begin():
+                            connection.execute(outbox.delete().where(
+                                outbox.c.created_at < datetime.utcnow() - self.retention))
+                        pruned = time.monotonic()
+            except Exception as e:
+                print(f"Error polling event outbox: {str(e)}")
+            time.sleep(self.interval)
+
+
+def get_broker():
+    return current_app.extensions['events']
+
+
+# --- Collecting deltas ------------------------------------------------------------
+
+def _changed(state, fields):
+    return any(key in state.attrs and state.attrs[key].history.has_changes() for key in fields)
+
+
+def _bill_row(obj):
+    if isinstance(obj, Purchase):
+        return {'id': obj.id, 'billNumber': obj.bill_number, 'supplierName': obj.supplier_name,
+                'amount': obj.total_amount or 0, 'date': obj.purchase_date.isoformat()}
+    return {'id': obj.id, 'billNumber': obj.bill_number, 'buyerName': obj.buyer_name,
+            'amount': obj.total_amount or 0, 'date': obj.sale_date.isoformat()}
+
+
+def _new_pending():
+    return {'types': [], 'totals': {}, 'inventory': {}, 'purchases': [], 'sales': [], 'payments': []}
+
+
+def _add(mapping, key, amount):
+    if amount:
+        mapping[key] = mapping.get(key, 0) + amount
+
+
+def _collect(session, pending):
+    """Fold this flush's bill, payment and stock changes into the pending delta"""
+    types, totals, inventory = pending['types'], pending['totals'], pending['inventory']
+
+    def mark(kind):
+        if kind not in types:
+            types.append(kind)
+
+    def stock(grain_id, bags):
+        if grain_id is not None and bags:
+            _add(inventory, str(grain_id), bags)
+            _add(totals, 'totalInventory', bags)
+            mark('inventory')
+
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        state = inspect(obj)
+        if isinstance(obj, (Purchase, Sale)):
+            kind, total = ('purchase', 'totalPurchases') if isinstance(obj, Purchase) else ('sale', 'totalSales')
+            rows = pending[kind + 's']
+            if obj in session.new:
+                _add(totals, total, obj.total_amount or 0)
+                rows.append(dict(_bill_row(obj), op='created'))
+                mark(f'{kind}.created')
+            elif obj in session.deleted:
+                _add(totals, total, -(previous(state, 'total_amount') or 0))
+                rows.append({'id': obj.id, 'op': 'deleted'})
+                mark(f'{kind}.deleted')
+            elif _changed(state, BILL_FIELDS):
+                _add(totals, total, (obj.total_amount or 0) - (previous(state, 'total_amount') or 0))
+                rows.append(dict(_bill_row(obj), op='updated'))
+                mark(f'{kind}.updated')
+            if obj not in session.new and obj not in session.deleted and _changed(state, PAYMENT_FIELDS):
+                pending['payments'].append({'bill': kind, 'id': obj.id, 'status': obj.payment_status})
+                mark('payment')
+
+
+        elif isinstance(obj, BagInventory):
+            if obj not in session.new:
+                stock(previous(state, 'grain_id'), -(previous(state, 'number_of_bags') or 0))
+            if obj not in session.deleted:
+                stock(obj.grain_id, obj.number_of_bags or 0)
+
+        elif isinstance(obj, PaymentHistory) and obj in session.new:
+            kind = 'sale' if obj.sale_id else 'purchase'
+            pending['payments'].append({'bill': kind, 'id': obj.sale_id or obj.purchase_id,
+                                        'amount': obj.amount})
+            mark('payment')
+
+    for grain_id, bags in session.info.pop(_STOCK_KEY, ()):
+        stock(grain_id, bags)
+
+    valuation = pop_valuation_delta(session)
+    if valuation:
+        _add(totals, 'costOfGoodsSold', valuation['cost'])
+        _add(totals, 'totalRevenue', valuation['margin'])
+        _add(totals, 'stockValue', valuation['stock'])
+
+
+def record_stock(session, grain_id, bags):
+    """Report a stock change made with a Core statement; the next flush picks it up"""
+    session.info.setdefault(_STOCK_KEY, []).append((grain_id, bags))
+
+
+def _compact(pending):
+    return {key: value for key, value in pending.items() if value}
+
+
+def _after_flush(session, flush_context):
+    if not has_app_context() or 'events' not in current_app.extensions:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, _new_pending())
+    _collect(session, pending)
+    if not pending['types'] and not pending['totals']:
+        return
+
+    if get_broker().durable:
+        # One outbox row per transaction, rewritten as later flushes add to it
+        payload = json.dumps(_compact(pending))
+        connection = session.connection()
+        row_id = session.info.get(_OUTBOX_KEY)
+        if row_id is None:
+            result = connection.execute(outbox.insert().values(payload=payload, created_at=datetime.utcnow()))
+            session.info[_OUTBOX_KEY] = result.inserted_primary_key[0]
+        else:
+            connection.execute(outbox.update().where(outbox.c.id == row_id).values(payload=payload))
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_OUTBOX_KEY, None)
+    session.info.pop(_STOCK_KEY, None)
+    if not pending or not has_app_context() or 'events' not in current_app.extensions:
+        return
+    broker = get_broker()
+    if not broker.durable and (pending['types'] or pending['totals']):
+        broker.publish(_compact(pending))
+
+
+def _reset(session, *args):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_OUTBOX_KEY, None)
+    session.info.pop(_STOCK_KEY, None)
+
+
+def init_app(app):
+    """Publish a compact delta for every committed bill, payment or stock change.
+
+    EVENTS_BROKER=local serves one process; database is needed (and the
+    default) when several workers share the database, so every worker sees
+    every change and event ids agree across them. EVENTS_MAX_SUBSCRIBERS
+    caps the streams one worker holds (see utils.serving.stream_limit).
+    Must be initialised after costing, whose valuation delta it reads.
+    """
+    global _listeners_installed
+    app.config.setdefault('EVENTS_BROKER', 'database' if workers() > 1 else 'local')
+    app.config.setdefault('EVENTS_KEEPALIVE', 15)
+    app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', stream_limit())
+    options = {'max_subscribers': app.config['EVENTS_MAX_SUBSCRIBERS']}
+    if app.config['EVENTS_BROKER'] == 'database':
+        app.extensions['events'] = DatabaseBroker(app, **options)
+    elif workers() > 1:
+        raise ValueError(f"EVENTS_BROKER=local cannot serve {workers()} workers: each would only see its own "
+                         "changes and number events on its own; use EVENTS_BROKER=database")
+    else:
+        app.extensions['events'] = LocalBroker(**options)
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
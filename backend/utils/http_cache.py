@@ -0,0 +1,147 @@
+from functools import wraps
+from datetime import datetime
+import hashlib
+from flask import current_app, make_response, request
+from sqlalchemy import event
+from extensions import db
+from models import ResourceVersion
+
+# Tables whose writes invalidate a cached resource
+TABLE_RESOURCES = {
+    'grains': ('grains',),
+    'godowns': ('godowns',),
+    'bag_inventory': ('inventory',),
+    'purchase': ('purchases',),
+    'sale': ('sales',),
+    'sale_godown_detail': ('sales',),
+    'stock_transfers': ('transfers',),
+}
+
+_BUMPED_KEY = 'http_cache_bumped'
+_listeners_installed = False
+
+
+def bump(*resources, session=None):
+    """Increment the version of each resource inside the current transaction.
+
+    Each resource is bumped at most once per transaction, so a bill touching
+    many rows only pays for one UPDATE per resource.
+    """
+    session = session or db.session
+    bumped = session.info.setdefault(_BUMPED_KEY, set())
+    pending = sorted(set(resources) - bumped)
+    if not pending:
+        return
+
+    table = ResourceVersion.__table__
+    now = datetime.utcnow()
+    connection = session.connection()
+    for name in pending:
+        result = connection.execute(
+            table.update()
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, version=1, updated_at=now))
+    bumped.update(pending)
+
+
+def _resources_for(instances):
+    resources = set()
+    for instance in instances:
+        table = getattr(instance, '__tablename__', None)
+        resources.update(TABLE_RESOURCES.get(table, ()))
+    return resources
+
+
+def _after_flush(session, flush_context):
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    resources = _resources_for(list(session.new) + dirty + list(session.deleted))
+    if resources:
+        bump(*resources, session=session)
+
+
+def _reset_bumped(session, *args):
+    session.info.pop(_BUMPED_KEY, None)
+
+
+def init_app(app):
+    """Track writes to cached tables so resource versions stay current"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _reset_bumped)
+    event.listen(db.session, 'after_soft_rollback', _reset_bumped)
+    _listeners_installed = True
+
+
+def current_versions(resources):
+    """Return {resource: (version, updated_at)} in a single primary-key lookup"""
+    table = ResourceVersion.__table__
+    rows = db.session.execute(
+        table.select().where(table.c.name.in_(list(resources)))
+    ).fetchall()
+    found = {row.name: (row.version, row.updated_at) for row in rows}
+    return {name: found.get(name, (0, None)) for name in resources}
+
+
+def make_etag(versions):
+    key = '|'.join([
+        current_app.config.get('ETAG_SALT', ''),
+        request.full_path,
+    ] + [f'{name}:{versions[name][0]}' for name in sorted(versions)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def _set_cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Auth-scoped data: let the browser and service worker keep a private copy
+    # but revalidate it with If-None-Match on every use.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Authorization')
+    return response
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match.star_tag:
+        return True
+    if request.if_none_match:
+        # Compressed representations carry the encoding as a tag suffix
+        return any(tag == etag or tag.startswith(etag + '-')
+                   for tag in request.if_none_match.as_set())
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional(*resources):
+    """Serve a GET endpoint with ETag/Last-Modified derived from resource versions.
+
+    When the client already holds the current representation a 304 is returned
+    before the view (and its queries) runs. Versions are read before the view,
+    so a write racing the query can only make the tag older than the body,
+    which costs the client one extra full fetch and never serves stale data.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            versions = current_versions(resources)
+            etag = make_etag(versions)
+            stamps = [stamp for _, stamp in versions.values() if stamp]
+            last_modified = max(stamps) if stamps else None
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+                return _set_cache_headers(response, etag, last_modified)
+
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                _set_cache_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
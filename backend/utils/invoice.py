@@ -0,0 +1,480 @@
+"""GST tax invoices as PDF.
+
+Pages are laid out with fpdf2 in Shobhika (backend/fonts, SIL Open Font
+License), which covers Latin and Devanagari. HarfBuzz shapes the text, so
+conjuncts and vowel signs print as written, and every PDF embeds a subset of
+the font holding only the glyphs it uses. Text in a script the font has no
+glyphs for is refused (see unprintable()) rather than printed as blanks.
+
+Each invoice is cached on disk as a one-page PDF under the SHA-256 of
+everything printed on it, so reprinting a sale, or a ZIP that includes it,
+reuses the bytes until the sale, its grain or the seller details change. A
+batch printed as one PDF is laid out in chunks of pages, one font subset per
+chunk rather than per page, and cached under the keys of its invoices. Cache
+misses render on a process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import repeat
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+from pypdf import PdfWriter
+
+from utils.money import money
+
+# Bump when the layout changes, so cached pages are rendered again
+TEMPLATE_VERSION = 2
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+FONT_FAMILY = 'Shobhika'
+FONT_FILES = {'': 'Shobhika-Regular.otf', 'B': 'Shobhika-Bold.otf'}
+# A one-page PDF takes ~0.1 s, most of it loading and subsetting the font;
+# from this many the pool's pickling round trip pays for itself
+POOL_MIN = 8
+# Fewest pages per document of a batch PDF: a page costs ~5 ms once the font
+# is loaded, so smaller chunks spend their time on the font
+CHUNK_MIN = 100
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+LEFT, RIGHT = 44, 551
+
+GRAIN_HSN = {
+    'wheat': '1001', 'rye': '1002', 'barley': '1003', 'oats': '1004', 'maize': '1005', 'corn': '1005',
+    'rice': '1006', 'paddy': '1006', 'jowar': '1007', 'sorghum': '1007', 'bajra': '1008', 'millet': '1008',
+}
+
+# First two digits of a GSTIN
+STATES = {
+    '01': 'Jammu and Kashmir', '02': 'Himachal Pradesh', '03': 'Punjab', '04': 'Chandigarh',
+    '05': 'Uttarakhand', '06': 'Haryana', '07': 'Delhi', '08': 'Rajasthan', '09': 'Uttar Pradesh',
+    '10': 'Bihar', '11': 'Sikkim', '12': 'Arunachal Pradesh', '13': 'Nagaland', '14': 'Manipur',
+    '15': 'Mizoram', '16': 'Tripura', '17': 'Meghalaya', '18': 'Assam', '19': 'West Bengal',
+    '20': 'Jharkhand', '21': 'Odisha', '22': 'Chhattisgarh', '23': 'Madhya Pradesh', '24': 'Gujarat',
+    '26': 'Dadra and Nagar Haveli and Daman and Diu', '27': 'Maharashtra', '29': 'Karnataka', '30': 'Goa',
+    '31': 'Lakshadweep', '32': 'Kerala', '33': 'Tamil Nadu', '34': 'Puducherry',
+    '35': 'Andaman and Nicobar Islands', '36': 'Telangana', '37': 'Andhra Pradesh', '38': 'Ladakh',
+    '97': 'Other Territory',
+}
+
+# Item table: (heading, x, align); numbers are right-aligned to their column edge
+_COLUMNS = (('#', 48, 'left'), ('Description of Goods', 64, 'left'), ('HSN', 250, 'left'),
+            ('Bags', 336, 'right'), ('Weight (kg)', 406, 'right'), ('Rate (Rs./kg)', 481, 'right'),
+            ('Amount (Rs.)', 547, 'right'))
+_COLUMN_RULES = (60, 246, 292, 342, 412, 487)
+
+_ONES = ('', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Eleven', 'Twelve',
+         'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen')
+_TENS = ('', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety')
+
+DECLARATION = ('We declare that this invoice shows the actual price of the goods described '
+               'and that all particulars are true and correct.')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def seller_from_config(config):
+    """The seller block as a hashable tuple: (name, address, gstin, gst rate %)"""
+    return (config.get('INVOICE_SELLER_NAME') or '', config.get('INVOICE_SELLER_ADDRESS') or '',
+            (config.get('INVOICE_SELLER_GSTIN') or '').upper(), float(config.get('INVOICE_GST_RATE') or 0))
+
+
+def state_of(gstin):
+    code = (gstin or '')[:2]
+    return code if code in STATES else None
+
+
+def invoice_fields(sale, seller):
+    """Everything printed for `sale`, as plain values; the taxes are worked out here"""
+    _, _, seller_gstin, rate = seller
+    buyer_gstin = (sale.buyer_gst or '').strip().upper()
+    buyer_state, seller_state = state_of(buyer_gstin), state_of(seller_gstin)
+    supply_state = buyer_state or seller_state
+    taxable = money(sale.total_amount)
+    if buyer_state and seller_state and buyer_state != seller_state:
+        taxes = [[f'IGST @ {rate:g}%', money(taxable * rate / 100)]]
+    else:
+        half = money(taxable * rate / 200)
+        taxes = [[f'CGST @ {rate / 2:g}%', half], [f'SGST @ {rate / 2:g}%', half]]
+    grain = sale.grain.name if sale.grain else ''
+    return {
+        'number': sale.bill_number,
+        'date': sale.sale_date.strftime('%d-%m-%Y'),
+        'place': f'{STATES[supply_state]} ({supply_state})' if supply_state else '',
+        'po': sale.po_number or '',
+        'lr': sale.lr_number or '',
+        'transport': sale.transportation_mode or '',
+        'vehicle': sale.vehicle_number or '',
+        'driver': sale.driver_name or '',
+        'buyer': sale.buyer_name,
+        'buyer_gstin': buyer_gstin,
+        'buyer_state': f'{STATES[buyer_state]} ({buyer_state})' if buyer_state else '',
+        'item': grain,
+        'hsn': GRAIN_HSN.get(grain.strip().lower(), ''),
+        'bags': sale.number_of_bags,
+        'weight': sale.total_weight,
+        'rate': sale.rate_per_kg,
+        'taxable': taxable,
+        'taxes': taxes,
+        'total': money(taxable + sum(amount for _, amount in taxes)),
+    }
+
+
+@lru_cache(maxsize=None)
+def _characters():
+    """Code points both the regular and the bold face have glyphs for"""
+    faces = [TTFont(os.path.join(FONT_DIR, name), lazy=True) for name in FONT_FILES.values()]
+    return frozenset.intersection(*(frozenset(face.getBestCmap()) for face in faces))
+
+
+def _printable(text):
+    characters = _characters()
+    return all(ord(ch) in characters for ch in text)
+
+
+def unprintable(fields):
+    """Names of the text fields the invoice font has no glyphs for"""
+    return sorted(key for key, value in fields.items() if isinstance(value, str) and not _printable(value))
+
+
+def unprintable_seller(seller):
+    """Seller settings (INVOICE_SELLER_*) the invoice font cannot print"""
+    return unprintable(dict(zip(('INVOICE_SELLER_NAME', 'INVOICE_SELLER_ADDRESS', 'INVOICE_SELLER_GSTIN'), seller)))
+
+
+def cache_key(seller, fields):
+    payload = json.dumps([TEMPLATE_VERSION, seller, fields], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def batch_key(keys):
+    """Cache key of one PDF holding the invoices with these keys, in order"""
+    return hashlib.sha256(' '.join(keys).encode('ascii')).hexdigest()
+
+
+# --- Text and numbers --------------------------------------------------------
+
+def _font(pdf, text, style, size):
+    pdf.set_font(FONT_FAMILY, style, size)
+    # Latin needs no shaping, and shaping is most of the cost of a line
+    pdf.set_text_shaping(not text.isascii())
+
+
+def text_width(pdf, text, style, size):
+    """Width of `text` in points, as shaped"""
+    _font(pdf, text, style, size)
+    return pdf.get_string_width(text)
+
+
+def fit(pdf, text, style, size, width):
+    """`text` cut to `width` points, with an ellipsis when it was cut"""
+    if text_width(pdf, text, style, size) <= width:
+        return text
+    while text and text_width(pdf, text + '...', style, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def wrap(pdf, text, style, size, width):
+    lines, line = [], ''
+    for word in text.split():
+        candidate = f'{line} {word}' if line else word
+        if line and text_width(pdf, candidate, style, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line] if line else lines
+
+
+def indian(amount, places=2):
+    """12,34,567.89: thousands, then groups of two"""
+    sign = '-' if amount < 0 else ''
+    whole, _, fraction = f'{abs(amount):.{places}f}'.partition('.')
+    head, tail = whole[:-3], whole[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    grouped = ','.join(groups + [tail])
+    return sign + grouped + ('.' + fraction if fraction else '')
+
+
+def _below_thousand(n):
+    words = []
+    if n >= 100:
+        words += [_ONES[n // 100], 'Hundred']
+        n %= 100
+    if n >= 20:
+        words.append(_TENS[n // 10])
+        n %= 10
+    if n:
+        words.append(_ONES[n])
+    return words
+
+
+def in_words(amount):
+    """Rupees in the Indian system: crore, lakh, thousand"""
+    paise_total = round(abs(amount) * 100)
+    rupees, paise = divmod(paise_total, 100)
+    words = []
+    for unit, name in ((10 ** 7, 'Crore'), (10 ** 5, 'Lakh'), (10 ** 3, 'Thousand')):
+        if rupees >= unit:
+            # Above 99 crore the crore count is itself spelled out
+            count = rupees // unit
+            words += (in_words(count).split()[1:-1] if count >= 1000 else _below_thousand(count)) + [name]
+            rupees %= unit
+    words += _below_thousand(rupees)
+    text = 'Rupees ' + (' '.join(words) or 'Zero')
+    if paise:
+        text += ' and ' + ' '.join(_below_thousand(paise)) + ' Paise'
+    return text + ' Only'
+
+
+# --- Drawing -----------------------------------------------------------------
+# Coordinates are PDF points from the bottom left of the page; fpdf2 measures
+# from the top, so y is flipped on the way in.
+
+def _document():
+    pdf = FPDF(unit='pt', format='A4')
+    pdf.set_auto_page_break(False)
+    pdf.set_margin(0)
+    pdf.c_margin = 0
+    for style, name in FONT_FILES.items():
+        pdf.add_font(FONT_FAMILY, style, os.path.join(FONT_DIR, name))
+    return pdf
+
+
+def _text(pdf, x, y, text, style='', size=9, align='left'):
+    """`text` with its baseline at `y`; only cell() shapes text, text() does not"""
+    if not text:
+        return
+    text = str(text)
+    _font(pdf, text, style, size)
+    if align == 'right':
+        x -= pdf.get_string_width(text)
+    elif align == 'center':
+        x -= pdf.get_string_width(text) / 2
+    # A cell as tall as the font puts the baseline 0.8 of the size below its top
+    pdf.set_xy(x, PAGE_HEIGHT - y - 0.8 * size)
+    pdf.cell(text=text)
+
+
+def _line(pdf, x1, y1, x2, y2):
+    pdf.line(x1, PAGE_HEIGHT - y1, x2, PAGE_HEIGHT - y2)
+
+
+def _draw_template(pdf, seller):
+    """The parts of the page that are the same on every invoice for `seller`"""
+    name, address, gstin, _ = seller
+    pdf.set_line_width(0.6)
+    pdf.rect(36, 36, 523, 770)
+    _text(pdf, LEFT, 786, fit(pdf, name, 'B', 13, 300), 'B', 13)
+    for i, line in enumerate(wrap(pdf, address, '', 9, 300)[:2]):
+        _text(pdf, LEFT, 772 - 11 * i, line)
+    if gstin:
+        _text(pdf, LEFT, 748, f'GSTIN: {gstin}', 'B', 9)
+    _text(pdf, RIGHT, 786, 'TAX INVOICE', 'B', 14, 'right')
+    _text(pdf, RIGHT, 772, 'Original for Recipient', '', 8, 'right')
+    _line(pdf, 36, 740, 559, 740)
+
+    for i, label in enumerate(('Invoice No.', 'Invoice Date', 'Place of Supply', 'Reverse Charge')):
+        _text(pdf, LEFT, 726 - 14 * i, label, '', 8)
+    _text(pdf, 128, 684, 'No')
+    for i, label in enumerate(("Buyer's Order No.", 'LR No.', 'Transport', 'Vehicle No.', 'Driver')):
+        _text(pdf, 310, 726 - 14 * i, label, '', 8)
+    _line(pdf, 300, 740, 300, 662)
+    _line(pdf, 36, 662, 559, 662)
+
+    _text(pdf, LEFT, 648, 'Bill To', 'B', 9)
+    _text(pdf, LEFT, 620, 'GSTIN', '', 8)
+    _text(pdf, LEFT, 606, 'State', '', 8)
+    _line(pdf, 36, 596, 559, 596)
+
+    for heading, x, align in _COLUMNS:
+        _text(pdf, x, 584, heading, 'B', 8, align)
+    _line(pdf, 36, 578, 559, 578)
+    for x in _COLUMN_RULES:
+        _line(pdf, x, 596, x, 540)
+    _line(pdf, 36, 540, 559, 540)
+
+    _text(pdf, LEFT, 526, 'Amount in words', '', 8)
+    _text(pdf, 345, 526, 'Taxable Value')
+    _line(pdf, 337, 540, 337, 440)
+    _line(pdf, 337, 482, 559, 482)
+    _text(pdf, 345, 466, 'Invoice Total', 'B', 10)
+    _line(pdf, 36, 440, 559, 440)
+
+    _text(pdf, LEFT, 426, 'Declaration', 'B', 8)
+    for i, line in enumerate(wrap(pdf, DECLARATION, '', 8, 280)):
+        _text(pdf, LEFT, 414 - 10 * i, line, '', 8)
+    _text(pdf, RIGHT, 426, fit(pdf, f'For {name}', 'B', 9, 240), 'B', 9, 'right')
+    _text(pdf, RIGHT, 360, 'Authorised Signatory', '', 8, 'right')
+    _text(pdf, PAGE_WIDTH / 2, 44, 'This is a computer generated invoice.', '', 7, 'center')
+
+
+def _draw(pdf, seller, fields):
+    pdf.add_page()
+    _draw_template(pdf, seller)
+    _text(pdf, 128, 726, fields['number'], 'B', 9)
+    _text(pdf, 128, 712, fields['date'])
+    _text(pdf, 128, 698, fit(pdf, fields['place'], '', 9, 165))
+    for i, key in enumerate(('po', 'lr', 'transport', 'vehicle', 'driver')):
+        _text(pdf, 400, 726 - 14 * i, fit(pdf, fields[key], '', 9, 150))
+    _text(pdf, LEFT, 634, fit(pdf, fields['buyer'], 'B', 11, 500), 'B', 11)
+    _text(pdf, 90, 620, fields['buyer_gstin'])
+    _text(pdf, 90, 606, fields['buyer_state'])
+
+    values = ('1', fit(pdf, fields['item'], '', 9, 178), fields['hsn'], str(fields['bags']),
+              indian(fields['weight'], 3), indian(fields['rate']), indian(fields['taxable']))
+    for (_, x, align), value in zip(_COLUMNS, values):
+        _text(pdf, x, 564, value, '', 9, align)
+
+    for i, line in enumerate(wrap(pdf, in_words(fields['total']), '', 9, 285)[:4]):
+        _text(pdf, LEFT, 512 - 12 * i, line)
+    _text(pdf, RIGHT, 526, indian(fields['taxable']), '', 9, 'right')
+    for i, (label, amount) in enumerate(fields['taxes']):
+        _text(pdf, 345, 512 - 14 * i, label)
+        _text(pdf, RIGHT, 512 - 14 * i, indian(amount), '', 9, 'right')
+    _text(pdf, RIGHT, 466, indian(fields['total']), 'B', 10, 'right')
+
+
+def render_invoice(seller, fields):
+    """One invoice as a one-page PDF"""
+    return render_pages(seller, [fields])
+
+
+def render_pages(seller, invoices):
+    """One PDF with a page per invoice, sharing one subset of the font"""
+    pdf = _document()
+    for fields in invoices:
+        _draw(pdf, seller, fields)
+    return bytes(pdf.output())
+
+
+def merge(documents):
+    """The pages of `documents`, in order, as one PDF"""
+    if len(documents) == 1:
+        return documents[0]
+    writer = PdfWriter()
+    for document in documents:
+        writer.append(io.BytesIO(document))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def zip_documents(named_documents):
+    """A ZIP of (file name, PDF); stored, the PDF streams are deflated already"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as archive:
+        for name, document in named_documents:
+            archive.writestr(name, document)
+    return out.getvalue()
+
+
+# --- Cache and pool ----------------------------------------------------------
+
+def _cache_path(directory, key):
+    return os.path.join(directory, key[:2], key + '.pdf')
+
+
+def _load(directory, key):
+    try:
+        with open(_cache_path(directory, key), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _store(directory, key, document):
+    path = _cache_path(directory, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so a concurrent reader never sees half a file
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.partial')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(document)
+    os.replace(partial, path)
+
+
+def _executor(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Created on first use, so gunicorn workers each fork their own
+            _pool = ProcessPoolExecutor(workers)
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _map(function, seller, items, workers):
+    """[function(seller, item) for item in items], on the pool when workers > 1"""
+    if workers <= 1 or len(items) <= 1:
+        return [function(seller, item) for item in items]
+    pool = _executor(workers)
+    try:
+        return list(pool.map(function, repeat(seller), items,
+                             chunksize=max(1, len(items) // (workers * 4))))
+    except BrokenProcessPool as e:
+        print(f'Error in invoice render pool, rendering in process: {str(e)}')
+        _reset_pool(pool)
+        return [function(seller, item) for item in items]
+
+
+def render(seller, invoices, directory=None, workers=1):
+    """One-page PDFs for a list of invoice_fields(), reusing cached ones.
+
+    Returns (keys, documents, rendered) where rendered counts the cache misses.
+    """
+    keys = [cache_key(seller, fields) for fields in invoices]
+    documents = [_load(directory, key) if directory else None for key in keys]
+    missing = {}
+    for i, document in enumerate(documents):
+        if document is None:
+            missing.setdefault(keys[i], i)  # the same sale twice renders once
+    if missing:
+        pending = [invoices[i] for i in missing.values()]
+        rendered = _map(render_invoice, seller, pending, workers if len(pending) >= POOL_MIN else 1)
+        by_key = dict(zip(missing, rendered))
+        for i, key in enumerate(keys):
+            if documents[i] is None:
+                documents[i] = by_key[key]
+        if directory:
+            for key, document in by_key.items():
+                _store(directory, key, document)
+    return keys, documents, len(missing)
+
+
+def combined(seller, invoices, directory=None, workers=1):
+    """One PDF with a page per invoice_fields(), reusing a cached copy of the same batch.
+
+    Returns (key, document, rendered) where rendered is 0 when it was cached.
+    """
+    key = batch_key([cache_key(seller, fields) for fields in invoices])
+    document = _load(directory, key) if directory else None
+    if document is not None:
+        return key, document, 0
+    count = max(1, min(workers, len(invoices) // CHUNK_MIN))
+    size = -(-len(invoices) // count)
+    chunks = [invoices[i:i + size] for i in range(0, len(invoices), size)]
+    document = merge(_map(render_pages, seller, chunks, workers))
+    if directory:
+        _store(directory, key, document)
+    return key, document, len(invoices)
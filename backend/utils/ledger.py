@@ -0,0 +1,218 @@
+from sqlalchemy import event, inspect
+from extensions import db
+from models import Party, PartyBalance, LedgerSide
+from utils.money import money, paise, rupees
+from utils.changes import previous
+
+_DELTAS_KEY = 'ledger_deltas'
+_PARTIES_KEY = 'ledger_parties'
+_listeners_installed = False
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive key used to match bills to a party"""
+    return ' '.join((name or '').split()).casefold()
+
+
+def purchase_outstanding(get):
+    return money((get('total_amount') or 0) - (get('paid_amount') or 0))
+
+
+def sale_outstanding(get):
+    return money((get('total_amount') or 0) - (get('paid_amount') or 0))
+
+
+# table -> (ledger side, party name attribute, bill date attribute, outstanding fn)
+BILL_LEDGERS = {
+    'purchase': (LedgerSide.PAYABLE.value, 'supplier_name', 'purchase_date', purchase_outstanding),
+    'sale': (LedgerSide.RECEIVABLE.value, 'buyer_name', 'sale_date', sale_outstanding),
+}
+
+
+def _as_date(value):
+    if value is None:
+        return None
+    return value.date() if hasattr(value, 'date') else value
+
+
+def find_or_create_party(session, name):
+    """Resolve a party by normalized name, creating it if needed (cached per session)"""
+    key = normalize_name(name)
+    cache = session.info.setdefault(_PARTIES_KEY, {})
+    party = cache.get(key)
+    if party is None:
+        with session.no_autoflush:
+            party = session.query(Party).filter_by(normalized_name=key).first()
+        if party is None:
+            party = Party(name=' '.join(name.split()), normalized_name=key, receivable=0, payable=0)
+            session.add(party)
+        cache[key] = party
+    return party
+
+
+def _before_flush(session, flush_context, instances):
+    deltas = session.info.setdefault(_DELTAS_KEY, [])
+
+    for obj in list(session.new):
+        ledger = BILL_LEDGERS.get(getattr(obj, '__tablename__', None))
+        if not ledger:
+            continue
+        side, name_attr, date_attr, outstanding = ledger
+        if obj.party is None:
+            obj.party = find_or_create_party(session, getattr(obj, name_attr))
+        deltas.append((obj.party, side, _as_date(getattr(obj, date_attr)),
+                       outstanding(lambda key: getattr(obj, key))))
+
+    for obj in list(session.dirty):
+        ledger = BILL_LEDGERS.get(getattr(obj, '__tablename__', None))
+        if not ledger or not session.is_modified(obj):
+            continue
+        side, name_attr, date_attr, outstanding = ledger
+        state = inspect(obj)
+        old_party_id = previous(state, 'party_id')
+        if old_party_id is not None:
+            deltas.append((old_party_id, side, _as_date(previous(state, date_attr)),
+                           -outstanding(lambda key: previous(state, key))))
+
+        if obj.party is None or normalize_name(getattr(obj, name_attr)) != obj.party.normalized_name:
+            obj.party = find_or_create_party(session, getattr(obj, name_attr))
+        deltas.append((obj.party, side, _as_date(getattr(obj, date_attr)),
+                       outstanding(lambda key: getattr(obj, key))))
+
+    for obj in list(session.deleted):
+        ledger = BILL_LEDGERS.get(getattr(obj, '__tablename__', None))
+        if not ledger:
+            continue
+        side, name_attr, date_attr, outstanding = ledger
+        state = inspect(obj)
+        old_party_id = previous(state, 'party_id')
+        if old_party_id is not None:
+            deltas.append((old_party_id, side, _as_date(previous(state, date_attr)),
+                           -outstanding(lambda key: previous(state, key))))
+
+
+def _after_flush(session, flush_context):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+
+    # Net the deltas per (party, side, day) so each balance row is written once;
+    # in paise, so a bill and its reversal cancel exactly
+    net = {}
+    for party, side, bill_date, amount in deltas:
+        party_id = party if isinstance(party, int) else party.id
+        key = (party_id, side, bill_date)
+        net[key] = net.get(key, 0) + paise(amount)
+
+    apply_balance_deltas(session.connection(), {key: rupees(amount) for key, amount in net.items() if amount})
+
+
+def apply_balance_deltas(connection, net):
+    """Add {(party_id, side, bill_date): amount} to the balance rows and party totals"""
+    if not net:
+        return
+    balances = PartyBalance.__table__
+    parties = Party.__table__
+
+    # Party order gives concurrent writers a consistent lock sequence
+    for (party_id, side, bill_date), amount in sorted(net.items(), key=lambda item: item[0][:2]):
+        result = connection.execute(
+            balances.update()
+            .where(balances.c.party_id == party_id,
+                   balances.c.side == side,
+                   balances.c.bill_date == bill_date)
+            .values(outstanding=balances.c.outstanding + amount)
+        )
+        if result.rowcount == 0:
+            connection.execute(balances.insert().values(
+                party_id=party_id, side=side, bill_date=bill_date, outstanding=amount
+            ))
+
+    totals = {}
+    for (party_id, side, _), amount in net.items():
+        totals[(party_id, side)] = totals.get((party_id, side), 0) + amount
+    for (party_id, side), amount in sorted(totals.items()):
+        column = parties.c[side]
+        connection.execute(
+            parties.update().where(parties.c.id == party_id).values({column: column + amount})
+        )
+
+
+def _reset(session, *args):
+    session.info.pop(_DELTAS_KEY, None)
+    session.info.pop(_PARTIES_KEY, None)
+
+
+def init_app(app):
+    """Keep party balances in step with every bill and payment write"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'before_flush', _before_flush)
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _reset)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
+
+
+def rebuild_balances(session=None):
+    """Relink every bill to its party and recompute balances with set-based SQL.
+
+    Used to backfill existing data and to repair drift; returns counts.
+    """
+    from models import Purchase, Sale
+    from sqlalchemy import Column, Integer, MetaData, String, Table, func, literal, select
+
+    session = session or db.session
+    linked = 0
+    # Bill names are not indexed, so relink through a keyed temporary table
+    # in one pass per bill table rather than one scan per name
+    name_map = Table('party_name_map', MetaData(), Column('raw_name', String(200), primary_key=True),
+                     Column('pid', Integer), prefixes=['TEMPORARY'])
+    for model, name_column in ((Purchase, Purchase.supplier_name), (Sale, Sale.buyer_name)):
+        names = [name for (name,) in session.query(name_column).distinct()]
+        parties = {name: find_or_create_party(session, name) for name in names}
+        session.flush()
+        if names:
+            connection = session.connection()
+            table = model.__table__
+            name_map.create(connection)
+            connection.execute(name_map.insert(), [{'raw_name': name, 'pid': party.id}
+                                                   for name, party in parties.items()])
+            connection.execute(table.update().values(party_id=select(name_map.c.pid).where(
+                name_map.c.raw_name == table.c[name_column.key]).scalar_subquery()))
+            name_map.drop(connection)
+            linked += len(names)
+
+    balances = PartyBalance.__table__
+    session.execute(balances.delete())
+    sources = (
+        (Purchase, Purchase.purchase_date, LedgerSide.PAYABLE.value,
+         Purchase.total_amount - func.coalesce(Purchase.paid_amount, 0)),
+        (Sale, Sale.sale_date, LedgerSide.RECEIVABLE.value,
+         Sale.total_amount - func.coalesce(Sale.paid_amount, 0)),
+    )
+    for model, date_column, side, outstanding in sources:
+        bill_date = func.date(date_column)
+        session.execute(balances.insert().from_select(
+            ['party_id', 'side', 'bill_date', 'outstanding'],
+            select(model.party_id, literal(side), bill_date, func.sum(outstanding))
+            .where(model.party_id.isnot(None))
+            .group_by(model.party_id, bill_date)
+        ))
+
+    parties = Party.__table__
+    totals = {}
+    for side in (LedgerSide.RECEIVABLE.value, LedgerSide.PAYABLE.value):
+        totals[side] = func.coalesce(
+            select(func.sum(balances.c.outstanding))
+            .where(balances.c.party_id == parties.c.id, balances.c.side == side)
+            .scalar_subquery(),
+            0
+        )
+    session.execute(parties.update().values(**totals))
+
+    return {
+        'names_linked': linked,
+        'balance_rows': session.query(func.count(PartyBalance.id)).scalar()
+    }
@@ -0,0 +1,70 @@
+"""Fixed-point columns for money and weights.
+
+Amounts are stored as integer paise and weights as integer grams, so SQLite
+and PostgreSQL add them up exactly, and faster than REAL or NUMERIC. The ORM
+still hands out rupees and kilograms as floats rounded to the paisa or gram,
+so views and JSON keep their units. Comparisons that must be exact, such as
+a payment against what a bill still owes, go through paise().
+
+SQL keeps the unit through sum(), min(), max(), coalesce(), case() and
+adding or subtracting two columns of the same type. A product comes back as
+a bare integer count of units, so wrap it in type_coerce(..., Money()) to
+read it in rupees.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+
+def to_units(value, factor):
+    """`value` as a whole number of 1/factor units, halves rounded to even"""
+    if isinstance(value, int):
+        return value * factor
+    if isinstance(value, Decimal):
+        return int((value * factor).to_integral_value(ROUND_HALF_EVEN))
+    return round(float(value) * factor)
+
+
+class Fixed(TypeDecorator):
+    """A decimal quantity stored as an integer count of 1/factor units"""
+    impl = BigInteger
+    cache_ok = True
+    factor = 1
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_units(value, self.factor)
+
+    def process_result_value(self, value, dialect):
+        # PostgreSQL sums bigints into numeric, which arrives as Decimal
+        return None if value is None else float(value) / self.factor
+
+    def coerce_compared_value(self, op, value):
+        return self
+
+
+class Money(Fixed):
+    """Rupees, stored as paise"""
+    factor = 100
+
+
+class Weight(Fixed):
+    """Kilograms, stored as grams"""
+    factor = 1000
+
+
+def paise(value):
+    return to_units(value or 0, Money.factor)
+
+
+def rupees(units):
+    """Paise back to rupees"""
+    return units / Money.factor
+
+
+def money(value):
+    """`value` rounded to the paisa, as the column would store it"""
+    return rupees(paise(value))
+
+
+def kilos(value):
+    """`value` rounded to the gram, as the column would store it"""
+    return to_units(value or 0, Weight.factor) / Weight.factor
@@ -0,0 +1,35 @@
+import os
+import threading
+from utils.serving import concurrency
+
+_lock = threading.Lock()
+_openai = {}
+
+
+def openai_client():
+    """The worker's shared OpenAI client.
+
+    Requests reuse its keep-alive connection pool instead of opening a TLS
+    connection per call, and time out rather than holding a thread for as
+    long as the API takes. Keyed by process id so a client created before
+    gunicorn forks is never shared with the workers.
+    """
+    pid = os.getpid()
+    with _lock:
+        client = _openai.get(pid)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+            timeout = float(os.getenv('OPENAI_TIMEOUT', 60))
+            client = OpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                max_retries=int(os.getenv('OPENAI_MAX_RETRIES', 2)),
+                timeout=timeout,
+                http_client=httpx.Client(
+                    timeout=timeout,
+                    limits=httpx.Limits(max_connections=concurrency(), max_keepalive_connections=8)
+                )
+            )
+            _openai.clear()
+            _openai[pid] = client
+    return client
@@ -0,0 +1,309 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from extensions import db
+from models import Party, PaymentHistory, PaymentStatus, Purchase, Sale
+from utils.ledger import normalize_name
+from utils.money import money, paise, rupees
+
+# Amounts are exact to the paisa (utils/money.py); anything under half a paisa is float noise
+SETTLED = 0.005
+
+# bill model, statement direction, party name attribute, bill date attribute
+BILL_SIDES = {
+    'sale': (Sale, 'credit', 'buyer_name', 'sale_date'),
+    'purchase': (Purchase, 'debit', 'supplier_name', 'purchase_date'),
+}
+
+COLUMN_ALIASES = {
+    'date': ('date', 'txn date', 'transaction date', 'value date', 'posting date'),
+    'amount': ('amount', 'signed amount'),
+    'credit': ('credit', 'deposit', 'cr', 'credit amount'),
+    'debit': ('debit', 'withdrawal', 'dr', 'debit amount'),
+    'party': ('party', 'name', 'party name', 'narration', 'description', 'particulars', 'remarks'),
+    'reference': ('reference', 'ref', 'ref no', 'reference no', 'cheque no', 'utr', 'transaction id'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d/%m/%y', '%d-%b-%Y', '%d %b %Y', '%Y/%m/%d')
+
+
+def outstanding(bill):
+    return money((bill.total_amount or 0) - (bill.paid_amount or 0))
+
+
+def status_for(bill):
+    if paise(outstanding(bill)) <= 0:
+        return PaymentStatus.PAID.value
+    if paise(bill.paid_amount) > 0:
+        return PaymentStatus.PARTIALLY_PAID.value
+    return PaymentStatus.PENDING.value
+
+
+def record_payment(bill, amount, description='', payment_date=None, reference=None):
+    """Add a payment to a purchase or sale and bump its paid amount (no commit)"""
+    entry = PaymentHistory(
+        amount=amount,
+        description=description,
+        payment_date=payment_date or datetime.utcnow(),
+        reference=reference,
+        **{bill.__tablename__: bill}
+    )
+    db.session.add(entry)
+    bill.paid_amount = rupees(paise(bill.paid_amount) + paise(amount))
+    return entry
+
+
+def apply_payment_status(bill, new_status, amount=0, description=''):
+    """Validate a status change from the bill screens and record its payment.
+
+    Shared by the purchase and sale payment-status endpoints; raises
+    ValueError with a user-facing message.
+    """
+    if new_status not in [status.value for status in PaymentStatus]:
+        raise ValueError('Invalid payment status')
+    try:
+        amount = money(float(amount or 0))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid amount')
+
+    if new_status == PaymentStatus.PARTIALLY_PAID.value:
+        if amount <= 0:
+            raise ValueError('Amount is required for partially paid status')
+        if paise(amount) >= paise(outstanding(bill)):
+            raise ValueError('Amount should be less than total for partially paid status')
+
+    if new_status == PaymentStatus.PAID.value:
+        amount = outstanding(bill)
+
+    if amount > 0:
+        record_payment(bill, amount, description)
+    bill.payment_status = new_status
+
+
+# --- Bank statement reconciliation -------------------------------------------
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognized date: {value!r}')
+
+
+def _parse_amount(value):
+    value = (value or '').strip().replace(',', '').replace('₹', '')
+    if not value:
+        return 0.0
+    if value.endswith(('CR', 'Cr', 'cr')):
+        return float(value[:-2])
+    if value.endswith(('DR', 'Dr', 'dr')):
+        return -float(value[:-2])
+    return float(value)
+
+
+def parse_statement(text):
+    """Read a bank statement CSV into a list of line dicts.
+
+    Accepts a signed `amount` column or separate credit/debit columns;
+    credits are incoming (sales), debits outgoing (purchases).
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise ValueError('Statement is empty')
+
+    headers = {name.strip().lower(): name for name in reader.fieldnames if name}
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[key] = headers[alias]
+                break
+    if 'date' not in columns or not ({'amount', 'credit', 'debit'} & set(columns)):
+        raise ValueError('Statement needs a date column and an amount or credit/debit columns')
+
+    lines, errors = [], []
+    for number, row in enumerate(reader, start=2):
+        try:
+            if 'amount' in columns:
+                amount = _parse_amount(row.get(columns['amount']))
+            else:
+                amount = _parse_amount(row.get(columns.get('credit'))) \
+                    - _parse_amount(row.get(columns.get('debit')))
+            if not amount:
+                continue
+            lines.append({
+                'line': number,
+                'date': _parse_date(row.get(columns['date'])),
+                'amount': round(abs(amount), 2),
+                'direction': 'credit' if amount > 0 else 'debit',
+                'party': (row.get(columns['party']) or '').strip() if 'party' in columns else '',
+                'reference': (row.get(columns['reference']) or '').strip()[:100] if 'reference' in columns else None,
+            })
+        except ValueError as e:
+            errors.append({'line': number, 'reason': str(e)})
+    return lines, errors
+
+
+def _resolve_parties(lines):
+    """Attach party_id to each line: exact normalized name first, then narration search"""
+    keys = {normalize_name(line['party']) for line in lines if line['party']}
+    by_key = {}
+    if keys:
+        by_key = dict(db.session.query(Party.normalized_name, Party.id)
+                      .filter(Party.normalized_name.in_(keys)).all())
+
+    pending = [line for line in lines if line['party'] and normalize_name(line['party']) not in by_key]
+    candidates = []
+    if pending:
+        # Narrations usually embed the name ("NEFT-RAMESH TRADERS-UTR..."); only
+        # parties that actually have something outstanding are worth scanning
+        candidates = db.session.query(Party.normalized_name, Party.id).filter(
+            (Party.receivable > SETTLED) | (Party.payable > SETTLED)
+        ).all()
+        candidates.sort(key=lambda item: -len(item[0]))
+
+    for line in lines:
+        key = normalize_name(line['party'])
+        line['party_id'] = by_key.get(key)
+        if line['party_id'] is None and key:
+            for name, party_id in candidates:
+                if name and name in key:
+                    line['party_id'] = party_id
+                    break
+
+
+def _open_bills(model, party_ids, amounts):
+    """Unpaid bills for the matched parties plus any whose outstanding equals a
+    party-less line amount, in two indexed queries"""
+    bills = {}
+    if party_ids:
+        for bill in model.query.filter(
+            model.party_id.in_(sorted(party_ids)),
+            model.payment_status != PaymentStatus.PAID.value
+        ):
+            bills[bill.id] = bill
+    if amounts:
+        remaining = model.total_amount - func.coalesce(model.paid_amount, 0)
+        for bill in model.query.filter(
+            model.payment_status != PaymentStatus.PAID.value,
+            remaining.in_(sorted(amounts))
+        ):
+            bills[bill.id] = bill
+    return list(bills.values())
+
+
+def _allocate(line, bills, window, date_attr, due, exact_only=False):
+    """Pick bills for one line: an exact outstanding match inside the date window,
+    else oldest-first across the party's open bills up to the line date"""
+    # Compare calendar days: statements carry no time of day
+    paid_on = line['date'].date()
+    in_window = [bill for bill in bills
+                 if due(bill) > SETTLED
+                 and timedelta(0) <= paid_on - getattr(bill, date_attr).date() <= window]
+    exact = [bill for bill in in_window if paise(due(bill)) == paise(line['amount'])]
+    if exact:
+        if exact_only and len(exact) > 1:
+            return None, 'ambiguous'
+        return [(exact[0], line['amount'])], 'exact'
+    if exact_only:
+        return None, 'no matching bill'
+
+    remaining = line['amount']
+    allocations = []
+    for bill in bills:
+        if remaining <= SETTLED:
+            break
+        if due(bill) <= SETTLED or getattr(bill, date_attr).date() > paid_on:
+            continue
+        take = round(min(due(bill), remaining), 2)
+        allocations.append((bill, take))
+        remaining = round(remaining - take, 2)
+    if not allocations:
+        return None, 'no open bills for party'
+    return allocations, 'fifo'
+
+
+def reconcile_statement(lines, window_days=7, dry_run=False):
+    """Match statement lines to open bills and record the payments.
+
+    Matching runs entirely in memory over bills fetched up front; payments are
+    then added to the current session and the caller commits once, so a
+    statement is applied entirely or not at all.
+    """
+    _resolve_parties(lines)
+    window = timedelta(days=window_days)
+    matched, unmatched, payments = [], [], []
+    applied = 0.0
+
+    for kind, (model, direction, name_attr, date_attr) in BILL_SIDES.items():
+        side_lines = sorted((line for line in lines if line['direction'] == direction),
+                            key=lambda line: (line['date'], line['line']))
+        if not side_lines:
+            continue
+        party_ids = {line['party_id'] for line in side_lines if line['party_id']}
+        amounts = {line['amount'] for line in side_lines if not line['party_id']}
+
+        by_party, unassigned = {}, []
+        for bill in sorted(_open_bills(model, party_ids, amounts),
+                           key=lambda bill: (getattr(bill, date_attr), bill.id)):
+            if bill.party_id in party_ids:
+                by_party.setdefault(bill.party_id, []).append(bill)
+            else:
+                unassigned.append(bill)
+
+        # Amounts claimed by earlier lines so one bill is never paid twice
+        claimed = {}
+        due = lambda bill: money(outstanding(bill) - claimed.get(bill.id, 0))
+
+        for line in side_lines:
+            if line['party_id']:
+                allocations, how = _allocate(line, by_party.get(line['party_id'], []),
+                                             window, date_attr, due)
+            else:
+                allocations, how = _allocate(line, unassigned, window, date_attr, due, exact_only=True)
+
+            if not allocations:
+                unmatched.append({'line': line['line'], 'amount': line['amount'],
+                                  'party': line['party'], 'reason': how})
+                continue
+
+            for bill, amount in allocations:
+                claimed[bill.id] = claimed.get(bill.id, 0) + amount
+                payments.append((bill, amount, line))
+            total = round(sum(amount for _, amount in allocations), 2)
+            applied += total
+            matched.append({
+                'line': line['line'],
+                'amount': line['amount'],
+                'party': line['party'],
+                'match': how,
+                'unapplied': round(line['amount'] - total, 2),
+                'allocations': [{
+                    'type': kind,
+                    'id': bill.id,
+                    'bill_number': bill.bill_number,
+                    'party_name': getattr(bill, name_attr),
+                    'amount': amount
+                } for bill, amount in allocations]
+            })
+
+    if not dry_run:
+        for bill, amount, line in payments:
+            record_payment(
+                bill, amount,
+                description=f"Bank reconciliation: {line['party'] or 'statement'} (line {line['line']})",
+                payment_date=line['date'],
+                reference=line['reference']
+            )
+            bill.payment_status = status_for(bill)
+
+    return {
+        'dry_run': dry_run,
+        'lines': len(lines),
+        'matched': matched,
+        'unmatched': unmatched,
+        'applied_amount': round(applied, 2),
+    }
@@ -0,0 +1,21 @@
+from extensions import db
+from sqlalchemy import func
+
+PERIODS = ('day', 'week', 'month')
+
+
+def period_bucket(column, period):
+    """Label expression grouping a datetime column by day, week (Monday) or month.
+
+    Labels are ISO date strings (YYYY-MM-DD for the bucket start) on every
+    backend so they sort and parse the same way.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Invalid period. Must be one of: {', '.join(PERIODS)}")
+    if db.engine.dialect.name == 'sqlite':
+        if period == 'day':
+            return func.date(column)
+        if period == 'week':
+            return func.date(column, '-6 days', 'weekday 1')
+        return func.date(column, 'start of month')
+    return func.to_char(func.date_trunc(period, column), 'YYYY-MM-DD')
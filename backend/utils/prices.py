@@ -0,0 +1,114 @@
+from datetime import timedelta
+from sqlalchemy import and_, event, func, inspect, literal, or_, select
+from extensions import db
+from models import PriceBucket, Purchase, Sale
+from utils.archive import history, routed
+from utils.changes import previous
+
+_KEYS_KEY = 'price_buckets'
+_listeners_installed = False
+
+buckets = PriceBucket.__table__
+
+# table -> (side, model, bill date column)
+PRICE_SIDES = {
+    'purchase': ('buy', Purchase, Purchase.purchase_date),
+    'sale': ('sell', Sale, Sale.sale_date),
+}
+PRICE_FIELDS = ('grain_id', 'rate_per_kg', 'total_weight', 'total_amount')
+
+
+def _day(value):
+    return value.date() if hasattr(value, 'date') else value
+
+
+def _bucket_query(side, model, date_column, condition=None):
+    day = func.date(date_column)
+    query = select(
+        model.grain_id, literal(side), day,
+        func.min(model.rate_per_kg), func.max(model.rate_per_kg),
+        func.sum(model.total_weight), func.sum(model.total_amount), func.count(model.id)
+    )
+    if condition is not None:
+        query = query.where(condition)
+    return query.group_by(model.grain_id, day)
+
+
+COLUMNS = ['grain_id', 'side', 'day', 'min_rate', 'max_rate', 'weight', 'amount', 'bills']
+
+
+def refresh_buckets(connection, keys):
+    """Recompute the daily buckets for {(grain_id, side, day)} from their bills.
+
+    Min and max cannot be maintained by increments once a bill is edited or
+    deleted, so each touched day is regrouped; that is a handful of rows on
+    the (grain, date) range.
+    """
+    for side, model, date_column in PRICE_SIDES.values():
+        side_keys = sorted((grain_id, day) for grain_id, key_side, day in keys if key_side == side)
+        if not side_keys:
+            continue
+        # A bill still open in a closed year shares its day with archived ones
+        model = routed(model, min(day for _, day in side_keys), connection)
+        date_column = getattr(model, date_column.key)
+        connection.execute(buckets.delete().where(buckets.c.side == side, or_(*[
+            and_(buckets.c.grain_id == grain_id, buckets.c.day == day) for grain_id, day in side_keys
+        ])))
+        condition = or_(*[
+            and_(model.grain_id == grain_id, date_column >= day, date_column < day + timedelta(days=1))
+            for grain_id, day in side_keys
+        ])
+        connection.execute(buckets.insert().from_select(
+            COLUMNS, _bucket_query(side, model, date_column, condition)))
+
+
+def _before_flush(session, flush_context, instances):
+    keys = session.info.setdefault(_KEYS_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        config = PRICE_SIDES.get(getattr(obj, '__tablename__', None))
+        if not config:
+            continue
+        side, model, date_column = config
+        date_attr = date_column.key
+        state = inspect(obj)
+        if obj not in session.new:
+            if obj in session.dirty and not any(
+                    state.attrs[field].history.has_changes() for field in PRICE_FIELDS + (date_attr,)):
+                continue
+            keys.add((previous(state, 'grain_id'), side, _day(previous(state, date_attr))))
+        if obj not in session.deleted:
+            keys.add((obj.grain_id, side, _day(getattr(obj, date_attr))))
+
+
+def _after_flush(session, flush_context):
+    keys = {key for key in session.info.pop(_KEYS_KEY, ()) if None not in key}
+    if keys:
+        refresh_buckets(session.connection(), keys)
+
+
+def _reset(session, *args):
+    session.info.pop(_KEYS_KEY, None)
+
+
+def init_app(app):
+    """Keep the daily price buckets in step with purchase and sale writes"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'before_flush', _before_flush)
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _reset)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
+
+
+def rebuild_buckets(session=None):
+    """Regroup every bill into daily buckets; returns the bucket count"""
+    session = session or db.session
+    connection = session.connection()
+    connection.execute(buckets.delete())
+    for side, model, date_column in PRICE_SIDES.values():
+        model = history(model, connection)
+        connection.execute(buckets.insert().from_select(
+            COLUMNS, _bucket_query(side, model, getattr(model, date_column.key))))
+    return session.query(func.count(PriceBucket.id)).scalar()
@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+from functools import partial
+from urllib.parse import urlparse
+from flask import current_app, has_app_context
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from extensions import db
+from models import LedgerSide, PartyBalance, PushSubscription, Sale
+
+_TRIGGERS_KEY = 'push_triggers'
+_listeners_installed = False
+
+GONE = (404, 410)
+RETRYABLE = (429, 500, 502, 503, 504)
+# Subscriptions read per query when expanding a broadcast
+PAGE_SIZE = 500
+# VAPID tokens are signed for 12 hours and renewed an hour before expiry
+VAPID_LIFETIME = 12 * 60 * 60
+VAPID_RENEW = 60 * 60
+# Balances below half a paisa are settled (same as the party ledger)
+SETTLED = 0.005
+
+
+class PushQueue:
+    """Background web-push delivery for one worker process.
+
+    notify() only enqueues. A dispatcher thread turns each broadcast into one
+    send per subscription, reading them a page at a time, and `concurrency`
+    sender threads deliver those over per-thread keep-alive sessions. 429,
+    5xx and network errors are retried with exponential backoff (or the
+    server's Retry-After); endpoints answering 404/410 are deleted in one
+    statement once the queue drains. Threads start on first use, so forked
+    workers each get their own.
+    """
+
+    def __init__(self, app, concurrency=8, max_attempts=4, backoff=1.0, ttl=24 * 60 * 60,
+                 timeout=10, max_pending=10000):
+        self.app = app
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.ttl = ttl
+        self.timeout = timeout
+        self.broadcasts = queue.Queue(maxsize=max_pending)
+        self.sends = queue.Queue(maxsize=max_pending)
+        self.retries = []
+        self.retry_ready = threading.Condition()
+        self.gone = set()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.outstanding = 0
+        self.local = threading.local()
+        self.vapid = None
+        self.vapid_headers = {}
+        self.started = False
+        self._sequence = itertools.count()
+
+    # --- Producers ----------------------------------------------------------------
+
+    def notify(self, title, body, url='/', tag=None, user_ids=None):
+        """Queue a message for every subscription (or those of user_ids)"""
+        message = {'title': title, 'body': body, 'url': url, 'tag': tag}
+        self.submit(lambda: (message, user_ids))
+
+    def submit(self, build):
+        """Queue build(), run on the dispatcher inside an app context; it
+        returns (message, user_ids) or None to send nothing"""
+        if not self.app.config.get('VAPID_PRIVATE_KEY'):
+            return
+        self._start()
+        try:
+            self._track(1)
+            self.broadcasts.put_nowait(build)
+        except queue.Full:
+            self._track(-1)
+            print('Push queue full, dropping notification')
+
+    def join(self, timeout=None):
+        """Wait until everything queued so far is delivered, failed or pruned"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.idle:
+            while self.outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    # --- Threads ------------------------------------------------------------------
+
+    def _start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threads = [self._dispatch, self._schedule_retries] + [self._deliver] * self.concurrency
+        for index, target in enumerate(threads):
+            threading.Thread(target=target, name=f'push-{index}', daemon=True).start()
+
+    def _track(self, count):
+        with self.idle:
+            self.outstanding += count
+            if not self.outstanding:
+                self.idle.notify_all()
+
+    def _dispatch(self):
+        while True:
+            build = self.broadcasts.get()
+            try:
+                with self.app.app_context():
+                    result = build()
+                    if result:
+                        self._expand(*result)
+            except Exception as e:
+                print(f"Error preparing push notification: {str(e)}")
+            finally:
+                db.session.remove()
+                self._track(-1)
+
+    def _expand(self, message, user_ids):
+        payload = json.dumps(message)
+        last_id = 0
+        while True:
+            query = PushSubscription.query.filter(PushSubscription.id > last_id)
+            if user_ids is not None:
+                query = query.filter(PushSubscription.user_id.in_(list(user_ids)))
+            page = query.order_by(PushSubscription.id).limit(PAGE_SIZE).all()
+            if not page:
+                return
+            for subscription in page:
+                self._track(1)
+                # Blocks while senders are behind, which is the concurrency bound
+                self.sends.put((payload, subscription.subscription_info(), 1))
+            last_id = page[-1].id
+
+    def _schedule_retries(self):
+        while True:
+            with self.retry_ready:
+                while True:
+                    delay = self.retries[0][0] - time.monotonic() if self.retries else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self.retry_ready.wait(delay)
+                _, _, job = heapq.heappop(self.retries)
+            # Outside the lock: senders need it to schedule retries while we wait
+            self.sends.put(job)
+
+    def _deliver(self):
+        while True:
+            payload, info, attempt = self.sends.get()
+            retried = False
+            try:
+                retried = self._send(payload, info, attempt)
+            except Exception as e:
+                print(f"Error sending push notification: {str(e)}")
+            finally:
+                if not retried:
+                    self._finish()
+
+    def _finish(self):
+        with self.lock:
+            drained = self.outstanding == 1 and self.gone
+        if drained or len(self.gone) >= PAGE_SIZE:
+            self._prune()
+        self._track(-1)
+
+    # --- Sending ------------------------------------------------------------------
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            # requests, pywebpush and py_vapid load on the first send, not at startup
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            # One pool per push service host, kept alive across sends
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            self.local.session = session
+        return session
+
+    def _headers(self, endpoint):
+        url = urlparse(endpoint)
+        audience = f'{url.scheme}://{url.netloc}'
+        now = int(time.time())
+        with self.lock:
+            if self.vapid is None:
+                from py_vapid import Vapid
+                self.vapid = Vapid.from_string(private_key=self.app.config['VAPID_PRIVATE_KEY'])
+            cached = self.vapid_headers.get(audience)
+            if cached is None or cached[0] - now < VAPID_RENEW:
+                claims = {'sub': self.app.config['VAPID_CLAIM_EMAIL'], 'aud': audience,
+                          'exp': now + VAPID_LIFETIME}
+                cached = (claims['exp'], self.vapid.sign(claims))
+                self.vapid_headers[audience] = cached
+        return dict(cached[1])
+
+    def _send(self, payload, info, attempt):
+        """Deliver one message; returns True when it was rescheduled"""
+        import requests
+        from pywebpush import WebPusher
+        retry_after = None
+        try:
+            response = WebPusher(info, requests_session=self._session()).send(
+                payload, headers=self._headers(info['endpoint']), ttl=self.ttl, timeout=self.timeout)
+            status = response.status_code
+            retry_after = response.headers.get('Retry-After')
+        except requests.RequestException as e:
+            status, response = None, e
+
+        if status is not None and status < 300:
+            return False
+        if status in GONE:
+            with self.lock:
+                self.gone.add(info['endpoint'])
+            return False
+        if (status is None or status in RETRYABLE) and attempt < self.max_attempts:
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = self.backoff * 2 ** (attempt - 1) * (1 + random.random())
+            with self.retry_ready:
+                heapq.heappush(self.retries, (time.monotonic() + delay, next(self._sequence),
+                                              (payload, info, attempt + 1)))
+                self.retry_ready.notify()
+            return True
+        print(f"Push notification failed after {attempt} attempt(s): {status or response}")
+        return False
+
+    def _prune(self):
+        with self.lock:
+            endpoints, self.gone = sorted(self.gone), set()
+        if not endpoints:
+            return
+        try:
+            with self.app.app_context():
+                for start in range(0, len(endpoints), PAGE_SIZE):
+                    PushSubscription.query.filter(
+                        PushSubscription.endpoint.in_(endpoints[start:start + PAGE_SIZE])
+                    ).delete(synchronize_session=False)
+                db.session.commit()
+                db.session.remove()
+        except Exception as e:
+            print(f"Error pruning push subscriptions: {str(e)}")
+
+
+def get_queue():
+    return current_app.extensions['push']
+
+
+# --- Triggers ---------------------------------------------------------------------
+
+def _large_sale(bill_number, buyer_name, amount):
+    return {'title': 'Large sale', 'body': f'{bill_number}: {buyer_name}, ₹{amount:,.0f}',
+            'url': '/sales', 'tag': f'sale-{bill_number}'}, None
+
+
+def _overdue(days):
+    cutoff = datetime.utcnow().date() - timedelta(days=days)
+    rows = db.session.query(
+        PartyBalance.party_id, func.sum(PartyBalance.outstanding)
+    ).filter(
+        PartyBalance.side == LedgerSide.RECEIVABLE.value, PartyBalance.bill_date <= cutoff
+    ).group_by(PartyBalance.party_id).having(func.sum(PartyBalance.outstanding) > SETTLED).all()
+    if not rows:
+        return None
+    total = sum(amount for _, amount in rows)
+    return {'title': 'Overdue payments',
+            'body': f'{len(rows)} buyers owe ₹{total:,.0f} on bills older than {days} days',
+            'url': '/parties', 'tag': 'overdue'}, None
+
+
+def notify_overdue(days):
+    """Queue the overdue receivables summary; meant for a daily scheduled run"""
+    get_queue().submit(partial(_overdue, days))
+
+
+def _after_flush(session, flush_context):
+    if not has_app_context() or 'push' not in current_app.extensions:
+        return
+    triggers = session.info.setdefault(_TRIGGERS_KEY, [])
+    large = current_app.config['NOTIFY_LARGE_SALE_AMOUNT']
+    for obj in session.new:
+        if isinstance(obj, Sale) and large and (obj.total_amount or 0) >= large:
+            triggers.append(partial(_large_sale, obj.bill_number, obj.buyer_name, obj.total_amount))
+
+
+def _after_commit(session):
+    triggers = session.info.pop(_TRIGGERS_KEY, None)
+    if triggers and has_app_context() and 'push' in current_app.extensions:
+        for build in triggers:
+            get_queue().submit(build)
+
+
+def _reset(session, *args):
+    session.info.pop(_TRIGGERS_KEY, None)
+
+
+def init_app(app):
+    """Set up the push queue and the large-sale trigger (stock alerts queue their own).
+
+    Without VAPID_PRIVATE_KEY nothing is queued, so development needs no keys.
+    """
+    global _listeners_installed
+    app.config.setdefault('VAPID_PRIVATE_KEY', None)
+    app.config.setdefault('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
+    app.config.setdefault('PUSH_CONCURRENCY', 8)
+    app.config.setdefault('NOTIFY_LARGE_SALE_AMOUNT', 500000)
+    app.extensions['push'] = PushQueue(app, concurrency=app.config['PUSH_CONCURRENCY'])
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_soft_rollback', _reset)
+    _listeners_installed = True
@@ -0,0 +1,175 @@
+"""Read replica routing for dashboards and reports.
+
+With REPLICA_DATABASE_URL set, views marked @replica_read run their queries
+on the replica, so heavy reads hold no connections, snapshots or row locks
+on the primary while bills are written there. Two kinds of replica work:
+
+* a PostgreSQL streaming standby; its position is the last replayed commit,
+  or now when it has replayed everything it received;
+* a SQLite snapshot of a SQLite primary, kept fresh by
+  `flask refresh-replica --every 10`; its position is the file's mtime,
+  which is set to the moment the snapshot was taken.
+
+A read goes to the replica only while its position is within
+REPLICA_MAX_LAG seconds of now and past the user's own last write, so a
+user always reads what they just saved. Every write request stamps the
+user's write mark inside its own transaction. Anything else, including a
+replica that cannot be reached, reads from the primary as before.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from extensions import REPLICA_BIND, db
+from models import WriteMark
+from utils.backup import BACKUP_PAGES, BACKUP_SLEEP, copy_database, enable_wal
+
+# The replica position is re-read at most this often per process
+POSITION_TTL = 2
+# A write mark is taken just before COMMIT; the replica must be this far past it
+WRITE_MARGIN = 1
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+POSTGRES_POSITION = text(
+    'SELECT extract(epoch FROM CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN now() ELSE pg_last_xact_replay_timestamp() END)'
+)
+
+_MARKED_KEY = 'replica_write_marked'
+_listeners_installed = False
+_positions = {}  # replica url -> (checked_at, position)
+
+
+def enabled():
+    return REPLICA_BIND in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _epoch(moment):
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _read_position(engine):
+    if engine.dialect.name == 'sqlite':
+        try:
+            return os.path.getmtime(engine.url.database)
+        except OSError:
+            return None  # not refreshed yet
+    with engine.connect() as connection:
+        position = connection.execute(POSTGRES_POSITION).scalar()
+    return float(position) if position is not None else None
+
+
+def replica_position():
+    """Epoch seconds up to which the replica holds every commit; None when unknown"""
+    engine = db.get_engine(bind=REPLICA_BIND)
+    key = str(engine.url)
+    checked_at, position = _positions.get(key, (0, None))
+    if time.monotonic() - checked_at >= POSITION_TTL:
+        try:
+            position = _read_position(engine)
+        except SQLAlchemyError as e:
+            print(f'Error reading replica position: {str(e)}')
+            position = None
+        _positions[key] = (time.monotonic(), position)
+    return position
+
+
+def last_write(user_id):
+    """Epoch seconds of the user's last write, read from the primary; None if never"""
+    with db.engine.connect() as connection:
+        written_at = connection.execute(
+            select(WriteMark.written_at).where(WriteMark.user_id == int(user_id))).scalar()
+    return _epoch(written_at) if written_at else None
+
+
+def _use_replica():
+    if not enabled():
+        return False
+    position = replica_position()
+    if position is None or time.time() - position > current_app.config['REPLICA_MAX_LAG']:
+        return False
+    user_id = get_jwt_identity()
+    written = last_write(user_id) if user_id is not None else None
+    return written is None or written + WRITE_MARGIN <= position
+
+
+def replica_read(when=None):
+    """Run a read-only view on the replica when it is fresh enough for this user.
+
+    `when` is an optional check that keeps the view on the primary when it
+    returns False. Put this above @conditional, so the ETag is computed on the
+    same database as the body.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if (when and not when()) or not _use_replica():
+                return fn(*args, **kwargs)
+            setattr(g, REPLICA_BIND, True)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                g.pop(REPLICA_BIND, None)
+        return wrapper
+    return decorator
+
+
+def _before_commit(session):
+    if session.info.get(_MARKED_KEY) or not has_request_context() or request.method in SAFE_METHODS:
+        return
+    if not enabled():
+        return
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        return  # no token on this request
+    if user_id is None:
+        return
+    # Flush first, so the mark is taken once the writes hold their locks
+    # and only the COMMIT is left
+    session.flush()
+    table = WriteMark.__table__
+    now = datetime.utcnow()
+    connection = session.connection()
+    result = connection.execute(table.update().where(table.c.user_id == int(user_id)).values(written_at=now))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(user_id=int(user_id), written_at=now))
+    session.info[_MARKED_KEY] = True
+
+
+def _reset_marked(session, *args):
+    session.info.pop(_MARKED_KEY, None)
+
+
+def refresh_snapshot(database, replica, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Replace the SQLite replica file with a fresh online copy of `database`.
+
+    The copy is built next to the replica and renamed over it, so readers
+    see either the old snapshot or the new one. Returns (created_at, seconds).
+    """
+    if enable_wal(database) != 'wal':
+        # In rollback-journal mode the copy would hold writers off while it runs
+        raise ValueError('Could not switch the database to WAL mode')
+    partial = replica + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    created_at, _, seconds, _, _ = copy_database(database, partial, pages, sleep)
+    stamp = _epoch(created_at)
+    os.utime(partial, (stamp, stamp))
+    os.replace(partial, replica)
+    return created_at, seconds
+
+
+def init_app(app):
+    """Stamp write marks on write requests while a replica is configured"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.session, 'before_commit', _before_commit)
+    event.listen(db.session, 'after_commit', _reset_marked)
+    event.listen(db.session, 'after_soft_rollback', _reset_marked)
+    _listeners_installed = True
@@ -0,0 +1,333 @@
+import re
+from sqlalchemy import event, inspect, text
+from extensions import db
+
+_listeners_installed = False
+
+# Devanagari -> Latin; vowels are dropped by search_key anyway, so the
+# inherent 'a' of consonants is never written out
+DEVANAGARI = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n', 'च': 'ch', 'छ': 'chh', 'ज': 'j',
+    'झ': 'jh', 'ञ': 'n', 'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n', 'त': 't',
+    'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n', 'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh',
+    'म': 'm', 'य': 'y', 'र': 'r', 'ल': 'l', 'व': 'v', 'श': 'sh', 'ष': 'sh', 'स': 's',
+    'ह': 'h', 'ळ': 'l', 'क़': 'k', 'ख़': 'kh', 'ग़': 'g', 'ज़': 'j', 'ड़': 'd', 'ढ़': 'dh',
+    'फ़': 'f', 'य़': 'y',
+    'अ': 'a', 'आ': 'aa', 'इ': 'i', 'ई': 'ee', 'उ': 'u', 'ऊ': 'oo', 'ऋ': 'ri', 'ए': 'e',
+    'ऐ': 'ai', 'ओ': 'o', 'औ': 'au',
+    'ा': 'aa', 'ि': 'i', 'ी': 'ee', 'ु': 'u', 'ू': 'oo', 'ृ': 'ri', 'े': 'e', 'ै': 'ai',
+    'ो': 'o', 'ौ': 'au', 'ं': 'n', 'ँ': 'n', 'ः': 'h', '्': '', '़': '',
+    **{chr(0x0966 + digit): str(digit) for digit in range(10)},
+}
+
+# Spelling variants that collapse to one sound when names are romanized
+LATIN_FOLDS = (
+    ('chh', 'c'), ('ch', 'c'), ('sh', 's'), ('ph', 'f'), ('kh', 'k'), ('gh', 'g'),
+    ('jh', 'j'), ('th', 't'), ('dh', 'd'), ('bh', 'b'), ('ck', 'k'), ('q', 'k'),
+    ('x', 'ks'), ('z', 'j'), ('w', 'v'),
+)
+_VOWELS = re.compile(r'(?<=\w)[aeiou]+')
+_REPEATS = re.compile(r'(\w)\1+')
+# Devanagari vowel signs and virama are combining marks, not \w
+_TOKENS = re.compile(r'[\w\u0900-\u097F]+')
+
+SEARCH_KINDS = ('sale', 'purchase')
+
+
+def transliterate(value):
+    return ''.join(DEVANAGARI.get(char, char) for char in value or '')
+
+
+def search_key(value):
+    """Phonetic key for a name that is the same for Hindi and romanized spellings.
+
+    'रमेश', 'Ramesh' and 'Ramesh ' all become 'rms': transliterate, fold
+    digraphs, drop vowels after the first letter and collapse repeats.
+    """
+    words = []
+    for word in _TOKENS.findall(transliterate(value).lower()):
+        for old, new in LATIN_FOLDS:
+            word = word.replace(old, new)
+        word = _REPEATS.sub(r'\1', _VOWELS.sub('', word))
+        if word:
+            words.append(word)
+    return ' '.join(words)
+
+
+def _search_row(kind, party, date, vehicle, refs, key='NULL'):
+    """SELECT list producing one bill_search row from a NEW/OLD trigger row.
+
+    The triggers leave party_key NULL: search_key() is Python, and another
+    client writing a bill must not need it. The app fills the key in after
+    each flush (see fill_keys()).
+    """
+    offset = 0 if kind == 'sale' else 1
+    return (
+        f"NEW.id * 2 + {offset}, '{kind}', NEW.id, NEW.{date}, NEW.bill_number, "
+        f"NEW.{party}, {key}, {vehicle}, {refs}"
+    )
+
+
+_SALE_VEHICLE = ("coalesce(NEW.vehicle_number, '') || ' ' || "
+                 "replace(replace(upper(coalesce(NEW.vehicle_number, '')), ' ', ''), '-', '')")
+_SALE_REFS = ("trim(coalesce(NEW.lr_number, '') || ' ' || coalesce(NEW.po_number, '') || ' ' || "
+              "coalesce(NEW.buyer_gst, ''))")
+
+SEARCH_SOURCES = {
+    # kind: (table, party column, date column, indexed columns, vehicle expr, refs expr)
+    'sale': ('sale', 'buyer_name', 'sale_date',
+             'bill_number, buyer_name, vehicle_number, lr_number, po_number, buyer_gst, sale_date',
+             _SALE_VEHICLE, _SALE_REFS),
+    'purchase': ('purchase', 'supplier_name', 'purchase_date',
+                 'bill_number, supplier_name, purchase_date', "''", "''"),
+}
+
+INDEX_COLUMNS = 'rowid, kind, bill_id, bill_date, bill_number, party, party_key, vehicle, refs'
+
+_TABLE_KINDS = {table: kind for kind, (table, *_) in SEARCH_SOURCES.items()}
+
+
+def sqlite_ddl():
+    """Statements creating the FTS5 index and the triggers that keep it in sync"""
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS bill_search USING fts5("
+        "kind UNINDEXED, bill_id UNINDEXED, bill_date UNINDEXED, "
+        "bill_number, party, party_key, vehicle, refs, "
+        "prefix='2 3 4', tokenize='unicode61 remove_diacritics 2')"
+    ]
+    for kind, (table, party, date, columns, vehicle, refs) in SEARCH_SOURCES.items():
+        offset = 0 if kind == 'sale' else 1
+        row = _search_row(kind, party, date, vehicle, refs)
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO bill_search ({INDEX_COLUMNS}) SELECT {row}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"DELETE FROM bill_search WHERE rowid = OLD.id * 2 + {offset}; "
+            f"INSERT INTO bill_search ({INDEX_COLUMNS}) SELECT {row}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM bill_search WHERE rowid = OLD.id * 2 + {offset}; END",
+        ]
+    return statements
+
+
+def sqlite_drop_trigger_ddl():
+    statements = []
+    for table, *_ in SEARCH_SOURCES.values():
+        for action in ('insert', 'update', 'delete'):
+            statements.append(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+    return statements
+
+
+def sqlite_drop_ddl():
+    return sqlite_drop_trigger_ddl() + ["DROP TABLE IF EXISTS bill_search"]
+
+
+# PostgreSQL has no FTS5; trigram indexes serve the same substring/prefix queries
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    *[f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)"
+      for table, columns in (('sale', ('bill_number', 'buyer_name', 'vehicle_number', 'lr_number',
+                                       'po_number', 'buyer_gst')),
+                             ('purchase', ('bill_number', 'supplier_name')))
+      for column in columns],
+]
+
+
+def create_index(connection):
+    if connection.dialect.name == 'sqlite':
+        for statement in sqlite_ddl():
+            connection.execute(text(statement))
+    elif connection.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+def _after_create(target, connection, **kw):
+    create_index(connection)
+
+
+def rebuild_index(session=None):
+    """Create the index if needed and repopulate it; returns indexed rows"""
+    session = session or db.session
+    connection = session.connection()
+    create_index(connection)
+    return populate_index(connection)
+
+
+def populate_index(connection):
+    """Reload bill_search from the bill tables (SQLite only)"""
+    if connection.dialect.name != 'sqlite':
+        return 0
+    connection.execute(text("DELETE FROM bill_search"))
+    # Keys are worked out once per distinct name and joined in
+    connection.execute(text("CREATE TEMP TABLE IF NOT EXISTS search_keys (party TEXT PRIMARY KEY, key TEXT)"))
+    for kind, (table, party, date, columns, vehicle, refs) in SEARCH_SOURCES.items():
+        connection.execute(text("DELETE FROM temp.search_keys"))
+        names = connection.execute(text(f"SELECT DISTINCT {party} FROM {table} WHERE {party} IS NOT NULL")).scalars().all()
+        if names:
+            connection.execute(text("INSERT INTO temp.search_keys (party, key) VALUES (:party, :key)"),
+                               [{'party': name, 'key': search_key(name)} for name in names])
+        row = _search_row(kind, party, date, vehicle, refs, 'search_keys.key').replace('NEW.', f'{table}.')
+        connection.execute(text(f"INSERT INTO bill_search ({INDEX_COLUMNS}) SELECT {row} FROM {table} "
+                                f"LEFT JOIN temp.search_keys ON search_keys.party = {table}.{party}"))
+    connection.execute(text("DROP TABLE temp.search_keys"))
+    return connection.execute(text("SELECT count(*) FROM bill_search")).scalar()
+
+
+def _has_index(connection):
+    info = connection.connection.info
+    # Only a hit is remembered; the index may be created later by rebuild-search
+    if not info.get('bill_search'):
+        info['bill_search'] = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bill_search'")).first() is not None
+    return info['bill_search']
+
+
+def fill_keys(connection, kind, bills):
+    """Set party_key on the indexed rows of (bill id, party name) pairs of one kind"""
+    if not bills or connection.dialect.name != 'sqlite' or not _has_index(connection):
+        return
+    offset = 0 if kind == 'sale' else 1
+    connection.execute(text("UPDATE bill_search SET party_key = :key WHERE rowid = :rowid"),
+                       [{'key': search_key(party), 'rowid': bill_id * 2 + offset} for bill_id, party in bills])
+
+
+def _after_flush(session, flush_context):
+    # The triggers re-index a bill when one of its indexed columns changes
+    bills = {}
+    for obj in list(session.new) + [obj for obj in session.dirty if session.is_modified(obj)]:
+        kind = _TABLE_KINDS.get(getattr(obj, '__tablename__', None))
+        if kind is None:
+            continue
+        _, party, _, columns, _, _ = SEARCH_SOURCES[kind]
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[column].history.has_changes() for column in columns.split(', ')):
+            bills.setdefault(kind, []).append((obj.id, getattr(obj, party)))
+    if bills:
+        connection = session.connection()
+        for kind, rows in bills.items():
+            fill_keys(connection, kind, rows)
+
+
+def init_app(app):
+    """Create the index with the schema and fill in the name keys of bills the app writes"""
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    event.listen(db.metadata, 'after_create', _after_create)
+    event.listen(db.session, 'after_flush', _after_flush)
+    _listeners_installed = True
+
+
+# --- Queries ------------------------------------------------------------------
+
+def _raw(value):
+    """Drop the compacted copy (never contains spaces) appended to an indexed value"""
+    return (value or '').rsplit(' ', 1)[0].strip() or None
+
+
+def _quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def match_expression(query, columns=('bill_number', 'party', 'vehicle', 'refs')):
+    """FTS5 MATCH string: every token must prefix-match a column or the name key"""
+    clauses = []
+    for token in _TOKENS.findall(query or ''):
+        options = [f"{{{' '.join(columns)}}} : {_quote(token)}*"]
+        key = search_key(token)
+        # Names have no digits; bm25 pays for every extra phrase on large doclists
+        if key and 'party' in columns and not any(char.isdigit() for char in token):
+            options.append(f"party_key : {_quote(key)}*")
+        clauses.append('(' + ' OR '.join(options) + ')')
+    return ' AND '.join(clauses)
+
+
+# bm25 weights in bill_search column order; UNINDEXED columns are ignored
+RANK = "bm25(bill_search, 0, 0, 0, 10.0, 5.0, 2.0, 4.0, 3.0)"
+
+# Common names match a large share of all bills. FTS5 walks a MATCH in rowid
+# order and stops at the LIMIT, so only the newest candidates are scored.
+CANDIDATE_WINDOW = 200
+
+
+def search_bills(query, kind=None, limit=20, offset=0):
+    """Ranked matches as dicts; fetches one extra row to report has_more"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        rows = _search_like(connection, query, kind, limit + 1, offset)
+        return rows[:limit], len(rows) > limit
+
+    expression = match_expression(query)
+    if not expression:
+        return [], False
+    params = {'match': expression, 'limit': limit + 1, 'offset': offset,
+              'candidates': max(CANDIDATE_WINDOW, (offset + limit) * 5)}
+    kind_filter = ''
+    if kind:
+        kind_filter = " AND kind = :kind"
+        params['kind'] = kind
+    sql = (f"SELECT * FROM ("
+           f"SELECT kind, bill_id, bill_number, party, bill_date, vehicle, {RANK} AS score "
+           f"FROM bill_search WHERE bill_search MATCH :match{kind_filter} "
+           f"ORDER BY rowid DESC LIMIT :candidates"
+           f") ORDER BY score, bill_date DESC LIMIT :limit OFFSET :offset")
+    rows = [dict(row._mapping) for row in connection.execute(text(sql), params)]
+    for row in rows:
+        # Show the raw number; the index also holds a compacted copy
+        row['vehicle'] = _raw(row['vehicle'])
+    return rows[:limit], len(rows) > limit
+
+
+def suggest(query, field='party', limit=10):
+    """Distinct prefix completions for a form field (party or vehicle)"""
+    connection = db.session.connection()
+    column = 'party' if field == 'party' else 'vehicle'
+    if connection.dialect.name != 'sqlite':
+        rows = _search_like(connection, query, None, limit * 5, 0)
+        values = [row['party'] if field == 'party' else row['vehicle'] for row in rows]
+        return list(dict.fromkeys(value for value in values if value))[:limit]
+
+    expression = match_expression(query, columns=(column,))
+    if not expression:
+        return []
+    # bm25() is not allowed inside an aggregate, so score the newest
+    # candidates first and de-duplicate them outside
+    rows = connection.execute(text(
+        f"SELECT value, min(score) AS score FROM ("
+        f"SELECT {column} AS value, {RANK} AS score FROM bill_search "
+        f"WHERE bill_search MATCH :match ORDER BY rowid DESC LIMIT :candidates"
+        f") GROUP BY value ORDER BY score LIMIT :limit"
+    ), {'match': expression, 'candidates': CANDIDATE_WINDOW, 'limit': limit}).all()
+    values = [_raw(row.value) if column == 'vehicle' else row.value for row in rows]
+    return [value for value in values if value]
+
+
+def _search_like(connection, query, kind, limit, offset):
+    """Trigram-indexed ILIKE fallback for PostgreSQL"""
+    from models import Purchase, Sale
+    from sqlalchemy import and_, literal, or_, select, union_all
+
+    tokens = _TOKENS.findall(query or '')
+    if not tokens:
+        return []
+    selects = []
+    if kind in (None, 'sale'):
+        columns = (Sale.bill_number, Sale.buyer_name, Sale.vehicle_number,
+                   Sale.lr_number, Sale.po_number, Sale.buyer_gst)
+        selects.append(select(
+            literal('sale').label('kind'), Sale.id.label('bill_id'), Sale.bill_number,
+            Sale.buyer_name.label('party'), Sale.sale_date.label('bill_date'), Sale.vehicle_number.label('vehicle')
+        ).where(and_(*[or_(*[column.ilike(f'%{token}%') for column in columns]) for token in tokens])))
+    if kind in (None, 'purchase'):
+        columns = (Purchase.bill_number, Purchase.supplier_name)
+        selects.append(select(
+            literal('purchase').label('kind'), Purchase.id.label('bill_id'), Purchase.bill_number,
+            Purchase.supplier_name.label('party'), Purchase.purchase_date.label('bill_date'),
+            literal(None).label('vehicle')
+        ).where(and_(*[or_(*[column.ilike(f'%{token}%') for column in columns]) for token in tokens])))
+    combined = union_all(*selects).subquery()
+    rows = connection.execute(
+        select(combined).order_by(combined.c.bill_date.desc()).limit(limit).offset(offset)
+    ).all()
+    return [dict(row._mapping) for row in rows]
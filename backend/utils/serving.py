@@ -0,0 +1,103 @@
+import os
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_listeners_installed = False
+
+# Seconds a SQLite writer waits for the database lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = 15
+
+
+def concurrency():
+    """Requests one worker process may have in flight, from the gunicorn settings.
+
+    gthread workers run GUNICORN_THREADS requests at once; gevent workers
+    are only bounded by worker_connections, so the pool is what limits them
+    and a modest size is used.
+    """
+    if os.getenv('GUNICORN_WORKER_CLASS', 'gthread') == 'gevent':
+        return int(os.getenv('DB_POOL_SIZE', 20))
+    return int(os.getenv('DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', 16)))
+
+
+def workers():
+    """Worker processes serving the app, as gunicorn.conf.py exports them"""
+    return int(os.getenv('GUNICORN_WORKERS', 1))
+
+
+def stream_limit():
+    """Long-lived requests (event streams) one worker should hold at once.
+
+    A gthread stream pins a thread for as long as it is open, so streams get
+    a quarter of the worker's threads and the rest stay free for ordinary
+    requests.
+    """
+    return max(1, concurrency() // 4)
+
+
+def engine_options(url, size=None):
+    """SQLAlchemy engine options for a worker serving requests concurrently.
+
+    Server databases get a pool with a connection for every request a
+    worker can have in flight, so threads never queue on the pool for
+    ordinary requests. SQLite opens a connection per checkout either way;
+    there the busy timeout matters, so concurrent writers wait for the lock
+    instead of failing at once.
+
+    That needs pysqlite to begin with BEGIN IMMEDIATE. It begins a
+    transaction just before the first INSERT/UPDATE/DELETE and runs reads
+    in autocommit. A deferred transaction would take the write lock only
+    at its first write, and SQLite fails that upgrade at once, without the
+    busy timeout, when it meets another writer. Reads (GETs, read-only
+    POSTs, the push dispatcher's paging) hold no lock between statements,
+    and a writer holds the lock only from its first write to its commit
+    (writing requests take it earlier, see _begin).
+    """
+    if url.startswith('sqlite'):
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT, 'isolation_level': 'IMMEDIATE'}}
+    size = size or concurrency()
+    return {
+        'pool_size': size,
+        'max_overflow': max(2, size // 4),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+
+def lock_at_first_write(fn):
+    """Let a POST/PUT/DELETE view take the SQLite write lock only when it writes.
+
+    For views that write nothing or nothing they read first (read-only
+    POSTs, or a view that talks to a slow service before its one insert),
+    so they do not hold the lock for the whole request.
+    """
+    fn.lock_at_first_write = True
+    return fn
+
+
+def _writing_request():
+    if not has_request_context() or request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return False
+    view = current_app.view_functions.get(request.endpoint)
+    return not getattr(view, 'lock_at_first_write', False)
+
+
+def _begin(connection):
+    """Take the write lock as SQLite transactions of writing requests begin.
+
+    Views read before they write (the next bill number, a party to link,
+    the stock a sale draws on); with the lock taken only at the first write,
+    two requests could read the same state and both write from it. Other
+    transactions begin lazily at their first write.
+    """
+    if connection.dialect.name == 'sqlite' and _writing_request():
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def init_app(app):
+    global _listeners_installed
+    if not _listeners_installed:
+        event.listen(Engine, 'begin', _begin)
+        _listeners_installed = True
@@ -0,0 +1,341 @@
+from datetime import datetime
+from sqlalchemy import and_, bindparam, case, func, literal, or_, select, union_all
+from extensions import db
+from models import BagInventory, Godown, OpeningStock, Purchase, Sale, SaleGodownDetail, StockTransfer
+from utils.http_cache import bump
+from utils.events import record_stock
+from utils.capacity import adjust_usage, usage_drift
+from utils.alerts import touch
+
+
+class InsufficientStock(ValueError):
+    """Raised with every shortfall of a multi-godown request, not just the first"""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__('; '.join(
+            f"Insufficient stock in {s['godown_name']}. "
+            f"Available: {s['available']}, Requested: {s['requested']}"
+            for s in shortfalls
+        ))
+
+
+def stock_matrix(grain_id=None):
+    """Return {(grain_id, godown_id): bags} from one grouped query"""
+    query = db.session.query(
+        BagInventory.grain_id,
+        BagInventory.godown_id,
+        func.sum(BagInventory.number_of_bags)
+    )
+    if grain_id is not None:
+        query = query.filter(BagInventory.grain_id == grain_id)
+    rows = query.group_by(
+        BagInventory.grain_id,
+        BagInventory.godown_id
+    ).all()
+    return {(grain, godown): int(bags or 0) for grain, godown, bags in rows}
+
+
+def merge_allocations(godown_details):
+    """Normalize [{'godown_id', 'number_of_bags'}] into {godown_id: bags}.
+
+    Repeated godowns are summed so each inventory row is touched once.
+    """
+    allocations = {}
+    for detail in godown_details:
+        try:
+            godown_id = int(detail.get('godown_id'))
+            bags = int(detail.get('number_of_bags'))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid godown details')
+        if godown_id <= 0 or bags <= 0:
+            raise ValueError('Invalid godown details')
+        allocations[godown_id] = allocations.get(godown_id, 0) + bags
+    return allocations
+
+
+def find_shortfalls(grain_id, allocations):
+    """Compare requested bags against stock with a single IN-list query"""
+    rows = db.session.query(
+        Godown.id,
+        Godown.name,
+        BagInventory.number_of_bags
+    ).outerjoin(
+        BagInventory,
+        (BagInventory.godown_id == Godown.id) & (BagInventory.grain_id == grain_id)
+    ).filter(
+        Godown.id.in_(list(allocations))
+    ).all()
+    stock = {godown_id: (name, bags or 0) for godown_id, name, bags in rows}
+
+    shortfalls = []
+    for godown_id in sorted(allocations):
+        name, available = stock.get(godown_id, (f'Godown {godown_id}', 0))
+        if available < allocations[godown_id]:
+            shortfalls.append({
+                'godown_id': godown_id,
+                'godown_name': name,
+                'requested': allocations[godown_id],
+                'available': available
+            })
+    return shortfalls
+
+
+def deduction_statement(grain_id, allocations):
+    """Single conditional UPDATE that deducts every allocation or matches fewer rows.
+
+    Each row only matches while it still holds enough bags, so concurrent
+    sales can never oversell; the caller compares rowcount to len(allocations).
+    """
+    table = BagInventory.__table__
+    requested = case(
+        {godown_id: bags for godown_id, bags in allocations.items()},
+        value=table.c.godown_id
+    )
+    return table.update().where(
+        table.c.grain_id == grain_id,
+        table.c.godown_id.in_(sorted(allocations)),
+        table.c.number_of_bags >= requested
+    ).values(
+        number_of_bags=table.c.number_of_bags - requested,
+        last_updated=datetime.utcnow()
+    )
+
+
+def locked_stock(grain_id, godown_ids):
+    """Fetch and lock the inventory rows of one grain in a single IN-list query.
+
+    Rows are locked in godown_id order so concurrent multi-godown writers
+    always acquire them in the same sequence.
+    """
+    rows = db.session.query(
+        BagInventory.godown_id,
+        BagInventory.number_of_bags
+    ).filter(
+        BagInventory.grain_id == grain_id,
+        BagInventory.godown_id.in_(sorted(godown_ids))
+    ).order_by(
+        BagInventory.godown_id
+    ).with_for_update().all()
+    return {godown_id: bags or 0 for godown_id, bags in rows}
+
+
+def deduct_stock(grain_id, allocations):
+    """Atomically remove bags from several godowns or raise InsufficientStock.
+
+    The locked fetch reports every shortfall up front; the conditional UPDATE
+    then guards against oversell on backends where FOR UPDATE is a no-op
+    (SQLite). If that guard trips, the caller must roll back the transaction.
+    """
+    if not allocations:
+        return
+    stock = locked_stock(grain_id, allocations)
+    if any(stock.get(godown_id, 0) < bags for godown_id, bags in allocations.items()):
+        raise InsufficientStock(find_shortfalls(grain_id, allocations))
+
+    result = db.session.execute(deduction_statement(grain_id, allocations))
+    if result.rowcount != len(allocations):
+        # Lost a race with another writer between the fetch and the update
+        raise InsufficientStock([{
+            'godown_id': godown_id,
+            'godown_name': f'Godown {godown_id}',
+            'requested': bags,
+            'available': None
+        } for godown_id, bags in sorted(allocations.items())])
+    adjust_usage(db.session.connection(), {godown_id: -bags for godown_id, bags in allocations.items()})
+    bump('inventory')
+    record_stock(db.session, grain_id, -sum(allocations.values()))
+
+
+def move_stock(changes):
+    """Apply {(grain_id, godown_id): bags} in one locked pass or raise InsufficientStock.
+
+    Every affected row is locked up front in (grain_id, godown_id) order, so
+    two batches touching the same godowns can never wait on each other in
+    opposite orders. Decrements keep the oversell guard of deduct_stock;
+    missing rows are created for increments, and godown counters are
+    adjusted (and capacity enforced) through adjust_usage.
+    """
+    changes = {key: bags for key, bags in changes.items() if bags}
+    if not changes:
+        return
+    keys = sorted(changes)
+    table = BagInventory.__table__
+    rows = db.session.query(
+        BagInventory.grain_id,
+        BagInventory.godown_id,
+        BagInventory.number_of_bags
+    ).filter(
+        or_(*[and_(BagInventory.grain_id == grain_id, BagInventory.godown_id == godown_id)
+              for grain_id, godown_id in keys])
+    ).order_by(
+        BagInventory.grain_id,
+        BagInventory.godown_id
+    ).with_for_update().all()
+    stock = {(grain_id, godown_id): bags or 0 for grain_id, godown_id, bags in rows}
+
+    short = [key for key in keys if changes[key] < 0 and stock.get(key, 0) < -changes[key]]
+    if short:
+        names = dict(db.session.query(Godown.id, Godown.name).filter(
+            Godown.id.in_({godown_id for _, godown_id in short})).all())
+        raise InsufficientStock([{
+            'grain_id': grain_id,
+            'godown_id': godown_id,
+            'godown_name': names.get(godown_id, f'Godown {godown_id}'),
+            'requested': -changes[(grain_id, godown_id)],
+            'available': stock.get((grain_id, godown_id), 0)
+        } for grain_id, godown_id in short])
+
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    for grain_id, godown_id in keys:
+        bags = changes[(grain_id, godown_id)]
+        if (grain_id, godown_id) not in stock:
+            connection.execute(table.insert().values(
+                grain_id=grain_id, godown_id=godown_id, number_of_bags=bags, last_updated=now))
+            continue
+        result = connection.execute(table.update().where(
+            table.c.grain_id == grain_id,
+            table.c.godown_id == godown_id,
+            table.c.number_of_bags + bags >= 0
+        ).values(number_of_bags=table.c.number_of_bags + bags, last_updated=now))
+        if result.rowcount != 1:
+            # Lost a race with another writer between the fetch and the update
+            raise InsufficientStock([{'grain_id': grain_id, 'godown_id': godown_id,
+                                      'godown_name': f'Godown {godown_id}',
+                                      'requested': -bags, 'available': None}])
+
+    usage, by_grain = {}, {}
+    for (grain_id, godown_id), bags in changes.items():
+        usage[godown_id] = usage.get(godown_id, 0) + bags
+        by_grain[grain_id] = by_grain.get(grain_id, 0) + bags
+    adjust_usage(connection, usage)
+    bump('inventory')
+    for grain_id, bags in sorted(by_grain.items()):
+        record_stock(db.session, grain_id, bags)
+
+
+def transfer_stock(moves, reference, note=None, user_id=None):
+    """Move bags between godowns as one batch; returns the StockTransfer rows.
+
+    moves is [(grain_id, from_godown_id, to_godown_id, bags)]. All of it
+    happens or none does: InsufficientStock or CapacityExceeded leave the
+    caller to roll back.
+    """
+    changes = {}
+    for grain_id, from_godown_id, to_godown_id, bags in moves:
+        changes[(grain_id, from_godown_id)] = changes.get((grain_id, from_godown_id), 0) - bags
+        changes[(grain_id, to_godown_id)] = changes.get((grain_id, to_godown_id), 0) + bags
+    move_stock(changes)
+
+    now = datetime.utcnow()
+    transfers = [StockTransfer(
+        reference=reference,
+        grain_id=grain_id,
+        from_godown_id=from_godown_id,
+        to_godown_id=to_godown_id,
+        number_of_bags=bags,
+        note=note,
+        transfer_date=now,
+        created_by=user_id
+    ) for grain_id, from_godown_id, to_godown_id, bags in moves]
+    db.session.add_all(transfers)
+    db.session.flush()
+    return transfers
+
+
+def _movements():
+    """Every bag movement and stock row as (grain_id, godown_id, expected, actual, rows).
+
+    Archived bills count through the opening stock their years carried forward.
+    """
+    inventory = BagInventory.__table__.c
+
+    def row(grain_id, godown_id, expected=0, actual=0, rows=0):
+        return select(grain_id.label('grain_id'), godown_id.label('godown_id'),
+                      literal(expected) if isinstance(expected, int) else expected,
+                      literal(actual) if isinstance(actual, int) else actual,
+                      literal(rows))
+
+    return union_all(
+        row(Purchase.grain_id, Purchase.godown_id, Purchase.number_of_bags),
+        row(Sale.grain_id, SaleGodownDetail.godown_id, -SaleGodownDetail.number_of_bags)
+        .join(Sale, Sale.id == SaleGodownDetail.sale_id),
+        row(StockTransfer.grain_id, StockTransfer.to_godown_id, StockTransfer.number_of_bags),
+        row(StockTransfer.grain_id, StockTransfer.from_godown_id, -StockTransfer.number_of_bags),
+        row(OpeningStock.grain_id, OpeningStock.godown_id, OpeningStock.bags),
+        row(inventory.grain_id, inventory.godown_id, actual=func.coalesce(inventory.number_of_bags, 0), rows=1),
+    ).subquery()
+
+
+def inventory_drift(connection=None):
+    """Diff bag_inventory against opening stock + purchases - sales +/- transfers per (grain, godown).
+
+    One grouped pass over a UNION ALL of the bill tables and the stock rows,
+    so the work is a single scan however many bills there are. Returns
+    [{grain_id, godown_id, expected, actual, rows}] for every pair that
+    differs or is stored in more than one row.
+    """
+    connection = connection or db.session.connection()
+    grain_id, godown_id, expected, actual, rows = _movements().c
+    query = select(
+        grain_id.label('grain_id'), godown_id.label('godown_id'), func.sum(expected).label('expected'),
+        func.sum(actual).label('actual'), func.sum(rows).label('rows')
+    ).group_by(grain_id, godown_id).having(or_(
+        func.sum(expected) != func.sum(actual), func.sum(rows) > 1
+    )).order_by(grain_id, godown_id)
+    return [dict(row._mapping) for row in connection.execute(query)]
+
+
+def merge_duplicates(connection=None):
+    """Fold duplicate (grain, godown) stock rows into the oldest one; returns rows removed"""
+    connection = connection or db.session.connection()
+    table = BagInventory.__table__
+    dupes = select(
+        func.min(table.c.id).label('keep'), func.sum(table.c.number_of_bags).label('bags')
+    ).group_by(table.c.grain_id, table.c.godown_id).having(func.count() > 1)
+    merged = connection.execute(dupes).all()
+    if not merged:
+        return 0
+    connection.execute(
+        table.update().where(table.c.id == bindparam('keep')).values(number_of_bags=bindparam('bags')),
+        [{'keep': row.keep, 'bags': row.bags} for row in merged]
+    )
+    keepers = select(func.min(table.c.id)).group_by(table.c.grain_id, table.c.godown_id).scalar_subquery()
+    return connection.execute(table.delete().where(table.c.id.not_in(keepers))).rowcount
+
+
+def repair_inventory(drift, session=None):
+    """Set stock rows to their expected bags with two executemany statements.
+
+    Pairs whose history sells more than it ever received (stock seeded
+    without a purchase) cannot be derived and are left alone; returns them.
+    Godown counters and stock alerts are brought in line afterwards.
+    """
+    session = session or db.session
+    connection = session.connection()
+    merge_duplicates(connection)
+    table = BagInventory.__table__
+    fixable = [row for row in drift if row['expected'] >= 0]
+    existing = {(row.grain_id, row.godown_id) for row in connection.execute(
+        select(table.c.grain_id, table.c.godown_id).where(
+            table.c.grain_id.in_({row['grain_id'] for row in fixable})
+        ))} if fixable else set()
+    now = datetime.utcnow()
+    updates = [{'grain': row['grain_id'], 'godown': row['godown_id'], 'bags': row['expected']}
+               for row in fixable if (row['grain_id'], row['godown_id']) in existing]
+    inserts = [{'grain_id': row['grain_id'], 'godown_id': row['godown_id'],
+                'number_of_bags': row['expected'], 'last_updated': now}
+               for row in fixable if (row['grain_id'], row['godown_id']) not in existing and row['expected']]
+    if updates:
+        connection.execute(table.update().where(
+            table.c.grain_id == bindparam('grain'), table.c.godown_id == bindparam('godown')
+        ).values(number_of_bags=bindparam('bags'), last_updated=now), updates)
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+    usage_drift(connection, fix=True)
+    if fixable:
+        bump('inventory', session=session)
+        touch(session, {(row['grain_id'], row['godown_id']) for row in fixable})
+    return [row for row in drift if row['expected'] < 0]
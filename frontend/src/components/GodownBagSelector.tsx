@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useMemo } from 'react';
 import {
   Box,
   Typography,
@@ -10,6 +10,7 @@ import {
 } from '@mui/material';
 import { Add as AddIcon, Remove as RemoveIcon } from '@mui/icons-material';
 import { GodownDetail } from '../types/inventory';
+import { availableBags, bootstrapService, FormBootstrap } from '../services/bootstrapService';
 
 interface Godown {
   id: number;
@@ -20,34 +21,41 @@ interface Godown {
 interface GodownBagSelectorProps {
   grainId: number;
   onChange: (details: GodownDetail[]) => void;
+  // Sale-form bootstrap the parent already loaded; fetched here otherwise
+  bootstrap?: FormBootstrap;
 }
 
 export const GodownBagSelector: React.FC<GodownBagSelectorProps> = ({
   grainId,
-  onChange
+  onChange,
+  bootstrap
 }) => {
-  const [godowns, setGodowns] = useState<Godown[]>([]);
+  const [fetched, setFetched] = useState<FormBootstrap | null>(null);
   const [selectedGodowns, setSelectedGodowns] = useState<GodownDetail[]>([]);
 
   useEffect(() => {
-    fetchGodownStock();
-  }, [grainId]);
+    if (!bootstrap) {
+      fetchFormData();
+    }
+  }, [bootstrap]);
 
-  const fetchGodownStock = async () => {
+  const fetchFormData = async () => {
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/api/inventory/godown-stock/${grainId}`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (!response.ok) throw new Error('Failed to fetch godown stock');
-      const data = await response.json();
-      setGodowns(data);
+      setFetched(await bootstrapService.getSaleForm());
     } catch (error) {
       console.error('Error fetching godown stock:', error);
     }
   };
 
+  // Godowns holding this grain, read from the stock matrix; changing the grain needs no request
+  const godowns = useMemo<Godown[]>(() => {
+    const data = bootstrap || fetched;
+    if (!data) return [];
+    return data.godowns
+      .map(godown => ({ id: godown.id, name: godown.name, available_bags: availableBags(data, grainId, godown.id) }))
+      .filter(godown => godown.available_bags > 0);
+  }, [bootstrap, fetched, grainId]);
+
   const addGodownSelection = () => {
     const newSelections = [...selectedGodowns, { godown_id: 0, number_of_bags: 0 }];
     setSelectedGodowns(newSelections);
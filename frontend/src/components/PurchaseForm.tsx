@@ -18,6 +18,7 @@ import {
 import { DatePicker } from '@mui/x-date-pickers';
 import { formatWeight } from '../utils/formatters';
 import { useNotification } from '../contexts/NotificationContext';
+import { useSuggestions } from '../hooks/useSuggestions';
 import { api } from '../services/api';
 import { useTranslation } from 'react-i18next';
 
@@ -82,6 +83,7 @@ export const PurchaseForm: React.FC<PurchaseFormProps> = ({
     godown_id: '',
     purchase_date: new Date()
   });
+  const supplierSuggestions = useSuggestions(formData.supplier_name, 'party');
 
   useEffect(() => {
     fetchGrainsAndGodowns();
@@ -215,8 +217,12 @@ export const PurchaseForm: React.FC<PurchaseFormProps> = ({
                 label={t('purchases.supplier_name')}
                 value={formData.supplier_name}
                 onChange={handleInputChange('supplier_name')}
+                inputProps={{ list: 'supplier-suggestions', autoComplete: 'off' }}
                 required
               />
+              <datalist id="supplier-suggestions">
+                {supplierSuggestions.map((name) => <option key={name} value={name} />)}
+              </datalist>
             </Grid>
 
             <Grid item xs={12} sm={6}>
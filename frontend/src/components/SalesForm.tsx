@@ -17,6 +17,8 @@ import { Grain } from '../types/grain';
 import { Godown } from '../types/godown';
 import { useNotification } from '../contexts/NotificationContext';
 import { useTranslation } from 'react-i18next';
+import { bootstrapService } from '../services/bootstrapService';
+import { useSuggestions } from '../hooks/useSuggestions';
 
 export interface SaleFormData {
   grain_id: string;
@@ -64,32 +66,15 @@ export const SalesForm: React.FC<SalesFormProps> = ({ open, onClose, onSubmit })
     buyer_gst: '',
     number_of_bags: ''
   });
+  const buyerSuggestions = useSuggestions(formData.buyer_name, 'party');
+  const vehicleSuggestions = useSuggestions(formData.vehicle_number, 'vehicle');
 
-  const fetchGrains = async () => {
+  const fetchFormData = async () => {
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/api/grains`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (!response.ok) throw new Error(t('errors.fetch_error'));
-      const data = await response.json();
-      setGrains(data);
-    } catch (error) {
-      showError(t('errors.fetch_error'));
-    }
-  };
-
-  const fetchGodowns = async () => {
-    try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/api/godowns`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (!response.ok) throw new Error(t('errors.fetch_error'));
-      const data = await response.json();
-      setGodowns(data);
+      // Grains, godowns and stock arrive in a single round-trip
+      const data = await bootstrapService.getSaleForm();
+      setGrains(data.grains as Grain[]);
+      setGodowns(data.godowns as Godown[]);
     } catch (error) {
       showError(t('errors.fetch_error'));
     }
@@ -97,8 +82,7 @@ export const SalesForm: React.FC<SalesFormProps> = ({ open, onClose, onSubmit })
 
   useEffect(() => {
     if (open) {
-      fetchGrains();
-      fetchGodowns();
+      fetchFormData();
     }
   }, [open]);
 
@@ -221,8 +205,12 @@ export const SalesForm: React.FC<SalesFormProps> = ({ open, onClose, onSubmit })
                 label={t('sales.customer_name')}
                 value={formData.buyer_name}
                 onChange={handleChange}
+                inputProps={{ list: 'buyer-suggestions', autoComplete: 'off' }}
                 required
               />
+              <datalist id="buyer-suggestions">
+                {buyerSuggestions.map((name) => <option key={name} value={name} />)}
+              </datalist>
             </Grid>
             <Grid item xs={12}>
               <Grid container spacing={2} alignItems="center">
@@ -339,8 +327,12 @@ export const SalesForm: React.FC<SalesFormProps> = ({ open, onClose, onSubmit })
                 label={t('sales.vehicle_number')}
                 value={formData.vehicle_number}
                 onChange={handleChange}
+                inputProps={{ list: 'vehicle-suggestions', autoComplete: 'off' }}
                 required
               />
+              <datalist id="vehicle-suggestions">
+                {vehicleSuggestions.map((vehicle) => <option key={vehicle} value={vehicle} />)}
+              </datalist>
             </Grid>
             <Grid item xs={12} sm={6}>
               <TextField
@@ -5,7 +5,10 @@ export interface DashboardData {
   totalPurchases: number;
   totalSales: number;
   totalInventory: number;
-  totalRevenue: number;
+  totalRevenue: number;  // realized margin on sold stock
+  costOfGoodsSold: number;
+  stockValue: number;
+  eventId: number;  // last live event already included in these figures
   recentPurchases: Array<{
     id: number;
     billNumber: string;
@@ -26,28 +29,140 @@ export interface DashboardData {
   }>;
 }
 
+type TotalKey = 'totalPurchases' | 'totalSales' | 'totalInventory' | 'totalRevenue' | 'costOfGoodsSold' | 'stockValue';
+type BillChange<T> = Partial<T> & { id: number; op: 'created' | 'updated' | 'deleted' };
+
+// Compact change pushed by /api/events after each committed write
+interface DashboardDelta {
+  types: string[];
+  totals?: Partial<Record<TotalKey, number>>;
+  inventory?: Record<string, number>;  // grainId -> change in bags
+  purchases?: BillChange<DashboardData['recentPurchases'][number]>[];
+  sales?: BillChange<DashboardData['recentSales'][number]>[];
+}
+
+const RECENT_LIMIT = 5;
+const RECENT_DAYS = 30;
+const RECONNECT_DELAY = 30000;
+
+// Returns null when a visible bill was deleted and the list needs a refetch
+const mergeRecent = <T extends { id: number; date: string }>(rows: T[], changes: BillChange<T>[] = []): T[] | null => {
+  let merged = rows;
+  for (const { op, ...change } of changes) {
+    const present = merged.some(row => row.id === change.id);
+    if (op === 'deleted') {
+      if (present) return null;
+    } else if (present) {
+      merged = merged.map(row => (row.id === change.id ? { ...row, ...change } as T : row));
+    } else if (op === 'created') {
+      merged = [change as T, ...merged];
+    }
+  }
+  const cutoff = Date.now() - RECENT_DAYS * 24 * 60 * 60 * 1000;
+  return merged
+    .filter(row => new Date(row.date).getTime() >= cutoff)
+    .sort((a, b) => b.date.localeCompare(a.date))
+    .slice(0, RECENT_LIMIT);
+};
+
+const applyDelta = (data: DashboardData, delta: DashboardDelta, eventId: number): DashboardData | null => {
+  const recentPurchases = mergeRecent(data.recentPurchases, delta.purchases);
+  const recentSales = mergeRecent(data.recentSales, delta.sales);
+  if (!recentPurchases || !recentSales) return null;
+
+  const next = { ...data, eventId, recentPurchases, recentSales };
+  for (const [key, change] of Object.entries(delta.totals ?? {}) as [TotalKey, number][]) {
+    next[key] = (next[key] ?? 0) + change;
+  }
+  if (delta.inventory) {
+    const summary = new Map(data.inventorySummary.map(item => [item.grainId, item.totalBags]));
+    for (const [grainId, bags] of Object.entries(delta.inventory)) {
+      summary.set(Number(grainId), (summary.get(Number(grainId)) ?? 0) + bags);
+    }
+    next.inventorySummary = Array.from(summary, ([grainId, totalBags]) => ({ grainId, totalBags }));
+  }
+  return next;
+};
+
 export const useDashboardData = () => {
   const [metrics, setMetrics] = useState<DashboardData | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
+    let cancelled = false;
+    let source: EventSource | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+    // Deltas that arrive while a full fetch is in flight are replayed onto its result
+    let pending: Array<{ id: number; delta: DashboardDelta }> | null = [];
+
     const fetchDashboardData = async () => {
+      pending = pending ?? [];
       try {
-        setIsLoading(true);
         const response = await api.get<DashboardData>('/api/metrics');
-        setMetrics(response.data);
+        if (cancelled) return;
+        let data: DashboardData | null = response.data;
+        for (const { id, delta } of pending) {
+          if (data && id > data.eventId) data = applyDelta(data, delta, id);
+        }
+        pending = null;
+        if (!data) {
+          fetchDashboardData();
+          return;
+        }
+        setMetrics(data);
         setError(null);
       } catch (err) {
         console.error('Error fetching dashboard data:', err);
         setError('Failed to load dashboard data');
       } finally {
-        setIsLoading(false);
+        if (!cancelled) setIsLoading(false);
       }
     };
 
+    const connect = () => {
+      const token = localStorage.getItem('token');
+      if (!token || typeof EventSource === 'undefined') return;
+      source = new EventSource(`${import.meta.env.VITE_API_URL}/api/events?jwt=${encodeURIComponent(token)}`);
+
+      source.addEventListener('delta', (event: MessageEvent) => {
+        const id = Number(event.lastEventId);
+        const delta: DashboardDelta = JSON.parse(event.data);
+        if (pending) {
+          pending.push({ id, delta });
+          return;
+        }
+        setMetrics(current => {
+          if (!current || id <= current.eventId) return current;
+          const next = applyDelta(current, delta, id);
+          if (!next) fetchDashboardData();
+          return next ?? current;
+        });
+      });
+      // Events were missed (slow consumer or server restart): start from a fresh snapshot
+      source.addEventListener('resync', () => fetchDashboardData());
+      source.onerror = () => {
+        // The browser retries dropped connections itself; a closed source means
+        // the server refused it (expired token, too many streams)
+        if (source?.readyState === EventSource.CLOSED) {
+          source = null;
+          reconnectTimer = setTimeout(() => {
+            fetchDashboardData();
+            connect();
+          }, RECONNECT_DELAY);
+        }
+      };
+    };
+
+    connect();
     fetchDashboardData();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(reconnectTimer);
+      source?.close();
+    };
   }, []);
 
   return { metrics, isLoading, error };
-};
\ No newline at end of file
+};
@@ -0,0 +1,27 @@
+import { useEffect, useState } from 'react';
+import { searchService } from '../services/searchService';
+
+// Debounced prefix suggestions for a form field; stale requests are aborted
+export const useSuggestions = (query: string, field: 'party' | 'vehicle' = 'party', delay = 150) => {
+  const [suggestions, setSuggestions] = useState<string[]>([]);
+
+  useEffect(() => {
+    const trimmed = query.trim();
+    if (trimmed.length < 2) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+      searchService.suggest(trimmed, field, controller.signal)
+        .then(setSuggestions)
+        .catch(() => undefined);
+    }, delay);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query, field, delay]);
+
+  return suggestions;
+};
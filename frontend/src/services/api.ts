@@ -47,13 +47,20 @@ export const apiWithCache = {
     } = options;
 
     try {
-      if (!bypassCache) {
-        const cachedData = await cacheManager.get(cacheName, url);
-        if (cachedData) return cachedData as T;
+      const cached = bypassCache ? null : await cacheManager.getEntry(cacheName, url);
+      if (cached && !cached.expired) return cached.value as T;
+
+      // Revalidate expired entries with their ETag; a 304 costs no body or query
+      const response = await api.get<T>(url, {
+        headers: cached?.etag ? { 'If-None-Match': cached.etag } : {},
+        validateStatus: status => (status >= 200 && status < 300) || status === 304
+      });
+      if (response.status === 304 && cached) {
+        await cacheManager.set(cacheName, url, cached.value, maxAge, cached.etag);
+        return cached.value as T;
       }
 
-      const response = await api.get<T>(url);
-      await cacheManager.set(cacheName, url, response.data, maxAge);
+      await cacheManager.set(cacheName, url, response.data, maxAge, response.headers.etag);
       return response.data;
     } catch (error) {
       throw handleApiError(error);
@@ -0,0 +1,42 @@
+import { getAuthHeader } from '../utils/auth';
+
+export interface BootstrapGrain {
+  id: number;
+  name: string;
+}
+
+export interface BootstrapGodown {
+  id: number;
+  name: string;
+  location: string | null;
+  capacity: number | null;
+  used_bags: number;
+  available_capacity: number | null;
+  created_at: string;
+}
+
+export interface FormBootstrap {
+  grains: BootstrapGrain[];
+  godowns: BootstrapGodown[];
+  // Sparse [grain_id, godown_id, bags] triples; missing pairs hold no stock
+  stock: Array<[number, number, number]>;
+}
+
+export const availableBags = (data: FormBootstrap, grainId: number, godownId: number): number => {
+  const entry = data.stock.find(([grain, godown]) => grain === grainId && godown === godownId);
+  return entry ? entry[2] : 0;
+};
+
+const fetchBootstrap = async (form: 'sale-form' | 'purchase-form'): Promise<FormBootstrap> => {
+  // Served with an ETag, so reopening the form usually costs a 304
+  const response = await fetch(`${import.meta.env.VITE_API_URL}/api/bootstrap/${form}`, {
+    headers: getAuthHeader()
+  });
+  if (!response.ok) throw new Error('Failed to fetch form data');
+  return response.json();
+};
+
+export const bootstrapService = {
+  getSaleForm: () => fetchBootstrap('sale-form'),
+  getPurchaseForm: () => fetchBootstrap('purchase-form')
+};
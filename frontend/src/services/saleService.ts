@@ -28,7 +28,41 @@ export interface SalesSummary {
   }>;
 }
 
+export type AllocationPolicy = 'fifo' | 'min_godowns' | 'nearest';
+
+export interface AllocationRequest {
+  grain_id: number;
+  number_of_bags: number;
+  policy?: AllocationPolicy;
+  location?: string;
+  distances?: Record<number, number>;
+}
+
+export interface AllocationPlan {
+  grain_id: number;
+  number_of_bags: number;
+  policy: AllocationPolicy;
+  // Directly usable as the godown_details of a new sale
+  godown_details: Array<{ godown_id: number; godown_name: string | null; number_of_bags: number }>;
+}
+
 export const saleService = {
+  async planAllocation(request: AllocationRequest): Promise<AllocationPlan> {
+    const response = await fetch(`${import.meta.env.VITE_API_URL}/api/sales/plan-allocation`, {
+      method: 'POST',
+      headers: {
+        ...getAuthHeader(),
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify(request)
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.error || 'Failed to plan allocation');
+    }
+    return response.json();
+  },
+
   async getAll(): Promise<Sale[]> {
     const response = await fetch(`${import.meta.env.VITE_API_URL}/api/sales`, {
       headers: getAuthHeader()
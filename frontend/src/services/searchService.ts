@@ -0,0 +1,41 @@
+import { getAuthHeader } from '../utils/auth';
+
+export interface SearchResult {
+  kind: 'sale' | 'purchase';
+  bill_id: number;
+  bill_number: string;
+  party: string;
+  bill_date: string;
+  vehicle: string | null;
+  score: number;
+}
+
+export interface SearchPage {
+  query: string;
+  page: number;
+  per_page: number;
+  has_more: boolean;
+  results: SearchResult[];
+}
+
+const API_URL = import.meta.env.VITE_API_URL;
+
+export const searchService = {
+  search: async (q: string, page = 1, type?: 'sale' | 'purchase'): Promise<SearchPage> => {
+    const params = new URLSearchParams({ q, page: String(page) });
+    if (type) params.set('type', type);
+    const response = await fetch(`${API_URL}/api/search?${params}`, { headers: getAuthHeader() });
+    if (!response.ok) throw new Error('Search failed');
+    return response.json();
+  },
+
+  suggest: async (q: string, field: 'party' | 'vehicle' = 'party', signal?: AbortSignal): Promise<string[]> => {
+    const params = new URLSearchParams({ q, field });
+    const response = await fetch(`${API_URL}/api/search/suggest?${params}`, {
+      headers: getAuthHeader(),
+      signal
+    });
+    if (!response.ok) throw new Error('Failed to fetch suggestions');
+    return response.json();
+  }
+};
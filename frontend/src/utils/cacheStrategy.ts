@@ -4,6 +4,12 @@ interface CacheConfig {
   maxItems?: number;
 }
 
+export interface CacheEntry {
+  value: any;
+  etag?: string;
+  expired: boolean;
+}
+
 class CacheManager {
   private caches: Map<string, Cache> = new Map();
 
@@ -29,12 +35,26 @@ class CacheManager {
     return data.value;
   }
 
-  async set(cacheName: string, key: string, value: any, maxAge: number) {
+  // Returns the cached entry even when expired so callers holding an ETag
+  // can revalidate it with a conditional GET instead of refetching the body.
+  async getEntry(cacheName: string, key: string): Promise<CacheEntry | null> {
+    const cache = this.caches.get(cacheName);
+    if (!cache) return null;
+
+    const response = await cache.match(key);
+    if (!response) return null;
+
+    const data = await response.json();
+    return { value: data.value, etag: data.etag, expired: this.isExpired(data) };
+  }
+
+  async set(cacheName: string, key: string, value: any, maxAge: number, etag?: string) {
     const cache = this.caches.get(cacheName);
     if (!cache) return;
 
     const data = {
       value,
+      etag,
       timestamp: Date.now(),
       maxAge
     };
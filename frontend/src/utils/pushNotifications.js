@@ -1,4 +1,4 @@
-const PUBLIC_VAPID_KEY = 'your_public_key';
+const PUBLIC_VAPID_KEY = import.meta.env.VITE_VAPID_PUBLIC_KEY;
 
 export async function subscribeToPushNotifications() {
   try {
@@ -16,14 +16,19 @@ export async function subscribeToPushNotifications() {
       applicationServerKey: urlBase64ToUint8Array(PUBLIC_VAPID_KEY)
     });
 
-    // Send subscription to backend
-    await fetch('/api/notifications/subscribe', {
+    // Send subscription to backend; it is stored against the signed-in user
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${import.meta.env.VITE_API_URL}/api/notifications/subscribe`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {})
       },
       body: JSON.stringify(subscription)
     });
+    if (!response.ok) {
+      throw new Error('Failed to save push subscription');
+    }
 
     return subscription;
   } catch (error) {